@@ -0,0 +1,201 @@
+"""
+קורפוס של תוכניות בסגנון שהבוט מקבל מ-Gemini, לפי הדוגמאות שבתיקיית examples/
+"""
+
+POLAR_CIRCLE = """import matplotlib.pyplot as plt
+import numpy as np
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+a = 3
+theta = np.linspace(0, 2 * np.pi, 500)
+r = np.full_like(theta, a)
+
+fig = plt.figure(figsize=(10, 10))
+ax = fig.add_subplot(111, projection='polar')
+ax.plot(theta, r, color='blue', linewidth=2)
+ax.set_rmax(4)
+ax.set_title(get_display("r=a במערכת צירים פולרית"))
+ax.grid(True)
+plt.savefig('polar.png')
+plt.close()
+"""
+
+FOURIER_SERIES = """import matplotlib.pyplot as plt
+import numpy as np
+import math
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+x = np.linspace(-2 * np.pi, 2 * np.pi, 2000)
+square = np.sign(np.sin(x))
+
+fig, ax = plt.subplots(figsize=(10, 10))
+ax.plot(x, square, color='black', linewidth=2, label=get_display("גל ריבועי"))
+for terms in [1, 3, 5, 15, 50]:
+    y = np.zeros_like(x)
+    for k in range(terms):
+        n = 2 * k + 1
+        y += 4 / (math.pi * n) * np.sin(n * x)
+    ax.plot(x, y, linewidth=1, label=f"N={terms}")
+ax.set_title(get_display("טור פורייה"))
+ax.grid(True)
+ax.legend()
+plt.savefig('fourier.png')
+plt.close()
+"""
+
+FRACTAL = """import matplotlib.pyplot as plt
+import numpy as np
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+width, height = 200, 200
+max_iter = 40
+image = np.zeros((height, width))
+for row in range(height):
+    for col in range(width):
+        c = (-2.0 + 3.0 * col / width) + 1j * (-1.5 + 3.0 * row / height)
+        z = 0
+        n = 0
+        while abs(z) <= 2 and n < max_iter:
+            z = z * z + c
+            n += 1
+        image[row, col] = n
+
+plt.figure(figsize=(10, 10))
+plt.imshow(image, cmap='magma', extent=(-2, 1, -1.5, 1.5))
+plt.title(get_display("פרקטל"))
+plt.axis('off')
+plt.savefig('fractal.png')
+plt.close()
+"""
+
+VENN_DIAGRAM = """import matplotlib.pyplot as plt
+from matplotlib.patches import Circle
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+fig, ax = plt.subplots(figsize=(10, 10))
+sets = [
+    ("ℕ", 1.0, 'tab:blue'),
+    ("ℤ", 2.0, 'tab:green'),
+    ("ℚ", 3.0, 'tab:orange'),
+    ("ℝ", 4.0, 'tab:red'),
+]
+for name, radius, color in sets:
+    ax.add_patch(Circle((0, 0), radius, fill=False, color=color, linewidth=2))
+    ax.text(0, radius - 0.4, name, ha='center', fontsize=20, color=color)
+ax.set_xlim(-4.5, 4.5)
+ax.set_ylim(-4.5, 4.5)
+plt.axis('equal')
+ax.axis('off')
+ax.set_title(get_display("קבוצות מספרים שכלולות זו בזו"))
+plt.savefig('venn.png')
+plt.close()
+"""
+
+EPICYCLOID = """import matplotlib.pyplot as plt
+import numpy as np
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+R, r = 5, 1
+t = np.linspace(0, 2 * np.pi, 3000)
+x = (R + r) * np.cos(t) - r * np.cos((R + r) / r * t)
+y = (R + r) * np.sin(t) - r * np.sin((R + r) / r * t)
+
+fig, ax = plt.subplots(figsize=(10, 10))
+ax.plot(x, y, color='purple', linewidth=2)
+ax.add_patch(plt.Circle((0, 0), R, fill=False, linestyle='--', color='gray'))
+plt.axis('equal')
+ax.grid(True)
+ax.set_title(get_display("אפיציקלואיד"))
+plt.savefig('epicycloid.png')
+plt.close()
+"""
+
+IMPLICIT_SIN = """import matplotlib.pyplot as plt
+import numpy as np
+
+x = np.linspace(-10, 10, 800)
+y = np.linspace(-10, 10, 800)
+X, Y = np.meshgrid(x, y)
+Z = np.sin(X + Y)
+
+plt.figure(figsize=(10, 10))
+plt.contour(X, Y, Z, levels=[0], colors='blue')
+plt.axhline(0, color='black', linewidth=0.8)
+plt.axvline(0, color='black', linewidth=0.8)
+plt.grid(True)
+plt.title('sin(x+y) = 0')
+plt.savefig('implicit.png')
+plt.close()
+"""
+
+DEFINITE_INTEGRAL = """import matplotlib.pyplot as plt
+import numpy as np
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+x = np.linspace(0, 4 * np.pi, 1000)
+y = np.sin(x)
+mask = (x >= np.pi) & (x <= 3 * np.pi)
+
+fig, ax = plt.subplots(figsize=(10, 10))
+ax.plot(x, y, color='blue', linewidth=2)
+ax.fill_between(x[mask], y[mask], color='orange', alpha=0.5)
+ax.set_xticks([0, np.pi, 2 * np.pi, 3 * np.pi, 4 * np.pi])
+ax.set_xticklabels(['0', 'π', '2π', '3π', '4π'])
+ax.axhline(0, color='black', linewidth=0.8)
+ax.grid(True)
+ax.set_title(get_display("אינטגרל מסוים של פונקציית הסינוס, בין π לבין 3π"))
+plt.savefig('integral.png')
+plt.close()
+"""
+
+HANOI_TOWERS = """import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+fig, ax = plt.subplots(figsize=(10, 10))
+for peg in range(3):
+    ax.add_patch(Rectangle((peg * 4 - 0.1, 0), 0.2, 5, color='saddlebrown'))
+colors = ['red', 'orange', 'gold', 'green', 'blue', 'purple']
+for level, width in enumerate(range(6, 0, -1)):
+    ax.add_patch(Rectangle((-width / 2 * 0.5, level * 0.6), width * 0.5, 0.5, color=colors[level]))
+ax.set_xlim(-2, 10)
+ax.set_ylim(-1, 6)
+plt.axis('equal')
+ax.axis('off')
+ax.set_title(get_display("מגדלי האנוי"))
+plt.savefig('hanoi.png')
+plt.close()
+"""
+
+# תיאור -> קוד
+CORPUS = {
+    "r=a במערכת צירים פולרית": POLAR_CIRCLE,
+    "טור פורייה": FOURIER_SERIES,
+    "פרקטל": FRACTAL,
+    "תורת הקבוצות - דיאגרמת ון": VENN_DIAGRAM,
+    "אפיציקלואיד": EPICYCLOID,
+    "sin(x+y)": IMPLICIT_SIN,
+    "אינטגרל מסוים של פונקציית הסינוס, בין π לבין 3π": DEFINITE_INTEGRAL,
+    "מגדלי האנוי": HANOI_TOWERS,
+}
@@ -0,0 +1,81 @@
+"""
+מיקרו-בנצ'מרק לתקורה הקבועה של SafeCodeExecutor.execute_code:
+בניית מרחב השמות בכל ריצה (השיטה הקודמת) מול שכפול של התבנית המוכנה.
+
+שימוש:
+    python -m benchmarks.exec_overhead --runs 2000
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from utils.config import GLOBAL_IMPORTS, GLOBAL_PATCHES
+from utils.code_executor import SafeCodeExecutor
+
+
+def rebuild_globals(executor: SafeCodeExecutor) -> dict:
+    """
+    בניית מרחב השמות כמו לפני התבנית: eval לכל ייבוא וייבוא מחדש של patches בכל ריצה
+    """
+    globals_dict = {'__builtins__': dict(executor.safe_builtins)}
+    for name, import_str in GLOBAL_IMPORTS.items():
+        if name == 'get_display':
+            from bidi.algorithm import get_display as bidi_get_display
+            globals_dict[name] = bidi_get_display
+        else:
+            globals_dict[name] = eval(import_str)
+    import matplotlib.patches
+    for name in GLOBAL_PATCHES:
+        globals_dict[name] = getattr(matplotlib.patches, name)
+    return globals_dict
+
+
+def time_per_call(func, runs: int) -> float:
+    """
+    זמן ממוצע לקריאה, במיקרו-שניות
+    """
+    func()
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the per-run execution overhead")
+    parser.add_argument('--runs', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    executor = SafeCodeExecutor()
+    code_object = executor.compile_code("x = 1")
+
+    # מודדים בלי הלוגים של כל ריצה
+    import logging
+    logging.getLogger('utils.code_executor').setLevel(logging.WARNING)
+
+    results = {
+        'runs': args.runs,
+        'rebuild_globals_us': time_per_call(lambda: rebuild_globals(executor), args.runs),
+        'template_globals_us': time_per_call(executor._new_globals, args.runs),
+        'execute_code_us': time_per_call(lambda: executor.execute_code(code_object), args.runs),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"namespace rebuild per run: {results['rebuild_globals_us']:8.1f} us")
+        print(f"namespace from template:   {results['template_globals_us']:8.1f} us")
+        print(f"execute_code (x = 1):      {results['execute_code_us']:8.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import io
+import random
+import asyncio
+import itertools
+from types import SimpleNamespace
+from google.api_core import exceptions as google_exceptions
+from benchmarks.corpus import CORPUS
+from services.gemini_service import TASK_PREFIX
+
+
+class FakeGeminiModel:
+    """
+    תחליף מקומי ל-GenerativeModel: מחזיר קוד מהקורפוס לפי התיאור שבפרומפט,
+    עם השהיה ושגיאות לפי ההגדרות. עם stream=True התשובה מגיעה בחלקים, כמו ממודל "חושב":
+    רוב ההשהיה עד החלק הראשון, אחריו הקוד שורה אחר שורה, ובסוף הסבר שאפשר לא לחכות לו
+    """
+    # חלק ההשהיה עד החלק הראשון, בזמן כתיבת הקוד ובזמן כתיבת ההסבר שאחריו
+    STREAM_PHASES = (0.7, 0.2, 0.1)
+    EXPLANATION = "\nThis code draws the requested figure with matplotlib.\n"
+    def __init__(self, latency: float = 1.0, jitter: float = 0.3,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 unique: bool = True, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.unique = unique
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._counter = itertools.count()
+
+    def _find_code(self, prompt: str) -> str:
+        # רק אחרי שורת המשימה, כדי שתיאורי הדוגמאות שלפניה לא ייבחרו במקומו
+        prompt = prompt.rsplit(TASK_PREFIX, 1)[-1]
+        # התיאור הארוך ביותר שמופיע בפרומפט, כדי ש"טור פורייה" לא ייבלע בתיאור קצר יותר
+        for description in sorted(CORPUS, key=len, reverse=True):
+            if description in prompt:
+                return CORPUS[description]
+        return CORPUS["טור פורייה"]
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        self.calls += 1
+        latency = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if stream:
+            thinking, writing, explaining = (latency * phase for phase in self.STREAM_PHASES)
+            await asyncio.sleep(thinking)
+            self._raise_error()
+            return self._stream(self._response_text(prompt), writing, explaining)
+        await asyncio.sleep(latency)
+        self._raise_error()
+        return SimpleNamespace(text=self._response_text(prompt) + self.EXPLANATION)
+
+    async def _stream(self, text: str, writing: float, explaining: float):
+        lines = text.splitlines(keepends=True)
+        for line in lines:
+            yield SimpleNamespace(text=line)
+            await asyncio.sleep(writing / len(lines))
+        await asyncio.sleep(explaining)
+        yield SimpleNamespace(text=self.EXPLANATION)
+
+    def _raise_error(self) -> None:
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            raise google_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise google_exceptions.ServiceUnavailable("503 The model is overloaded.")
+
+    def _response_text(self, prompt: str) -> str:
+        code = self._find_code(prompt)
+        if self.unique:
+            # הערה ייחודית מונעת פגיעה במטמון הרינדור, כך שכל בקשה מגיעה עד ה-worker
+            code += f"# request {next(self._counter)}\n"
+        return f"```python\n{code}```"
+
+
+class FakeMessage:
+    """
+    תחליף להודעת טלגרם: רושם את התשובות ומדמה השהיית רשת בשליחת תמונה,
+    ואם upload_kbps מוגדר - גם זמן העלאה לפי גודל התמונה
+    """
+    def __init__(self, text: str = None, send_latency: float = 0.0, events: list = None, upload_kbps: float = 0.0):
+        self.text = text
+        self.send_latency = send_latency
+        self.upload_kbps = upload_kbps
+        self.events = events if events is not None else []
+        self.photo = []
+
+    async def reply_text(self, text: str, **kwargs):
+        self.events.append(('text', text))
+        return FakeMessage(text, self.send_latency, self.events, self.upload_kbps)
+
+    async def reply_photo(self, photo=None, **kwargs):
+        size = len(photo.getvalue()) if isinstance(photo, io.BytesIO) else 0
+        upload_seconds = size * 8 / 1000 / self.upload_kbps if self.upload_kbps else 0.0
+        await asyncio.sleep(self.send_latency + upload_seconds)
+        self.events.append(('photo', size))
+        sent = FakeMessage(None, self.send_latency, self.events, self.upload_kbps)
+        sent.photo = [SimpleNamespace(file_id=f"fake-file-{id(sent)}")]
+        return sent
+
+    async def edit_text(self, text: str, **kwargs):
+        self.events.append(('edit', text))
+        return self
+
+    async def delete(self):
+        self.events.append(('delete',))
+
+
+def make_update(text: str, user_id: int, send_latency: float = 0.0, upload_kbps: float = 0.0):
+    """
+    בונה Update ו-context מזויפים להעברה ל-MathDrawingBot.handle_message
+    """
+    message = FakeMessage(text, send_latency, upload_kbps=upload_kbps)
+    user = SimpleNamespace(id=user_id, first_name=f"user{user_id}")
+    update = SimpleNamespace(
+        message=message,
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=user_id),
+        effective_message=message,
+    )
+    context = SimpleNamespace(user_data={}, chat_data={}, bot_data={})
+    return update, context
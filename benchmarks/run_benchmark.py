@@ -0,0 +1,344 @@
+"""
+בנצ'מרק מקצה לקצה של הבוט, בלי טלגרם ובלי Gemini אמיתיים.
+
+כל משתמש מדומה שולח בקשות בזו אחר זו דרך MathDrawingBot.handle_message,
+ה-Gemini המזויף מחזיר קוד מהקורפוס, והרינדור רץ במאגר ה-workers האמיתי.
+
+שימוש:
+    python -m benchmarks.run_benchmark --users 1,4,16 --requests 8 --output results.json
+    python -m benchmarks.run_benchmark --baseline results.json   # יציאה עם קוד 1 אם יש רגרסיה
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# השלבים שנמדדים, לפי סדר הטיפול בבקשה
+STAGES = ['generate', 'validate', 'render', 'send', 'total']
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    אחוזון עם אינטרפולציה לינארית בין שני הערכים הקרובים
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: list) -> dict:
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values, default=0.0),
+    }
+
+
+def _peak_rss_mb(pid) -> float:
+    """
+    שיא ה-RSS של תהליך (VmHWM) במגה-בייט, או 0 אם אי אפשר לקרוא אותו
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+class RssSampler(threading.Thread):
+    """
+    דוגם ברקע את שיא הזיכרון של תהליך הבוט ושל תהליכי הרינדור
+    """
+    def __init__(self, render_pool, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.render_pool = render_pool
+        self.interval = interval
+        self.bot_peak_mb = 0.0
+        self.worker_peak_mb = 0.0
+        self._stop_event = threading.Event()
+
+    def sample(self) -> None:
+        self.bot_peak_mb = max(self.bot_peak_mb, _peak_rss_mb('self'))
+        with self.render_pool._lock:
+            pids = [worker.process.pid for worker in self.render_pool._all_workers]
+        for pid in pids:
+            self.worker_peak_mb = max(self.worker_peak_mb, _peak_rss_mb(pid))
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+class StageTimer:
+    """
+    עוטף את המתודות של השירותים ורושם כמה זמן לקח כל שלב
+    """
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def wrap_async(self, stage: str, func):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def wrap_sync(self, stage: str, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+
+async def _run_users(bot, timer: StageTimer, descriptions: list, users: int,
+                     requests_per_user: int, send_latency: float, unique: bool,
+                     upload_kbps: float = 0.0) -> dict:
+    from benchmarks.fakes import make_update
+
+    outcomes = {'ok': 0, 'error': 0}
+    errors = {}
+    image_bytes = []
+
+    async def user(user_id: int) -> None:
+        for i in range(requests_per_user):
+            description = descriptions[(user_id + i) % len(descriptions)]
+            if unique:
+                # תיאור ייחודי כדי שמטמון הקוד לא ידלג על Gemini
+                description = f"{description} ({user_id}-{i})"
+            update, context = make_update(description, user_id, send_latency, upload_kbps)
+            await bot.handle_message(update, context)
+
+            photos = [event[1] for event in update.message.events if event[0] == 'photo']
+            if photos:
+                outcomes['ok'] += 1
+                image_bytes.extend(size for size in photos if size)
+            else:
+                outcomes['error'] += 1
+                reply = next((event[1] for event in reversed(update.message.events) if event[0] == 'edit'), '')
+                errors[reply] = errors.get(reply, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    return {'elapsed': elapsed, 'outcomes': outcomes, 'errors': errors, 'image_bytes': image_bytes}
+
+
+def run_scenario(args, users: int) -> dict:
+    """
+    מריץ תרחיש אחד עם users משתמשים במקביל ומחזיר את התוצאות
+    """
+    import bot.telegram_bot as bot_module
+    from bot.telegram_bot import MathDrawingBot
+    from utils.code_analyzer import analyze_code
+    from benchmarks.corpus import CORPUS
+    from benchmarks.fakes import FakeGeminiModel
+
+    bot = MathDrawingBot()
+    fake_model = FakeGeminiModel(
+        latency=args.gemini_latency,
+        jitter=args.gemini_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        unique=not args.warm_cache,
+        seed=args.seed,
+    )
+    bot.gemini_service.model = fake_model
+    # בבנצ'מרק לא רוצים לחכות שנייה שלמה לכל retry
+    bot.gemini_service.retry_delay = args.retry_delay
+    bot.gemini_service.stream = not args.no_stream
+
+    timer = StageTimer()
+    bot.gemini_service.generate_code_async = timer.wrap_async('generate', bot.gemini_service.generate_code_async)
+    bot_module.analyze_code = timer.wrap_sync('validate', analyze_code)
+    bot.render_pool.render_async = timer.wrap_async('render', bot.render_pool.render_async)
+    bot.handle_message = timer.wrap_async('total', bot.handle_message)
+
+    from benchmarks import fakes
+    original_reply_photo = fakes.FakeMessage.reply_photo
+    fakes.FakeMessage.reply_photo = timer.wrap_async('send', original_reply_photo)
+
+    sampler = RssSampler(bot.render_pool)
+    sampler.start()
+    try:
+        if args.warm_cache:
+            # סבב חימום שממלא את המטמונים, ואז נמדדים רק הסבבים החמים
+            asyncio.run(_run_users(bot, StageTimer(), list(CORPUS), 1, len(CORPUS), 0.0, False))
+            timer.samples = {stage: [] for stage in STAGES}
+        result = asyncio.run(_run_users(
+            bot, timer, list(CORPUS), users, args.requests, args.send_latency, not args.warm_cache,
+            args.upload_kbps
+        ))
+    finally:
+        fakes.FakeMessage.reply_photo = original_reply_photo
+        bot_module.analyze_code = analyze_code
+        sampler.stop()
+        bot.render_pool.close()
+
+    return {
+        'users': users,
+        'requests': users * args.requests,
+        'elapsed_seconds': result['elapsed'],
+        'renders_per_second': result['outcomes']['ok'] / result['elapsed'] if result['elapsed'] else 0.0,
+        'outcomes': result['outcomes'],
+        'errors': result['errors'],
+        'stages': {stage: summarize(samples) for stage, samples in timer.samples.items()},
+        'image_bytes': summarize(result['image_bytes']),
+        'gemini': {
+            'calls': fake_model.calls,
+            'retries': bot.gemini_service.retry_count,
+            'rate_limited': bot.gemini_service.rate_limited_count,
+        },
+        'peak_rss_mb': {
+            'bot': sampler.bot_peak_mb,
+            'render_worker': sampler.worker_peak_mb,
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    for scenario in report['scenarios']:
+        print(
+            f"\nusers={scenario['users']} requests={scenario['requests']} "
+            f"elapsed={scenario['elapsed_seconds']:.2f}s "
+            f"renders/sec={scenario['renders_per_second']:.2f} "
+            f"ok={scenario['outcomes']['ok']} error={scenario['outcomes']['error']}"
+        )
+        print(f"  {'stage':<10}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for stage, stats in scenario['stages'].items():
+            print(
+                f"  {stage:<10}{stats['count']:>7}"
+                f"{stats['p50'] * 1000:>8.0f}ms{stats['p95'] * 1000:>8.0f}ms{stats['p99'] * 1000:>8.0f}ms"
+            )
+        print(
+            f"  image bytes: mean={scenario['image_bytes']['mean'] / 1024:.0f}KB "
+            f"p95={scenario['image_bytes']['p95'] / 1024:.0f}KB"
+        )
+        print(
+            f"  peak RSS: bot={scenario['peak_rss_mb']['bot']:.0f}MB "
+            f"render worker={scenario['peak_rss_mb']['render_worker']:.0f}MB"
+        )
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    משווה לתוצאות קודמות: p95 מקצה לקצה, קצב רינדורים ושיא זיכרון
+    """
+    regressions = []
+    previous = {scenario['users']: scenario for scenario in baseline.get('scenarios', [])}
+    for scenario in report['scenarios']:
+        old = previous.get(scenario['users'])
+        if old is None:
+            continue
+        users = scenario['users']
+        checks = [
+            ('total p95', old['stages']['total']['p95'], scenario['stages']['total']['p95'], True),
+            ('renders/sec', old['renders_per_second'], scenario['renders_per_second'], False),
+            ('worker peak RSS', old['peak_rss_mb']['render_worker'], scenario['peak_rss_mb']['render_worker'], True),
+            ('mean image bytes', old.get('image_bytes', {}).get('mean'), scenario['image_bytes']['mean'], True),
+        ]
+        for name, old_value, new_value, lower_is_better in checks:
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change if lower_is_better else -change) > tolerance:
+                regressions.append(f"users={users}: {name} {old_value:.3f} -> {new_value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the drawing bot")
+    parser.add_argument('--users', default='1,4,16', help="comma separated concurrent user counts")
+    parser.add_argument('--requests', type=int, default=8, help="requests sent by each user")
+    parser.add_argument('--gemini-latency', type=float, default=1.0, help="fake Gemini latency in seconds")
+    parser.add_argument('--gemini-jitter', type=float, default=0.3, help="random +/- latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of Gemini calls failing with 503")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of Gemini calls failing with 429")
+    parser.add_argument('--no-stream', action='store_true', help="wait for the full Gemini response instead of streaming")
+    parser.add_argument('--retry-delay', type=float, default=0.1, help="base Gemini retry delay in seconds")
+    parser.add_argument('--send-latency', type=float, default=0.2, help="fake Telegram upload latency in seconds")
+    parser.add_argument('--upload-kbps', type=float, default=0.0,
+                        help="simulated upload bandwidth, adds size-proportional send time (0 disables)")
+    parser.add_argument('--workers', type=int, help="render worker processes (default RENDER_WORKERS or CPU count)")
+    parser.add_argument('--warm-cache', action='store_true', help="measure repeated requests served from the caches")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--json', action='store_true', help="print the JSON report instead of the table")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    # הבוט דורש מפתחות, והמכסה של Gemini לא רלוונטית מול המודל המזויף
+    os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    os.environ.setdefault('GEMINI_RPM', '1000000')
+    os.environ.setdefault('GEMINI_BURST', '1000')
+    os.environ.setdefault('GEMINI_MAX_QUEUE', '100000')
+    os.environ.setdefault('SCHEDULER_MAX_ACTIVE', '1000')
+    os.environ.setdefault('SCHEDULER_MAX_QUEUE', '100000')
+    if args.workers:
+        os.environ['RENDER_WORKERS'] = str(args.workers)
+    cache_dir = tempfile.TemporaryDirectory(prefix='render-cache-')
+    os.environ['RENDER_CACHE_DIR'] = cache_dir.name
+
+    import bot.telegram_bot  # noqa: F401 - מגדיר את הלוגים, ואז משתיקים אותם
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'json', 'baseline')},
+        'scenarios': [],
+    }
+    with cache_dir:
+        for users in [int(value) for value in args.users.split(',') if value.strip()]:
+            report['scenarios'].append(run_scenario(args, users))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+בנצ'מרק לזמן העלייה של הבוט: כמה זמן עובר מהפעלת התהליך ועד שהבוט מוכן לקבל עדכונים,
+ואילו מודולים כבדים כבר נטענו עד אז. כל מדידה רצה בתהליך Python חדש (cold start).
+
+שימוש:
+    python -m benchmarks.startup_time --runs 5
+    python -m benchmarks.startup_time --max-ready-seconds 1.5   # נכשל אם העלייה איטית מזה
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# מודולים שאמורים להיטען רק ברקע או בתהליכי הרינדור, ולא לפני שהבוט מוכן
+HEAVY_MODULES = ('google.generativeai', 'google.api_core', 'matplotlib', 'numpy', 'PIL')
+
+# התוכנית שרצה בכל תהליך מדידה
+CHILD_PROGRAM = """
+import sys, time, json
+start = time.perf_counter()
+import bot.telegram_bot as bot_module
+imported = time.perf_counter()
+bot = bot_module.MathDrawingBot()
+bot.build_application()
+ready = time.perf_counter()
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+warm_up = None
+if WARM_UP:
+    bot._warm_up()
+    warm_up = time.perf_counter() - ready
+    if bot._render_pool:
+        bot._render_pool.close()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'ready_seconds': ready - start,
+    'warm_up_seconds': warm_up,
+    'heavy_modules_at_ready': loaded,
+}))
+"""
+
+
+def measure_once(warm_up: bool) -> dict:
+    """
+    מריץ תהליך חדש אחד ומחזיר את הזמנים שלו, כולל זמן העלייה של המפרש עצמו
+    """
+    env = dict(os.environ)
+    env.setdefault('TELEGRAM_TOKEN', 'benchmark')
+    env.setdefault('GEMINI_API_KEY', 'benchmark')
+    env['METRICS_PORT'] = '0'
+    env.setdefault('RENDER_CACHE_DIR', tempfile.mkdtemp(prefix="startup-cache-"))
+    program = f"HEAVY_MODULES = {HEAVY_MODULES!r}\nWARM_UP = {warm_up!r}\n{CHILD_PROGRAM}"
+
+    import time
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', program],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - start
+    return result
+
+
+def median(values: list) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the bot entry point")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-warm-up', action='store_true', help="skip timing the background warm-up")
+    parser.add_argument('--max-ready-seconds', type=float, help="exit with 1 if the median time to ready is above this")
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once(not args.no_warm_up) for _ in range(args.runs)]
+    results = {
+        'runs': args.runs,
+        'import_seconds': median([run['import_seconds'] for run in runs]),
+        'ready_seconds': median([run['ready_seconds'] for run in runs]),
+        'heavy_modules_at_ready': sorted({name for run in runs for name in run['heavy_modules_at_ready']}),
+    }
+    if not args.no_warm_up:
+        results['warm_up_seconds'] = median([run['warm_up_seconds'] for run in runs])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"import bot.telegram_bot:  {results['import_seconds']:6.3f} s")
+        print(f"ready for updates:        {results['ready_seconds']:6.3f} s")
+        if 'warm_up_seconds' in results:
+            print(f"background warm-up:       {results['warm_up_seconds']:6.3f} s")
+        print(f"heavy modules at ready:   {', '.join(results['heavy_modules_at_ready']) or '-'}")
+
+    if args.max_ready_seconds is not None and results['ready_seconds'] > args.max_ready_seconds:
+        print(f"FAIL: ready after {results['ready_seconds']:.3f}s (limit {args.max_ready_seconds}s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import io
+from types import SimpleNamespace
+
+from services.batch_service import BatchResult
+
+
+class _StatusMessage:
+    """
+    הודעת ההתקדמות של תיאור אחד בדף העבודה: לא נשלחת לטלגרם, רק זוכרת את הטקסט האחרון
+    (ההודעה הסופית של בקשה שנכשלה היא סיבת הכישלון)
+    """
+    def __init__(self, text: str):
+        self.text = text
+
+    async def edit_text(self, text: str, **kwargs):
+        self.text = text
+        return self
+
+    async def delete(self):
+        return True
+
+
+class BatchItemMessage:
+    """
+    מחליף את update.message עבור תיאור אחד מתוך דף עבודה, כדי שהוא יעבור את אותו מסלול
+    כמו הודעה רגילה (מטמונים, איחוד בקשות, תיקון קוד, מדדים): במקום לשלוח את התמונה
+    לצ'אט היא נשמרת, והבוט שולח את כל התוצאות יחד בקבוצות מדיה או בקובץ אחד
+    """
+    def __init__(self, index: int, description: str):
+        self.index = index
+        self.text = description
+        self.status = None
+        self.photo = None
+
+    async def reply_text(self, text: str, **kwargs):
+        self.status = _StatusMessage(text)
+        return self.status
+
+    async def reply_photo(self, photo, **kwargs):
+        # BytesIO של תמונה חדשה, או file_id של תמונה שכבר נשלחה לטלגרם
+        self.photo = photo
+        return SimpleNamespace(photo=[])
+
+    def result(self) -> BatchResult:
+        if isinstance(self.photo, io.BytesIO):
+            return BatchResult(self.index, self.text, image=self.photo.getvalue())
+        if isinstance(self.photo, str):
+            return BatchResult(self.index, self.text, file_id=self.photo)
+        return BatchResult(self.index, self.text, error=self.status.text if self.status else None)
@@ -0,0 +1,120 @@
+import time
+import asyncio
+import logging
+from telegram.error import BadRequest, RetryAfter
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class ProgressMessage:
+    """
+    עוטף את הודעת "מעבד את הבקשה שלך..." ומעדכן אותה בשלבים בלי לחרוג ממגבלות העריכה של טלגרם:
+    - update() לא ממתין לרשת: אם העריכה הקודמת הייתה לפני פחות מ-min_interval שניות,
+      הטקסט נשמר ונשלח בסוף ההשהיה, וכל עדכון חדש יותר מחליף אותו
+    - טקסט זהה לטקסט הנוכחי לא נשלח (טלגרם מחזיר עליו שגיאה)
+    - RetryAfter דוחה את העריכה הבאה במשך הזמן שטלגרם ביקש
+    edit_text() ו-delete() הם למצבים סופיים: הם מבטלים עדכון ממתין ורצים מיד
+    """
+    def __init__(self, message, min_interval: float = 2.0):
+        self.message = message
+        self.min_interval = min_interval
+        self.text = getattr(message, 'text', None)
+        self.edits = 0
+        self.dropped = 0
+        self._pending = None
+        self._flush_task = None
+        self._next_edit = time.monotonic() + min_interval
+        self._closed = False
+
+    def update(self, text: str) -> None:
+        """
+        מבקש לעדכן את ההודעה לשלב חדש (בלי להמתין)
+        """
+        if self._closed or text == (self._pending or self.text):
+            return
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = text
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            while self._pending is not None and not self._closed:
+                delay = self._next_edit - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                text, self._pending = self._pending, None
+                if text == self.text:
+                    continue
+                try:
+                    await self._edit(text)
+                except RetryAfter as e:
+                    logger.warning(f"Progress edit throttled by Telegram for {e.retry_after}s")
+                    self._next_edit = time.monotonic() + float(e.retry_after)
+                    if self._pending is None:
+                        self._pending = text
+                except Exception as e:
+                    logger.warning(f"Could not update progress message: {str(e)}")
+        finally:
+            self._flush_task = None
+
+    async def _edit(self, text: str) -> None:
+        self._next_edit = time.monotonic() + self.min_interval
+        await self.message.edit_text(text)
+        self.text = text
+        self.edits += 1
+
+    def _cancel_pending(self) -> None:
+        self._pending = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    async def edit_text(self, text: str, **kwargs):
+        """
+        עריכה מיידית (הודעת שגיאה או מצב סופי אחר)
+        """
+        self._cancel_pending()
+        if text == self.text:
+            return self.message
+        try:
+            result = await self.message.edit_text(text, **kwargs)
+        except BadRequest as e:
+            # "message is not modified" - ההודעה כבר מציגה את הטקסט הזה
+            logger.warning(f"Could not edit progress message: {str(e)}")
+            return self.message
+        self.text = text
+        self.edits += 1
+        self._next_edit = time.monotonic() + self.min_interval
+        return result
+
+    async def delete(self):
+        self._closed = True
+        self._cancel_pending()
+        return await self.message.delete()
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: עשרה עדכונים מהירים הופכים לשתי עריכות בלבד
+    class PrintMessage:
+        text = "מעבד..."
+
+        async def edit_text(self, text: str, **kwargs):
+            print(f"{time.monotonic():.1f} edit: {text}")
+
+        async def delete(self):
+            print("deleted")
+
+    async def main():
+        progress = ProgressMessage(PrintMessage(), min_interval=0.5)
+        for lines in range(10):
+            progress.update(f"כותב את הקוד... ({lines} שורות)")
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(0.6)
+        await progress.delete()
+        print(f"edits={progress.edits} dropped={progress.dropped}")
+
+    asyncio.run(main())
@@ -0,0 +1,217 @@
+import os
+import sys
+import signal
+import socket
+import logging
+import asyncio
+from pathlib import Path
+from functools import partial
+from types import SimpleNamespace
+from telegram import Bot
+from telegram.error import BadRequest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bot.telegram_bot import MathDrawingBot
+from services.job_queue import JobQueue
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class SentReply:
+    """
+    תשובה שכבר נשלחה במסירה קודמת של העבודה: לא נשלחת שוב, אבל אפשר לערוך או למחוק אותה
+    (למשל הודעת "מעבד את הבקשה שלך..." של המסירה הקודמת)
+    """
+    def __init__(self, bot: Bot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = None
+        self.photo = ()
+
+    async def edit_text(self, text: str, **kwargs):
+        return await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+
+    async def delete(self):
+        try:
+            return await self.bot.delete_message(self.chat_id, self.message_id)
+        except BadRequest as e:
+            # המסירה הקודמת כבר מחקה אותה
+            logger.info(f"Earlier reply {self.message_id} is already gone: {str(e)}")
+            return False
+
+
+class QueuedMessage:
+    """
+    מחליף את update.message עבור עבודה מהתור: התשובות נשלחות דרך ה-Bot API כתגובה להודעה המקורית.
+    כל תשובה (טקסט, תמונה, קבוצת תמונות או קובץ) נרשמת בתור מיד אחרי השליחה לפי מפתח שנגזר
+    מהתוכן שלה, ובמסירה חוזרת של העבודה תשובה עם מפתח שכבר נרשם לא נשלחת שוב - כך גם
+    דף עבודה שנקטע באמצע ממשיך רק עם השרטוטים שעוד לא נשלחו
+    """
+    def __init__(self, bot: Bot, job_queue: JobQueue, job):
+        self.bot = bot
+        self.job_queue = job_queue
+        self.job = job
+        self.chat_id = job.chat_id
+        self.message_id = job.message_id
+        self.text = job.payload['text']
+
+    async def _reply(self, key: str, send):
+        if key in self.job.replies:
+            logger.info(f"Job {self.job.update_id} already sent {key!r}, not sending it again")
+            return SentReply(self.bot, self.chat_id, self.job.replies[key])
+        sent = await send(reply_to_message_id=self.message_id, allow_sending_without_reply=True)
+        await self._record({key: sent.message_id})
+        return sent
+
+    async def _record(self, replies: dict) -> None:
+        self.job.replies.update(replies)
+        await asyncio.to_thread(self.job_queue.record_replies, self.job.update_id, replies)
+
+    @staticmethod
+    def _photo_key(caption) -> str:
+        # תמונה מזוהה לפי הכיתוב: בדף עבודה הוא מתחיל במספר השורה, ובשרטוט בודד יש רק אחת
+        return f"photo:{caption or ''}"
+
+    async def reply_text(self, text: str, **kwargs):
+        return await self._reply(f"text:{text}", partial(self.bot.send_message, self.chat_id, text, **kwargs))
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self._reply(
+            self._photo_key(kwargs.get('caption')), partial(self.bot.send_photo, self.chat_id, photo, **kwargs)
+        )
+
+    # תשובות של דף עבודה (/batch)
+    async def reply_media_group(self, media, **kwargs):
+        """
+        כל תמונה בקבוצה נרשמת בנפרד: במסירה חוזרת הקבוצות מתחלקות אחרת (לפי סדר הסיום),
+        ורק התמונות שעוד לא נשלחו נשלחות
+        """
+        pending = [item for item in media if self._photo_key(item.caption) not in self.job.replies]
+        if len(pending) < len(media):
+            logger.info(f"Job {self.job.update_id} already sent {len(media) - len(pending)} of the photos")
+        if not pending:
+            return ()
+        if len(pending) == 1:
+            item = pending[0]
+            return (await self.reply_photo(item.media, caption=item.caption, **kwargs),)
+        sent = await self.bot.send_media_group(
+            self.chat_id, pending,
+            reply_to_message_id=self.message_id, allow_sending_without_reply=True, **kwargs
+        )
+        await self._record({
+            self._photo_key(item.caption): message.message_id for item, message in zip(pending, sent)
+        })
+        return sent
+
+    async def reply_document(self, document, **kwargs):
+        key = f"document:{kwargs.get('filename') or ''}"
+        return await self._reply(key, partial(self.bot.send_document, self.chat_id, document, **kwargs))
+
+
+class QueueWorker:
+    """
+    תהליך עבודה שצורך את תור העבודות: לוקח עבודות, מריץ אותן דרך MathDrawingBot
+    (כולל המטמונים, המתזמן ומאגר הרינדור שלו) ומסמן אותן כגמורות.
+    אפשר להריץ כמה תהליכים כאלה על אותו קובץ תור
+    """
+    def __init__(self):
+        self.drawing_bot = MathDrawingBot(use_job_queue=False)
+        queue_path = os.getenv('JOB_QUEUE_PATH')
+        if not queue_path:
+            raise ValueError("JOB_QUEUE_PATH is not set!")
+        self.job_queue = JobQueue(
+            queue_path,
+            lease_seconds=float(os.getenv('JOB_QUEUE_LEASE_SECONDS', 120)),
+            max_attempts=int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', 3))
+        )
+        self.concurrency = int(os.getenv('QUEUE_WORKER_CONCURRENCY', 8))
+        self.poll_interval = float(os.getenv('QUEUE_POLL_INTERVAL', 0.5))
+        self.drain_timeout = float(os.getenv('QUEUE_DRAIN_TIMEOUT', 45))
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._running = {}
+        self._stopping = None
+
+    async def _handle(self, bot: Bot, job) -> None:
+        try:
+            # עבודה שנמסרת שוב רצה מההתחלה (המטמונים חוסכים את רוב העבודה),
+            # ותשובות שכבר נשלחו לא נשלחות שוב - ראו QueuedMessage
+            message = QueuedMessage(bot, self.job_queue, job)
+            update = SimpleNamespace(
+                update_id=job.update_id,
+                message=message,
+                effective_message=message,
+                effective_user=SimpleNamespace(id=job.user_id),
+                effective_chat=SimpleNamespace(id=job.chat_id)
+            )
+            if job.payload.get('batch'):
+                await self.drawing_bot._schedule_batch(update, message.text, job.payload['batch'], bot)
+            else:
+                await self.drawing_bot._schedule(update, message.text, job.payload.get('use_cache', True))
+            await asyncio.to_thread(self.job_queue.complete, job.update_id)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.job_queue.release, job)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.update_id} failed: {str(e)}")
+            await asyncio.to_thread(self.job_queue.release, job, str(e))
+        finally:
+            self._running.pop(job.update_id, None)
+
+    async def _heartbeat(self) -> None:
+        """
+        מאריך את ה-lease של העבודות שרצות, כדי שלא יימסרו לתהליך אחר באמצע
+        """
+        while True:
+            await asyncio.sleep(self.job_queue.lease_seconds / 3)
+            await asyncio.to_thread(self.job_queue.extend, list(self._running), self.name)
+
+    async def run(self) -> None:
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        # מאגר הרינדור ומודל Gemini נטענים ברקע בזמן שכבר לוקחים עבודות
+        await self.drawing_bot._post_init(None)
+        # מדדי השלבים, הרינדור ו-Gemini של העבודות נאספים בתהליך הזה, ולכן הוא מגיש אותם בעצמו
+        self.drawing_bot.start_metrics_server()
+
+        async with Bot(self.drawing_bot.token) as bot:
+            heartbeat = asyncio.create_task(self._heartbeat())
+            logger.info(f"Queue worker {self.name} started")
+            try:
+                while not self._stopping.is_set():
+                    free = self.concurrency - len(self._running)
+                    jobs = await asyncio.to_thread(self.job_queue.claim, self.name, free) if free > 0 else []
+                    for job in jobs:
+                        self._running[job.update_id] = asyncio.create_task(self._handle(bot, job))
+                    if not jobs:
+                        try:
+                            await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                        except asyncio.TimeoutError:
+                            pass
+
+                # ניקוז: מחכים לעבודות שרצות, ומה שלא הספיק חוזר לתור לתהליך אחר
+                logger.info(f"Draining {len(self._running)} running jobs...")
+                tasks = list(self._running.values())
+                if tasks:
+                    _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+            finally:
+                heartbeat.cancel()
+                await self.drawing_bot.cleanup(None)
+                await asyncio.to_thread(self.job_queue.purge)
+        logger.info(f"Queue worker {self.name} stopped")
+
+
+def main() -> None:
+    asyncio.run(QueueWorker().run())
+
+
+if __name__ == "__main__":
+    main()
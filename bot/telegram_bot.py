@@ -1,25 +1,44 @@
+import io
 import os
+import sys
+import time
 import logging
 import asyncio
+import threading
+import subprocess
 from pathlib import Path
-from dotenv import load_dotenv
-from telegram import Update
+from types import SimpleNamespace
+from telegram import Update, InputMediaPhoto
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
-from telegram.error import NetworkError, TimedOut
+from telegram.error import BadRequest, NetworkError, TimedOut
 
-import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
-from services.gemini_service import GeminiService
-from services.renderer_service import RendererService
+from bot.progress_message import ProgressMessage
+from bot.batch_message import BatchItemMessage
+from services.gemini_service import GeminiService, GeminiRateLimitError, GeminiBusyError
+from services.render_pool import RenderPool
+from services.code_cache import CodeCache, description_key
+from services.fast_path_service import FastPathService
+from services.render_cache import RenderCache, code_hash, image_format, image_filename, render_settings
+from services.single_flight import SingleFlight
+from services.fair_scheduler import FairScheduler, SchedulerBusyError, JobSuperseded
+from services.job_queue import JobQueue
+from services.batch_service import BatchRunner, OUTPUTS, parse_descriptions, pack_zip, pack_pdf
+from services.session_store import SessionStore
+from services.metrics import (
+    REGISTRY, RequestTrace, MetricsServer, CACHE_REQUESTS, REJECTIONS, REPAIRS, ROUND_TRIPS_SAVED,
+    RESUBMISSIONS, BATCH_ITEMS, SESSION_EDITS
+)
+from utils.code_executor import RenderTooExpensiveError, CodeExecutionError
+from utils.code_analyzer import analyze_code
+from utils.code_repair import CodeFailure, repair_code
+from utils.code_editor import parse_edit_request, edit_code
+from utils.config import get_render_limits
 
 # ביטול לוגים של HTTPX
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-# טעינת משתני הסביבה מהתיקייה הראשית של הפרויקט
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
-
 # הגדרת לוגים
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -27,15 +46,185 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# טלגרם מקבל עד 10 תמונות בקבוצת מדיה אחת
+MEDIA_GROUP_SIZE = 10
+# קובץ טקסט של דף עבודה גדול מזה לא נקרא
+BATCH_MAX_FILE_BYTES = 256 * 1024
+
 class MathDrawingBot:
-    def __init__(self):
+    def __init__(self, use_job_queue: bool = True):
+        """
+        use_job_queue - כשמוגדר JOB_QUEUE_PATH, התהליך הזה רק מקבל עדכונים ומכניס אותם לתור,
+        ותהליכי bot.queue_worker מייצרים את השרטוטים. תהליכי העבודה עצמם יוצרים את הבוט עם False
+        """
         self.token = os.getenv('TELEGRAM_TOKEN')
         if not self.token:
             raise ValueError("Telegram token not found!")
         
+        # הגדרות מקביליות - handler שממתין בתור של המתזמן כמעט לא עולה כלום,
+        # ולכן המגבלה כאן גבוהה והעומס האמיתי נשלט על ידי המתזמן
+        self.max_concurrent_updates = int(os.getenv('MAX_CONCURRENT_UPDATES', 256))
+
+        # מרווח מינימלי בין עריכות של הודעת ההתקדמות (טלגרם מגביל עריכות לכל צ'אט)
+        self.progress_edit_interval = float(os.getenv('PROGRESS_EDIT_INTERVAL', 2.0))
+        # בקשות שרצות כרגע, לפי משתמש ותיאור, כדי לזהות שליחה חוזרת של אותה בקשה
+        self._in_progress = {}
+
+        # דפי עבודה (/batch): מספר התיאורים המקסימלי, כמה מהם רצים במקביל,
+        # וצורת הפלט כברירת מחדל (photos - קבוצות מדיה, zip או pdf - קובץ אחד)
+        self.batch_max_items = int(os.getenv('BATCH_MAX_ITEMS', 50))
+        self.batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', 4))
+        self.batch_output = os.getenv('BATCH_OUTPUT', 'photos').lower()
+        self.render_workers = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+
+        # מגבלות להערכה הסטטית של עלות הקוד, לפני שהוא נשלח לרינדור
+        render_limits = get_render_limits()
+        self.max_array_elements = render_limits['MAX_ARRAY_ELEMENTS']
+        self.max_loop_iterations = render_limits['MAX_LOOP_ITERATIONS']
+
+        # תור עבודות מתמיד (אופציונלי): העדכונים נכנסים לתור ותהליכי עבודה צורכים אותו
+        queue_path = os.getenv('JOB_QUEUE_PATH')
+        self.job_queue = None
+        if use_job_queue and queue_path:
+            self.job_queue = JobQueue(
+                queue_path,
+                lease_seconds=float(os.getenv('JOB_QUEUE_LEASE_SECONDS', 120)),
+                max_attempts=int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', 3))
+            )
+        self.queue_workers = int(os.getenv('QUEUE_WORKERS', 2))
+        # השלבים של בקשה מהתור נמדדים בתהליכי העבודה: כל אחד מגיש /metrics משלו,
+        # על הפורט הזה ועל הבאים אחריו (0 מבטל)
+        self.queue_worker_metrics_port = int(os.getenv('QUEUE_WORKER_METRICS_PORT', 9465))
+        self.worker_processes = []
+
         # Initialize services
         self.gemini_service = GeminiService()
-        self.renderer_service = RendererService()
+        self.fast_path = FastPathService()
+        # מאגר הרינדור נוצר ברקע אחרי שהבוט עלה, ראו render_pool
+        self._render_pool = None
+        self._render_pool_lock = threading.Lock()
+        self._warm_up_task = None
+
+        # מטמון קוד לפי תיאור מנורמל - נשמר רק קוד שרונדר בהצלחה
+        self.code_cache = CodeCache(
+            max_entries=int(os.getenv('CODE_CACHE_MAX_ENTRIES', 1000)),
+            ttl_seconds=int(os.getenv('CODE_CACHE_TTL_SECONDS', 24 * 60 * 60))
+        )
+
+        # מטמון תמונות מתמיד לפי hash של הקוד והגדרות הרינדור, כולל file_id של טלגרם
+        self.render_cache = RenderCache(
+            os.getenv('RENDER_CACHE_DIR', Path(__file__).parent.parent / "cache" / "renders"),
+            max_bytes=int(os.getenv('RENDER_CACHE_MAX_MB', 512)) * 1024 * 1024,
+            settings=render_settings()
+        )
+
+        # השרטוט האחרון של כל צ'אט, כדי שבקשת המשך תערוך אותו במקום לייצר מחדש
+        self.sessions = SessionStore(
+            max_sessions=int(os.getenv('SESSION_MAX_CHATS', 10000)),
+            max_bytes=int(os.getenv('SESSION_MAX_MB', 64)) * 1024 * 1024,
+            ttl_seconds=int(os.getenv('SESSION_TTL_SECONDS', 6 * 60 * 60))
+        )
+
+        # איחוד בקשות זהות שרצות במקביל (למשל כל הכיתה שולחת את אותה משימה)
+        self.generate_flight = SingleFlight("generate")
+        self.render_flight = SingleFlight("render")
+        self.repair_flight = SingleFlight("repair")
+
+        # תזמון הוגן בין משתמשים: תור לכל משתמש, מגבלת עבודות במקביל לכל משתמש ובסך הכל,
+        # ובקשה חדשה של משתמש מחליפה בקשה קודמת שלו שעוד לא התחילה
+        self.scheduler = FairScheduler(
+            max_active=int(os.getenv('SCHEDULER_MAX_ACTIVE', 16)),
+            max_per_user=int(os.getenv('SCHEDULER_MAX_PER_USER', 1)),
+            max_queue=int(os.getenv('SCHEDULER_MAX_QUEUE', 100)),
+            max_user_queue=int(os.getenv('SCHEDULER_MAX_USER_QUEUE', 5))
+        )
+
+        # מצב קבלת העדכונים: polling (ברירת מחדל) או webhook
+        self.mode = os.getenv('BOT_MODE', 'polling').lower()
+        self.webhook_url = os.getenv('WEBHOOK_URL')
+        self.webhook_listen = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        self.webhook_port = int(os.getenv('WEBHOOK_PORT', 8443))
+        self.webhook_path = os.getenv('WEBHOOK_PATH', 'telegram')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET')
+        if self.mode == 'webhook' and not self.webhook_url:
+            raise ValueError("WEBHOOK_URL is required in webhook mode!")
+
+        # מדדים בפורמט Prometheus על פורט מקומי (0 מבטל)
+        self.metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics_port = int(os.getenv('METRICS_PORT', 9464))
+        self.metrics_server = None
+        self._register_gauges()
+
+    @property
+    def render_pool(self) -> RenderPool:
+        """
+        כל רינדור רץ בתהליך נפרד, כך שמצב pyplot וזיכרון לא נשארים בתהליך הבוט.
+        המאגר נוצר בגישה הראשונה (בדרך כלל ב-_warm_up, ברקע), כי הפעלת התהליכים
+        לוקחת זמן. כשיש תור עבודות הרינדור קורה בתהליכי העבודה, ואין כאן מאגר
+        """
+        if self._render_pool is None and self.job_queue is None:
+            with self._render_pool_lock:
+                if self._render_pool is None:
+                    self._render_pool = RenderPool(
+                        workers=self.render_workers,
+                        max_jobs_per_worker=int(os.getenv('RENDER_MAX_JOBS_PER_WORKER', 50)),
+                        max_worker_rss_mb=int(os.getenv('RENDER_MAX_WORKER_RSS_MB', 512))
+                    )
+        return self._render_pool
+
+    def _warm_up(self) -> None:
+        """Build the heavy services (render workers, Gemini client) so the first request does not wait for them"""
+        start = time.perf_counter()
+        self.render_pool
+        if self.job_queue is None:
+            self.gemini_service.model
+        logger.info(f"Services warmed up in {time.perf_counter() - start:.2f}s")
+
+    async def _post_init(self, application: Application) -> None:
+        """Start warming up in the background; updates are accepted right away"""
+        self._warm_up_task = asyncio.create_task(asyncio.to_thread(self._warm_up))
+
+    def _register_gauges(self) -> None:
+        """Expose the current state of the services, read only when /metrics is scraped"""
+        limiter = self.gemini_service.concurrency_limiter
+        gemini = REGISTRY.gauge(
+            'drawing_gemini_concurrency', 'Gemini concurrency limiter state', ('state',)
+        )
+        gemini.set_function(lambda: int(limiter.limit), state='limit')
+        gemini.set_function(lambda: limiter.in_flight, state='in_flight')
+        gemini.set_function(lambda: limiter.queue_length, state='queued')
+
+        in_flight = REGISTRY.gauge(
+            'drawing_in_flight_requests', 'Coalesced requests currently running', ('stage',)
+        )
+        in_flight.set_function(lambda: self.generate_flight.stats()['in_flight'], stage='generate')
+        in_flight.set_function(lambda: self.render_flight.stats()['in_flight'], stage='render')
+
+        scheduler = REGISTRY.gauge(
+            'drawing_scheduler_jobs', 'Jobs in the per-user fair scheduler', ('state',)
+        )
+        scheduler.set_function(lambda: self.scheduler.active, state='active')
+        scheduler.set_function(lambda: self.scheduler.queued, state='queued')
+        REGISTRY.gauge(
+            'drawing_scheduler_users', 'Users with queued or running jobs'
+        ).set_function(lambda: self.scheduler.stats()['users'])
+
+        sessions = REGISTRY.gauge(
+            'drawing_sessions', 'Chats whose last drawing is kept for follow-up edits', ('state',)
+        )
+        sessions.set_function(lambda: self.sessions.stats()['sessions'], state='chats')
+        sessions.set_function(lambda: self.sessions.stats()['bytes'], state='bytes')
+
+        REGISTRY.gauge(
+            'drawing_prompt_examples', 'Rendered descriptions kept as few-shot examples for Gemini prompts'
+        ).set_function(lambda: self.gemini_service.examples.stats()['examples'])
+
+        if self.job_queue:
+            job_queue = REGISTRY.gauge(
+                'drawing_job_queue_jobs', 'Jobs in the persistent job queue', ('status',)
+            )
+            for status in ('queued', 'running', 'failed'):
+                job_queue.set_function(lambda status=status: self.job_queue.stats()[status], status=status)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """טיפול בפקודת /start"""
@@ -64,7 +253,11 @@ class MathDrawingBot:
             "💡 טיפים להצלחה:\n"
             "• נסחו את הבקשה בצורה ברורה ופשוטה\n"
             "• הימנעו מבקשות עם יותר מדי פרטים בבת אחת\n"
-            "• אם התוצאה לא מדויקת, נסו לנסח את הבקשה אחרת\n\n"
+            "• אם התוצאה לא מדויקת, נסו לנסח את הבקשה אחרת\n"
+            "• כדי לקבל שרטוט חדש לבקשה האחרונה, השתמשו בפקודה /redraw\n"
+            "• כדי לשנות את השרטוט האחרון, פשוט כתבו מה לשנות: 'עכשיו עם רדיוס 5', 'תוסיף רשת'\n"
+            "• לדף עבודה שלם: /batch ואחריו תיאור בכל שורה, או קובץ טקסט. "
+            "הוסיפו zip או pdf אחרי הפקודה כדי לקבל קובץ אחד\n\n"
             "🎨 סגנון התצוגה:\n"
             "• צורות גיאומטריות: רקע נקי\n"
             "• פונקציות וגרפים: כולל מערכת צירים\n"
@@ -74,37 +267,415 @@ class MathDrawingBot:
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle regular text messages"""
+        # /redraw draws the last full description again, not a follow-up edit of it
+        if not parse_edit_request(update.message.text).is_follow_up:
+            context.user_data['last_description'] = update.message.text
+        await self._submit(update, update.message.text)
+
+    async def redraw(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """טיפול בפקודת /redraw - יצירה מחדש של הבקשה האחרונה, בלי המטמון"""
+        description = context.user_data.get('last_description')
+        if not description:
+            await update.message.reply_text("עדיין לא שלחת בקשה לשרטוט 🙂")
+            return
+        await self._submit(update, description, use_cache=False)
+
+    async def batch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """טיפול בפקודת /batch - דף עבודה עם תיאור בכל שורה, בהודעה עצמה או בקובץ טקסט שהיא עונה עליו"""
+        output, text = self._batch_request(update.message.text)
+        reply_to = update.message.reply_to_message
+        if not text.strip() and reply_to and reply_to.document:
+            text = await self._read_document(update, reply_to.document)
+            if text is None:
+                return
+        await self._submit_batch(update, text, output)
+
+    async def batch_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle a text file sent to the bot as a worksheet (the caption may pick zip or pdf)"""
+        output, _ = self._batch_request(update.message.caption or '')
+        text = await self._read_document(update, update.message.document)
+        if text is not None:
+            await self._submit_batch(update, text, output)
+
+    def _batch_request(self, text: str):
+        """Split '/batch [photos|zip|pdf] descriptions...' into the output format and the worksheet text"""
+        text = text.strip()
+        if text.startswith('/'):
+            # הפקודה עצמה (אולי עם @שם_הבוט)
+            text = text[len(text.split(maxsplit=1)[0]):].strip()
+        first = text.split(maxsplit=1)[:1]
+        if first and first[0].lower() in OUTPUTS:
+            return first[0].lower(), text[len(first[0]):]
+        return self.batch_output, text
+
+    async def _read_document(self, update: Update, document):
+        """Download a worksheet text file, or tell the user why it cannot be read"""
+        if document.file_size and document.file_size > BATCH_MAX_FILE_BYTES:
+            await update.message.reply_text("הקובץ גדול מדי לדף עבודה 📄")
+            return None
+        file = await document.get_file()
+        data = await file.download_as_bytearray()
+        return bytes(data).decode('utf-8-sig', errors='replace')
+
+    async def _submit_batch(self, update: Update, text: str, output: str) -> None:
+        """Hand a worksheet to the job queue when there is one, otherwise draw it in this process"""
+        if not parse_descriptions(text):
+            await update.message.reply_text(
+                "שלחו /batch ואחריו תיאור של שרטוט בכל שורה, או קובץ טקסט עם תיאור בכל שורה 📝"
+            )
+            return
+        if self.job_queue is None:
+            await self._schedule_batch(update, text, output, update.get_bot())
+            return
+        user = update.effective_user or update.effective_chat
+        await asyncio.to_thread(
+            self.job_queue.enqueue,
+            update.update_id,
+            update.effective_chat.id,
+            user.id,
+            update.message.message_id,
+            {'text': text, 'batch': output}
+        )
+
+    async def _submit(self, update: Update, description: str, use_cache: bool = True) -> None:
+        """Hand a request to the job queue when there is one, otherwise handle it in this process"""
+        if self.job_queue is None:
+            await self._schedule(update, description, use_cache)
+            return
+        user = update.effective_user or update.effective_chat
+        await asyncio.to_thread(
+            self.job_queue.enqueue,
+            update.update_id,
+            update.effective_chat.id,
+            user.id,
+            update.message.message_id,
+            {'text': description, 'use_cache': use_cache}
+        )
+
+    async def _schedule(self, update: Update, description: str, use_cache: bool = True) -> None:
+        """Queue a request in the fair scheduler under its user and wait until it is handled"""
+        user = update.effective_user or update.effective_chat
+        request_key = (user.id, description_key(description))
+        if self._in_progress.get(request_key):
+            RESUBMISSIONS.inc()
         try:
-            # Send waiting message
-            processing_message = await update.message.reply_text(
-                "מעבד את הבקשה שלך... 🎨"
+            job = self.scheduler.submit(
+                user.id, lambda: self._process_description(update, description, use_cache)
             )
-            
-            # Generate code using Gemini
+        except SchedulerBusyError:
+            logger.warning("Scheduler queue is full")
+            REJECTIONS.inc(reason='busy')
+            await update.message.reply_text(
+                "המערכת עמוסה כרגע. אנא נסה שוב בעוד כמה דקות 🕒"
+            )
+            return
+
+        self._in_progress[request_key] = self._in_progress.get(request_key, 0) + 1
+        try:
+            await job
+        except JobSuperseded:
+            REJECTIONS.inc(reason='superseded')
+            await update.message.reply_text(
+                "קיבלתי ממך בקשה חדשה יותר, אז דילגתי על הבקשה הזו ⏭️"
+            )
+        finally:
+            self._in_progress[request_key] -= 1
+            if not self._in_progress[request_key]:
+                del self._in_progress[request_key]
+
+    async def _schedule_batch(self, update: Update, text: str, output: str, bot) -> None:
+        """
+        Queue a worksheet as one job of its user. Inside it the descriptions fan out in parallel
+        (up to BATCH_CONCURRENCY), still under the Gemini quota and the render pool size
+        """
+        user = update.effective_user or update.effective_chat
+        descriptions = parse_descriptions(text)
+        if len(descriptions) > self.batch_max_items:
+            await update.message.reply_text(
+                f"בדף העבודה יש {len(descriptions)} תיאורים, אשרטט רק את {self.batch_max_items} הראשונים ✂️"
+            )
+            descriptions = descriptions[:self.batch_max_items]
+        try:
+            # דף עבודה לא מבטל בקשות של המשתמש שכבר ממתינות בתור, ובקשה רגילה שמגיעה אחריו
+            # לא מבטלת אותו (supersede=False, וסוג נפרד)
+            job = self.scheduler.submit(
+                user.id, lambda: self._process_batch(update, descriptions, output, bot),
+                supersede=False, kind='batch'
+            )
+        except SchedulerBusyError:
+            logger.warning("Scheduler queue is full")
+            REJECTIONS.inc(reason='busy')
+            await update.message.reply_text(
+                "המערכת עמוסה כרגע. אנא נסה שוב בעוד כמה דקות 🕒"
+            )
+            return
+        await job
+
+    async def _process_batch(self, update: Update, descriptions: list, output: str, bot) -> None:
+        """
+        Draw a worksheet with one combined progress message. Every description goes through
+        _process_description (caches, coalescing, repair); photos are sent in media groups as
+        they finish, or everything is packed into one ZIP/PDF at the end
+        """
+        total = len(descriptions)
+        progress = ProgressMessage(
+            await update.message.reply_text(f"מעבד דף עבודה עם {total} שרטוטים... 🎨"),
+            min_interval=self.progress_edit_interval
+        )
+
+        async def produce(index: int, description: str):
+            message = BatchItemMessage(index, description)
+            await self._process_description(SimpleNamespace(message=message), description)
+            result = message.result()
+            if output != 'photos' and result.file_id:
+                # לקובץ צריך את התמונה עצמה, והמטמון החזיר רק את ה-file_id שלה בטלגרם
+                file = await bot.get_file(result.file_id)
+                result.image = bytes(await file.download_as_bytearray())
+            return result
+
+        results = []
+        ready = []
+        try:
+            async for result in BatchRunner(self.batch_concurrency).run(descriptions, produce):
+                results.append(result)
+                BATCH_ITEMS.inc(result='ok' if result.ok else 'failed')
+                if output == 'photos' and result.ok:
+                    ready.append(result)
+                    if len(ready) == MEDIA_GROUP_SIZE:
+                        await self._send_batch_photos(update, ready)
+                        ready = []
+                failed = sum(not result.ok for result in results)
+                progress.update(
+                    f"מעבד דף עבודה: {len(results)}/{total} מוכנים"
+                    + (f" ({failed} נכשלו)" if failed else "") + " ⏳"
+                )
+            if ready:
+                await self._send_batch_photos(update, ready)
+
+            if output != 'photos' and any(result.ok for result in results):
+                pack = pack_pdf if output == 'pdf' else pack_zip
+                data = await asyncio.to_thread(pack, results)
+                await update.message.reply_document(document=io.BytesIO(data), filename=f"worksheet.{output}")
+
+            succeeded = sum(result.ok for result in results)
+            summary = f"דף העבודה מוכן: {succeeded}/{total} שרטוטים ✅"
+            failures = sorted((result for result in results if not result.ok), key=lambda result: result.index)
+            if failures:
+                summary += "\n\nלא הצלחתי לשרטט:\n" + "\n".join(
+                    f"{result.index}. {result.description}" for result in failures
+                )
+            await progress.edit_text(summary[:4000])
+        except Exception as e:
+            logger.error(f"Error processing batch: {str(e)}", exc_info=True)
+            await progress.edit_text(
+                f"מצטער, נתקלתי בשגיאה בדף העבודה ({len(results)}/{total} שרטוטים הושלמו) 😕"
+            )
+
+    async def _send_batch_photos(self, update: Update, results: list) -> None:
+        """Send finished worksheet drawings as one media group, each captioned with its line"""
+        def caption(result) -> str:
+            return f"{result.index}. {result.description}"[:1024]
+
+        try:
+            if len(results) == 1:
+                await update.message.reply_photo(
+                    photo=results[0].file_id or results[0].image, filename=results[0].filename,
+                    caption=caption(results[0])
+                )
+            else:
+                await update.message.reply_media_group(media=[
+                    InputMediaPhoto(result.file_id or result.image, caption=caption(result), filename=result.filename)
+                    for result in results
+                ])
+            return
+        except BadRequest as e:
+            # file_id ישן מהמטמון מפיל את כל הקבוצה - שולחים אחת אחת ומדלגים על מה שנדחה
+            logger.warning(f"Media group was rejected by Telegram, sending one by one: {str(e)}")
+        for result in results:
             try:
-                code = self.gemini_service.generate_code(update.message.text)
-            except RuntimeError as e:
-                if "429" in str(e) or "quota" in str(e).lower():
+                await update.message.reply_photo(
+                    photo=result.file_id or result.image, filename=result.filename, caption=caption(result)
+                )
+            except BadRequest:
+                result.file_id = result.image = None
+                result.error = "rejected by Telegram"
+
+    async def _process_description(self, update: Update, description: str, use_cache: bool = True) -> None:
+        """Generate, render and send a drawing for a description"""
+        trace = RequestTrace()
+        try:
+            # Send waiting message; it is then edited in stages, within Telegram's edit limits
+            processing_message = ProgressMessage(
+                await update.message.reply_text("מעבד את הבקשה שלך... 🎨"),
+                min_interval=self.progress_edit_interval
+            )
+
+            # A follow-up to this chat's previous drawing ("עכשיו עם רדיוס 5") edits its code:
+            # locally when every part of it is understood, otherwise with a short Gemini request
+            chat = getattr(update, 'effective_chat', None)
+            session = self.sessions.get(chat.id) if chat is not None else None
+            edit_request = parse_edit_request(description) if session else None
+            follow_up = edit_request is not None and edit_request.is_follow_up
+            session_description = session.description if follow_up else description
+
+            # Simple requests are drawn from a local template, and earlier rendered code
+            # for the same description is reused (both skipped on /redraw)
+            code = None
+            if follow_up:
+                with trace.span('edit'):
+                    edit = await asyncio.to_thread(edit_code, session.code, edit_request)
+                SESSION_EDITS.inc(stage='local' if edit else 'gemini')
+                if edit:
+                    code = edit.code
+            elif use_cache:
+                code = self.fast_path.generate_code(description)
+                CACHE_REQUESTS.inc(cache='fast_path', result='hit' if code else 'miss')
+                if code is None:
+                    code = self.code_cache.get(description)
+                    CACHE_REQUESTS.inc(cache='code', result='hit' if code else 'miss')
+            cached = code is not None and not follow_up
+
+            # Generate code using Gemini
+            if code is None:
+                try:
+                    with trace.span('generate'):
+                        if follow_up:
+                            code = await self.generate_flight.run(
+                                f"edit:{code_hash(session.code)}:{description_key(description)}",
+                                self._edit_code, session, description, processing_message
+                            )
+                        else:
+                            code = await self.generate_flight.run(
+                                description_key(description), self._generate_code, description, processing_message
+                            )
+                except GeminiRateLimitError:
                     logger.warning("Gemini rate limit reached")
+                    trace.outcome = 'rejected'
+                    REJECTIONS.inc(reason='rate_limited')
                     await processing_message.edit_text(
                         "מצטער, הגענו למגבלת הבקשות של המערכת. אנא נסה שוב בעוד כמה דקות 🕒"
                     )
                     return
-                raise  # Re-raise if it's not a rate limit error
-            
-            # Validate code safety
-            if not self.gemini_service.validate_code(code):
-                await processing_message.edit_text("מצטער, הקוד שנוצר אינו בטוח להרצה 😕")
-                return
-            
-            # Create image
-            img_data = self.renderer_service.create_image(code)
+                except GeminiBusyError:
+                    logger.warning("Gemini queue is full")
+                    trace.outcome = 'rejected'
+                    REJECTIONS.inc(reason='busy')
+                    await processing_message.edit_text(
+                        "המערכת עמוסה כרגע. אנא נסה שוב בעוד כמה דקות 🕒"
+                    )
+                    return
+
+            # Validate code safety and estimated cost in one pass; the compiled code
+            # object goes straight to the render worker
+            compiled = None
+            # Failed code is repaired locally first, then with one targeted Gemini follow-up
+            repair_stages = ['local', 'gemini']
+            repaired_by = None
+            if not cached:
+                with trace.span('validate'):
+                    # The analysis is CPU-bound, so it runs off the event loop
+                    analysis = await asyncio.to_thread(analyze_code, code)
+                if not analysis.is_safe:
+                    repaired = await self._repair(
+                        code, CodeFailure.from_analysis(analysis), repair_stages, trace, processing_message
+                    )
+                    if repaired:
+                        code, analysis, repaired_by = repaired
+                if not analysis.is_safe:
+                    logger.warning(f"Unsafe code rejected: {analysis.violations}")
+                    trace.outcome = 'rejected'
+                    REJECTIONS.inc(reason='unsafe_code')
+                    await processing_message.edit_text("מצטער, הקוד שנוצר אינו בטוח להרצה 😕")
+                    return
+                violation = analysis.cost_violation(self.max_array_elements, self.max_loop_iterations)
+                if violation:
+                    logger.warning(f"Render too expensive (static estimate): {violation[1]}")
+                    trace.outcome = 'rejected'
+                    REJECTIONS.inc(reason='too_expensive')
+                    await processing_message.edit_text(
+                        "מצטער, השרטוט שביקשת כבד מדי לחישוב. נסה לפשט את הבקשה 🐢"
+                    )
+                    return
+                compiled = analysis.code_object
             
+            # Reuse an earlier render of the same code: by Telegram file_id (no upload) or from disk
+            file_id, image_bytes, image_fmt = await asyncio.to_thread(self.render_cache.get, code)
+            if file_id:
+                try:
+                    with trace.span('send'):
+                        await update.message.reply_photo(
+                            photo=file_id,
+                            caption="הנה השרטוט שביקשת! 🎨"
+                        )
+                    CACHE_REQUESTS.inc(cache='render', result='file_id')
+                    trace.outcome = 'ok'
+                    self._remember(update, session_description, code)
+                    await processing_message.delete()
+                    return
+                except BadRequest:
+                    logger.warning("Cached file_id was rejected by Telegram, uploading again")
+                    await asyncio.to_thread(self.render_cache.forget_file_id, code)
+                    file_id, image_bytes, image_fmt = await asyncio.to_thread(self.render_cache.get, code)
+
+            if image_bytes is not None:
+                CACHE_REQUESTS.inc(cache='render', result='hit')
+                img_data = io.BytesIO(image_bytes)
+            else:
+                CACHE_REQUESTS.inc(cache='render', result='miss')
+                processing_message.update("הקוד מוכן, משרטט... 🖌️")
+                # Create image in a render worker process (shared with identical in-flight requests)
+                while True:
+                    try:
+                        with trace.span('render'):
+                            image_bytes = await self.render_flight.run(
+                                code_hash(code), self._render, code, compiled
+                            )
+                        break
+                    except RenderTooExpensiveError as e:
+                        logger.warning(f"Render too expensive: {str(e)}")
+                        trace.outcome = 'rejected'
+                        REJECTIONS.inc(reason='too_expensive')
+                        await processing_message.edit_text(
+                            "מצטער, השרטוט שביקשת כבד מדי לחישוב. נסה לפשט את הבקשה 🐢"
+                        )
+                        return
+                    except CodeExecutionError as e:
+                        if repaired_by:
+                            REPAIRS.inc(stage=repaired_by, result='failure')
+                        repaired = await self._repair(
+                            code, CodeFailure.from_error(e), repair_stages, trace, processing_message
+                        )
+                        if not repaired:
+                            raise
+                        code, analysis, repaired_by = repaired
+                        if analysis.cost_violation(self.max_array_elements, self.max_loop_iterations):
+                            raise
+                        compiled = analysis.code_object
+                img_data = io.BytesIO(image_bytes)
+
+            if repaired_by:
+                REPAIRS.inc(stage=repaired_by, result='success')
+                if repaired_by == 'local':
+                    ROUND_TRIPS_SAVED.inc()
+            # A follow-up only makes sense on top of this chat's drawing, so it is not cached by its text;
+            # rendered code also becomes a few-shot example for similar descriptions
+            if not follow_up and (not cached or repaired_by):
+                self.code_cache.put(description, code)
+                self.gemini_service.examples.add(description, code)
+
             # Send image
-            await update.message.reply_photo(
-                photo=img_data,
-                caption="הנה השרטוט שביקשת! 🎨"
-            )
+            with trace.span('send'):
+                sent_message = await update.message.reply_photo(
+                    photo=img_data,
+                    filename=image_filename(image_fmt or image_format(image_bytes)),
+                    caption="הנה השרטוט שביקשת! 🎨"
+                )
+            trace.outcome = 'ok'
+            self._remember(update, session_description, code)
+            if sent_message.photo:
+                await asyncio.to_thread(
+                    self.render_cache.set_file_id, code, sent_message.photo[-1].file_id
+                )
             
             # Delete processing message
             await processing_message.delete()
@@ -119,6 +690,83 @@ class MathDrawingBot:
                 await processing_message.edit_text(error_message)
             else:
                 await update.message.reply_text(error_message)
+        finally:
+            trace.finish()
+
+    async def _repair(self, code: str, failure: CodeFailure, stages: list, trace: RequestTrace, processing_message):
+        """
+        Try the remaining repair stages in order ('local' AST rewrites, then one 'gemini' follow-up
+        with the error and the broken code). Returns (code, analysis, stage) for the first repair
+        that passes validation, or None; whether it also renders is counted by the caller
+        """
+        while stages:
+            stage = stages.pop(0)
+            repaired_code = None
+            with trace.span('repair'):
+                if stage == 'local':
+                    repair = await asyncio.to_thread(repair_code, code, failure)
+                    if repair:
+                        return repair.code, repair.analysis, stage
+                else:
+                    processing_message.update("מתקן את הקוד שנוצר... 🔧")
+                    try:
+                        repaired_code = await self.repair_flight.run(
+                            code_hash(code), self.gemini_service.repair_code_async, code, failure.report(code)
+                        )
+                    except Exception as e:
+                        logger.warning(f"Gemini repair failed: {str(e)}")
+            if repaired_code is None:
+                REPAIRS.inc(stage=stage, result='no_fix')
+                continue
+            analysis = await asyncio.to_thread(analyze_code, repaired_code)
+            if analysis.is_safe:
+                return repaired_code, analysis, stage
+            REPAIRS.inc(stage=stage, result='failure')
+            failure = CodeFailure.from_analysis(analysis)
+            code = repaired_code
+        return None
+
+    def _remember(self, update: Update, description: str, code: str) -> None:
+        """Keep the drawing that was just sent as the chat's session, for follow-up edits"""
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            self.sessions.put(chat.id, description, code)
+
+    @staticmethod
+    def _progress_callbacks(processing_message):
+        """Callbacks that tell the user their place if the request is queued and how far the code got"""
+        async def on_queued(position: int) -> None:
+            processing_message.update(f"המערכת עמוסה, הבקשה שלך ממתינה בתור (מקום {position})... ⏳")
+
+        def on_progress(stage: str, lines: int) -> None:
+            if stage == 'thinking':
+                processing_message.update("חושב על השרטוט... 🤔")
+            elif lines:
+                processing_message.update(f"כותב את הקוד... ({lines} שורות) ✍️")
+
+        return on_queued, on_progress
+
+    async def _generate_code(self, description: str, processing_message) -> str:
+        """Generate code with Gemini, with progress updates in the processing message"""
+        on_queued, on_progress = self._progress_callbacks(processing_message)
+        return await self.gemini_service.generate_code_async(
+            description, on_queued=on_queued, on_progress=on_progress
+        )
+
+    async def _edit_code(self, session, request: str, processing_message) -> str:
+        """Ask Gemini to change the chat's previous drawing (a follow-up that could not be applied locally)"""
+        on_queued, on_progress = self._progress_callbacks(processing_message)
+        return await self.gemini_service.edit_code_async(
+            session.code, session.description, request, on_queued=on_queued, on_progress=on_progress
+        )
+
+    async def _render(self, code: str, compiled=None) -> bytes:
+        """Render code (or its already validated code object) in the worker pool and cache the result"""
+        render_pool = self._render_pool or await asyncio.to_thread(lambda: self.render_pool)
+        img_data = await render_pool.render_async(compiled or code)
+        image_bytes = img_data.getvalue()
+        await asyncio.to_thread(self.render_cache.put, code, image_bytes)
+        return image_bytes
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle errors"""
@@ -134,29 +782,98 @@ class MathDrawingBot:
     async def cleanup(self, application: Application) -> None:
         """Cleanup resources before bot shutdown"""
         logger.info("Cleaning up resources...")
+        # בקשות שכבר רצות מסתיימות לפני שסוגרים את תהליכי הרינדור
+        await self.scheduler.drain(timeout=30)
+        if self._warm_up_task:
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+        if self._render_pool:
+            self._render_pool.close()
+        # תהליכי העבודה מסיימים את מה שכבר רץ ומחזירים לתור את השאר
+        for process in self.worker_processes:
+            process.terminate()
+        for process in self.worker_processes:
+            try:
+                await asyncio.to_thread(process.wait, timeout=60)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Queue worker {process.pid} did not stop in time, killing it")
+                process.kill()
+        if self.metrics_server:
+            self.metrics_server.stop()
         logger.info("Cleanup completed")
 
-    def run(self):
-        """Run the bot"""
+    def start_metrics_server(self) -> None:
+        """Serve metrics on a local port (METRICS_PORT, 0 disables)"""
+        if not self.metrics_port:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics_host, self.metrics_port)
+            self.metrics_server.start()
+        except OSError as e:
+            logger.warning(f"Could not start metrics server: {str(e)}")
+
+    def worker_environment(self, index: int) -> dict:
+        """Environment of the index-th queue worker: its own metrics port, or 0 when disabled"""
+        port = self.queue_worker_metrics_port + index if self.queue_worker_metrics_port else 0
+        return dict(os.environ, METRICS_PORT=str(port))
+
+    def build_application(self) -> Application:
+        """Create the Telegram application with all handlers (no network access)"""
         # Create application
-        application = Application.builder().token(self.token).build()
+        application = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(self.max_concurrent_updates)
+            .build()
+        )
 
         # Add command handlers
         application.add_handler(CommandHandler("start", self.start))
         application.add_handler(CommandHandler("help", self.help))
+        application.add_handler(CommandHandler("redraw", self.redraw))
+        application.add_handler(CommandHandler("batch", self.batch))
         
-        # Add text message handler
+        # Add text message handler, and text files as worksheets
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        application.add_handler(MessageHandler(filters.Document.FileExtension("txt"), self.batch_document))
 
         # Add error handler
         application.add_error_handler(self.error_handler)
 
-        # Set cleanup function for shutdown
+        # Warm up services once the bot is running, and clean up on shutdown
+        application.post_init = self._post_init
         application.post_shutdown = lambda app: self.cleanup(app)
+        return application
+
+    def run(self):
+        """Run the bot"""
+        application = self.build_application()
+
+        self.start_metrics_server()
+
+        # Start queue workers on this machine (more can run elsewhere with: python -m bot.queue_worker),
+        # each serving its own pipeline metrics on the next port
+        if self.job_queue:
+            for index in range(self.queue_workers):
+                self.worker_processes.append(subprocess.Popen(
+                    [sys.executable, '-m', 'bot.queue_worker'],
+                    cwd=Path(__file__).parent.parent, env=self.worker_environment(index)
+                ))
+            logger.info(f"Started {len(self.worker_processes)} queue workers")
 
         # Start the bot
-        logger.info("Bot is starting...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+        logger.info(f"Bot is starting ({self.mode})...")
+        if self.mode == 'webhook':
+            # Telegram שולח את העדכונים ל-WEBHOOK_URL; עדכון שנשלח שוב מסונן בתור לפי update_id
+            application.run_webhook(
+                listen=self.webhook_listen,
+                port=self.webhook_port,
+                url_path=self.webhook_path,
+                webhook_url=self.webhook_url,
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
 
 if __name__ == "__main__":
     bot = MathDrawingBot()
@@ -0,0 +1,260 @@
+"""
+שרטוט של דף עבודה שלם (הרבה תיאורים בבת אחת): פירוק הטקסט לתיאורים,
+הרצה במקביל עם החזרת כל תוצאה ברגע שהיא מוכנה, ואריזה ל-ZIP או ל-PDF.
+
+המודול לא תלוי בטלגרם - הבוט (/batch) והכלי המקומי משתמשים בו באותה צורה.
+
+שימוש מקומי (Gemini אמיתי, רינדור בתהליך הנוכחי):
+    python -m services.batch_service worksheet.txt --output worksheet.pdf
+    python -m services.batch_service worksheet.txt --output drawings/ --concurrency 4
+"""
+import io
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import zipfile
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.config import get_render_limits
+from services.render_cache import image_format, image_filename
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מספור או תבליט בתחילת שורה ("1.", "2)", "-", "•") - לא חלק מהתיאור
+ITEM_PREFIX = re.compile(r'^\s*(?:\d{1,3}\s*[.)]|[-*•])\s+')
+# תווים שאסורים בשמות קבצים
+UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\s]+')
+# צורות הפלט האפשריות: תמונות (בטלגרם - קבוצות מדיה), קובץ ZIP או קובץ PDF
+OUTPUTS = ('photos', 'zip', 'pdf')
+
+
+class BatchResult:
+    """
+    התוצאה של תיאור אחד מתוך דף העבודה: תמונה (או file_id של טלגרם), או הודעת שגיאה
+    """
+    def __init__(self, index: int, description: str, image: bytes = None, file_id: str = None,
+                 error: str = None):
+        self.index = index
+        self.description = description
+        self.image = image
+        self.file_id = file_id
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.image is not None or self.file_id is not None
+
+    @property
+    def filename(self) -> str:
+        name = UNSAFE_FILENAME.sub('_', self.description).strip('_.')[:40]
+        return image_filename(image_format(self.image), f"{self.index:02d}_{name}")
+
+
+def parse_descriptions(text: str, max_items: int = None) -> list:
+    """
+    מפרק טקסט של דף עבודה לתיאורים: שורה לכל שרטוט, בלי מספור ותבליטים.
+    שורות ריקות ושורות הערה (#) מדולגות. max_items - אורך מקסימלי לרשימה
+    """
+    descriptions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        line = ITEM_PREFIX.sub('', line).strip()
+        if line:
+            descriptions.append(line)
+    if max_items is not None:
+        descriptions = descriptions[:max_items]
+    return descriptions
+
+
+class BatchRunner:
+    """
+    מריץ פונקציה אסינכרונית על כל תיאור, עד concurrency במקביל, ומחזיר את התוצאות
+    לפי סדר הסיום (לא לפי סדר התיאורים) כדי שאפשר יהיה לשלוח כל אחת כשהיא מוכנה.
+    המכסה של Gemini ומאגר הרינדור ממשיכים לאכוף את המגבלות שלהם מתחת לזה
+    """
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = max(1, concurrency)
+
+    async def run(self, descriptions: list, produce):
+        """
+        produce(index, description) מחזירה BatchResult; חריגה בה הופכת לתוצאה עם שגיאה.
+        מחולל אסינכרוני - יציאה מוקדמת מהלולאה מבטלת את התיאורים שעוד לא הסתיימו
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(index: int, description: str) -> BatchResult:
+            async with semaphore:
+                try:
+                    return await produce(index, description)
+                except Exception as e:
+                    logger.warning(f"Batch item {index} failed: {str(e)}")
+                    return BatchResult(index, description, error=str(e))
+
+        tasks = [
+            asyncio.ensure_future(run_one(index, description))
+            for index, description in enumerate(descriptions, 1)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _failures_text(results: list) -> str:
+    return ''.join(
+        f"{result.index}. {result.description}: {result.error or 'no drawing'}\n"
+        for result in results if not result.ok
+    )
+
+
+def pack_zip(results: list) -> bytes:
+    """
+    אורז את התמונות לקובץ ZIP לפי סדר התיאורים, עם failed.txt לתיאורים שנכשלו
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for result in sorted(results, key=lambda result: result.index):
+            if result.image is not None:
+                # התמונות כבר דחוסות, אין טעם לדחוס שוב
+                archive.writestr(result.filename, result.image, compress_type=zipfile.ZIP_STORED)
+        failures = _failures_text(results)
+        if failures:
+            archive.writestr('failed.txt', failures, compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+def pack_pdf(results: list) -> bytes:
+    """
+    אורז את התמונות לקובץ PDF, עמוד לכל שרטוט לפי סדר התיאורים
+    """
+    from PIL import Image
+
+    pages = []
+    for result in sorted(results, key=lambda result: result.index):
+        if result.image is not None:
+            pages.append(Image.open(io.BytesIO(result.image)).convert('RGB'))
+    if not pages:
+        raise ValueError("אין תמונות לאריזה")
+    buffer = io.BytesIO()
+    pages[0].save(buffer, 'PDF', save_all=True, append_images=pages[1:], resolution=100)
+    return buffer.getvalue()
+
+
+class LocalBatchRenderer:
+    """
+    הצד המקומי של מצב הדפים, בלי טלגרם: GeminiService מייצר את הקוד (במקביל, בתוך המכסה
+    שלו) ו-RendererService מרנדר בתהליך הנוכחי. הרינדור רץ ב-thread הראשי, אחד בכל פעם,
+    כי pyplot משותף לכל התהליך ומגבלות הזמן של ה-executor עובדות רק שם
+    """
+    def __init__(self):
+        from services.gemini_service import GeminiService
+        from services.renderer_service import RendererService
+
+        self.gemini_service = GeminiService()
+        self.renderer = RendererService()
+        render_limits = get_render_limits()
+        self.max_array_elements = render_limits['MAX_ARRAY_ELEMENTS']
+        self.max_loop_iterations = render_limits['MAX_LOOP_ITERATIONS']
+
+    async def produce(self, index: int, description: str) -> BatchResult:
+        from utils.code_analyzer import analyze_code
+        from utils.code_executor import CodeExecutionError
+        from utils.code_repair import CodeFailure, repair_code
+
+        code = await self.gemini_service.generate_code_async(description)
+        analysis = analyze_code(code)
+        if not analysis.is_safe:
+            repair = repair_code(code, CodeFailure.from_analysis(analysis))
+            if repair is None:
+                return BatchResult(index, description, error=f"unsafe code: {analysis.violations}")
+            code, analysis = repair.code, repair.analysis
+        violation = analysis.cost_violation(self.max_array_elements, self.max_loop_iterations)
+        if violation:
+            return BatchResult(index, description, error=f"too expensive: {violation[1]}")
+
+        try:
+            image = self.renderer.create_image(analysis.code_object)
+        except CodeExecutionError as e:
+            # תיקון מקומי אחד, בלי בקשה נוספת ל-Gemini
+            repair = repair_code(code, CodeFailure.from_error(e))
+            if repair is None or repair.analysis.cost_violation(self.max_array_elements, self.max_loop_iterations):
+                raise
+            code = repair.code
+            image = self.renderer.create_image(repair.analysis.code_object)
+        self.gemini_service.examples.add(description, code)
+        return BatchResult(index, description, image=image.getvalue())
+
+    async def render(self, descriptions: list, concurrency: int = 4, on_result=None) -> list:
+        """
+        משרטט את כל התיאורים ומחזיר את התוצאות לפי סדר התיאורים.
+        on_result(result) נקרא עם כל תוצאה ברגע שהיא מוכנה
+        """
+        results = []
+        async for result in BatchRunner(concurrency).run(descriptions, self.produce):
+            results.append(result)
+            if on_result:
+                on_result(result)
+        return sorted(results, key=lambda result: result.index)
+
+
+def write_output(results: list, output: Path) -> None:
+    """
+    כותב את התוצאות לפי הסיומת: .zip, .pdf, או תיקייה עם קובץ לכל שרטוט
+    """
+    suffix = output.suffix.lower()
+    if suffix == '.zip':
+        output.write_bytes(pack_zip(results))
+    elif suffix == '.pdf':
+        output.write_bytes(pack_pdf(results))
+    else:
+        output.mkdir(parents=True, exist_ok=True)
+        for result in results:
+            if result.image is not None:
+                (output / result.filename).write_bytes(result.image)
+        failures = _failures_text(results)
+        if failures:
+            (output / 'failed.txt').write_text(failures, encoding='utf-8')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Draw a whole worksheet (one description per line)")
+    parser.add_argument('input', help="text file with one description per line, or - for stdin")
+    parser.add_argument('--output', default='worksheet.zip',
+                        help="output .zip or .pdf file, or a directory for separate images")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BATCH_CONCURRENCY', 4)),
+                        help="descriptions generated and rendered at the same time")
+    parser.add_argument('--max-items', type=int, default=int(os.getenv('BATCH_MAX_ITEMS', 50)))
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    text = sys.stdin.read() if args.input == '-' else Path(args.input).read_text(encoding='utf-8-sig')
+    descriptions = parse_descriptions(text, args.max_items)
+    if not descriptions:
+        sys.exit("No descriptions found")
+
+    def on_result(result: BatchResult) -> None:
+        status = 'ok' if result.ok else f"failed: {result.error}"
+        print(f"[{time.perf_counter() - start:6.1f}s] {result.index}. {result.description} - {status}", flush=True)
+
+    start = time.perf_counter()
+    results = asyncio.run(LocalBatchRenderer().render(descriptions, args.concurrency, on_result))
+    succeeded = sum(result.ok for result in results)
+    if not succeeded:
+        sys.exit("No drawing succeeded")
+    write_output(results, Path(args.output))
+    print(f"{succeeded}/{len(results)} drawings written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# אותיות סופיות -> האות הרגילה
+FINAL_LETTERS = str.maketrans({
+    'ך': 'כ',
+    'ם': 'מ',
+    'ן': 'נ',
+    'ף': 'פ',
+    'ץ': 'צ',
+})
+
+# סימני פיסוק שאינם משנים את משמעות הבקשה (סימנים מתמטיים כמו = ^ - נשמרים)
+# (נקודה שלפני ספרה היא נקודה עשרונית ונשמרת: "3.5", ".5")
+IGNORED_PUNCTUATION = re.compile(r'[!?,;:"\'`״׳“”„־…]|\.(?!\d)')
+# רווחים מסביב לאופרטורים מתמטיים
+OPERATOR_SPACING = re.compile(r'\s*([=+\-*/^()\[\]<>|])\s*')
+# מספר עם מפרידי אלפים (1,000) שעומד לבד בין רווחים. צמוד לסוגריים, לאופרטור או לפסיק אחר
+# הפסיק עלול להפריד בין ערכים: (3,500) היא נקודה ולא 3500
+THOUSANDS_NUMBER = re.compile(r'(?<!\S)\d{1,3}(?:,\d{3})+(?!\S)')
+DECIMAL_NUMBER = re.compile(r'\d+(?:\.\d+)?|(?<![\w.])\.\d+')
+NIQQUD = re.compile(r'[\u0591-\u05C7]')
+
+
+def _strip_thousands(match: re.Match) -> str:
+    # גם בתוך סוגריים פתוחים ("(1, 2,500)") הפסיק הוא מפריד בין ערכים
+    before = match.string[:match.start()]
+    if before.count('(') > before.count(')') or before.count('[') > before.count(']'):
+        return match.group(0)
+    return match.group(0).replace(',', '')
+
+
+def _format_number(match: re.Match) -> str:
+    # 03.50 -> 3.5, 3.0 -> 3, .5 -> 0.5 (בלי המרה ל-float, כדי לא לאבד דיוק)
+    integer, _, fraction = match.group(0).partition('.')
+    integer = integer.lstrip('0') or '0'
+    fraction = fraction.rstrip('0')
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def normalize_description(description: str) -> str:
+    """
+    מנרמל תיאור כך שניסוחים שקולים יקבלו את אותו מפתח:
+    רווחים, פיסוק, אותיות סופיות, ניקוד ופורמט מספרים
+    """
+    text = unicodedata.normalize('NFKC', description).lower()
+    text = NIQQUD.sub('', text)
+    text = text.translate(FINAL_LETTERS)
+    text = THOUSANDS_NUMBER.sub(_strip_thousands, text)
+    text = DECIMAL_NUMBER.sub(_format_number, text)
+    text = IGNORED_PUNCTUATION.sub(' ', text)
+    text = OPERATOR_SPACING.sub(r'\1', text)
+    return ' '.join(text.split())
+
+
+def description_key(description: str) -> str:
+    """
+    מחזיר מפתח תוכן (hash) לתיאור המנורמל
+    """
+    return hashlib.sha256(normalize_description(description).encode('utf-8')).hexdigest()
+
+
+class CodeCache:
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (code, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, description: str):
+        """
+        מחזיר את הקוד השמור לתיאור, או None אם אין (או שפג תוקפו)
+        """
+        key = description_key(description)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Code cache hit for: {description}")
+            return entry[0]
+
+    def put(self, description: str, code: str) -> None:
+        """
+        שומר קוד עבור תיאור, ומפנה את הרשומות הישנות ביותר אם צריך
+        """
+        key = description_key(description)
+        with self._lock:
+            self._entries[key] = (code, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, description: str) -> None:
+        with self._lock:
+            self._entries.pop(description_key(description), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,140 @@
+import math
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+from services.code_cache import normalize_description, description_key
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# אורך ה-n-grams של התווים: תופס מילים עם תחיליות ("במעגל", "והמשולש") וניסוחים קרובים
+NGRAM_SIZE = 3
+# דמיון מינימלי (cosine) כדי שדוגמה תיכנס לפרומפט - דוגמה לא קשורה רק מאריכה אותו
+MIN_SIMILARITY = 0.4
+# קוד ארוך מזה לא נשמר כדוגמה, כדי שהפרומפט יישאר קצר
+MAX_CODE_CHARS = 2000
+
+
+def _features(text: str) -> Counter:
+    """
+    המאפיינים של תיאור מנורמל: המילים עצמן ו-n-grams של התווים בכל מילה
+    """
+    features = Counter()
+    for word in text.split():
+        features['w:' + word] += 1
+        padded = f" {word} "
+        for start in range(max(1, len(padded) - NGRAM_SIZE + 1)):
+            features['c:' + padded[start:start + NGRAM_SIZE]] += 1
+    return features
+
+
+class Example:
+    """
+    תיאור וקוד שרונדר בהצלחה עבורו
+    """
+    def __init__(self, description: str, code: str, features: Counter):
+        self.description = description
+        self.code = code
+        self.features = features
+
+
+class ExampleStore:
+    """
+    מאגר מקומי של דוגמאות (תיאור -> קוד שרונדר בהצלחה), שמהן נבחרות דוגמאות few-shot
+    לפרומפט של Gemini. החיפוש הוא TF-IDF על n-grams של התיאור המנורמל, עם אינדקס הפוך
+    בזיכרון, כך שרק דוגמאות שחולקות מאפיין עם התיאור נבדקות.
+    בזיכרון בלבד, עם מגבלה על מספר הדוגמאות: הדוגמה הוותיקה ביותר מפונה ראשונה
+    """
+    def __init__(self, max_examples: int = 500):
+        self.max_examples = max_examples
+        self._examples = OrderedDict()  # key -> Example
+        self._postings = {}  # feature -> set of keys
+        self._lock = threading.Lock()
+
+    def add(self, description: str, code: str) -> None:
+        """
+        שומר דוגמה; תיאור שקול לתיאור קיים מחליף אותו
+        """
+        # שורות הערה ושורות ריקות רק מאריכות את הפרומפט
+        code = '\n'.join(
+            line for line in code.splitlines() if line.strip() and not line.lstrip().startswith('#')
+        )
+        if len(code) > MAX_CODE_CHARS:
+            return
+        key = description_key(description)
+        example = Example(description, code, _features(normalize_description(description)))
+        with self._lock:
+            self._remove(key)
+            self._examples[key] = example
+            for feature in example.features:
+                self._postings.setdefault(feature, set()).add(key)
+            while len(self._examples) > self.max_examples:
+                self._remove(next(iter(self._examples)))
+
+    def similar(self, description: str, k: int = 2) -> list:
+        """
+        עד k הדוגמאות הדומות ביותר לתיאור, מהדומה ביותר. דוגמה לאותו תיאור בדיוק
+        לא מוחזרת, כדי ש-/redraw לא יקבל שוב את אותו שרטוט
+        """
+        if k <= 0:
+            return []
+        key = description_key(description)
+        query = _features(normalize_description(description))
+        with self._lock:
+            total = len(self._examples)
+            idf = {}
+            candidates = set()
+            for feature in query:
+                keys = self._postings.get(feature)
+                if keys:
+                    idf[feature] = math.log((total + 1) / (len(keys) + 1)) + 1
+                    candidates |= keys
+            candidates.discard(key)
+            if not candidates:
+                return []
+
+            query_norm = math.sqrt(sum((count * idf.get(feature, 0.0)) ** 2 for feature, count in query.items()))
+            scored = []
+            for candidate in candidates:
+                example = self._examples[candidate]
+                dot = sum(
+                    count * example.features[feature] * idf[feature] ** 2
+                    for feature, count in query.items() if feature in example.features
+                )
+                norm = math.sqrt(sum(
+                    (count * (math.log((total + 1) / (len(self._postings[feature]) + 1)) + 1)) ** 2
+                    for feature, count in example.features.items()
+                ))
+                score = dot / (query_norm * norm) if query_norm and norm else 0.0
+                if score >= MIN_SIMILARITY:
+                    scored.append((score, example))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [example for _, example in scored[:k]]
+
+    def _remove(self, key: str) -> None:
+        example = self._examples.pop(key, None)
+        if example is None:
+            return
+        for feature in example.features:
+            keys = self._postings.get(feature)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[feature]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'examples': len(self._examples),
+                'features': len(self._postings)
+            }
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: הדוגמה הקרובה לתיאור חדש
+    store = ExampleStore()
+    store.add("מעגל ברדיוס 3", "r = 3")
+    store.add("פרבולה y=x^2", "x = 1")
+    store.add("משולש שווה צלעות", "a = 1")
+    print([example.description for example in store.similar("מעגל ברדיוס 5 ובתוכו משולש")])
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from collections import deque
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusyError(RuntimeError):
+    """
+    נזרקת כשהתור הכללי או התור של המשתמש מלאים
+    """
+
+
+class JobSuperseded(Exception):
+    """
+    התוצאה של עבודה שהוחלפה בבקשה חדשה יותר של אותו משתמש לפני שהתחילה
+    """
+
+
+class _Job:
+    def __init__(self, user_id, func, cost: float, supersede: bool, kind: str):
+        self.user_id = user_id
+        self.func = func
+        self.cost = cost
+        self.supersede = supersede
+        self.kind = kind
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class _UserState:
+    def __init__(self):
+        self.queue = deque()
+        self.in_flight = 0
+        self.deficit = 0.0
+        self.has_turn = False
+        self.in_ring = False
+
+
+class FairScheduler:
+    """
+    מתזמן הוגן בין משתמשים בשיטת Deficit Round-Robin:
+    לכל משתמש תור משלו, בכל תור מקבל המשתמש quantum של "קרדיט" ומריץ עבודות כל עוד יש לו.
+    מגביל עבודות במקביל לכל משתמש ובסך הכל, ודוחה בקשות חדשות כשהתורים מלאים
+    """
+    def __init__(self, max_active: int = 16, max_per_user: int = 1, max_queue: int = 100,
+                 max_user_queue: int = 5, quantum: float = 1.0):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self.quantum = quantum
+        self.active = 0
+        self.queued = 0
+        self.superseded = 0
+        self.rejected = 0
+        self._users = {}
+        self._ring = deque()
+        self._tasks = set()
+
+    def submit(self, user_id, func, cost: float = 1.0, supersede: bool = True,
+               kind: str = 'request') -> asyncio.Future:
+        """
+        מוסיף עבודה (func היא פונקציה אסינכרונית בלי פרמטרים) לתור של המשתמש.
+        supersede - עבודות של המשתמש מאותו סוג (kind) שעוד לא התחילו מוחלפות בעבודה הזו.
+        עבודה שנשלחה עם supersede=False לא מוחלפת בעצמה, כך שדף עבודה לא הולך לאיבוד בגלל הודעה רגילה.
+        מחזיר Future שמסתיים עם התוצאה, או עם JobSuperseded אם העבודה הוחלפה
+        """
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState()
+
+        if supersede:
+            kept = deque()
+            for old_job in state.queue:
+                if not (old_job.supersede and old_job.kind == kind):
+                    kept.append(old_job)
+                    continue
+                self.queued -= 1
+                self.superseded += 1
+                old_job.future.set_exception(JobSuperseded())
+                logger.info(f"Dropped a superseded job of user {user_id}")
+            state.queue = kept
+
+        if self.queued >= self.max_queue or len(state.queue) >= self.max_user_queue:
+            self.rejected += 1
+            if not state.queue and not state.in_flight:
+                del self._users[user_id]
+            raise SchedulerBusyError("תור הבקשות מלא")
+
+        job = _Job(user_id, func, cost, supersede, kind)
+        state.queue.append(job)
+        self.queued += 1
+        if not state.in_ring and state.in_flight < self.max_per_user:
+            self._ring.append(user_id)
+            state.in_ring = True
+        self._dispatch()
+        return job.future
+
+    def _dispatch(self) -> None:
+        while self._ring and self.active < self.max_active:
+            user_id = self._ring[0]
+            state = self._users[user_id]
+            if not state.has_turn:
+                state.deficit += self.quantum
+                state.has_turn = True
+
+            if state.queue and state.in_flight < self.max_per_user and state.queue[0].cost <= state.deficit:
+                job = state.queue.popleft()
+                state.deficit -= job.cost
+                self._start(job, state)
+                continue
+
+            # התור של המשתמש נגמר - עובר לסוף הסבב, או יוצא ממנו עד שתסתיים עבודה שלו
+            state.has_turn = False
+            self._ring.popleft()
+            state.in_ring = False
+            if not state.queue:
+                state.deficit = 0.0
+                # המשתמש נשאר בסבב כשכל המקומות היו תפוסים, והעבודה שלו כבר הסתיימה
+                if not state.in_flight:
+                    del self._users[user_id]
+            elif state.in_flight < self.max_per_user:
+                self._ring.append(user_id)
+                state.in_ring = True
+
+    def _start(self, job: _Job, state: _UserState) -> None:
+        self.queued -= 1
+        self.active += 1
+        state.in_flight += 1
+        task = asyncio.ensure_future(self._run(job, state))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: _Job, state: _UserState) -> None:
+        try:
+            result = await job.func()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.active -= 1
+            state.in_flight -= 1
+            if state.queue and not state.in_ring:
+                self._ring.append(job.user_id)
+                state.in_ring = True
+            elif not state.queue and not state.in_flight and not state.in_ring:
+                self._users.pop(job.user_id, None)
+            self._dispatch()
+
+    async def drain(self, timeout: float = None) -> None:
+        """
+        ממתין לסיום העבודות שכבר רצות
+        """
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'users': len(self._users),
+            'superseded': self.superseded,
+            'rejected': self.rejected
+        }
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: משתמש אחד ששולח הרבה בקשות לא חוסם משתמש אחר
+    async def main():
+        scheduler = FairScheduler(max_active=2, max_per_user=1)
+
+        def job(name):
+            async def run():
+                await asyncio.sleep(0.1)
+                print(f"done {name}")
+            return run
+
+        jobs = [scheduler.submit('heavy', job(f'heavy-{i}'), supersede=False) for i in range(3)]
+        jobs.append(scheduler.submit('light', job('light-0')))
+        await asyncio.gather(*jobs)
+        print(scheduler.stats())
+
+    asyncio.run(main())
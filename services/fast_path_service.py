@@ -0,0 +1,360 @@
+import re
+import ast
+import math
+import logging
+import threading
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+NUMBER = r'-?\d+(?:\.\d+)?'
+# ערך בתחום: מספר, π, כפולה או שבר של π (למשל -2π, π/2, 3pi)
+VALUE = r'-?\s*(?:\d+(?:\.\d+)?)?\s*(?:π|pi)?(?:\s*/\s*\d+)?'
+
+RANGE_PATTERNS = [
+    re.compile(rf'(?:בתחום|תחום|בטווח|טווח)?\s*[\[(]\s*({VALUE})\s*[,;]\s*({VALUE})\s*[\])]'),
+    re.compile(rf'(?:בתחום|בטווח)?\s*(?:בין|מ-?)\s*({VALUE})\s*(?:ל-?|עד|ועד)\s*({VALUE})(?![\d.])'),
+]
+EXPRESSION_CHARS = r'[0-9a-zπ+\-*/^().\s]'
+EXPRESSION_PATTERNS = [
+    re.compile(rf'(?:y|f\s*\(\s*x\s*\))\s*=\s*({EXPRESSION_CHARS}+)'),
+    re.compile(rf'(?:גרף|פונקציה|פונקציית|הפונקציה)\s+(?:של\s+)?(?:ה)?({EXPRESSION_CHARS}+)'),
+]
+RADIUS_PATTERN = re.compile(rf'(?:ב)?רדיוס\s*(?:של\s*)?(?:=\s*)?({NUMBER})')
+CENTER_PATTERN = re.compile(rf'(?:ב)?מרכז\s*(?:ב)?\(\s*({NUMBER})\s*,\s*({NUMBER})\s*\)')
+SIDE_PATTERN = re.compile(rf'(?:עם\s+)?(?:ש)?(?:אורך\s+)?(?:ה)?צלע(?:ו)?\s*(?:ב)?(?:אורך\s*)?(?:של\s*)?(?:=\s*)?({NUMBER})')
+SIDE_COUNT_PATTERN = re.compile(r'(?:עם\s+)?(\d+)\s+צלעות')
+
+POLYGON_NAMES = {
+    'משולש': 3,
+    'ריבוע': 4,
+    'מחומש': 5,
+    'משושה': 6,
+    'מתומן': 8,
+}
+POLYGON_TITLES = {
+    3: "משולש שווה צלעות",
+    4: "ריבוע",
+    5: "מחומש משוכלל",
+    6: "משושה משוכלל",
+    8: "מתומן משוכלל",
+}
+
+FUNCTIONS = {
+    'sin': 'np.sin',
+    'cos': 'np.cos',
+    'tan': 'np.tan',
+    'exp': 'np.exp',
+    'log': 'np.log',
+    'ln': 'np.log',
+    'sqrt': 'np.sqrt',
+    'abs': 'np.abs',
+}
+CONSTANTS = {
+    'x': 'x',
+    'pi': 'np.pi',
+    'π': 'np.pi',
+    'e': 'np.e',
+}
+EXPRESSION_TOKEN = re.compile(r'\s*(\d+(?:\.\d+)?|[a-z]+|π|\*\*|[+\-*/^()])')
+
+# מילים שמותר שיופיעו בבקשה בלי לפגוע בביטחון בפענוח
+FILLER_WORDS = {
+    'צייר', 'ציירי', 'תצייר', 'שרטט', 'שרטטי', 'תשרטט', 'הצג', 'הראה', 'ציור', 'שרטוט',
+    'בבקשה', 'את', 'של', 'עם', 'על', 'גרף', 'פונקציה', 'פונקציית', 'הפונקציה',
+    'מעגל', 'פרבולה', 'משוכלל', 'מצולע', 'שווה', 'צלעות', 'במרכז', 'מרכז',
+    'הראשית', 'ראשית', 'צירים', 'מערכת',
+    'draw', 'plot', 'graph', 'of', 'the', 'a', 'function', 'circle', 'please',
+}
+HEBREW_PREFIXES = 'הבולמש'
+
+GEOMETRY_HEADER = """import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patches import Circle, Polygon
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+fig, ax = plt.subplots(figsize=(10, 10))
+"""
+
+GEOMETRY_FOOTER = """ax.set_xlim({x_min!r}, {x_max!r})
+ax.set_ylim({y_min!r}, {y_max!r})
+ax.set_aspect('equal')
+plt.axis('equal')
+ax.axis('off')
+ax.set_title(get_display({title!r}))
+plt.savefig('drawing.png')
+plt.close()
+"""
+
+CIRCLE_TEMPLATE = GEOMETRY_HEADER + """circle = Circle(({cx!r}, {cy!r}), {r!r}, fill=False, color='blue', linewidth=2)
+ax.add_patch(circle)
+ax.plot({cx!r}, {cy!r}, 'o', color='black', markersize=4)
+""" + GEOMETRY_FOOTER
+
+POLYGON_TEMPLATE = GEOMETRY_HEADER + """n = {n!r}
+radius = {radius!r}
+angles = {start_angle!r} + 2 * np.pi * np.arange(n) / n
+vertices = np.column_stack((radius * np.cos(angles), radius * np.sin(angles)))
+polygon = Polygon(vertices, closed=True, fill=False, color='blue', linewidth=2)
+ax.add_patch(polygon)
+""" + GEOMETRY_FOOTER
+
+FUNCTION_TEMPLATE = """import matplotlib.pyplot as plt
+import numpy as np
+from bidi.algorithm import get_display
+
+plt.rcParams['font.family'] = 'Arial'
+plt.rcParams['font.size'] = 12
+
+fig, ax = plt.subplots(figsize=(10, 10))
+x = np.linspace({x_min!r}, {x_max!r}, 2000)
+with np.errstate(all='ignore'):
+    y = ({expression}) + 0 * x
+y = np.where(np.isfinite(y), y, np.nan)
+
+ax.plot(x, y, color='blue', linewidth=2, label={label!r})
+ax.axhline(0, color='black', linewidth=0.8)
+ax.axvline(0, color='black', linewidth=0.8)
+ax.grid(True, linestyle='--', alpha=0.6)
+ax.set_xlabel('x')
+ax.set_ylabel('y')
+ax.set_title(get_display({title!r}) + ' ' + {label!r})
+ax.legend()
+plt.savefig('drawing.png')
+plt.close()
+"""
+
+
+def _parse_value(text: str) -> float:
+    """
+    ממיר ערך כמו '-2π', 'π/2' או '3' למספר
+    """
+    match = re.fullmatch(r'(-?)\s*(\d+(?:\.\d+)?)?\s*(π|pi)?(?:\s*/\s*(\d+))?', text.strip())
+    if not match or not (match.group(2) or match.group(3)):
+        raise ValueError(f"Unsupported value: {text}")
+    sign, number, pi, denominator = match.groups()
+    value = float(number) if number else 1.0
+    if pi:
+        value *= math.pi
+    if denominator:
+        value /= float(denominator)
+    return -value if sign else value
+
+
+def _to_numpy_expression(text: str) -> str:
+    """
+    ממיר ביטוי כמו '2sin(x)^2' לביטוי numpy תקין ('2*np.sin(x)**2').
+    זורק ValueError אם הביטוי מכיל משהו שאינו ברשימה המותרת
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = EXPRESSION_TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"Unsupported expression: {text}")
+        tokens.append(match.group(1))
+        position = match.end()
+
+    output = []
+    previous = None  # 'value' / 'function' / 'operator' / '(' / ')'
+    for token in tokens:
+        if token in FUNCTIONS:
+            kind, translated = 'function', FUNCTIONS[token]
+        elif token in CONSTANTS or re.fullmatch(r'\d+(?:\.\d+)?', token):
+            kind, translated = 'value', CONSTANTS.get(token, token)
+        elif token == '(':
+            kind, translated = '(', token
+        elif token == ')':
+            kind, translated = ')', token
+        elif token in ('+', '-', '*', '/', '^', '**'):
+            kind, translated = 'operator', '**' if token == '^' else token
+        else:
+            raise ValueError(f"Unsupported token: {token}")
+
+        # כפל מרומז: 2x, 2sin(x), x(x+1), (x+1)(x-1)
+        if previous in ('value', ')') and kind in ('value', 'function', '('):
+            output.append('*')
+        if previous == 'function' and kind != '(':
+            raise ValueError(f"Function without parentheses in: {text}")
+        output.append(translated)
+        previous = kind
+
+    expression = ''.join(output)
+    if 'x' not in tokens:
+        raise ValueError(f"Expression does not depend on x: {text}")
+    ast.parse(expression, mode='eval')
+    return expression
+
+
+class FastPathService:
+    """
+    מזהה בקשות פשוטות (מעגל, מצולע משוכלל, גרף פונקציה) ומייצר להן קוד מתבנית,
+    בלי לפנות ל-Gemini. כל בקשה שלא מפוענחת בביטחון מלא מוחזרת כ-None
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generate_code(self, description: str):
+        """
+        מחזיר קוד matplotlib לבקשה פשוטה, או None אם צריך לפנות ל-Gemini
+        """
+        try:
+            code = self._match(description)
+        except (ValueError, ZeroDivisionError, SyntaxError) as e:
+            logger.debug(f"Fast path rejected description: {e}")
+            code = None
+
+        with self._lock:
+            if code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if code is not None:
+            logger.info(f"Fast path matched description: {description}")
+        return code
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def _match(self, description: str):
+        text = ' '.join(description.lower().split())
+        consumed = []
+
+        def take(pattern):
+            match = pattern.search(text)
+            if match:
+                consumed.append(match.span())
+            return match
+
+        # נקודת מרכז כמו "במרכז (1, -1)" אינה תחום
+        center = CENTER_PATTERN.search(text)
+        x_range = None
+        for pattern in RANGE_PATTERNS:
+            match = next(
+                (m for m in pattern.finditer(text)
+                 if not center or m.end() <= center.start() or m.start() >= center.end()),
+                None
+            )
+            if match:
+                consumed.append(match.span())
+                x_range = (_parse_value(match.group(1)), _parse_value(match.group(2)))
+                if x_range[0] >= x_range[1]:
+                    return None
+                break
+
+        polygon_sides = [n for name, n in POLYGON_NAMES.items() if name in text]
+        side_count = take(SIDE_COUNT_PATTERN)
+        if side_count:
+            polygon_sides.append(int(side_count.group(1)))
+        shapes = len(polygon_sides) + ('מעגל' in text) + ('פרבולה' in text)
+        if shapes > 1:
+            return None
+
+        if polygon_sides:
+            code = self._polygon(polygon_sides[0], take)
+        elif 'מעגל' in text:
+            code = self._circle(take)
+        else:
+            expression = None
+            for pattern in EXPRESSION_PATTERNS:
+                match = take(pattern)
+                if match:
+                    expression = match.group(1).strip()
+                    break
+            if expression is None and 'פרבולה' in text:
+                expression = 'x^2'
+            if expression is None:
+                return None
+            code = self._function(expression, x_range)
+
+        if code is None or not self._fully_understood(text, consumed):
+            return None
+        return code
+
+    def _fully_understood(self, text: str, consumed: list) -> bool:
+        """
+        בודק שכל מה שנשאר בבקשה מחוץ לחלקים שפוענחו הוא מילות קישור מוכרות
+        """
+        for start, end in sorted(consumed, reverse=True):
+            text = text[:start] + ' ' + text[end:]
+
+        for word in re.split(r'[\s,.!?:;\-]+', text):
+            if not word:
+                continue
+            if word in FILLER_WORDS:
+                continue
+            if len(word) > 1 and word[0] in HEBREW_PREFIXES and word[1:] in FILLER_WORDS:
+                continue
+            if word in POLYGON_NAMES:
+                continue
+            logger.debug(f"Fast path: unknown word '{word}'")
+            return False
+        return True
+
+    def _circle(self, take):
+        radius = take(RADIUS_PATTERN)
+        r = float(radius.group(1)) if radius else 1.0
+        if r <= 0:
+            return None
+        center = take(CENTER_PATTERN)
+        cx, cy = (float(center.group(1)), float(center.group(2))) if center else (0.0, 0.0)
+
+        margin = r * 1.2
+        return CIRCLE_TEMPLATE.format(
+            cx=cx, cy=cy, r=r,
+            x_min=cx - margin, x_max=cx + margin,
+            y_min=cy - margin, y_max=cy + margin,
+            title=f"מעגל ברדיוס {r:g}"
+        )
+
+    def _polygon(self, n: int, take):
+        if not 3 <= n <= 100:
+            return None
+        side = take(SIDE_PATTERN)
+        radius = take(RADIUS_PATTERN)
+        if side and radius:
+            return None
+        if side:
+            circumradius = float(side.group(1)) / (2 * math.sin(math.pi / n))
+        elif radius:
+            circumradius = float(radius.group(1))
+        else:
+            circumradius = 1.0
+        if circumradius <= 0:
+            return None
+
+        # קודקוד למעלה במצולע אי-זוגי, בסיס אופקי במצולע זוגי
+        start_angle = math.pi / 2 if n % 2 else math.pi / 2 + math.pi / n
+        margin = circumradius * 1.2
+        return POLYGON_TEMPLATE.format(
+            n=n, radius=circumradius, start_angle=start_angle,
+            x_min=-margin, x_max=margin, y_min=-margin, y_max=margin,
+            title=POLYGON_TITLES.get(n, f"מצולע משוכלל עם {n} צלעות")
+        )
+
+    def _function(self, expression: str, x_range):
+        numpy_expression = _to_numpy_expression(expression)
+        if x_range is None:
+            if any(name in numpy_expression for name in ('np.sin', 'np.cos', 'np.tan')):
+                x_range = (-2 * math.pi, 2 * math.pi)
+            else:
+                x_range = (-10.0, 10.0)
+
+        return FUNCTION_TEMPLATE.format(
+            x_min=x_range[0], x_max=x_range[1],
+            expression=numpy_expression,
+            label=f"y = {expression}",
+            title="גרף הפונקציה"
+        )
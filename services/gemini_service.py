@@ -1,18 +1,88 @@
 import os
 import time
+import random
+import asyncio
+import inspect
 import logging
-from pathlib import Path
-from dotenv import load_dotenv
-import google.generativeai as genai
-from bidi.algorithm import get_display
-from utils.config import ALLOWED_MODULES
+import threading
+from utils.code_analyzer import analyze_code
+from services.example_store import ExampleStore
+from services.rate_limiter import TokenBucket, AdaptiveConcurrencyLimiter, QueueFullError
+from services.metrics import (
+    GEMINI_RETRIES, GEMINI_ERRORS, GEMINI_STREAM_SECONDS, GEMINI_PROMPT_CHARS, PROMPT_EXAMPLES
+)
 
 # הגדרת לוגר
 logger = logging.getLogger(__name__)
 
-# טעינת משתני הסביבה
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
+MODEL_NAME = 'gemini-2.0-flash-thinking-exp-01-21'
+
+# ההנחיות הקבועות לכל שרטוט חדש: נבנות פעם אחת לתהליך, ולא מחדש בכל בקשה
+GUIDELINES = """Write matplotlib code for a mathematical drawing. Rules:
+- Use only matplotlib, numpy, math and bidi.algorithm. Return ONLY complete, runnable Python code.
+- Start with plt.rcParams['font.family'] = 'Arial' and plt.rcParams['font.size'] = 12.
+- Wrap Hebrew text with get_display() (from bidi.algorithm import get_display).
+- Figure size (10, 10). Set tick positions (set_xticks) before tick labels (set_xticklabels).
+- End with plt.savefig() and plt.close(), never plt.show().
+- Geometric shapes: white background, no grid or axes unless asked, plt.axis('equal').
+- Functions and analytic geometry: coordinate system with grid. Clear, contrasting colors.
+"""
+# השורה שמסמנת את התיאור לשרטוט בסוף הפרומפט (אחרי הדוגמאות)
+TASK_PREFIX = "Create matplotlib code for the following mathematical drawing: "
+
+class GeminiRateLimitError(RuntimeError):
+    """
+    נזרקת כש-Gemini ממשיך להחזיר 429 / מכסה גם אחרי כל הניסיונות
+    """
+
+
+class GeminiBusyError(RuntimeError):
+    """
+    נזרקת כשתור ההמתנה ל-Gemini מלא
+    """
+
+
+def _google_exceptions():
+    """
+    google.api_core נטען רק כשיש שגיאה לסווג (או אחרי שהמודל נטען ממילא)
+    """
+    from google.api_core import exceptions
+    return exceptions
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    google_exceptions = _google_exceptions()
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+def _error_kind(error: Exception) -> str:
+    """
+    סוג השגיאה עבור המדדים
+    """
+    if _is_rate_limit_error(error):
+        return 'rate_limited'
+    if isinstance(error, (asyncio.TimeoutError, _google_exceptions().DeadlineExceeded)):
+        return 'timeout'
+    if _is_transient_error(error):
+        return 'transient'
+    return 'fatal'
+
+
+def _is_transient_error(error: Exception) -> bool:
+    if "500" in str(error) or "503" in str(error):
+        return True
+    google_exceptions = _google_exceptions()
+    return isinstance(error, (
+        google_exceptions.InternalServerError,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.BadGateway,
+        asyncio.TimeoutError,
+        ConnectionError,
+    ))
+
 
 class GeminiService:
     def __init__(self):
@@ -20,84 +90,282 @@ class GeminiService:
         if not self.api_key:
             raise ValueError("לא נמצא מפתח API של Gemini!")
         
-        # הגדרת Gemini
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
+        # המודל נוצר בשימוש הראשון (או ברקע אחרי שהבוט עלה), ראו model
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._system_instruction = False
+
+        # דוגמאות few-shot: תיאורים דומים שכבר רונדרו בהצלחה מצורפים לפרומפט עם הקוד שלהם
+        self.examples = ExampleStore(max_examples=int(os.getenv('PROMPT_EXAMPLE_STORE_SIZE', 500)))
+        self.prompt_examples = int(os.getenv('PROMPT_EXAMPLES', 2))
         
         # הגדרות retry
-        self.max_retries = 3
-        self.retry_delay = 2  # שניות
+        self.max_retries = int(os.getenv('GEMINI_MAX_RETRIES', 4))
+        self.retry_delay = 1  # שניות, בסיס להמתנה האקספוננציאלית
+        self.max_retry_delay = 30  # שניות
+        self.retry_count = 0
+        self.rate_limited_count = 0
+
+        # תשובה בזרימה (stream): אפשר לדווח על התקדמות ולחלץ את הקוד ברגע שבלוק הקוד נסגר
+        self.stream = os.getenv('GEMINI_STREAM', 'true').lower() in ('1', 'true', 'yes')
+
+        # מגביל קצב לפי המכסה, ומקביליות אדפטיבית שנחתכת אחרי 429
+        requests_per_minute = float(os.getenv('GEMINI_RPM', 15))
+        self.rate_limiter = TokenBucket(
+            rate=requests_per_minute / 60,
+            capacity=max(1, int(os.getenv('GEMINI_BURST', 3)))
+        )
+        max_concurrency = int(os.getenv('GEMINI_CONCURRENCY', 8))
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=max(1, max_concurrency // 2),
+            max_limit=max_concurrency,
+            max_queue=int(os.getenv('GEMINI_MAX_QUEUE', 100))
+        )
+
+    @property
+    def model(self):
+        """
+        מודל Gemini, שנוצר בגישה הראשונה: הייבוא של google.generativeai לוקח
+        חלק ניכר משנייה, והבוט צריך להתחיל לקבל עדכונים לפני כן
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    # גרסאות חדשות של ה-SDK מקבלות הוראות מערכת; ב-0.3.1 ההנחיות נשלחות עם כל פרומפט
+                    if 'system_instruction' in inspect.signature(genai.GenerativeModel).parameters:
+                        self._system_instruction = True
+                        self._model = genai.GenerativeModel(MODEL_NAME, system_instruction=GUIDELINES)
+                    else:
+                        self._model = genai.GenerativeModel(MODEL_NAME)
+        return self._model
+
+    @model.setter
+    def model(self, model) -> None:
+        self._model = model
+
+    async def _get_model(self):
+        """
+        המודל בלי לחסום את לולאת האירועים, אם הוא עוד לא נטען
+        """
+        if self._model is not None:
+            return self._model
+        return await asyncio.to_thread(lambda: self.model)
+
+    def _build_prompt(self, description: str) -> str:
+        """
+        בונה את הפרומפט ל-Gemini עבור תיאור נתון: דוגמאות לתיאורים דומים שכבר רונדרו בהצלחה,
+        ואחריהן התיאור עצמו. ההנחיות הקבועות לא כאן - ראו _with_guidelines
+        """
+        examples = self.examples.similar(description, self.prompt_examples)
+        if examples:
+            PROMPT_EXAMPLES.inc(len(examples))
+        shots = ''.join(
+            f"Example - {example.description}\n```python\n{example.code}\n```\n\n"
+            for example in examples
+        )
+        return f"{shots}{TASK_PREFIX}{description}\n"
+
+    def _with_guidelines(self, prompt: str) -> str:
+        """
+        ההנחיות הקבועות הן הוראות המערכת של המודל כשה-SDK תומך בכך (נשלחות פעם אחת לתהליך
+        כחלק מהמודל), ואחרת הן נוספות לפני הפרומפט
+        """
+        if self._system_instruction:
+            return prompt
+        return f"{GUIDELINES}\n{prompt}"
 
     def generate_code(self, description: str) -> str:
         """
         מקבל תיאור מילולי ומייצר קוד matplotlib מתאים
+        (עטיפה סינכרונית ל-generate_code_async, לשימוש מחוץ ללולאת אירועים)
+        """
+        return asyncio.run(self.generate_code_async(description))
+
+    async def generate_code_async(self, description: str, on_queued=None, on_progress=None) -> str:
+        """
+        מייצר קוד בלי לחסום את לולאת האירועים: ממתין לתור המקביליות ולמגביל הקצב,
+        ומנסה שוב שגיאות זמניות עם המתנה אקספוננציאלית אקראית.
+        on_queued(position) נקרא אם הבקשה נאלצה להמתין בתור.
+        on_progress(stage, lines) נקרא (בלי await) כשהבקשה נשלחה ('thinking')
+        ועם כל חלק של קוד שמגיע בזרימה ('writing', מספר השורות עד כה)
         """
         logger.info(f"Generating code for description: {description}")
-        
-        prompt = f"""Create matplotlib code for the following mathematical drawing: {description}
-        Important guidelines:
-        1. Use only matplotlib and math libraries
-        2. Return ONLY the Python code without any explanations
-        3. Make sure the code is complete and can run independently
-        4. For Hebrew text in labels or titles:
-           - Use plt.rcParams['font.family'] = 'Arial' at the start
-           - Add plt.rcParams['font.size'] = 12
-           - For any Hebrew text, use bidi layout by:
-             * First add: from bidi.algorithm import get_display
-             * Then wrap Hebrew text with get_display()
-             Example: title = get_display("שרטוט מתמטי")
-        5. When setting axis labels and ticks:
-           - First use ax.set_xticks() to set tick positions
-           - Then use ax.set_xticklabels() to set labels
-           - Do the same for y-axis
-        6. Use plt.savefig() instead of plt.show()
-        7. Clean up the plot after saving using plt.close()
-        8. Make sure to set figure size to (10, 10)
-        9. For the plot style:
-           - For geometric shapes (circles, triangles, polygons etc.) use a clean white background without grid or axes unless specifically requested
-           - For functions and analytical geometry (graphs, curves, etc.) include a proper coordinate system with grid
-           - Always use plt.axis('equal') for geometric shapes to maintain proportions
-           - Use clear, contrasting colors for better visibility
+        return await self._request_code(self._build_prompt(description), on_queued, on_progress, kind='generate')
+
+    async def repair_code_async(self, code: str, error_report: str, on_queued=None) -> str:
+        """
+        בקשת המשך ממוקדת לקוד שנכשל: רק הקוד והשגיאה, בלי הפרומפט המלא של התיאור
+        """
+        logger.info(f"Asking Gemini to repair code: {error_report.splitlines()[0]}")
+        return await self._request_code(self._build_repair_prompt(code, error_report), on_queued, kind='repair')
+
+    async def edit_code_async(self, code: str, description: str, request: str, on_queued=None, on_progress=None) -> str:
+        """
+        בקשת המשך לשרטוט קיים ("עכשיו עם משולש בפנים"): הקוד השמור והשינוי המבוקש,
+        בלי הפרומפט המלא של התיאור
+        """
+        logger.info(f"Asking Gemini to edit code: {request}")
+        return await self._request_code(
+            self._build_edit_prompt(code, description, request), on_queued, on_progress, kind='edit'
+        )
+
+    def _build_edit_prompt(self, code: str, description: str, request: str) -> str:
+        """
+        בונה את הפרומפט לעריכת קוד של שרטוט קיים
         """
+        return f"""This matplotlib code draws: {description}
+```python
+{code}
+```
+Change the drawing as follows: {request}
 
+Change only what this asks for and keep the rest of the code as it is.
+Use only matplotlib, numpy, math and bidi.algorithm (wrap Hebrew text with get_display).
+Return ONLY the complete updated Python code.
+"""
+
+    def _build_repair_prompt(self, code: str, error_report: str) -> str:
+        """
+        בונה את הפרומפט לתיקון קוד שנכשל
+        """
+        return f"""This matplotlib code failed:
+```python
+{code}
+```
+Error:
+{error_report}
+
+Fix only what causes the error, keep the drawing the same.
+Use only matplotlib, numpy, math and bidi.algorithm. Return ONLY the complete corrected Python code.
+"""
+
+    async def _request_code(self, prompt: str, on_queued=None, on_progress=None, kind: str = 'generate') -> str:
+        """
+        שולח פרומפט ל-Gemini ומחלץ את הקוד מהתשובה: ממתין לתור המקביליות ולמגביל הקצב,
+        ומנסה שוב שגיאות זמניות עם המתנה אקספוננציאלית אקראית.
+        kind - סוג הבקשה (generate / repair / edit), למדדים; רק ל-generate מצורפות ההנחיות הקבועות
+        """
         last_error = None
+        full_prompt = None
         for attempt in range(self.max_retries):
             try:
+                await self.concurrency_limiter.acquire(on_queued if attempt == 0 else None)
+            except QueueFullError:
+                logger.warning("Gemini queue is full, rejecting request")
+                raise GeminiBusyError("יותר מדי בקשות ממתינות ל-Gemini")
+
+            overloaded = False
+            try:
+                await self.rate_limiter.acquire()
                 logger.info(f"Attempt {attempt + 1}/{self.max_retries} to generate code")
-                response = self.model.generate_content(prompt)
-                code = self._extract_code(response.text)
+                model = await self._get_model()
+                if full_prompt is None:
+                    # ידוע רק אחרי שהמודל נוצר: האם ההנחיות כבר הוראות המערכת שלו
+                    full_prompt = self._with_guidelines(prompt) if kind == 'generate' else prompt
+                    GEMINI_PROMPT_CHARS.observe(len(full_prompt), kind=kind)
+                if on_progress:
+                    on_progress('thinking', 0)
+                if self.stream:
+                    code = await self._read_stream(model, full_prompt, on_progress)
+                else:
+                    response = await model.generate_content_async(full_prompt)
+                    code = self._extract_code(response.text)
                 logger.info("Code generated successfully")
                 logger.debug(f"Generated code:\n{code}")
                 return code
             except Exception as e:
                 last_error = e
-                if "500" in str(e):
-                    logger.warning(f"Server error on attempt {attempt + 1}, retrying...")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay * (attempt + 1))
-                        continue
-                logger.error(f"Failed to generate code: {str(e)}", exc_info=True)
-                raise RuntimeError(f"נכשל ליצור קוד אחרי {self.max_retries} ניסיונות. שגיאה אחרונה: {str(last_error)}")
+                GEMINI_ERRORS.inc(kind=_error_kind(e))
+                overloaded = _is_rate_limit_error(e)
+                if overloaded:
+                    self.rate_limited_count += 1
+                    self.rate_limiter.drain()
+                if not (overloaded or _is_transient_error(e)):
+                    logger.error(f"Failed to generate code: {str(e)}", exc_info=True)
+                    raise RuntimeError(f"נכשל ליצור קוד. שגיאה: {str(e)}")
+                logger.warning(f"Retryable Gemini error on attempt {attempt + 1}: {str(e)}")
+            finally:
+                self.concurrency_limiter.release(overloaded=overloaded)
+
+            if attempt < self.max_retries - 1:
+                self.retry_count += 1
+                GEMINI_RETRIES.inc()
+                # full jitter: המתנה אקראית עד לתקרה שגדלה אקספוננציאלית
+                delay = random.uniform(0, min(self.max_retry_delay, self.retry_delay * 2 ** attempt))
+                await asyncio.sleep(delay)
+
+        logger.error(f"Failed to generate code: {str(last_error)}")
+        if _is_rate_limit_error(last_error):
+            raise GeminiRateLimitError(f"הגענו למגבלת הבקשות של Gemini: {str(last_error)}")
+        raise RuntimeError(f"נכשל ליצור קוד אחרי {self.max_retries} ניסיונות. שגיאה אחרונה: {str(last_error)}")
+
+    async def _read_stream(self, model, prompt: str, on_progress=None) -> str:
+        """
+        קורא את התשובה בזרימה ומחזיר את הקוד ברגע שבלוק הקוד נסגר,
+        בלי לחכות להסברים שהמודל כותב אחריו
+        """
+        start = time.perf_counter()
+        response = await model.generate_content_async(prompt, stream=True)
+        chunks = response.__aiter__()
+        text = ''
+        try:
+            async for chunk in chunks:
+                try:
+                    part = chunk.text
+                except ValueError:
+                    # חלק בלי טקסט (למשל רק מטא-דאטה של בטיחות)
+                    continue
+                if not text:
+                    GEMINI_STREAM_SECONDS.observe(time.perf_counter() - start, phase='first_chunk')
+                text += part
+                code = self._find_complete_code(text)
+                if code is not None:
+                    GEMINI_STREAM_SECONDS.observe(time.perf_counter() - start, phase='code_ready')
+                    logger.debug(f"Code block closed after {len(text)} characters, not waiting for the rest")
+                    return code
+                if on_progress:
+                    opened = self._open_code_block(text)
+                    if opened is not None:
+                        on_progress('writing', opened.count('\n'))
+        finally:
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+
+        GEMINI_STREAM_SECONDS.observe(time.perf_counter() - start, phase='code_ready')
+        return self._extract_code(text)
+
+    def _open_code_block(self, text: str):
+        """
+        הקוד שהגיע עד כה בתוך בלוק קוד פתוח, או None אם הבלוק עוד לא נפתח
+        """
+        fence = text.find('```')
+        if fence == -1:
+            return None
+        start = text.find('\n', fence)
+        return text[start + 1:] if start != -1 else ''
+
+    def _find_complete_code(self, text: str):
+        """
+        הקוד מבלוק הקוד הראשון אם הוא כבר נסגר, אחרת None
+        """
+        fence = text.find('```')
+        if fence == -1:
+            return None
+        start = text.find('\n', fence)
+        if start == -1:
+            return None
+        end = text.find('```', start)
+        if end == -1:
+            return None
+        return self._extract_code(text[:end + 3])
 
     def validate_code(self, code: str) -> bool:
         """
         בודק שהקוד בטוח ומתאים להרצה
         """
-        logger.info("Starting code validation")
-        logger.debug(f"Code to validate:\n{code}")
-        
-        # בדיקת ייבוא ספריות
-        import_lines = [line.strip() for line in code.split('\n') 
-                       if line.strip().startswith('import') or 'from' in line]
-        
-        logger.info("Found import lines:")
-        for line in import_lines:
-            logger.info(f"  {line}")
-            if not any(lib in line for lib in ALLOWED_MODULES):
-                logger.warning(f"Validation failed: Unauthorized import: {line}")
-                return False
-                
-        return True
+        return analyze_code(code).is_safe
 
     def _extract_code(self, response: str) -> str:
         """
@@ -0,0 +1,157 @@
+import io
+import os
+import logging
+from PIL import Image, ImageChops
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# שוליים (בפיקסלים) שנשארים סביב השרטוט אחרי חיתוך הרקע
+TRIM_PADDING = 12
+
+# מעל מספר צבעים כזה התמונה "צילומית" (מפת צבעים, משטח) ו-PNG עם פלטה יפגע בה
+PHOTO_COLOR_THRESHOLD = 65536
+
+# צעדי הקטנה כשהתמונה חורגת מתקציב הבתים, והצד הקצר המינימלי
+DOWNSCALE_FACTOR = 0.8
+MIN_SIDE = 480
+
+# פורמטים נתמכים
+FORMATS = {'auto', 'png', 'jpeg', 'webp'}
+
+
+class ImageEncoder:
+    """
+    שלב הקידוד שאחרי הרינדור: בחירת DPI, חיתוך שוליים לבנים,
+    ובחירת PNG עם פלטה / JPEG / WebP בתוך תקציב של פיקסלים ובתים
+    """
+    def __init__(self):
+        self.max_side = int(os.getenv('IMAGE_MAX_SIDE', 1280))
+        self.max_bytes = int(os.getenv('IMAGE_MAX_BYTES', 1024 * 1024))
+        self.format = os.getenv('IMAGE_FORMAT', 'auto').lower()
+        self.jpeg_quality = int(os.getenv('IMAGE_JPEG_QUALITY', 90))
+        if self.format not in FORMATS:
+            logger.warning(f"Unknown IMAGE_FORMAT '{self.format}', using auto")
+            self.format = 'auto'
+
+    def pick_dpi(self, fig, requested_dpi: float) -> float:
+        """
+        ה-DPI שהקוד ביקש, מוקטן כך שהצד הארוך לא יעבור את max_side.
+        טלגרם מקטינה תמונות גדולות ממילא, ורינדור גדול יותר רק מאט את ההעלאה
+        """
+        longest_inches = max(fig.get_size_inches())
+        if longest_inches <= 0 or not self.max_side:
+            return requested_dpi
+        return min(requested_dpi, self.max_side / longest_inches)
+
+    def encode(self, image: Image.Image) -> io.BytesIO:
+        """
+        מקבל את התמונה שרונדרה ומחזיר אותה מקודדת בתוך התקציב
+        """
+        image = self._flatten(image)
+        image = self._trim(image)
+        image = self._fit_side(image)
+
+        fmt = self.format if self.format != 'auto' else self._choose_format(image)
+        quality = self.jpeg_quality
+        data = self._encode_as(image, fmt, quality)
+
+        # מעל התקציב: קודם מורידים איכות (רק בפורמטים עם איבוד), אחר כך מקטינים
+        while len(data) > self.max_bytes:
+            if fmt in ('jpeg', 'webp') and quality > 70:
+                quality -= 10
+            elif min(image.size) * DOWNSCALE_FACTOR >= MIN_SIDE:
+                size = (int(image.width * DOWNSCALE_FACTOR), int(image.height * DOWNSCALE_FACTOR))
+                image = image.resize(size, Image.LANCZOS)
+            else:
+                logger.warning(f"Image is still {len(data)} bytes at the smallest allowed size")
+                break
+            data = self._encode_as(image, fmt, quality)
+
+        logger.info(f"Encoded {image.width}x{image.height} {fmt}: {len(data)} bytes")
+        return io.BytesIO(data)
+
+    @staticmethod
+    def _flatten(image: Image.Image) -> Image.Image:
+        """
+        מניח רקע לבן מתחת לשקיפות - טלגרם ממירה תמונות ל-JPEG, ושקיפות הופכת לשחור
+        """
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            if image.getchannel('A').getextrema() == (255, 255):
+                return image.convert('RGB')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+    @staticmethod
+    def _trim(image: Image.Image) -> Image.Image:
+        """
+        חותך שוליים בצבע הרקע (לפי הפיקסל השמאלי העליון), ומשאיר ריפוד קטן
+        """
+        background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+        bbox = ImageChops.difference(image, background).getbbox()
+        if not bbox:
+            return image
+        left, top, right, bottom = bbox
+        bbox = (
+            max(0, left - TRIM_PADDING),
+            max(0, top - TRIM_PADDING),
+            min(image.width, right + TRIM_PADDING),
+            min(image.height, bottom + TRIM_PADDING),
+        )
+        if bbox == (0, 0, image.width, image.height):
+            return image
+        return image.crop(bbox)
+
+    def _fit_side(self, image: Image.Image) -> Image.Image:
+        if not self.max_side or max(image.size) <= self.max_side:
+            return image
+        scale = self.max_side / max(image.size)
+        return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+
+    @staticmethod
+    def _choose_format(image: Image.Image) -> str:
+        """
+        גרפים, טקסט וצורות: PNG עם פלטה (חד, וקטן פי כמה).
+        תמונות עם מעברי צבע רבים: JPEG
+        """
+        if image.getcolors(PHOTO_COLOR_THRESHOLD) is None:
+            return 'jpeg'
+        return 'png'
+
+    @staticmethod
+    def _encode_as(image: Image.Image, fmt: str, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        if fmt == 'png':
+            # פלטה של 256 צבעים בכימות octree - שומר על קצוות חדים של טקסט
+            palette_image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+            palette_image.save(buffer, format='PNG')
+        elif fmt == 'webp':
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        else:
+            # בלי subsampling של הצבע, כדי שטקסט צבעוני לא יימרח
+            try:
+                image.save(buffer, format='JPEG', quality=quality, subsampling=0, optimize=True)
+            except OSError:
+                # עם optimize כל הקובץ נכתב לבאפר אחד בגודל בית לפיקסל, ותמונה רועשת
+                # באיכות גבוהה גדולה ממנו - בלי optimize הקידוד נכתב בחלקים
+                buffer = io.BytesIO()
+                image.save(buffer, format='JPEG', quality=quality, subsampling=0)
+        return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 10))
+    plt.plot([0, 1, 2], [0, 1, 4])
+    raw = io.BytesIO()
+    fig.savefig(raw, format='png', dpi=300)
+    raw.seek(0)
+    encoded = ImageEncoder().encode(Image.open(raw))
+    print(f"{len(raw.getvalue())} -> {len(encoded.getvalue())} bytes")
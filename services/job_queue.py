@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    update_id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    replies TEXT NOT NULL DEFAULT '{}',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, available_at);
+"""
+
+# מצבים של עבודה בתור
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """
+    עבודה אחת מהתור: הודעה של משתמש שצריך לייצר עבורה שרטוט
+    """
+    def __init__(self, update_id: int, chat_id: int, user_id: int, message_id: int,
+                 payload: dict, attempts: int, replies: dict = None):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.payload = payload
+        self.attempts = attempts
+        # התשובות שכבר נשלחו במסירות קודמות: מפתח של תשובה -> ה-message_id שלה
+        self.replies = replies or {}
+
+
+class JobQueue:
+    """
+    תור עבודות מתמיד ב-SQLite, משותף לתהליך שמקבל עדכונים מטלגרם ולתהליכי העבודה.
+    - המפתח הוא update_id של טלגרם, כך שעדכון שנשלח שוב (webhook שלא אושר בזמן) לא ייכנס פעמיים
+    - עבודה נלקחת עם lease; אם התהליך נפל באמצעה, ה-lease פג והיא נמסרת שוב (at-least-once)
+    - כל תשובה נשמרת מיד אחרי השליחה (לפי מפתח, ראו QueuedMessage), כך שמסירה חוזרת
+      לא שולחת שוב את מה שכבר נשלח - גם באמצע דף עבודה
+    """
+    def __init__(self, path, lease_seconds: float = 120, max_attempts: int = 3,
+                 retry_delay: float = 5.0, keep_seconds: float = 24 * 60 * 60):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_seconds = keep_seconds
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # קובץ תור מגרסה קודמת, שבה נשמרה רק תשובה אחת לכל עבודה
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'replies' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN replies TEXT NOT NULL DEFAULT '{}'")
+
+    def _connect(self) -> sqlite3.Connection:
+        # חיבור חדש לכל פעולה - זול ב-SQLite, ובטוח בין threads ותהליכים
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, update_id: int, chat_id: int, user_id: int, message_id: int, payload: dict) -> bool:
+        """
+        מוסיף עבודה לתור. מחזיר False אם העדכון כבר נמצא בתור (מסירה כפולה מטלגרם)
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (update_id, chat_id, user_id, message_id, payload,"
+                " available_at, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (update_id, chat_id, user_id, message_id,
+                 json.dumps(payload, ensure_ascii=False), now, now, now)
+            )
+            added = cursor.rowcount == 1
+        finally:
+            conn.close()
+        if not added:
+            logger.info(f"Update {update_id} is already queued, ignoring the duplicate")
+        return added
+
+    def claim(self, worker: str, limit: int = 1) -> list:
+        """
+        לוקח עד limit עבודות שממתינות (או שה-lease שלהן פג) ומסמן אותן כרצות אצל worker
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT update_id, chat_id, user_id, message_id, payload, attempts, replies"
+                " FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)"
+                " ORDER BY available_at LIMIT ?",
+                (QUEUED, now, RUNNING, now, limit)
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?,"
+                    " updated = ? WHERE update_id = ?",
+                    (RUNNING, now + self.lease_seconds, worker, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return [
+            Job(update_id, chat_id, user_id, message_id, json.loads(payload), attempts + 1, json.loads(replies))
+            for update_id, chat_id, user_id, message_id, payload, attempts, replies in rows
+        ]
+
+    def extend(self, update_ids: list, worker: str) -> None:
+        """
+        מאריך את ה-lease של עבודות שעדיין רצות אצל worker
+        """
+        if not update_ids:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE update_id = ? AND worker = ? AND status = ?",
+                [(now + self.lease_seconds, now, update_id, worker, RUNNING) for update_id in update_ids]
+            )
+        finally:
+            conn.close()
+
+    def record_replies(self, update_id: int, replies: dict) -> None:
+        """
+        שומר שהתשובות לעדכון כבר נשלחו (מפתח של תשובה -> ה-message_id שלה)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT replies FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+            if row is not None:
+                recorded = json.loads(row[0])
+                recorded.update(replies)
+                conn.execute(
+                    "UPDATE jobs SET replies = ?, updated = ? WHERE update_id = ?",
+                    (json.dumps(recorded, ensure_ascii=False), time.time(), update_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, update_id: int) -> None:
+        self._set_status(update_id, DONE)
+
+    def release(self, job: Job, error: str = None) -> None:
+        """
+        מחזיר עבודה שלא הסתיימה לתור (אחרי השהיה), או מסמן אותה כנכשלת אחרי max_attempts
+        """
+        if error and job.attempts >= self.max_attempts:
+            logger.error(f"Job {job.update_id} failed after {job.attempts} attempts: {error}")
+            self._set_status(job.update_id, FAILED)
+            return
+        now = time.time()
+        delay = self.retry_delay * job.attempts if error else 0
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, worker = NULL,"
+                " updated = ? WHERE update_id = ? AND status = ?",
+                (QUEUED, now + delay, now, job.update_id, RUNNING)
+            )
+        finally:
+            conn.close()
+
+    def _set_status(self, update_id: int, status: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL, updated = ? WHERE update_id = ?",
+                (status, time.time(), update_id)
+            )
+        finally:
+            conn.close()
+
+    def purge(self) -> int:
+        """
+        מוחק עבודות שהסתיימו לפני יותר מ-keep_seconds
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, FAILED, time.time() - self.keep_seconds)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    import tempfile
+
+    queue = JobQueue(Path(tempfile.mkdtemp()) / "jobs.sqlite3")
+    queue.enqueue(1, chat_id=10, user_id=10, message_id=5, payload={'text': 'צייר מעגל'})
+    print("duplicate added:", queue.enqueue(1, chat_id=10, user_id=10, message_id=5, payload={}))
+    for job in queue.claim(f"example-{os.getpid()}"):
+        print(job.update_id, job.payload, job.attempts)
+        queue.complete(job.update_id)
+    print(queue.stats())
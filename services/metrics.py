@@ -0,0 +1,348 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# גבולות ברירת המחדל של היסטוגרמות זמן, בשניות
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# גבולות היסטוגרמת זיכרון, בבתים (64MB עד 4GB)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(6, 13))
+
+# גבולות היסטוגרמת ההאצה של לולאות שהומרו למערכים (פי כמה)
+SPEEDUP_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# גבולות היסטוגרמת אורך הפרומפטים, בתווים
+PROMPT_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """
+    מונה שרק עולה, עם תוויות אופציונליות
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        # מונה בלי תוויות מופיע כבר מההתחלה עם 0
+        self._values = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    ערך נוכחי. אפשר לקבוע ערך ידנית, או פונקציה שנקראת רק בזמן הקריאה של /metrics
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.warning(f"Could not collect gauge {self.name}: {str(e)}")
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """
+    היסטוגרמה מצטברת בסגנון Prometheus (דליים, סכום ומספר תצפיות)
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # מונה לכל דלי (לא מצטבר), ועוד אחד ל-+Inf, סכום ומספר
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((key, [list(series[0]), series[1], series[2]]) for key, series in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    אוסף המדדים של התהליך. get-or-create לפי שם, כך שמודולים יכולים להגדיר מדדים ברמת המודול
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames=labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames=labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        מחזיר את כל המדדים בפורמט הטקסט של Prometheus
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# הרישום הגלובלי של התהליך
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'drawing_stage_seconds', 'Time spent in each stage of handling a drawing request', ('stage',)
+)
+REQUESTS = REGISTRY.counter(
+    'drawing_requests_total', 'Drawing requests by outcome', ('outcome',)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'drawing_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result')
+)
+REJECTIONS = REGISTRY.counter(
+    'drawing_rejections_total', 'Requests rejected before a drawing was sent', ('reason',)
+)
+GEMINI_RETRIES = REGISTRY.counter(
+    'drawing_gemini_retries_total', 'Gemini calls retried after a transient error or 429'
+)
+GEMINI_STREAM_SECONDS = REGISTRY.histogram(
+    'drawing_gemini_stream_seconds', 'Time from a streamed Gemini request to its first chunk and to a complete code block',
+    ('phase',)
+)
+GEMINI_PROMPT_CHARS = REGISTRY.histogram(
+    'drawing_gemini_prompt_chars', 'Length of the prompts sent to Gemini, by request kind', ('kind',),
+    buckets=PROMPT_BUCKETS
+)
+PROMPT_EXAMPLES = REGISTRY.counter(
+    'drawing_gemini_prompt_examples_total', 'Similar rendered examples added to generation prompts'
+)
+GEMINI_ERRORS = REGISTRY.counter(
+    'drawing_gemini_errors_total', 'Failed Gemini calls by kind', ('kind',)
+)
+RENDER_LIMITS = REGISTRY.counter(
+    'drawing_render_limit_exceeded_total', 'Renders stopped by a resource limit', ('limit',)
+)
+RENDER_CPU_SECONDS = REGISTRY.histogram(
+    'drawing_render_cpu_seconds', 'CPU time used by a single render in a worker process'
+)
+RENDER_PEAK_MEMORY = REGISTRY.histogram(
+    'drawing_render_peak_memory_bytes', 'Peak resident memory of the worker process during a render',
+    buckets=MEMORY_BUCKETS
+)
+RESUBMISSIONS = REGISTRY.counter(
+    'drawing_resubmissions_total', 'Descriptions sent again by a user while the same request was still in progress'
+)
+REPAIRS = REGISTRY.counter(
+    'drawing_repairs_total', 'Repairs of failed generated code by stage and result', ('stage', 'result')
+)
+ROUND_TRIPS_SAVED = REGISTRY.counter(
+    'drawing_gemini_round_trips_saved_total', 'Failed code fixed locally, without another Gemini call'
+)
+RENDER_VERTICES = REGISTRY.counter(
+    'drawing_render_vertices_total', 'Vertices in drawn figures before and after the render policy', ('stage',)
+)
+RENDER_ARTISTS = REGISTRY.counter(
+    'drawing_render_artists_total', 'Data artists in drawn figures before and after the render policy', ('stage',)
+)
+RENDER_POLICY_ACTIONS = REGISTRY.counter(
+    'drawing_render_policy_actions_total', 'Artists decimated, merged into collections or rasterized', ('action',)
+)
+VECTORIZED_LOOPS = REGISTRY.counter(
+    'drawing_vectorized_loops_total', 'Scalar loops in generated code run as numpy arrays, by result', ('result',)
+)
+VECTORIZE_SPEEDUP = REGISTRY.histogram(
+    'drawing_vectorize_speedup', 'Estimated speedup of a vectorized loop over running it in Python',
+    buckets=SPEEDUP_BUCKETS
+)
+SESSION_EDITS = REGISTRY.counter(
+    'drawing_session_edits_total', 'Follow-ups to the previous drawing of a chat, by where they were resolved', ('stage',)
+)
+BATCH_ITEMS = REGISTRY.counter(
+    'drawing_batch_items_total', 'Descriptions in batch requests (worksheets), by result', ('result',)
+)
+
+
+class RequestTrace:
+    """
+    מודד את משך השלבים של בקשה אחת, מעדכן את ההיסטוגרמות,
+    ובסוף כותב שורת לוג מובנית אחת עם כל הזמנים
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.outcome = 'error'
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def finish(self) -> None:
+        self.record('total', time.perf_counter() - self.started)
+        REQUESTS.inc(outcome=self.outcome)
+        timings = {stage: round(seconds, 4) for stage, seconds in self.durations.items()}
+        logger.info(f"Request finished: {json.dumps({'outcome': self.outcome, 'seconds': timings})}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # בלי לוג לכל סריקה של Prometheus
+        pass
+
+
+class MetricsServer:
+    """
+    שרת HTTP קטן ב-thread רקע שמגיש את /metrics
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 9464, registry: MetricsRegistry = REGISTRY):
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self) -> None:
+        self.thread.start()
+        logger.info(f"Metrics available at http://{self.server.server_address[0]}:{self.port}/metrics")
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    trace = RequestTrace()
+    with trace.span('generate'):
+        time.sleep(0.01)
+    trace.outcome = 'ok'
+    trace.finish()
+    print(REGISTRY.render())
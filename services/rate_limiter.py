@@ -0,0 +1,122 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    """
+    נזרקת כשתור ההמתנה מלא ואין טעם להמתין
+    """
+
+
+class TokenBucket:
+    """
+    מגביל קצב אסינכרוני: rate אסימונים לשנייה, עד capacity ברצף
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        # הנעילה שומרת על סדר FIFO בין הממתינים
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self) -> None:
+        """
+        מרוקן את הדלי - אחרי 429 השרת כבר אמר לנו שאנחנו מהירים מדי
+        """
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    מגביל מקביליות בשיטת AIMD: עלייה הדרגתית אחרי הצלחות,
+    וחיתוך כפלי של המגבלה אחרי עומס (429). בקשות מעבר למגבלה ממתינות בתור חסום
+    """
+    def __init__(self, initial_limit: int, min_limit: int = 1, max_limit: int = 16,
+                 decrease_factor: float = 0.5, max_queue: int = 100):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = deque()
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self, on_queued=None) -> None:
+        """
+        ממתין למקום פנוי. on_queued(position) נקרא אם הבקשה נכנסה לתור
+        """
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise QueueFullError("תור הבקשות מלא")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if on_queued is not None:
+            await on_queued(len(self._waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not waiter.cancelled():
+                # קיבלנו מקום אבל בוטלנו - מעבירים אותו הלאה
+                self.in_flight -= 1
+                self._wake_waiters()
+            raise
+
+    def release(self, overloaded: bool = False) -> None:
+        """
+        משחרר מקום ומעדכן את המגבלה לפי תוצאת הבקשה
+        """
+        self.in_flight -= 1
+        if overloaded:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            logger.warning(f"Overload detected, concurrency limit reduced to {int(self.limit)}")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'queued': len(self._waiters)
+        }
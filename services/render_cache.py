@@ -0,0 +1,204 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    code_hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    file_id TEXT,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    format TEXT
+);
+CREATE INDEX IF NOT EXISTS renders_last_used ON renders (last_used);
+"""
+
+# סיומת הקובץ לכל פורמט שה-encoder מייצר
+IMAGE_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+# הגדרות שמשנות את התמונה שיוצאת מאותו קוד - חלק ממפתח המטמון
+RENDER_SETTINGS = (
+    'IMAGE_FORMAT', 'IMAGE_MAX_SIDE', 'IMAGE_MAX_BYTES', 'IMAGE_JPEG_QUALITY',
+    'RENDER_POLICY', 'RENDER_DECIMATE_MIN_POINTS', 'RENDER_MERGE_MIN_ARTISTS',
+)
+
+
+def code_hash(code: str) -> str:
+    """
+    מחזיר מפתח תוכן (hash) לקוד
+    """
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def render_settings() -> str:
+    """
+    טביעת האצבע של הגדרות הרינדור והקידוד הנוכחיות (נקראת מהסביבה, בלי לטעון את matplotlib)
+    """
+    return ';'.join(f"{name}={os.getenv(name, '').strip().lower()}" for name in RENDER_SETTINGS)
+
+
+def image_format(data: bytes) -> str:
+    """
+    הפורמט של תמונה לפי הבתים הראשונים שלה (ה-encoder בוחר PNG, JPEG או WebP)
+    """
+    if data is not None and data.startswith(b'\xff\xd8'):
+        return 'jpeg'
+    if data is not None and data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'png'
+
+
+def image_filename(fmt: str, stem: str = 'drawing') -> str:
+    """
+    שם קובץ לשליחה לטלגרם, עם הסיומת של הפורמט
+    """
+    return f"{stem}.{IMAGE_EXTENSIONS.get(fmt, 'png')}"
+
+
+class RenderCache:
+    """
+    מטמון תמונות מתמיד על הדיסק: SQLite לאינדקס ותיקיית קבצים לתמונות.
+    שומר גם את ה-file_id של טלגרם, כדי שבקשה חוזרת תישלח בלי רינדור ובלי העלאה.
+    המפתח כולל את הגדרות הרינדור (settings), כך ששינוי שלהן לא מחזיר תמונות ישנות.
+    בטוח לשימוש מכמה תהליכים שחולקים את אותה תיקייה
+    """
+    def __init__(self, directory, max_bytes: int = 512 * 1024 * 1024, settings: str = ''):
+        self.directory = Path(directory)
+        self.settings = settings
+        self.blob_dir = self.directory / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "renders.sqlite3"
+        self.max_bytes = max_bytes
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # מטמון מגרסה קודמת, לפני שנשמר הפורמט: כל התמונות בו נשמרו בשם .png
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(renders)")}
+            if 'format' not in columns:
+                conn.execute("ALTER TABLE renders ADD COLUMN format TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        # חיבור חדש לכל פעולה - זול ב-SQLite, ובטוח בין threads ותהליכים
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _key(self, code: str) -> str:
+        return code_hash(f"{self.settings}\n{code}") if self.settings else code_hash(code)
+
+    def _blob_path(self, key: str, fmt: str) -> Path:
+        return self.blob_dir / f"{key}.{IMAGE_EXTENSIONS.get(fmt, 'png')}"
+
+    def get(self, code: str):
+        """
+        מחזיר (file_id, image_bytes, format) עבור הקוד, או (None, None, None) אם אין במטמון
+        """
+        key = self._key(code)
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT file_id, format FROM renders WHERE code_hash = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None, None, None
+                conn.execute(
+                    "UPDATE renders SET last_used = ? WHERE code_hash = ?", (time.time(), key)
+                )
+        finally:
+            conn.close()
+
+        file_id, fmt = row
+        if file_id:
+            return file_id, None, fmt
+
+        try:
+            image_bytes = self._blob_path(key, fmt).read_bytes()
+        except FileNotFoundError:
+            # תהליך אחר פינה את הקובץ בינתיים
+            return None, None, None
+        return None, image_bytes, fmt or image_format(image_bytes)
+
+    def put(self, code: str, image_bytes: bytes) -> None:
+        """
+        שומר תמונה עבור קוד, ומפנה את הרשומות הישנות ביותר אם חרגנו מהגודל המותר
+        """
+        key = self._key(code)
+        fmt = image_format(image_bytes)
+
+        # כתיבה לקובץ זמני והחלפה אטומית, כך שקורא אחר לא יראה קובץ חלקי
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(temp_path, self._blob_path(key, fmt))
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                previous = conn.execute(
+                    "SELECT format FROM renders WHERE code_hash = ?", (key,)
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO renders (code_hash, size, file_id, created, last_used, format) "
+                    "VALUES (?, ?, NULL, ?, ?, ?) "
+                    "ON CONFLICT(code_hash) DO UPDATE SET size = excluded.size, last_used = excluded.last_used, "
+                    "format = excluded.format",
+                    (key, len(image_bytes), now, now, fmt)
+                )
+            if previous is not None and self._blob_path(key, previous[0]) != self._blob_path(key, fmt):
+                # אותו קוד קודד בעבר בפורמט אחר (למשל אחרי שינוי IMAGE_FORMAT)
+                self._blob_path(key, previous[0]).unlink(missing_ok=True)
+            self._evict(conn)
+        finally:
+            conn.close()
+
+    def set_file_id(self, code: str, file_id: str) -> None:
+        """
+        שומר את ה-file_id שטלגרם החזיר עבור התמונה של הקוד
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE renders SET file_id = ? WHERE code_hash = ?", (file_id, self._key(code))
+                )
+        finally:
+            conn.close()
+
+    def forget_file_id(self, code: str) -> None:
+        """
+        מוחק file_id שטלגרם כבר לא מקבל
+        """
+        self.set_file_id(code, None)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        with conn:
+            for key, size, fmt in conn.execute(
+                "SELECT code_hash, size, format FROM renders ORDER BY last_used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM renders WHERE code_hash = ?", (key,))
+                evicted.append((key, fmt))
+                total -= size
+
+        for key, fmt in evicted:
+            self._blob_path(key, fmt).unlink(missing_ok=True)
+        logger.info(f"Evicted {len(evicted)} renders from the render cache")
@@ -0,0 +1,282 @@
+import os
+import logging
+from contextlib import contextmanager
+import numpy as np
+import matplotlib
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from matplotlib.collections import Collection, LineCollection, PathCollection, QuadMesh
+from matplotlib.colors import to_rgba
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מדלדלים קו רק כשיש לו יותר נקודות מזה (ומיותר מכמה נקודות לכל פיקסל ברוחב הצירים)
+DECIMATE_MIN_POINTS = 5000
+
+# עמודות לכל פיקסל בדילול min/max של קו שה-x שלו מונוטוני
+COLUMNS_PER_PIXEL = 2
+
+# מאחדים לאוסף אחד קבוצה של לפחות כך הרבה קווים או צורות קטנים עם אותו סגנון
+MERGE_MIN_ARTISTS = 50
+
+# אובייקט עם יותר קודקודים מזה מסומן לרסטור (משפיע על פלט וקטורי, למשל PDF)
+RASTERIZE_MIN_VERTICES = 100_000
+
+# גודל המקטע ש-Agg מצייר בבת אחת, כשנתיב ארוך מדי נכשל בציור רגיל
+AGG_CHUNK_SIZE = 20_000
+
+# קוד המיקום 'best' של מקרא - נקבע בזמן הציור לפי הנקודות של הקווים
+LEGEND_BEST = 0
+
+
+class RenderReport:
+    """
+    מה מדיניות הרינדור עשתה לגרף: קודקודים ואובייקטים לפני ואחרי, וכמה דולדלו, אוחדו ורוסטרו
+    """
+    def __init__(self):
+        self.vertices_before = 0
+        self.vertices_after = 0
+        self.artists_before = 0
+        self.artists_after = 0
+        self.decimated = 0
+        self.merged = 0
+        self.rasterized = 0
+
+    def add(self, other: 'RenderReport') -> None:
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _vertex_count(artist) -> int:
+    if isinstance(artist, Line2D):
+        return len(artist.get_xydata())
+    if isinstance(artist, QuadMesh):
+        # get_paths() בונה את כל הנתיבים - מספיק לספור את קודקודי הרשת
+        coordinates = artist.get_coordinates()
+        return coordinates.shape[0] * coordinates.shape[1]
+    if isinstance(artist, Collection):
+        paths = artist.get_paths()
+        if len(paths) == 1:
+            return len(paths[0].vertices) * max(1, len(artist.get_offsets()))
+        return sum(len(path.vertices) for path in paths)
+    if isinstance(artist, Patch):
+        return len(artist.get_path().vertices)
+    return 0
+
+
+def _data_artists(ax) -> list:
+    return [*ax.lines, *ax.collections, *ax.patches]
+
+
+def _solid(line: Line2D) -> bool:
+    """
+    קו רציף פשוט: בלי סמנים, מקפים, drawstyle או אפקטים, כך שאפשר לוותר על נקודות
+    """
+    return (
+        line.get_visible()
+        and line.get_marker() in ('None', 'none', '', ' ', None)
+        and line.get_linestyle() == '-'
+        and line.get_drawstyle() == 'default'
+        and not line.get_path_effects()
+        and line.get_sketch_params() is None
+    )
+
+
+def _m4_indices(px: np.ndarray, py: np.ndarray, column: float) -> np.ndarray:
+    """
+    דילול min/max לקו שה-x שלו מונוטוני: בכל עמודה נשמרות הנקודה הראשונה, האחרונה,
+    הנמוכה והגבוהה - אותם פיקסלים מצוירים כמו עם כל הנקודות.
+    נקודות לא סופיות (שבירות בקו) נשמרות, ועמודה לא נמשכת מעבר לשבירה
+    """
+    finite = np.isfinite(px) & np.isfinite(py)
+    broken = np.flatnonzero(~finite)
+    indices = np.flatnonzero(finite) if len(broken) else np.arange(len(px))
+    if px[indices[-1]] < px[indices[0]]:
+        px = -px
+    keys = np.floor((px[indices] - px[indices[0]]) / column).astype(np.int64)
+    if len(broken):
+        # מספר המקטע (בין שבירות) נכנס למפתח, כך שעמודה לא חוצה שבירה
+        keys += np.cumsum(~finite)[indices] * (keys[-1] + 2)
+    values = py[indices]
+    starts = np.flatnonzero(np.r_[True, np.diff(keys) != 0])
+    counts = np.diff(np.r_[starts, len(indices)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    keep = [starts, starts + counts - 1]
+    for reduce in (np.minimum, np.maximum):
+        hits = np.flatnonzero(values == np.repeat(reduce.reduceat(values, starts), counts))
+        _, first = np.unique(group[hits], return_index=True)
+        keep.append(hits[first])
+    return np.unique(np.concatenate([indices[np.concatenate(keep)], broken]))
+
+
+class RenderPolicy:
+    """
+    מקל על הרינדור של גרפים צפופים מאוד לפני הציור, בלי שינוי שרואים ב-DPI של התמונה:
+    - קווים עם הרבה יותר נקודות מפיקסלים מדולדלים לפי הרזולוציה של הפלט
+    - הרבה קווים או צורות קטנים באותו סגנון מאוחדים לאוסף (collection) אחד
+    - אובייקטים כבדים מסומנים לרסטור, ונתיבים ארוכים מצוירים במקטעים עם פישוט נתיבים
+    """
+    def __init__(self):
+        self.decimate_min_points = int(os.getenv('RENDER_DECIMATE_MIN_POINTS', DECIMATE_MIN_POINTS))
+        self.merge_min_artists = int(os.getenv('RENDER_MERGE_MIN_ARTISTS', MERGE_MIN_ARTISTS))
+
+    @contextmanager
+    def drawing(self, chunked: bool = False):
+        """
+        הגדרות rcParams לזמן הציור: פישוט נתיבים, ובציור חוזר אחרי OverflowError של Agg -
+        ציור במקטעים (רק אז, כי מקטעים משנים מעט את הציור של קו שחוצה את עצמו)
+        """
+        params = {'path.simplify': True}
+        if chunked:
+            params['agg.path.chunksize'] = AGG_CHUNK_SIZE
+        with matplotlib.rc_context(params):
+            yield
+
+    def apply(self, fig, dpi: float) -> RenderReport:
+        report = RenderReport()
+        scale = dpi / fig.dpi
+        for ax in fig.axes:
+            if ax.name == '3d':
+                continue
+            artists = _data_artists(ax)
+            report.artists_before += len(artists)
+            report.vertices_before += sum(_vertex_count(artist) for artist in artists)
+
+            # גבולות הצירים נקבעים לפני השינויים, כמו שהיו נקבעים בציור
+            ax.get_xlim()
+            ax.get_ylim()
+            try:
+                self._decimate(ax, scale, report)
+                if ax.name == 'rectilinear':
+                    self._merge_lines(ax, report)
+                    self._merge_patches(ax, report)
+            except Exception as e:
+                # המדיניות היא אופטימיזציה בלבד - כל תקלה משאירה את הגרף כמו שהוא
+                logger.warning(f"Render policy skipped part of a figure: {str(e)}")
+
+            artists = _data_artists(ax)
+            for artist in artists:
+                vertices = _vertex_count(artist)
+                report.vertices_after += vertices
+                if vertices > RASTERIZE_MIN_VERTICES and not artist.get_rasterized():
+                    artist.set_rasterized(True)
+                    report.rasterized += 1
+            report.artists_after += len(artists)
+        return report
+
+    def _decimate(self, ax, scale: float, report: RenderReport) -> None:
+        if ax.xaxis.have_units() or ax.yaxis.have_units():
+            return
+        legends = [ax.get_legend(), *ax.figure.legends]
+        if any(legend is not None and legend._loc == LEGEND_BEST for legend in legends):
+            # מקרא במיקום 'best' עלול לזוז אם הנקודות משתנות
+            return
+        width = ax.get_window_extent().width * scale
+        limit = max(self.decimate_min_points, int(width * COLUMNS_PER_PIXEL * 4))
+        for line in ax.lines:
+            xy = line.get_xydata()
+            if len(xy) <= limit or not _solid(line):
+                continue
+            # עקומות פרמטריות (x לא מונוטוני) נשארות לפישוט הנתיבים של matplotlib,
+            # שעושה את אותה עבודה מהר יותר מכל דילול מראש
+            pixels = line.get_transform().transform(xy) * scale
+            px = pixels[:, 0]
+            if not np.isfinite(px).all():
+                px = px[np.isfinite(pixels).all(axis=1)]
+            if len(px) < 2 or not self._monotonic(px):
+                continue
+            keep = _m4_indices(pixels[:, 0], pixels[:, 1], 1 / COLUMNS_PER_PIXEL)
+            if len(keep) < len(xy):
+                line.set_data(xy[keep, 0], xy[keep, 1])
+                report.decimated += 1
+
+    @staticmethod
+    def _monotonic(values: np.ndarray) -> bool:
+        if values[-1] < values[0]:
+            values = values[::-1]
+        return bool((values[1:] >= values[:-1]).all())
+
+    def _groups(self, ax, artists, key) -> dict:
+        """
+        מקבץ אובייקטים שאפשר לאחד לפי מפתח סגנון. קבוצה נלקחת רק אם היא כוללת את כל
+        האובייקטים באותו zorder, כדי שסדר הציור מול אובייקטים אחרים לא ישתנה
+        """
+        groups = {}
+        for artist in artists:
+            groups.setdefault(key(artist), []).append(artist)
+        zorders = {}
+        for artist in ax.get_children():
+            if artist is ax.patch:
+                continue
+            zorders[artist.get_zorder()] = zorders.get(artist.get_zorder(), 0) + 1
+        return {
+            group_key: members for group_key, members in groups.items()
+            if group_key is not None and len(members) >= self.merge_min_artists
+            and zorders.get(group_key[0], 0) == len(members)
+        }
+
+    def _merge_lines(self, ax, report: RenderReport) -> None:
+        def key(line):
+            label = line.get_label()
+            if not _solid(line) or (label and not label.startswith('_')) or line.get_transform() != ax.transData:
+                return None
+            return (
+                line.get_zorder(), line.get_solid_capstyle(), line.get_solid_joinstyle(),
+                line.get_antialiased(), line.get_clip_on(),
+            )
+
+        for (zorder, capstyle, joinstyle, antialiased, clip_on), lines in self._groups(ax, ax.lines, key).items():
+            collection = LineCollection(
+                [line.get_xydata() for line in lines],
+                colors=[to_rgba(line.get_color(), line.get_alpha()) for line in lines],
+                linewidths=[line.get_linewidth() for line in lines],
+                capstyle=capstyle, joinstyle=joinstyle, antialiaseds=antialiased, zorder=zorder,
+            )
+            self._replace(ax, lines, collection, clip_on, report)
+
+    def _merge_patches(self, ax, report: RenderReport) -> None:
+        def key(patch):
+            if (
+                not patch.get_visible() or patch.get_hatch() or patch.get_path_effects()
+                or patch.get_data_transform() != ax.transData or (patch.get_label() or '_')[0] != '_'
+            ):
+                return None
+            return (
+                patch.get_zorder(), patch.get_capstyle(), patch.get_joinstyle(),
+                patch.get_antialiased(), patch.get_clip_on(),
+            )
+
+        for (zorder, capstyle, joinstyle, antialiased, clip_on), patches in self._groups(ax, ax.patches, key).items():
+            collection = PathCollection(
+                [patch.get_patch_transform().transform_path(patch.get_path()) for patch in patches],
+                facecolors=[patch.get_facecolor() for patch in patches],
+                edgecolors=[patch.get_edgecolor() for patch in patches],
+                linewidths=[patch.get_linewidth() for patch in patches],
+                linestyles=[patch.get_linestyle() for patch in patches],
+                capstyle=capstyle, joinstyle=joinstyle, antialiaseds=antialiased, zorder=zorder,
+            )
+            self._replace(ax, patches, collection, clip_on, report)
+
+    @staticmethod
+    def _replace(ax, artists: list, collection, clip_on: bool, report: RenderReport) -> None:
+        ax.add_collection(collection, autolim=False)
+        collection.set_clip_on(clip_on)
+        for artist in artists:
+            artist.remove()
+        report.merged += len(artists)
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: מיליון נקודות ואלף קטעים נפרדים
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    x = np.linspace(0, 10, 1_000_000)
+    ax.plot(x, np.sin(40 * x))
+    for k in range(1000):
+        ax.plot([k / 100, k / 100 + 0.05], [1.2, 1.3], color='C1')
+    report = RenderPolicy().apply(fig, 100)
+    print(report.as_dict())
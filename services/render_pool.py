@@ -0,0 +1,291 @@
+import io
+import os
+import sys
+import time
+import types
+import queue
+import marshal
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import get_render_limits
+from utils.code_executor import RenderTooExpensiveError
+from services.metrics import (
+    STAGE_SECONDS, RENDER_CPU_SECONDS, RENDER_PEAK_MEMORY, RENDER_LIMITS, VECTORIZED_LOOPS, VECTORIZE_SPEEDUP,
+    RENDER_VERTICES, RENDER_ARTISTS, RENDER_POLICY_ACTIONS
+)
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מודולים שנטענים מראש בתהליך ה-forkserver, כך שכל worker חדש
+# נולד עם matplotlib (Agg), numpy ו-bidi כבר מיובאים
+PRELOAD_MODULES = [
+    'matplotlib',
+    'matplotlib.pyplot',
+    'numpy',
+    'bidi.algorithm',
+    'services.renderer_service',
+]
+
+# זמן חסד מעבר למגבלת הזמן של ה-executor, לפני שהורגים את ה-worker בכוח
+KILL_GRACE_SECONDS = 5
+
+
+def _current_rss_mb() -> float:
+    """
+    מחזיר את צריכת הזיכרון (RSS) הנוכחית של התהליך במגה-בייט
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ב-macOS הערך בבתים, ב-Linux בקילובייט
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def _reset_peak_rss() -> None:
+    """
+    מאפס את שיא ה-RSS של התהליך (Linux בלבד), כדי למדוד שיא לכל רינדור בנפרד
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """
+    מחזיר את שיא ה-RSS של התהליך מאז האיפוס האחרון, או את ה-RSS הנוכחי אם אין נתון
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return _current_rss_mb()
+
+
+def _warm_up() -> None:
+    """
+    מרנדר גרף קטן כדי לטעון מראש פונטים ומקודדי PNG לפני העבודה הראשונה
+    """
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(1, 1))
+    plt.plot([0, 1], [0, 1])
+    plt.title("warm-up")
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close('all')
+
+
+def _worker_main(conn) -> None:
+    """
+    לולאת העבודה של תהליך רינדור: מקבל קוד, מחזיר את בייטי התמונה
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from services.renderer_service import RendererService
+    from utils.code_executor import flush_logs
+
+    renderer = RendererService()
+    _warm_up()
+    renderer.executor.prepare_globals()
+    renderer.executor.apply_memory_limit()
+    try:
+        while True:
+            try:
+                code = conn.recv()
+            except (EOFError, OSError):
+                break
+            if code is None:
+                break
+            if isinstance(code, bytes):
+                # קוד שנותח ו-קומפל בתהליך הבוט מגיע כ-marshal, בלי parse נוסף
+                code = marshal.loads(code)
+
+            _reset_peak_rss()
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                status, payload = 'ok', renderer.create_image(code).getvalue()
+            except Exception as e:
+                status, payload = 'error', e
+            wall_seconds = time.perf_counter() - wall_start
+            stats = {
+                'execute_seconds': max(0.0, wall_seconds - renderer.encode_seconds),
+                'encode_seconds': renderer.encode_seconds,
+                'cpu_seconds': time.process_time() - cpu_start,
+                'peak_rss_mb': _peak_rss_mb(),
+                'render_policy': renderer.render_report.as_dict(),
+                'vectorized': [
+                    (report['result'], report.get('speedup')) for report in renderer.executor.vectorize_reports
+                ],
+            }
+            conn.send((status, payload, _current_rss_mb(), stats))
+    finally:
+        flush_logs()
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+
+    def stop(self, timeout: float = 5) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    def __init__(self, workers: int = None, max_jobs_per_worker: int = 50, max_worker_rss_mb: int = 512):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_rss_mb = max_worker_rss_mb
+        self.max_execution_time = get_render_limits()['MAX_EXECUTION_TIME']
+
+        # ה-backend נקבע לפני יצירת התהליכים כדי שיעבור בירושה
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+
+        if 'forkserver' in mp.get_all_start_methods():
+            self.context = mp.get_context('forkserver')
+            self.context.set_forkserver_preload(PRELOAD_MODULES)
+        else:
+            self.context = mp.get_context('spawn')
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._all_workers = set()
+        self._closed = False
+        for _ in range(self.workers):
+            self._idle.put(self._spawn_worker())
+
+        # כל thread ממתין לתשובה מ-worker אחד, כך שהלולאה הראשית לא נחסמת
+        self._dispatch_executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="render-dispatch"
+        )
+        logger.info(f"Render pool started with {self.workers} workers")
+
+    def _spawn_worker(self) -> _Worker:
+        worker = _Worker(self.context)
+        with self._lock:
+            self._all_workers.add(worker)
+        return worker
+
+    def _retire_worker(self, worker: _Worker) -> None:
+        with self._lock:
+            self._all_workers.discard(worker)
+        worker.stop()
+
+    def render(self, code) -> io.BytesIO:
+        """
+        מרנדר קוד באחד מתהליכי ה-worker ומחזיר את התמונה כ-BytesIO.
+        code הוא מחרוזת, או אובייקט קוד מקומפל שעבר ניתוח (נשלח ב-marshal)
+        """
+        if self._closed:
+            raise RuntimeError("מאגר הרינדור סגור")
+
+        message = marshal.dumps(code) if isinstance(code, types.CodeType) else code
+        worker = self._idle.get()
+        try:
+            worker.conn.send(message)
+            # ה-executor עוצר קוד איטי בעצמו; אם ה-worker תקוע (למשל בתוך קוד C) הורגים אותו
+            if not worker.conn.poll(self.max_execution_time + KILL_GRACE_SECONDS):
+                logger.warning(f"Render worker {worker.process.pid} exceeded the time limit, killing it")
+                worker.process.kill()
+                self._retire_worker(worker)
+                self._idle.put(self._spawn_worker())
+                RENDER_LIMITS.inc(limit='time')
+                raise RenderTooExpensiveError(
+                    f"הרינדור חרג ממגבלת הזמן ({self.max_execution_time} שניות)", limit='time'
+                )
+            status, payload, rss_mb, stats = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            logger.error(f"Render worker {worker.process.pid} died: {e}")
+            self._retire_worker(worker)
+            self._idle.put(self._spawn_worker())
+            raise RuntimeError("תהליך הרינדור קרס")
+
+        worker.jobs_done += 1
+        if worker.jobs_done >= self.max_jobs_per_worker or rss_mb > self.max_worker_rss_mb:
+            logger.info(
+                f"Recycling render worker {worker.process.pid} "
+                f"(jobs={worker.jobs_done}, rss={rss_mb:.0f}MB)"
+            )
+            self._retire_worker(worker)
+            worker = self._spawn_worker()
+        self._idle.put(worker)
+        self._record_stats(stats)
+
+        if status == 'error':
+            if isinstance(payload, RenderTooExpensiveError):
+                RENDER_LIMITS.inc(limit=payload.limit or 'unknown')
+            raise payload
+        return io.BytesIO(payload)
+
+    @staticmethod
+    def _record_stats(stats: dict) -> None:
+        """
+        מעדכן את המדדים לפי הנתונים שה-worker מדד על הרינדור
+        """
+        STAGE_SECONDS.observe(stats['execute_seconds'], stage='execute')
+        if stats['encode_seconds']:
+            STAGE_SECONDS.observe(stats['encode_seconds'], stage='encode')
+        RENDER_CPU_SECONDS.observe(stats['cpu_seconds'])
+        RENDER_PEAK_MEMORY.observe(stats['peak_rss_mb'] * 1024 * 1024)
+        policy = stats.get('render_policy')
+        if policy:
+            for stage in ('before', 'after'):
+                RENDER_VERTICES.inc(policy[f'vertices_{stage}'], stage=stage)
+                RENDER_ARTISTS.inc(policy[f'artists_{stage}'], stage=stage)
+            for action in ('decimated', 'merged', 'rasterized'):
+                if policy[action]:
+                    RENDER_POLICY_ACTIONS.inc(policy[action], action=action)
+        for result, speedup in stats.get('vectorized', ()):
+            VECTORIZED_LOOPS.inc(result=result)
+            if speedup:
+                VECTORIZE_SPEEDUP.observe(speedup)
+
+    async def render_async(self, code) -> io.BytesIO:
+        """
+        גרסה אסינכרונית של render
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._dispatch_executor, self.render, code)
+
+    def close(self) -> None:
+        """
+        עוצר את כל תהליכי ה-worker
+        """
+        self._closed = True
+        self._dispatch_executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            workers = list(self._all_workers)
+            self._all_workers.clear()
+        for worker in workers:
+            worker.stop()
+        logger.info("Render pool closed")
@@ -1,63 +1,158 @@
-import os
 import io
-import tempfile
-from pathlib import Path
+import os
+import time
+from contextlib import contextmanager, nullcontext
 import matplotlib.pyplot as plt
-from utils.code_executor import SafeCodeExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+from utils.code_executor import SafeCodeExecutor, RenderTooExpensiveError, CodeExecutionError
+from services.image_encoder import ImageEncoder
+from services.render_policy import RenderPolicy, RenderReport
+
+# פרמטרים של savefig ששלב הקידוד מטפל בהם בעצמו (חיתוך שוליים ורקע לבן),
+# כך שאפשר לקחת את הפיקסלים ישר מה-canvas בלי לכתוב PNG ביניים
+DIRECT_DRAW_KWARGS = {'bbox_inches', 'pad_inches', 'transparent'}
+
 
 class RendererService:
     def __init__(self):
         self.executor = SafeCodeExecutor()
-        # יצירת תיקיית temp בתוך הפרויקט
-        self.temp_dir = Path(__file__).parent.parent / "tempmedia"
-        self.temp_dir.mkdir(exist_ok=True)
+        self.encoder = ImageEncoder()
+        # זמן קידוד ה-PNG ברינדור האחרון (נמדד בנפרד מזמן הרצת הקוד)
+        self.encode_seconds = 0.0
+        # דילול ואיחוד של גרפים צפופים לפני הציור (RENDER_POLICY)
+        self.policy = RenderPolicy() if os.getenv('RENDER_POLICY', 'true').lower() == 'true' else None
+        # מה המדיניות עשתה ברינדור האחרון (מכל הגרפים שנשמרו בו)
+        self.render_report = RenderReport()
 
-    def create_image(self, code: str) -> io.BytesIO:
+    def create_image(self, code) -> io.BytesIO:
         """
-        מקבל קוד matplotlib ומחזיר את התמונה כ-BytesIO
+        מקבל קוד matplotlib ומחזיר את התמונה כ-BytesIO.
+        אם הקוד שומר כמה גרפים, מוחזר האחרון שבהם
+        """
+        return self.create_images(code)[-1]
+
+    def create_images(self, code) -> list:
+        """
+        מריץ את הקוד ולוכד לזיכרון כל גרף שנשמר (או מוצג), בלי קבצים זמניים.
+        קוד שלא קורא ל-savefig בכלל - נלכדים הגרפים שנשארו פתוחים בסוף הריצה
         """
         # ניקוי כל הגרפים הקודמים
         plt.close('all')
-        
-        # יצירת שם קובץ זמני
-        temp_file = self.temp_dir / f"{abs(hash(code))}.png"
-        
+        captured = []
+        self.encode_seconds = 0.0
+        self.render_report = RenderReport()
+
         try:
-            # עדכון הקוד כך שישמור את הקובץ במיקום הנכון
-            code_lines = code.split('\n')
-            modified_code = []
-            for line in code_lines:
-                if 'savefig' in line:
-                    modified_code.append(f"plt.savefig(r'{temp_file}')")
-                else:
-                    modified_code.append(line)
-            
-            # הרצת הקוד המעודכן
-            self.executor.execute_code('\n'.join(modified_code))
-            
-            # וידוא שהקובץ נוצר
-            if not temp_file.exists():
-                raise RuntimeError("הקובץ לא נוצר כראוי")
-            
-            # המרת התמונה ל-BytesIO
-            img_data = io.BytesIO()
-            with open(temp_file, 'rb') as f:
-                img_data.write(f.read())
-            img_data.seek(0)
-            
-            return img_data
-            
+            with self._capture_figures(captured):
+                self.executor.execute_code(code)
+
+                if not captured:
+                    for number in plt.get_fignums():
+                        captured.append(self._render_figure(plt.figure(number)))
+
+            if not captured:
+                raise CodeExecutionError(
+                    "הקוד לא יצר שרטוט",
+                    error_type='NoFigure',
+                    error_message="the code ran but did not create any figure"
+                )
+            return captured
+
         finally:
             # ניקוי
-            self.cleanup(temp_file)
+            self.cleanup()
+
+    def _render_figure(self, fig, **kwargs) -> io.BytesIO:
+        """
+        מרנדר גרף ב-DPI שנבחר לפי תקציב הפיקסלים (אחרי בדיקה שהגודל בתוך המגבלה),
+        ומעביר לשלב הקידוד שחותך שוליים ובוחר פורמט בתוך תקציב הבתים
+        """
+        dpi = kwargs.pop('dpi', None)
+        if not isinstance(dpi, (int, float)) or dpi <= 0:
+            dpi = fig.dpi
+        dpi = self.encoder.pick_dpi(fig, dpi)
+        width, height = fig.get_size_inches() * dpi
+        if width * height > self.executor.max_output_pixels:
+            raise RenderTooExpensiveError(
+                f"התמונה גדולה מדי ({int(width)}x{int(height)} פיקסלים)", limit='pixels'
+            )
+
+        # שם הקובץ והפורמט שהקוד ביקש לא רלוונטיים - הקידוד הסופי נבחר אחר כך
+        kwargs.pop('fname', None)
+        kwargs.pop('format', None)
+        kwargs.pop('pil_kwargs', None)
+
+        start = time.perf_counter()
+        if self.policy is not None:
+            self.render_report.add(self.policy.apply(fig, dpi))
+        try:
+            with self.policy.drawing() if self.policy is not None else nullcontext():
+                image = self._draw(fig, dpi, kwargs)
+        except OverflowError:
+            if self.policy is None:
+                raise
+            # נתיב ארוך מדי ל-Agg - ציור חוזר במקטעים
+            with self.policy.drawing(chunked=True):
+                image = self._draw(fig, dpi, kwargs)
+        buffer = self.encoder.encode(image)
+        self.encode_seconds += time.perf_counter() - start
+        buffer.seek(0)
+        return buffer
+
+    def _draw(self, fig, dpi: float, kwargs: dict) -> Image.Image:
+        if set(kwargs) <= DIRECT_DRAW_KWARGS and isinstance(fig.canvas, FigureCanvasAgg):
+            return self._draw_to_image(fig, dpi)
+        # פרמטרים אחרים (למשל facecolor) - דרך savefig, עם PNG ביניים בדחיסה מינימלית
+        raw = io.BytesIO()
+        self._original_savefig(fig, raw, format='png', dpi=dpi, pil_kwargs={'compress_level': 1}, **kwargs)
+        raw.seek(0)
+        return Image.open(raw)
+
+    @staticmethod
+    def _draw_to_image(fig, dpi: float) -> Image.Image:
+        """
+        מצייר את הגרף ב-DPI הנתון ומחזיר את הפיקסלים כתמונת PIL
+        """
+        original_dpi = fig.dpi
+        fig.dpi = dpi
+        try:
+            fig.canvas.draw()
+            width, height = fig.canvas.get_width_height(physical=True)
+            return Image.frombuffer('RGBA', (width, height), fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).copy()
+        finally:
+            fig.dpi = original_dpi
+
+    @contextmanager
+    def _capture_figures(self, captured: list):
+        """
+        מחליף זמנית את Figure.savefig ואת plt.show בפונקציות שלוכדות את הגרף לזיכרון.
+        כל worker מרנדר עבודה אחת בכל פעם, ולכן ההחלפה לא משפיעה על רינדורים אחרים
+        """
+        self._original_savefig = Figure.savefig
+        original_show = plt.show
+
+        def capture_savefig(fig, *args, **kwargs):
+            captured.append(self._render_figure(fig, **kwargs))
+
+        def capture_show(*args, **kwargs):
+            for number in plt.get_fignums():
+                captured.append(self._render_figure(plt.figure(number)))
+
+        Figure.savefig = capture_savefig
+        plt.show = capture_show
+        try:
+            yield
+        finally:
+            Figure.savefig = self._original_savefig
+            plt.show = original_show
 
-    def cleanup(self, temp_file: Path = None):
+    def cleanup(self):
         """
-        ניקוי קבצים זמניים
+        סגירת כל הגרפים הפתוחים
         """
         try:
-            if temp_file and temp_file.exists():
-                temp_file.unlink()
             plt.close('all')
         except Exception as e:
             print(f"שגיאה בניקוי: {e}")
@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    השרטוט האחרון של צ'אט: התיאור המקורי והקוד האחרון שרונדר בהצלחה (כולל עריכות)
+    """
+    def __init__(self, description: str, code: str, expires_at: float):
+        self.description = description
+        self.code = code
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.description.encode('utf-8')) + len(self.code.encode('utf-8'))
+
+
+class SessionStore:
+    """
+    מצב לכל צ'אט, כדי שבקשת המשך ("עכשיו עם רדיוס 5") תערוך את הקוד הקודם במקום לייצר מחדש.
+    בזיכרון בלבד, עם הגבלה על מספר הצ'אטים ועל סך הבתים: הצ'אט שלא היה פעיל הכי הרבה זמן מפונה ראשון
+    """
+    def __init__(self, max_sessions: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: int = 6 * 60 * 60):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # chat_id -> Session
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, chat_id):
+        """
+        מחזיר את ה-Session של הצ'אט, או None אם אין (או שפג תוקפו)
+        """
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                return None
+            if session.expires_at < time.monotonic():
+                self._remove(chat_id)
+                return None
+            self._sessions.move_to_end(chat_id)
+            return session
+
+    def put(self, chat_id, description: str, code: str) -> None:
+        """
+        שומר את השרטוט האחרון של הצ'אט, ומפנה צ'אטים ישנים אם עברנו את המגבלות
+        """
+        session = Session(description, code, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._remove(chat_id)
+            if session.size > self.max_bytes:
+                return
+            self._sessions[chat_id] = session
+            self._bytes += session.size
+            while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._sessions)))
+                self.evictions += 1
+
+    def drop(self, chat_id) -> None:
+        with self._lock:
+            self._remove(chat_id)
+
+    def _remove(self, chat_id) -> None:
+        session = self._sessions.pop(chat_id, None)
+        if session is not None:
+            self._bytes -= session.size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self._bytes,
+                'evictions': self.evictions
+            }
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: שני צ'אטים בתקציב של צ'אט אחד - הישן מפונה
+    store = SessionStore(max_sessions=1)
+    store.put(1, "מעגל ברדיוס 3", "r = 3")
+    store.put(2, "פרבולה", "x = 1")
+    print(store.get(1), store.get(2).description, store.stats())
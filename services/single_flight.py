@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    מאחד בקשות זהות שרצות במקביל: הראשונה מבצעת את העבודה,
+    וכל השאר ממתינות לאותה תוצאה (או לאותה שגיאה)
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, func, *args):
+        """
+        מריץ את func(*args) פעם אחת לכל key שרץ כרגע, ומחזיר את התוצאה המשותפת
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            self.leaders += 1
+            future = asyncio.ensure_future(func(*args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight {self.name} request")
+
+        # shield - ביטול של ממתין אחד לא מבטל את העבודה עבור השאר
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._in_flight),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced
+        }
@@ -0,0 +1,108 @@
+import io
+import asyncio
+import zipfile
+
+import pytest
+from PIL import Image
+
+from services.batch_service import BatchResult, BatchRunner, parse_descriptions, pack_zip, pack_pdf
+
+
+def _image(fmt: str = 'PNG', color: str = 'red') -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_parse_descriptions():
+    text = (
+        "# דף עבודה 3\n"
+        "1. מעגל ברדיוס 3\n"
+        "\n"
+        "2) y=x^2\n"
+        "- משולש שווה צלעות\n"
+        "• ריבוע\n"
+        "   מחומש משוכלל   \n"
+        "3.5 ס\"מ צלע של ריבוע\n"
+    )
+    assert parse_descriptions(text) == [
+        "מעגל ברדיוס 3", "y=x^2", "משולש שווה צלעות", "ריבוע", "מחומש משוכלל", "3.5 ס\"מ צלע של ריבוע",
+    ]
+    assert parse_descriptions(text, max_items=2) == ["מעגל ברדיוס 3", "y=x^2"]
+
+
+@pytest.mark.parametrize('image, filename', [
+    (_image('PNG'), '03_מעגל_ברדיוס_3_y_x.png'),
+    (_image('JPEG'), '03_מעגל_ברדיוס_3_y_x.jpg'),
+])
+def test_result_filename(image, filename):
+    assert BatchResult(3, 'מעגל ברדיוס 3 / y:x?', image=image).filename == filename
+
+
+def test_runner_limits_concurrency_and_yields_in_completion_order():
+    async def main():
+        running, peak = [0], [0]
+        delays = {'a': 0.04, 'bad': 0.01, 'c': 0.01, 'd': 0.01}
+
+        async def produce(index, description):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(delays[description])
+            running[0] -= 1
+            if description == 'bad':
+                raise ValueError("no drawing")
+            return BatchResult(index, description, image=b'image')
+
+        results = [result async for result in BatchRunner(concurrency=2).run(['a', 'bad', 'c', 'd'], produce)]
+        assert peak[0] == 2
+        assert [result.index for result in results] == [2, 3, 4, 1]
+        assert [result.ok for result in results] == [False, True, True, True]
+        assert results[0].error == "no drawing"
+
+    asyncio.run(main())
+
+
+def test_leaving_the_runner_early_cancels_the_rest():
+    async def main():
+        started = []
+
+        async def produce(index, description):
+            started.append(index)
+            await asyncio.sleep(0 if index == 1 else 10)
+            return BatchResult(index, description, image=b'image')
+
+        async for result in BatchRunner(concurrency=4).run(['a', 'b', 'c'], produce):
+            assert result.index == 1
+            break
+        await asyncio.sleep(0)
+        assert started == [1, 2, 3]
+
+    asyncio.run(asyncio.wait_for(main(), 1))
+
+
+def test_pack_zip_in_description_order_with_failures():
+    results = [
+        BatchResult(2, 'ריבוע', image=_image('JPEG')),
+        BatchResult(3, 'בלי שרטוט', error='timeout'),
+        BatchResult(1, 'מעגל', image=_image('PNG')),
+    ]
+    with zipfile.ZipFile(io.BytesIO(pack_zip(results))) as archive:
+        assert archive.namelist() == ['01_מעגל.png', '02_ריבוע.jpg', 'failed.txt']
+        assert archive.getinfo('01_מעגל.png').compress_type == zipfile.ZIP_STORED
+        assert archive.read('failed.txt').decode('utf-8') == "3. בלי שרטוט: timeout\n"
+
+
+def test_pack_pdf_has_a_page_per_drawing():
+    results = [
+        BatchResult(1, 'a', image=_image('PNG')),
+        BatchResult(2, 'b', error='failed'),
+        BatchResult(3, 'c', image=_image('WEBP', 'blue')),
+    ]
+    data = pack_pdf(results)
+    assert data.startswith(b'%PDF')
+    assert data.count(b'/Type /Page') - data.count(b'/Type /Pages') == 2
+
+
+def test_pack_pdf_without_images():
+    with pytest.raises(ValueError):
+        pack_pdf([BatchResult(1, 'a', error='failed')])
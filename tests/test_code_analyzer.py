@@ -0,0 +1,186 @@
+import time
+
+import pytest
+
+from utils.code_analyzer import analyze_code
+
+
+@pytest.mark.parametrize('code', [
+    "m = np; m.pi = 4",
+    "k = np\nm = k\ndel m.pi",
+    "m = np.random\nm.seed = 1",
+    "import math as mm\nmm.pi = 4",
+    "for m in [np, math]:\n    m.pi = 4",
+    "d = {}\nd['m'] = np\nd['m'].pi = 4",
+    "items = []\nitems.append(np)\nitems[0].pi = 4",
+    "def f():\n    return np\nf().pi = 4",
+    "def g(o):\n    o.pi = 4\ng(np)",
+    "class A:\n    m = np\nA.m.pi = 4",
+    "(lambda: np)().pi = 4",
+    "[np][0].pi = 4",
+    "type(np).x = 1",
+    "np.asarray(np).item().pi = 4",
+    "x = (m := np)\nm.pi = 4",
+    "m.pi = 4\nm = np",
+])
+def test_attribute_store_on_shared_object_is_rejected(code):
+    analysis = analyze_code(code)
+    assert not analysis.is_safe
+    assert any('אסור לשנות' in violation for violation in analysis.violations)
+
+
+@pytest.mark.parametrize('code', [
+    "fig, ax = plt.subplots()\nax.dist = 10",
+    "ax = plt.gca()\nplt.xticks([0, np.pi])\nax.dist = 10",
+    "plt.gca().foo = 1",
+    "plt.rcParams['font.size'] = 12",
+    "x = np.zeros(4)\nx.shape = (2, 2)",
+])
+def test_attribute_store_on_own_object_is_allowed(code):
+    assert analyze_code(code).is_safe
+
+
+@pytest.mark.parametrize('code', [
+    "np.DataSource(None).open('/etc/passwd').read()",
+    "np.fromregex('/etc/passwd', r'(.*)', [('line', 'S80')])",
+    "np.recfromtxt('/etc/passwd')",
+    "np.lib.npyio.pickle.loads(b'')",
+    "np.loadtxt('/etc/passwd')",
+    "matplotlib.cbook.get_sample_data('/etc/passwd')",
+    "from numpy import DataSource",
+    "from numpy.lib import npyio",
+    "import numpy.lib.npyio as io",
+    "import numpy.f2py",
+])
+def test_file_access_is_rejected(code):
+    assert not analyze_code(code).is_safe
+
+
+@pytest.mark.parametrize('code', [
+    "import matplotlib.testing\nmatplotlib.testing.subprocess_run_for_testing(['touch', '/tmp/marker'])",
+    "from matplotlib import testing",
+    "np.testing.assert_equal(1, 1)",
+    "plt.matplotlib.testing",
+    "m = np\nm.testing",
+    "import matplotlib.cbook",
+    "plt.cbook.to_filehandle('/tmp/marker', 'w')",
+    "fig = plt.figure()\nfig.canvas.print_figure('/tmp/marker.png')",
+    "plt.gcf().canvas.print_png('/tmp/marker.png')",
+    "np.zeros(3).dump('/tmp/marker')",
+    # מודולים שלא ברשימה, גם בלי שם מוכר כמסוכן
+    "import matplotlib.sankey",
+    "from matplotlib import mlab",
+    "np.matlib.eye(2)",
+    "m = matplotlib\nm.widgets",
+    "np.lib.format",
+])
+def test_modules_outside_the_allow_list_are_rejected(code):
+    assert not analyze_code(code).is_safe
+
+
+@pytest.mark.parametrize('code', [
+    "import matplotlib.pyplot as plt\nfrom matplotlib.patches import Circle, Polygon",
+    "from matplotlib import cm, colors",
+    "import matplotlib.colors as mcolors",
+    "plt.figure()\nplt.axis('off')\nplt.text(0, 0, 'a')\nplt.style.use('ggplot')",
+    "c = plt.cm.viridis(0.5)\nmatplotlib.rcParams['font.size'] = 12",
+    "rng = np.random.default_rng(1)\nv = np.polynomial.polynomial.polyval(1, [1, 2])",
+    "w = np.lib.stride_tricks.sliding_window_view(np.arange(5), 2)",
+    "from numpy.random import default_rng",
+])
+def test_allowed_modules_pass(code):
+    assert analyze_code(code).is_safe
+
+
+@pytest.mark.parametrize('code', ["return 1", "x = 1\nyield x", "break"])
+def test_compile_error_is_reported_as_syntax_error(code):
+    analysis = analyze_code(code)
+    assert not analysis.is_safe
+    assert isinstance(analysis.syntax_error, SyntaxError)
+    assert analysis.violations
+
+
+def test_parse_error_is_reported_as_syntax_error():
+    analysis = analyze_code("plt.plot(")
+    assert analysis.syntax_error is not None
+    assert analysis.code_object is None
+
+
+def test_cost_estimate():
+    analysis = analyze_code(
+        "x = np.linspace(0, 1, 1000)\n"
+        "X, Y = np.meshgrid(x, x)\n"
+        "for i in range(100):\n"
+        "    plt.plot(x, np.sin(x + i))\n"
+    )
+    assert analysis.is_safe
+    assert analysis.max_array_elements == 1000 * 1000
+    assert analysis.loop_iterations == 100
+    assert analysis.cost_violation(10 ** 5, 10 ** 6)[0] == 'memory'
+    assert analysis.cost_violation(10 ** 7, 10)[0] == 'time'
+    assert analysis.cost_violation(10 ** 7, 10 ** 6) is None
+
+
+@pytest.mark.parametrize('code', [
+    "a = ((((10) ** 64) ** 64) ** 64) ** 64",
+    "a = (((((10) ** 64) ** 64) ** 64) ** 64) ** 64",
+    "a = 10 ** 60\n" + "a = a * a\n" * 30,
+    "x = np.zeros(2 ** 10 ** 9)",
+])
+def test_huge_constants_are_not_computed(code):
+    start = time.perf_counter()
+    analysis = analyze_code(code)
+    assert time.perf_counter() - start < 1
+    assert analysis.is_safe
+
+
+def test_small_powers_are_still_computed():
+    analysis = analyze_code("n = 2 ** 10\nx = np.zeros((n, n))")
+    assert analysis.max_array_elements == 2 ** 20
+
+
+@pytest.mark.parametrize('code, unbounded', [
+    ("x = 0\nwhile True:\n    x += 1", 1),
+    ("x = 0\nwhile 1:\n    for i in range(3):\n        break", 1),
+    ("x = 0\nwhile True:\n    x += 1\n    if x > 10:\n        break", 0),
+    ("def f():\n    while True:\n        return 3\nf()", 0),
+    ("x = 0\nwhile x < 10:\n    x += 1", 0),
+])
+def test_loops_without_an_exit(code, unbounded):
+    analysis = analyze_code(code)
+    assert analysis.unbounded_loops == unbounded
+    assert (analysis.cost_violation(10 ** 7, 10 ** 6) is not None) == bool(unbounded)
+
+
+@pytest.mark.parametrize('code', [
+    "def f(n):\n    return f(n)\nf(3)",
+    "def f(n):\n    if n > 100:\n        return\n    f(n + 1)\nf(0)",
+    "def f(n, m):\n    if n < 1:\n        return\n    f(m, n - 1)\nf(3, 3)",
+])
+def test_recursion_without_a_shrinking_argument_is_rejected(code):
+    analysis = analyze_code(code)
+    assert analysis.unbounded_recursion == {'f'}
+    assert analysis.cost_violation(10 ** 7, 10 ** 6)[0] == 'time'
+
+
+@pytest.mark.parametrize('code, calls', [
+    # שתי קריאות בכל רמה, 11 רמות
+    ("def h(n, a, b, c):\n    if n == 0:\n        return\n    h(n - 1, a, c, b)\n    h(n - 1, c, b, a)\nh(10, 1, 2, 3)", 2 ** 11 - 1),
+    # העומק לפי depth ולא לפי length
+    ("def branch(length, depth):\n    if depth == 0:\n        return\n    branch(length * 0.7, depth - 1)\n"
+     "    branch(0.7 * length, depth=depth - 1)\nbranch(1, depth=8)", 2 ** 9 - 1),
+    ("def f(n):\n    if n < 1:\n        return\n    f(n // 2)\nf(1024)", 11),
+    ("def f(n):\n    if n < 1:\n        return\n    f(n - 1)\n    f(n - 1)\nfor i in range(10):\n    f(5)", 10 + 10 * 63),
+    # ערך התחלתי לא ידוע
+    ("def f(n):\n    if n < 1:\n        return\n    f(n - 1)\nf(len(plt.gca().lines))", 0),
+])
+def test_recursion_cost_estimate(code, calls):
+    analysis = analyze_code(code)
+    assert analysis.is_safe
+    assert not analysis.unbounded_recursion
+    assert analysis.loop_iterations == calls
+
+
+def test_deep_branching_recursion_is_too_expensive():
+    code = "def h(n):\n    if n == 0:\n        return\n    h(n - 1)\n    h(n - 1)\nh(40)"
+    assert analyze_code(code).cost_violation(10 ** 7, 10 ** 6)[0] == 'time'
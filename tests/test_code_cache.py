@@ -0,0 +1,69 @@
+import pytest
+
+from services.code_cache import CodeCache, description_key, normalize_description
+
+
+@pytest.mark.parametrize('first, second', [
+    ("מעגל ברדיוס 5", "  מעגל   ברדיוס 5!  "),
+    ("מעגל שמרכזו בראשית", "מעגל שמרכזו בראשית."),
+    ("y = x ^ 2", "y=x^2"),
+    ("רדיוס 3.50", "רדיוס 3.5"),
+    ("רדיוס 3.0", "רדיוס 3"),
+    ("רדיוס 05", "רדיוס 5"),
+    ("מעגל ברדיוס .5", "מעגל ברדיוס 0.5"),
+    ("y=x^-.5", "y=x^-0.5"),
+    ("1,000 נקודות", "1000 נקודות"),
+    ("פרבולה", "פָּרָבוֹלָה"),
+    ("משולש ושרטוט", "משולש ושרטוט"),
+])
+def test_equivalent_descriptions_share_a_key(first, second):
+    assert description_key(first) == description_key(second)
+
+
+@pytest.mark.parametrize('first, second', [
+    ("נקודה (3,500)", "נקודה (3500)"),
+    ("נקודות (1, 2,500)", "נקודות (1, 2500)"),
+    ("x=3,500", "x=3500"),
+    ("קטע [0,100]", "קטע [0100]"),
+    ("רדיוס 3.5", "רדיוס 35"),
+    ("מעגל ברדיוס .5", "מעגל ברדיוס 5"),
+    ("y=x^-.5", "y=x^-5"),
+    ("y=x^2", "y=x^3"),
+    ("מעגל ברדיוס 5", "מעגל ברדיוס 6"),
+])
+def test_different_descriptions_do_not_collide(first, second):
+    assert normalize_description(first) != normalize_description(second)
+    assert description_key(first) != description_key(second)
+
+
+def test_final_letters_are_normalized():
+    assert normalize_description("שלום") == normalize_description("שלומ")
+
+
+def test_cache_hit_and_miss():
+    cache = CodeCache()
+    cache.put("מעגל ברדיוס 5", "code")
+    assert cache.get("מעגל  ברדיוס 5") == "code"
+    assert cache.get("מעגל ברדיוס 6") is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CodeCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('services.code_cache.time.monotonic', lambda: now[0])
+    cache = CodeCache(ttl_seconds=10)
+    cache.put("a", "1")
+    now[0] += 11
+    assert cache.get("a") is None
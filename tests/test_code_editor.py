@@ -0,0 +1,169 @@
+import time
+
+import pytest
+
+from utils.code_editor import parse_edit_request, edit_code
+from services.session_store import SessionStore
+
+CIRCLE = """import matplotlib.pyplot as plt
+import numpy as np
+r = 3
+theta = np.linspace(0, 2 * np.pi, 200)
+plt.figure(figsize=(10, 10))
+plt.plot(r * np.cos(theta), r * np.sin(theta), 'b-')
+plt.axhline(0, color='gray')
+plt.axis('equal')
+plt.axis('off')
+plt.savefig('circle.png')
+plt.close()
+"""
+
+PARABOLA = """import matplotlib.pyplot as plt
+import numpy as np
+x = np.linspace(-5, 5, 400)
+a = 1
+plt.plot(x, a * x ** 2, color='green')
+plt.xlim(-5, 5)
+plt.grid(True, alpha=0.3)
+plt.title('y = x^2')
+plt.savefig('parabola.png')
+"""
+
+
+@pytest.mark.parametrize('text, edits', [
+    ("עכשיו עם רדיוס 5 ובאדום", [('radius', '5'), ('color', 'red')]),
+    ("radius -π/2", [('radius', '-np.pi / 2')]),
+    ("x בין -3 ל-3", [('range', '-3', '3')]),
+    ("בתחום [0, 2π]", [('range', '0', '2 * np.pi')]),
+    ("בלי רשת ובלי צירים", [('grid', False), ('axes', False)]),
+    ("תוסיף רשת", [('grid', True)]),
+    ('עם כותרת "גרף"', [('title', 'גרף')]),
+    ("without the title", [('title', None)]),
+    ("a=2", [('constant', 'a', '2')]),
+    ("ובכחולים", [('color', 'blue')]),
+])
+def test_parse_edit_request(text, edits):
+    request = parse_edit_request(text)
+    assert request.edits == edits
+    assert request.unresolved == []
+    assert request.local and request.is_follow_up
+
+
+@pytest.mark.parametrize('text, follow_up', [
+    # מתייחס לשרטוט הקודם, אבל צריך את Gemini
+    ("עכשיו תוסיף משולש", True),
+    ("ותוסיף משולש בפנים", True),
+    # בקשה חדשה
+    ("צייר פרבולה", False),
+])
+def test_unresolved_words_are_not_local(text, follow_up):
+    request = parse_edit_request(text)
+    assert not request.local
+    assert request.unresolved
+    assert request.is_follow_up == follow_up
+
+
+def _edit(code, text):
+    return edit_code(code, parse_edit_request(text))
+
+
+def test_radius_and_color():
+    result = _edit(CIRCLE, "עכשיו עם רדיוס 5 ובאדום")
+    assert "r = 5" in result.code
+    assert "'-', color='red'" in result.code
+    # קו ייחוס לא נצבע
+    assert "axhline(0, color='gray')" in result.code
+    assert result.analysis.is_safe
+
+
+def test_range_changes_linspace_and_xlim():
+    result = _edit(PARABOLA, "x בין -2 ל-2")
+    assert "np.linspace(-2, 2, 400)" in result.code
+    assert "plt.xlim(-2, 2)" in result.code
+
+
+def test_range_of_other_parameters_is_left_alone():
+    assert _edit(CIRCLE, "בתחום [0, π]") is None
+
+
+def test_grid_on_turns_axes_on():
+    code = _edit(CIRCLE, "תוסיף רשת").code
+    assert "plt.axis('on')" in code
+    assert code.index("plt.grid(True)") < code.index("plt.savefig")
+
+
+def test_grid_off_drops_styling():
+    code = _edit(PARABOLA, "בלי רשת").code
+    assert "plt.grid(False)" in code
+    assert "alpha" not in code
+
+
+def test_axes_off_is_added_before_saving():
+    code = _edit(PARABOLA, "בלי צירים").code
+    assert code.index("plt.axis('off')") < code.index("plt.savefig")
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('עם כותרת "פרבולה"', "plt.title(get_display('פרבולה'))"),
+    ('title "parabola"', "plt.title('parabola')"),
+])
+def test_title_is_replaced(text, expected):
+    assert expected in _edit(PARABOLA, text).code
+
+
+def test_title_is_removed():
+    assert "title" not in _edit(PARABOLA, "בלי כותרת").code
+
+
+def test_constant():
+    assert "a = 2.5" in _edit(PARABOLA, "a=2.5").code
+    assert _edit(PARABOLA, "b=2") is None
+
+
+def test_different_radii_go_to_gemini():
+    code = CIRCLE.replace("r = 3", "r = 3\nR = 4")
+    assert _edit(code, "רדיוס 5") is None
+
+
+def test_colorful_loop_goes_to_gemini():
+    code = (
+        "import matplotlib.pyplot as plt\n"
+        "for k in range(3):\n"
+        "    plt.plot([0, k], [0, 1])\n"
+        "plt.savefig('lines.png')\n"
+    )
+    assert _edit(code, "באדום") is None
+
+
+def test_several_colors_go_to_gemini():
+    code = PARABOLA.replace("color='green')", "color='green')\nplt.plot(x, x, 'r--')")
+    assert _edit(code, "בכחול") is None
+
+
+def test_unparsable_code_and_unresolved_request():
+    assert _edit("plt.plot(", "באדום") is None
+    assert _edit(CIRCLE, "תוסיף משולש") is None
+
+
+def test_session_store_evicts_least_recently_used():
+    store = SessionStore(max_sessions=2)
+    store.put(1, "מעגל", "r = 3")
+    store.put(2, "פרבולה", "x = 1")
+    store.get(1)
+    store.put(3, "ישר", "y = 2")
+    assert store.get(2) is None
+    assert store.get(1).code == "r = 3"
+    assert store.stats()['evictions'] == 1
+
+
+def test_session_store_byte_limit_and_expiry(monkeypatch):
+    store = SessionStore(max_bytes=20, ttl_seconds=10)
+    store.put(1, "a", "x" * 30)
+    assert store.get(1) is None
+    store.put(2, "a", "x = 1")
+    assert store.stats()['bytes'] == 6
+
+    now = time.monotonic()
+    monkeypatch.setattr('services.session_store.time.monotonic', lambda: now + 11)
+    assert store.get(2) is None
+    assert store.stats() == {'sessions': 0, 'bytes': 0, 'evictions': 0}
@@ -0,0 +1,107 @@
+import time
+
+import matplotlib
+import pytest
+
+from services.renderer_service import RendererService
+from utils.code_executor import SafeCodeExecutor, RenderTooExpensiveError, CodeExecutionError
+
+# תנאי שהניתוח הסטטי לא יודע שתמיד מתקיים - רק המגבלות בזמן הריצה עוצרות אותה
+BUSY_LOOP = "x = 0\nwhile x >= 0:\n    x += 1"
+
+
+@pytest.fixture(autouse=True)
+def _run_in_tmp(tmp_path, monkeypatch):
+    # קוד שנכשל באמצע עלול להשאיר קבצים בתיקייה הנוכחית
+    monkeypatch.chdir(tmp_path)
+
+
+def test_array_estimate_over_the_limit(monkeypatch):
+    monkeypatch.setenv('MAX_ARRAY_ELEMENTS', '1000')
+    with pytest.raises(RenderTooExpensiveError) as error:
+        SafeCodeExecutor().execute_code("x = np.linspace(0, 1, 5000)")
+    assert error.value.limit == 'memory'
+
+
+def test_loop_estimate_over_the_limit(monkeypatch):
+    monkeypatch.setenv('MAX_LOOP_ITERATIONS', '1000')
+    with pytest.raises(RenderTooExpensiveError) as error:
+        SafeCodeExecutor().execute_code("for i in range(100):\n    for j in range(100):\n        pass")
+    assert error.value.limit == 'time'
+
+
+def test_wall_time_limit(monkeypatch):
+    monkeypatch.setenv('MAX_EXECUTION_TIME', '1')
+    with pytest.raises(RenderTooExpensiveError) as error:
+        SafeCodeExecutor().execute_code(BUSY_LOOP)
+    assert error.value.limit == 'time'
+
+
+def test_cpu_time_limit(monkeypatch):
+    monkeypatch.setenv('MAX_CPU_TIME', '1')
+    with pytest.raises(RenderTooExpensiveError) as error:
+        SafeCodeExecutor().execute_code(BUSY_LOOP)
+    assert error.value.limit == 'cpu'
+
+
+def test_pixel_limit(monkeypatch):
+    monkeypatch.setenv('MAX_OUTPUT_PIXELS', '1000')
+    with pytest.raises(RenderTooExpensiveError) as error:
+        RendererService().create_image("plt.plot([0, 1], [0, 1])\nplt.savefig('line.png')")
+    assert error.value.limit == 'pixels'
+
+
+def test_limits_are_removed_after_the_run(monkeypatch):
+    monkeypatch.setenv('MAX_EXECUTION_TIME', '1')
+    executor = SafeCodeExecutor()
+    executor.execute_code("x = 1")
+    # אם הטיימר נשאר פעיל, SIGALRM היה קוטע את ההמתנה הזו
+    time.sleep(1.2)
+
+
+def test_names_do_not_leak_between_runs():
+    executor = SafeCodeExecutor()
+    executor.execute_code("leftover = 1\nnp = None\nlen = None")
+    executor.execute_code("assert np.pi > 3\nassert len([1]) == 1")
+    with pytest.raises(CodeExecutionError) as error:
+        executor.execute_code("x = leftover")
+    assert error.value.error_type == 'NameError'
+
+
+def test_globals_template_is_built_once():
+    executor = SafeCodeExecutor()
+    executor.prepare_globals()
+    template = executor._globals_template
+    executor.execute_code("x = 1")
+    assert executor._globals_template is template
+    with pytest.raises(TypeError):
+        template['np'] = None
+
+
+def test_rc_params_are_restored_after_each_run():
+    size = matplotlib.rcParams['font.size']
+    executor = SafeCodeExecutor()
+    executor.execute_code("plt.rcParams['font.size'] = 31")
+    assert matplotlib.rcParams['font.size'] == size
+
+
+def test_extra_globals_are_visible_to_the_code():
+    executor = SafeCodeExecutor()
+    executor.execute_code("assert radius == 3", extra_globals={'radius': 3})
+
+
+@pytest.mark.parametrize('code', [
+    "import matplotlib.testing\nmatplotlib.testing.subprocess_run_for_testing(['touch', {path!r}])",
+    "plt.plot([0, 1])\nplt.gcf().canvas.print_figure({path!r})",
+])
+def test_code_cannot_write_files(tmp_path, code):
+    marker = tmp_path / "marker.png"
+    with pytest.raises(ValueError):
+        SafeCodeExecutor().execute_code(code.format(path=str(marker)))
+    assert not marker.exists()
+
+
+def test_infinite_loop_is_rejected_before_running():
+    with pytest.raises(RenderTooExpensiveError) as error:
+        SafeCodeExecutor().execute_code("x = 0\nwhile True:\n    x += 1")
+    assert error.value.limit == 'time'
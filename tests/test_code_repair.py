@@ -0,0 +1,117 @@
+import pytest
+
+from utils.code_analyzer import analyze_code
+from utils.code_repair import CodeFailure, repair_code
+
+STYLE_MESSAGE = (
+    "'{}' is not a valid package style, path of style file, URL of style file, "
+    "or library style name (library styles are listed in `style.available`)"
+)
+
+
+def _unsafe(code: str) -> CodeFailure:
+    return CodeFailure.from_analysis(analyze_code(code))
+
+
+def test_pylab_star_import_is_replaced_and_names_qualified():
+    code = "from pylab import *\nx = linspace(0, 2 * pi, 100)\nplot(x, sin(x))\n"
+    repair = repair_code(code, _unsafe(code))
+    assert repair is not None
+    assert 'np.linspace' in repair.code and 'plt.plot' in repair.code and 'np.sin' in repair.code
+    assert 'pylab' not in repair.code
+    assert repair.analysis.is_safe
+
+
+def test_disallowed_import_is_dropped():
+    code = "import os\nimport numpy as np\nx = np.linspace(0, 1)\n"
+    repair = repair_code(code, _unsafe(code))
+    assert 'import os' not in repair.code
+    assert 'import numpy as np' in repair.code
+
+
+def test_global_name_imported_from_wrong_module():
+    code = "from bidi import get_display\nplt.title(get_display('גרף'))\n"
+    failure = CodeFailure('runtime', 'ImportError', "cannot import name 'get_display' from 'bidi'", line=1)
+    repair = repair_code(code, failure)
+    assert 'from bidi import' not in repair.code
+    assert 'use global get_display' in repair.fixes
+
+
+def test_undefined_numpy_name_is_qualified():
+    code = "x = np.linspace(0, 1)\nplt.plot(x, sqrt(x))\nplt.plot(x, cos(x))\n"
+    failure = CodeFailure('runtime', 'NameError', "name 'sqrt' is not defined", line=2)
+    repair = repair_code(code, failure)
+    assert 'np.sqrt(x)' in repair.code and 'np.cos(x)' in repair.code
+
+
+def test_unknown_undefined_name_is_not_guessed():
+    code = "plt.plot(x_values)\n"
+    failure = CodeFailure('runtime', 'NameError', "name 'x_values' is not defined", line=1)
+    assert repair_code(code, failure) is None
+
+
+def test_removed_numpy_alias():
+    code = "x = np.zeros(3, dtype=np.float)\ny = np.NaN\n"
+    failure = CodeFailure('runtime', 'AttributeError', "module 'numpy' has no attribute 'float'", line=1)
+    repair = repair_code(code, failure)
+    assert 'dtype=float' in repair.code and 'np.nan' in repair.code
+
+
+def test_tick_labels_are_matched_to_ticks():
+    code = "fig, ax = plt.subplots()\nax.set_xticks([0, 1, 2])\nax.set_xticklabels(['a', 'b'])\n"
+    failure = CodeFailure(
+        'runtime', 'ValueError',
+        "The number of FixedLocator locations (3), usually from a call to set_ticks, "
+        "does not match the number of labels (2).", line=3
+    )
+    repair = repair_code(code, failure)
+    assert repair.fixes[0] == 'match set_xticklabels to ticks'
+
+
+def test_old_seaborn_style_is_renamed():
+    code = "plt.style.use('seaborn-darkgrid')\nplt.plot([1, 2])\n"
+    failure = CodeFailure('runtime', 'OSError', STYLE_MESSAGE.format('seaborn-darkgrid'), line=1)
+    repair = repair_code(code, failure)
+    assert "plt.style.use('seaborn-v0_8-darkgrid')" in repair.code
+
+
+def test_only_the_missing_style_is_dropped():
+    code = "plt.style.use('ggplot')\nplt.style.use(['classic', 'no-such-style'])\nplt.plot([1, 2])\n"
+    failure = CodeFailure('runtime', 'OSError', STYLE_MESSAGE.format('no-such-style'), line=2)
+    repair = repair_code(code, failure)
+    assert "plt.style.use('ggplot')" in repair.code
+    assert "plt.style.use(['classic'])" in repair.code
+    assert repair.fixes == ['drop style no-such-style']
+
+
+def test_other_errors_mentioning_style_do_not_touch_styles():
+    code = "plt.style.use('ggplot')\nplt.plot([1, 2], linestyle='zz')\n"
+    failure = CodeFailure(
+        'runtime', 'ValueError', "'zz' is not a valid value for ls; Unknown linestyle", line=2
+    )
+    assert repair_code(code, failure) is None
+
+
+def test_hebrew_text_is_wrapped_only_with_a_real_fix():
+    code = "plt.title('גרף')\nplt.plot(x, sqrt(x))\n"
+    assert repair_code(code, CodeFailure('runtime', 'ValueError', 'something else')) is None
+    failure = CodeFailure('runtime', 'NameError', "name 'sqrt' is not defined", line=2)
+    repair = repair_code(code, failure)
+    assert "plt.title(get_display('גרף'))" in repair.code
+
+
+def test_syntax_errors_are_left_to_gemini():
+    code = "plt.plot(\n"
+    assert repair_code(code, CodeFailure.from_analysis(analyze_code(code))) is None
+
+
+def test_repaired_style_runs(tmp_path, monkeypatch):
+    from utils.code_executor import CodeExecutionError, SafeCodeExecutor
+
+    monkeypatch.chdir(tmp_path)
+    executor = SafeCodeExecutor()
+    code = "plt.style.use('seaborn-darkgrid')\nplt.plot([1, 2], [3, 4])\nplt.savefig('drawing.png')\n"
+    with pytest.raises(CodeExecutionError) as error:
+        executor.execute_code(code)
+    repair = repair_code(code, CodeFailure.from_error(error.value))
+    executor.execute_code(repair.code)
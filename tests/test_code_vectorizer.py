@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+import pytest
+
+from utils.code_analyzer import analyze_code
+from utils import vectorized_runtime
+
+CURVE = """
+xs, ys = [], []
+for k in range(2000):
+    t = 2 * math.pi * k / 2000
+    xs.append(math.cos(3 * t) * math.exp(-t / 10))
+    ys.append(math.sin(2 * t))
+"""
+
+GRID = """
+x = np.linspace(-2, 2, 60)
+y = np.linspace(-1, 1, 40)
+Z = np.zeros((40, 60))
+for i in range(40):
+    for j in range(60):
+        r = math.sqrt(x[j] ** 2 + y[i] ** 2)
+        Z[i, j] = math.sin(3 * r) / (1 + r)
+"""
+
+ESCAPE = """
+def escape(c, max_iter):
+    z = 0
+    for n in range(max_iter):
+        if abs(z) > 2:
+            return n
+        z = z * z + c
+    return max_iter
+
+x = np.linspace(-2, 1, 40)
+y = np.linspace(-1.5, 1.5, 30)
+image = np.zeros((30, 40))
+for i in range(30):
+    for j in range(40):
+        image[i][j] = escape(complex(x[j], y[i]), 30)
+"""
+
+COMPREHENSION = "values = [math.sin(k / 100) ** 2 for k in range(1000)]"
+
+BRANCHES = """
+out = []
+for k in range(1000):
+    v = k / 100 - 5
+    if v < -2:
+        w = -v
+    elif v < 2:
+        w = v * v
+    else:
+        w = abs(v) % 3
+    out.append(int(w * 10) // 3)
+"""
+
+# מספרים שלמים גדולים: ב-int64 הם גולשים, ולכן הגרסה על מערכים נפסלת בבדיקה
+OVERFLOW = """
+vals = []
+for k in range(300):
+    vals.append(2 ** k)
+"""
+
+SMALL = """
+small = []
+for k in range(10):
+    small.append(k * k)
+"""
+
+
+def _run(code: str, vectorize: bool):
+    analysis = analyze_code(code, vectorize=vectorize)
+    assert analysis.is_safe, analysis.violations
+    namespace = dict(vectorized_runtime.HELPERS, math=math, np=np)
+    vectorized_runtime.reset_reports()
+    exec(analysis.code_object, namespace)
+    results = [report['result'] for report in vectorized_runtime.take_reports()]
+    return analysis, namespace, results
+
+
+def _user_variables(namespace: dict) -> dict:
+    return {
+        name: value for name, value in namespace.items()
+        if not name.startswith('__') and name not in ('math', 'np') and not callable(value)
+    }
+
+
+def _assert_same(vector, scalar, name):
+    assert type(vector) is type(scalar), name
+    if isinstance(scalar, list):
+        assert [type(item) for item in vector] == [type(item) for item in scalar], name
+        if all(isinstance(item, int) for item in scalar):
+            assert vector == scalar, name
+            return
+    if isinstance(scalar, (list, np.ndarray)):
+        np.testing.assert_allclose(vector, scalar, rtol=1e-12, atol=1e-12, err_msg=name)
+    else:
+        assert vector == pytest.approx(scalar, rel=1e-12), name
+
+
+@pytest.mark.parametrize('code, expected', [
+    (CURVE, ['vectorized']),
+    (GRID, ['vectorized']),
+    (ESCAPE, ['vectorized']),
+    (COMPREHENSION, ['vectorized']),
+    (BRANCHES, ['vectorized']),
+    (OVERFLOW, ['fallback']),
+    (SMALL, []),
+], ids=['curve', 'grid', 'escape', 'comprehension', 'branches', 'overflow', 'small'])
+def test_vectorized_run_matches_the_loop(code, expected):
+    _, scalar, _ = _run(code, vectorize=False)
+    analysis, vector, results = _run(code, vectorize=True)
+    assert analysis.vectorized_loops == 1
+    assert results == expected
+
+    scalar, vector = _user_variables(scalar), _user_variables(vector)
+    assert scalar.keys() == vector.keys()
+    for name, value in scalar.items():
+        _assert_same(vector[name], value, name)
+
+
+def test_error_in_the_loop_is_raised_as_before():
+    code = "out = []\nfor k in range(1000):\n    out.append(math.sqrt(500 - k))"
+    with pytest.raises(ValueError):
+        _run(code, vectorize=False)
+    with pytest.raises(ValueError):
+        _run(code, vectorize=True)
+
+
+@pytest.mark.parametrize('code', [
+    # המיכל נקרא בתוך הלולאה
+    "xs = []\nfor k in range(1000):\n    xs.append(len(xs))",
+    # אין פלט מהלולאה
+    "total = 0\nfor k in range(1000):\n    total += k",
+    # משתנה שמוצב רק בחלק מהאיטרציות ונקרא אחרי הלולאה
+    "xs = []\nfor k in range(1000):\n    if k > 500:\n        m = k\n    xs.append(k)\nprint(m)",
+])
+def test_unsupported_loops_are_left_as_is(code):
+    assert analyze_code(code, vectorize=True).vectorized_loops == 0
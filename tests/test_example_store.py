@@ -0,0 +1,86 @@
+import pytest
+
+from services.example_store import ExampleStore, MAX_CODE_CHARS
+from services.gemini_service import GeminiService, TASK_PREFIX
+
+
+@pytest.fixture
+def store():
+    store = ExampleStore()
+    store.add("מעגל ברדיוס 3", "r = 3")
+    store.add("פרבולה y=x^2", "x = 1")
+    store.add("משולש שווה צלעות", "a = 1")
+    return store
+
+
+def _similar(store, description, k=2):
+    return [example.description for example in store.similar(description, k)]
+
+
+@pytest.mark.parametrize('description, expected', [
+    ("מעגל ברדיוס 5", ["מעגל ברדיוס 3"]),
+    ("משולש שווה שוקיים", ["משולש שווה צלעות"]),
+    # אין דוגמה דומה מספיק
+    ("ריבוע", []),
+])
+def test_similar_examples(store, description, expected):
+    assert _similar(store, description) == expected
+
+
+def test_same_description_is_not_returned(store):
+    assert _similar(store, "מעגל ברדיוס 3") == []
+    assert _similar(store, "  מעגל   ברדיוס 3 ") == []
+
+
+def test_most_similar_first_and_k(store):
+    store.add("מעגל ברדיוס 4 ובתוכו משולש", "r = 4")
+    assert _similar(store, "מעגל ברדיוס 5 ובתוכו משולש") == ["מעגל ברדיוס 4 ובתוכו משולש", "מעגל ברדיוס 3"]
+    assert _similar(store, "מעגל ברדיוס 5 ובתוכו משולש", k=1) == ["מעגל ברדיוס 4 ובתוכו משולש"]
+    assert _similar(store, "מעגל ברדיוס 5", k=0) == []
+
+
+def test_equivalent_description_replaces_the_example(store):
+    store.add("  מעגל ברדיוס 3", "r = 3.0")
+    assert store.stats()['examples'] == 3
+    assert [example.code for example in store.similar("מעגל ברדיוס 5")] == ["r = 3.0"]
+
+
+def test_comments_and_blank_lines_are_stripped():
+    store = ExampleStore()
+    store.add("מעגל ברדיוס 7", "# מעגל\nr = 7\n\n    # רדיוס\nplt.plot(r)  # קו\n")
+    [example] = store.similar("מעגל ברדיוס 8")
+    assert example.code == "r = 7\nplt.plot(r)  # קו"
+
+
+def test_long_code_is_not_stored(store):
+    store.add("מעגל ברדיוס 9", "x = 1\n" * (MAX_CODE_CHARS // 5))
+    assert store.stats()['examples'] == 3
+
+
+def test_oldest_example_is_evicted():
+    store = ExampleStore(max_examples=2)
+    store.add("מעגל ברדיוס 3", "r = 3")
+    store.add("פרבולה y=x^2", "x = 1")
+    store.add("משולש שווה צלעות", "a = 1")
+    assert store.stats()['examples'] == 2
+    assert _similar(store, "מעגל ברדיוס 5") == []
+    assert _similar(store, "פרבולה y=x^3") == ["פרבולה y=x^2"]
+
+
+def test_postings_are_cleaned_on_eviction():
+    store = ExampleStore(max_examples=1)
+    store.add("מעגל ברדיוס 3", "r = 3")
+    features = store.stats()['features']
+    store.add("מעגל ברדיוס 3", "r = 3")
+    assert store.stats() == {'examples': 1, 'features': features}
+    store.add("ריבוע", "a = 1")
+    assert store.stats()['features'] < features
+
+
+def test_prompt_includes_similar_examples(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    service = GeminiService()
+    service.examples.add("מעגל ברדיוס 3", "r = 3")
+    prompt = service._build_prompt("מעגל ברדיוס 5")
+    assert prompt == f"Example - מעגל ברדיוס 3\n```python\nr = 3\n```\n\n{TASK_PREFIX}מעגל ברדיוס 5\n"
+    assert service._build_prompt("ריבוע") == f"{TASK_PREFIX}ריבוע\n"
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from services.fair_scheduler import FairScheduler, JobSuperseded, SchedulerBusyError
+
+
+def _job(name: str, log: list, gate: asyncio.Event = None):
+    async def run():
+        if gate is not None:
+            await gate.wait()
+        log.append(name)
+        return name
+    return run
+
+
+def test_new_request_supersedes_queued_request_of_same_user():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        running = scheduler.submit('u', _job('first', log, gate))
+        queued = scheduler.submit('u', _job('second', log))
+        latest = scheduler.submit('u', _job('third', log))
+        gate.set()
+        assert await running == 'first'
+        with pytest.raises(JobSuperseded):
+            await queued
+        assert await latest == 'third'
+        assert log == ['first', 'third']
+        assert scheduler.stats()['superseded'] == 1
+
+    asyncio.run(main())
+
+
+def test_request_does_not_supersede_queued_batch():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        running = scheduler.submit('u', _job('first', log, gate))
+        batch = scheduler.submit('u', _job('batch', log), supersede=False, kind='batch')
+        message = scheduler.submit('u', _job('message', log))
+        gate.set()
+        await asyncio.gather(running, batch, message)
+        assert log == ['first', 'batch', 'message']
+        assert scheduler.stats()['superseded'] == 0
+
+    asyncio.run(main())
+
+
+def test_request_supersedes_only_jobs_of_its_kind():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        running = scheduler.submit('u', _job('first', log, gate))
+        other = scheduler.submit('u', _job('other', log), kind='other')
+        queued = scheduler.submit('u', _job('queued', log))
+        latest = scheduler.submit('u', _job('latest', log))
+        gate.set()
+        await asyncio.gather(running, other, latest)
+        with pytest.raises(JobSuperseded):
+            await queued
+        assert log == ['first', 'other', 'latest']
+
+    asyncio.run(main())
+
+
+def test_batch_does_not_supersede_queued_requests():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        running = scheduler.submit('u', _job('first', log, gate))
+        message = scheduler.submit('u', _job('message', log))
+        batch = scheduler.submit('u', _job('batch', log), supersede=False, kind='batch')
+        gate.set()
+        await asyncio.gather(running, message, batch)
+        assert log == ['first', 'message', 'batch']
+
+    asyncio.run(main())
+
+
+def test_busy_user_does_not_starve_others():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        jobs = [scheduler.submit('heavy', _job('heavy0', log, gate), supersede=False)]
+        jobs += [scheduler.submit('heavy', _job(f'heavy{i}', log), supersede=False) for i in range(1, 4)]
+        jobs.append(scheduler.submit('light', _job('light', log)))
+        gate.set()
+        await asyncio.gather(*jobs)
+        assert log == ['heavy0', 'light', 'heavy1', 'heavy2', 'heavy3']
+
+    asyncio.run(main())
+
+
+def test_costly_jobs_get_a_proportional_share():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_per_user=1)
+        log, gate = [], asyncio.Event()
+        jobs = [scheduler.submit('x', _job('x', log, gate))]
+        jobs += [scheduler.submit('a', _job(f'a{i}', log), cost=2, supersede=False) for i in range(2)]
+        jobs += [scheduler.submit('b', _job(f'b{i}', log), supersede=False) for i in range(4)]
+        gate.set()
+        await asyncio.gather(*jobs)
+        assert log == ['x', 'b0', 'a0', 'b1', 'b2', 'a1', 'b3']
+
+    asyncio.run(main())
+
+
+def test_concurrency_limits():
+    async def main():
+        scheduler = FairScheduler(max_active=2, max_per_user=1)
+        running, peak = {}, {}
+
+        def job(user_id):
+            async def run():
+                running[user_id] = running.get(user_id, 0) + 1
+                peak[user_id] = max(peak.get(user_id, 0), running[user_id])
+                peak['total'] = max(peak.get('total', 0), sum(running.values()))
+                await asyncio.sleep(0.01)
+                running[user_id] -= 1
+            return run
+
+        await asyncio.gather(*[
+            scheduler.submit(user_id, job(user_id), supersede=False)
+            for user_id in ('a', 'b', 'c') for _ in range(3)
+        ])
+        assert peak == {'a': 1, 'b': 1, 'c': 1, 'total': 2}
+
+    asyncio.run(main())
+
+
+def test_full_queues_are_rejected():
+    async def main():
+        scheduler = FairScheduler(max_active=1, max_queue=3, max_user_queue=2)
+        gate = asyncio.Event()
+        jobs = [scheduler.submit('a', _job('a', [], gate))]
+        jobs += [scheduler.submit('a', _job('a', []), supersede=False) for _ in range(2)]
+        with pytest.raises(SchedulerBusyError):
+            scheduler.submit('a', _job('a', []), supersede=False)
+        jobs.append(scheduler.submit('b', _job('b', [])))
+        with pytest.raises(SchedulerBusyError):
+            scheduler.submit('c', _job('c', []))
+        assert scheduler.stats()['rejected'] == 2
+        gate.set()
+        await asyncio.gather(*jobs)
+
+    asyncio.run(main())
+
+
+def test_errors_reach_the_caller_and_users_are_released():
+    async def main():
+        scheduler = FairScheduler(max_active=1)
+
+        async def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await scheduler.submit('a', fail)
+        await scheduler.submit('b', _job('b', []))
+        assert scheduler.stats() == {'active': 0, 'queued': 0, 'users': 0, 'superseded': 0, 'rejected': 0}
+
+    asyncio.run(main())
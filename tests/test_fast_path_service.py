@@ -0,0 +1,76 @@
+import math
+
+import pytest
+
+from services.fast_path_service import FastPathService, _parse_value, _to_numpy_expression
+from utils.code_analyzer import analyze_code
+
+
+@pytest.mark.parametrize('text, value', [
+    ('3', 3.0),
+    ('-1.5', -1.5),
+    ('π/2', math.pi / 2),
+    ('-2π', -2 * math.pi),
+    ('3pi', 3 * math.pi),
+])
+def test_parse_value(text, value):
+    assert _parse_value(text) == pytest.approx(value)
+
+
+@pytest.mark.parametrize('text', ['', '-', 'x', '2e'])
+def test_parse_value_rejects(text):
+    with pytest.raises(ValueError):
+        _parse_value(text)
+
+
+@pytest.mark.parametrize('text, expression', [
+    ('2sin(x)^2', '2*np.sin(x)**2'),
+    ('x(x+1)', 'x*(x+1)'),
+    ('(x+1)(x-1)', '(x+1)*(x-1)'),
+    ('e^x', 'np.e**x'),
+    ('ln(x) + 2x', 'np.log(x)+2*x'),
+])
+def test_to_numpy_expression(text, expression):
+    assert _to_numpy_expression(text) == expression
+
+
+@pytest.mark.parametrize('text', ['import(x)', 'sin x', '2 + 3', 'x +* 2', 'x_1'])
+def test_to_numpy_expression_rejects(text):
+    with pytest.raises((ValueError, SyntaxError)):
+        _to_numpy_expression(text)
+
+
+@pytest.mark.parametrize('description, expected', [
+    ("צייר מעגל ברדיוס 3", "Circle((0.0, 0.0), 3.0"),
+    ("מעגל ברדיוס 2 במרכז (1, -1)", "Circle((1.0, -1.0), 2.0"),
+    ("משושה עם צלע 2", "n = 6"),
+    ("מצולע עם 7 צלעות", "n = 7"),
+    ("y=2sin(x)^2", "2*np.sin(x)**2"),
+    ("גרף של x^2 בתחום [-2, 2]", "np.linspace(-2.0, 2.0, 2000)"),
+    ("פונקציה x^3 בין -1 ל 3", "np.linspace(-1.0, 3.0, 2000)"),
+    ("פרבולה", "(x**2)"),
+])
+def test_simple_requests_use_a_template(description, expected):
+    code = FastPathService().generate_code(description)
+    assert expected in code
+    assert analyze_code(code).is_safe
+
+
+@pytest.mark.parametrize('description', [
+    "מעגל ובתוכו משולש",
+    "מעגל ברדיוס 3 בצבע אדום",
+    "y=x^2 בתחום [3, 1]",
+    "מעגל ברדיוס -1",
+    "משולש עם צלע 2 ברדיוס 3",
+    "y = import(x)",
+    "משפט פיתגורס",
+])
+def test_other_requests_go_to_gemini(description):
+    assert FastPathService().generate_code(description) is None
+
+
+def test_stats():
+    service = FastPathService()
+    service.generate_code("מעגל ברדיוס 1")
+    service.generate_code("משפט פיתגורס")
+    assert service.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
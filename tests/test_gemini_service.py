@@ -0,0 +1,211 @@
+import time
+import asyncio
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from services.gemini_service import GeminiService, GeminiRateLimitError, GeminiBusyError
+
+CODE = "plt.plot([0, 1])"
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    מודל שמחזיר לפי הסדר את התשובות (או זורק את השגיאות) שקיבל
+    """
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _Response(outcome)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setenv('GEMINI_STREAM', 'false')
+    service = GeminiService()
+    service.retry_delay = 0
+    # אחרי 429 הדלי מתרוקן; בקצב אמיתי הניסיון הבא היה ממתין שניות
+    service.rate_limiter.rate = 1000
+    return service
+
+
+def _request(service, model):
+    service.model = model
+    return asyncio.run(service._request_code("prompt", kind='repair'))
+
+
+class SlowModel:
+    """
+    מודל שעונה אחרי המתנה אסינכרונית, כמו קריאת רשת
+    """
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def generate_content_async(self, prompt, stream=False):
+        await asyncio.sleep(self.delay)
+        return _Response(CODE)
+
+
+async def _ticking(awaitable):
+    """
+    מריץ את awaitable לצד טיימר של 10ms ומחזיר (תוצאה, כמה פעמים הטיימר הספיק לרוץ)
+    """
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    try:
+        return await awaitable, ticks
+    finally:
+        ticker.cancel()
+
+
+def test_requests_run_concurrently_on_the_event_loop(service):
+    service.model = SlowModel(0.3)
+
+    async def main():
+        start = time.perf_counter()
+        codes, ticks = await _ticking(asyncio.gather(*[service.generate_code_async("מעגל") for _ in range(3)]))
+        return codes, ticks, time.perf_counter() - start
+
+    codes, ticks, elapsed = asyncio.run(main())
+    assert codes == [CODE] * 3
+    # שלוש הבקשות ממתינות יחד, והלולאה ממשיכה לטפל בדברים אחרים בזמן הזה
+    assert elapsed < 0.6
+    assert ticks >= 10
+
+
+def test_model_is_loaded_off_the_event_loop(service, monkeypatch):
+    def load(self):
+        # טעינת ה-SDK והמודל חוסמת
+        time.sleep(0.3)
+        return FakeModel(CODE)
+
+    monkeypatch.setattr(GeminiService, 'model', property(load))
+    code, ticks = asyncio.run(_ticking(service.generate_code_async("מעגל")))
+    assert code == CODE
+    assert ticks >= 10
+
+
+def test_transient_errors_are_retried(service):
+    model = FakeModel(google_exceptions.ServiceUnavailable("503"), f"```python\n{CODE}\n```")
+    assert _request(service, model) == CODE
+    assert model.calls == 2
+    assert service.retry_count == 1
+
+
+def test_rate_limit_cuts_concurrency_and_drains_the_bucket(service):
+    limit = service.concurrency_limiter.limit
+    model = FakeModel(google_exceptions.ResourceExhausted("quota exceeded"), CODE)
+    assert _request(service, model) == CODE
+    assert service.rate_limited_count == 1
+    assert service.concurrency_limiter.limit < limit
+    assert service.rate_limiter.tokens < 1
+
+
+def test_fatal_error_is_not_retried(service):
+    model = FakeModel(google_exceptions.InvalidArgument("bad request"), CODE)
+    with pytest.raises(RuntimeError):
+        _request(service, model)
+    assert model.calls == 1
+
+
+def test_rate_limit_on_every_attempt(service):
+    model = FakeModel(*[google_exceptions.TooManyRequests("429")] * service.max_retries)
+    with pytest.raises(GeminiRateLimitError):
+        _request(service, model)
+    assert model.calls == service.max_retries
+
+
+def test_full_queue_is_rejected(service):
+    service.concurrency_limiter.max_queue = 0
+    service.concurrency_limiter.in_flight = service.concurrency_limiter.limit
+    with pytest.raises(GeminiBusyError):
+        _request(service, FakeModel(CODE))
+
+
+class _Chunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no text in this chunk")
+        return self._text
+
+
+class _Stream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.read = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            for part in self.parts:
+                self.read += 1
+                yield _Chunk(part)
+        finally:
+            self.closed = True
+
+
+class StreamingModel:
+    def __init__(self, parts):
+        self.stream = _Stream(parts)
+
+    async def generate_content_async(self, prompt, stream=False):
+        assert stream
+        return self.stream
+
+
+@pytest.mark.parametrize('text, code', [
+    ("Here:\n```python\nx = 1\n", None),
+    ("Here:\n```python\nx = 1\n```", "x = 1"),
+    ("```\nx = 1\n```\nand more", "x = 1"),
+    ("no code yet", None),
+    ("```py", None),
+])
+def test_find_complete_code(service, text, code):
+    assert service._find_complete_code(text) == code
+
+
+def test_stream_returns_as_soon_as_the_code_block_closes(service):
+    service.stream = True
+    model = StreamingModel([
+        "Sure!\n```python\n", None, "plt.plot([0, 1])\n", "```\n", "Explanation ", "that is not needed",
+    ])
+    progress = []
+    service.model = model
+    code = asyncio.run(service._request_code("prompt", on_progress=lambda *event: progress.append(event)))
+    assert code == CODE
+    assert model.stream.read == 4
+    assert model.stream.closed
+    assert progress[0] == ('thinking', 0)
+    assert ('writing', 1) in progress
+
+
+def test_stream_without_code_fence(service):
+    service.stream = True
+    service.model = StreamingModel(["plt.plot(", "[0, 1])"])
+    assert asyncio.run(service._request_code("prompt")) == CODE
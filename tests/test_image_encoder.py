@@ -0,0 +1,71 @@
+import io
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+from matplotlib.figure import Figure
+
+from services.image_encoder import ImageEncoder, TRIM_PADDING
+
+
+def _drawing(size=(1000, 800), box=(300, 200, 500, 400)) -> Image.Image:
+    image = Image.new('RGB', size, 'white')
+    ImageDraw.Draw(image).rectangle(box, outline='blue', width=3)
+    return image
+
+
+def _noise(size=(800, 800)) -> Image.Image:
+    return Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+
+
+def _decode(buffer: io.BytesIO) -> Image.Image:
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_white_margins_are_trimmed_with_padding():
+    image = _decode(ImageEncoder().encode(_drawing()))
+    assert image.format == 'PNG'
+    assert image.size == (201 + 2 * TRIM_PADDING, 201 + 2 * TRIM_PADDING)
+
+
+def test_transparency_becomes_white():
+    image = Image.new('RGBA', (600, 600), (0, 0, 0, 0))
+    ImageDraw.Draw(image).line((0, 0, 600, 600), fill=(255, 0, 0, 255), width=5)
+    encoded = _decode(ImageEncoder().encode(image)).convert('RGB')
+    assert encoded.getpixel((encoded.width - 1, 0)) == (255, 255, 255)
+
+
+def test_many_colors_are_encoded_as_jpeg():
+    assert _decode(ImageEncoder().encode(_noise())).format == 'JPEG'
+
+
+@pytest.mark.parametrize('fmt, pil_format', [('png', 'PNG'), ('jpeg', 'JPEG'), ('webp', 'WEBP')])
+def test_configured_format(monkeypatch, fmt, pil_format):
+    monkeypatch.setenv('IMAGE_FORMAT', fmt)
+    assert _decode(ImageEncoder().encode(_drawing())).format == pil_format
+
+
+def test_unknown_format_falls_back_to_auto(monkeypatch):
+    monkeypatch.setenv('IMAGE_FORMAT', 'gif')
+    assert ImageEncoder().format == 'auto'
+
+
+def test_long_side_is_limited(monkeypatch):
+    monkeypatch.setenv('IMAGE_MAX_SIDE', '400')
+    image = _decode(ImageEncoder().encode(_drawing(box=(0, 0, 999, 799))))
+    assert max(image.size) == 400
+
+
+def test_byte_budget_lowers_quality_then_size(monkeypatch):
+    monkeypatch.setenv('IMAGE_MAX_BYTES', '150000')
+    encoded = ImageEncoder().encode(_noise((1200, 1200)))
+    image = _decode(encoded)
+    assert len(encoded.getvalue()) <= 150000
+    assert image.width < 1200
+
+
+def test_pick_dpi_keeps_the_long_side_within_the_limit(monkeypatch):
+    monkeypatch.setenv('IMAGE_MAX_SIDE', '1000')
+    encoder = ImageEncoder()
+    assert encoder.pick_dpi(Figure(figsize=(10, 5)), 300) == 100
+    assert encoder.pick_dpi(Figure(figsize=(10, 5)), 72) == 72
@@ -0,0 +1,121 @@
+import sqlite3
+
+import pytest
+
+from services.job_queue import JobQueue, SCHEMA
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('services.job_queue.time.time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=60, max_attempts=2, retry_delay=5)
+
+
+def _enqueue(queue, update_id=1, text="צייר מעגל"):
+    return queue.enqueue(update_id, chat_id=10, user_id=20, message_id=30, payload={'text': text})
+
+
+def test_duplicate_update_is_ignored(queue):
+    assert _enqueue(queue)
+    assert not _enqueue(queue, text="עדכון כפול")
+    [job] = queue.claim('w1', limit=5)
+    assert job.payload == {'text': "צייר מעגל"}
+    assert queue.stats()['running'] == 1
+
+
+def test_claimed_job_is_not_claimed_again(queue):
+    _enqueue(queue)
+    assert len(queue.claim('w1')) == 1
+    assert queue.claim('w2') == []
+
+
+def test_expired_lease_is_delivered_again(queue, clock):
+    _enqueue(queue)
+    [first] = queue.claim('w1')
+    clock[0] += 61
+    [second] = queue.claim('w2')
+    assert second.update_id == first.update_id
+    assert (first.attempts, second.attempts) == (1, 2)
+
+
+def test_extended_lease_is_kept(queue, clock):
+    _enqueue(queue)
+    queue.claim('w1')
+    clock[0] += 50
+    queue.extend([1], 'w1')
+    clock[0] += 50
+    assert queue.claim('w2') == []
+    # רק ה-worker שמחזיק בעבודה יכול להאריך אותה
+    queue.extend([1], 'w2')
+    clock[0] += 11
+    assert len(queue.claim('w2')) == 1
+
+
+def test_replies_are_remembered_across_deliveries(queue, clock):
+    _enqueue(queue)
+    queue.claim('w1')
+    queue.record_replies(1, {'text:מעבד': 554})
+    queue.record_replies(1, {'photo:1. מעגל': 555, 'photo:2. ריבוע': 556})
+    clock[0] += 61
+    [job] = queue.claim('w2')
+    assert job.replies == {'text:מעבד': 554, 'photo:1. מעגל': 555, 'photo:2. ריבוע': 556}
+
+
+def test_failed_job_is_retried_after_a_delay_then_marked_failed(queue, clock):
+    _enqueue(queue)
+    [job] = queue.claim('w1')
+    queue.release(job, error="boom")
+    assert queue.claim('w1') == []
+    clock[0] += 5
+    [job] = queue.claim('w1')
+    queue.release(job, error="boom")
+    assert queue.stats() == {'queued': 0, 'running': 0, 'done': 0, 'failed': 1}
+    clock[0] += 1000
+    assert queue.claim('w1') == []
+
+
+def test_release_without_error_requeues_immediately(queue):
+    _enqueue(queue)
+    [job] = queue.claim('w1')
+    queue.release(job)
+    assert [job.update_id for job in queue.claim('w1')] == [1]
+
+
+def test_jobs_are_claimed_in_arrival_order(queue, clock):
+    for update_id in (3, 1, 2):
+        _enqueue(queue, update_id)
+        clock[0] += 1
+    assert [job.update_id for job in queue.claim('w1', limit=3)] == [3, 1, 2]
+
+
+def test_purge_removes_only_old_finished_jobs(queue, clock):
+    _enqueue(queue, 1)
+    _enqueue(queue, 2)
+    queue.claim('w1', limit=2)
+    queue.complete(1)
+    clock[0] += queue.keep_seconds + 1
+    assert queue.purge() == 1
+    assert queue.stats() == {'queued': 0, 'running': 1, 'done': 0, 'failed': 0}
+
+
+def test_queue_file_from_an_older_version_is_upgraded(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA.replace("replies TEXT NOT NULL DEFAULT '{}'", "reply_message_id INTEGER"))
+    conn.close()
+    queue = JobQueue(path)
+    _enqueue(queue)
+    queue.record_replies(1, {'text:a': 1})
+    assert queue.claim('w1')[0].replies == {'text:a': 1}
+
+
+def test_queue_survives_reopening(tmp_path):
+    _enqueue(JobQueue(tmp_path / "jobs.sqlite3"))
+    [job] = JobQueue(tmp_path / "jobs.sqlite3").claim('w1')
+    assert job.payload == {'text': "צייר מעגל"}
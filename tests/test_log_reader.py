@@ -0,0 +1,75 @@
+import json
+import logging
+
+from utils.code_executor import JSONLinesHandler, JSONQueueHandler
+from utils.log_reader import iter_log_entries, iter_rotated_log_entries, convert_to_json_lines
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"test_log_reader.{id(handler)}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+def test_json_lines_and_old_array_format(tmp_path):
+    entries = [{'message': 'a'}, {'message': 'ב'}]
+    old = tmp_path / "old.json"
+    old.write_text(json.dumps(entries, ensure_ascii=False), encoding='utf-8')
+    new = tmp_path / "new.jsonl"
+    assert convert_to_json_lines(old, new) == 2
+    assert list(iter_log_entries(old)) == entries
+    assert list(iter_log_entries(new)) == entries
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('{"message": "a"}\n\n{"message": "b"}\n{"mess', encoding='utf-8')
+    assert [entry['message'] for entry in iter_log_entries(path)] == ['a', 'b']
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('\n', encoding='utf-8')
+    assert list(iter_log_entries(path)) == []
+
+
+def test_queue_handler_writes_one_json_record_per_line(tmp_path):
+    path = tmp_path / "log.jsonl"
+    handler = JSONQueueHandler(JSONLinesHandler(path))
+    logger = _logger(handler)
+    logger.warning("first")
+    logger.warning("שני")
+    handler.close()
+
+    entries = list(iter_log_entries(path))
+    assert [entry['message'] for entry in entries] == ['first', 'שני']
+    assert entries[0]['level'] == 'WARNING'
+
+
+def test_rotated_files_are_read_from_oldest(tmp_path):
+    path = tmp_path / "log.jsonl"
+    handler = JSONQueueHandler(JSONLinesHandler(path, max_bytes=300, backup_count=10))
+    logger = _logger(handler)
+    for number in range(10):
+        logger.warning(f"record {number}")
+    handler.close()
+
+    assert list(tmp_path.glob("log.jsonl.*"))
+    messages = [entry['message'] for entry in iter_rotated_log_entries(path)]
+    assert messages == [f"record {number}" for number in range(10)]
+
+
+def test_time_based_rollover(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('utils.code_executor.time.time', lambda: clock[0])
+    path = tmp_path / "log.jsonl"
+    handler = JSONLinesHandler(path, rotate_seconds=60)
+    logger = _logger(handler)
+    logger.warning("before")
+    clock[0] += 61
+    logger.warning("after")
+    handler.close()
+
+    assert (tmp_path / "log.jsonl.1").exists()
+    assert path.read_text(encoding='utf-8').splitlines() == ['after']
@@ -0,0 +1,84 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from services.metrics import MetricsRegistry, MetricsServer, RequestTrace, STAGE_SECONDS, REQUESTS
+
+
+def test_counter_with_and_without_labels():
+    registry = MetricsRegistry()
+    plain = registry.counter('plain_total', 'Plain counter')
+    labelled = registry.counter('labelled_total', 'Labelled counter', ('kind',))
+    plain.inc()
+    labelled.inc(2, kind='b')
+    labelled.inc(kind='a')
+    assert registry.render() == (
+        "# HELP plain_total Plain counter\n"
+        "# TYPE plain_total counter\n"
+        "plain_total 1\n"
+        "# HELP labelled_total Labelled counter\n"
+        "# TYPE labelled_total counter\n"
+        'labelled_total{kind="a"} 1\n'
+        'labelled_total{kind="b"} 2\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4',
+    ]
+
+
+def test_gauge_function_is_read_on_collection():
+    registry = MetricsRegistry()
+    gauge = registry.gauge('queue_length', 'Queue length')
+    queue = [1, 2]
+    gauge.set_function(lambda: len(queue))
+    queue.append(3)
+    assert gauge.samples() == ['queue_length 3']
+
+
+def test_same_name_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('a_total', 'A') is registry.counter('a_total', 'A')
+    with pytest.raises(ValueError):
+        registry.histogram('a_total', 'A')
+
+
+def test_request_trace_records_stages_and_outcome():
+    count = STAGE_SECONDS._series.get(('generate',), [None, 0, 0])[2]
+    ok = REQUESTS.value(outcome='ok')
+    trace = RequestTrace()
+    with trace.span('generate'):
+        pass
+    with trace.span('generate'):
+        pass
+    trace.outcome = 'ok'
+    trace.finish()
+    assert set(trace.durations) == {'generate', 'total'}
+    assert STAGE_SECONDS._series[('generate',)][2] == count + 2
+    assert REQUESTS.value(outcome='ok') == ok + 1
+
+
+def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('served_total', 'Served').inc()
+    server = MetricsServer(port=0, registry=registry)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'served_total 1' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+    finally:
+        server.stop()
@@ -0,0 +1,171 @@
+import asyncio
+import socket
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from bot.queue_worker import QueuedMessage, SentReply
+from bot.telegram_bot import MathDrawingBot
+from services.job_queue import JobQueue
+
+
+class FakeBot:
+    """
+    Bot API בזיכרון: כל הודעה שנשלחת מקבלת message_id חדש ונרשמת ב-sent
+    """
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+        self.deleted = []
+
+    def _message(self, kind, content):
+        self.sent.append((kind, content))
+        return SimpleNamespace(message_id=100 + len(self.sent), photo=())
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return self._message('text', text)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        return self._message('photo', caption)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        return tuple(self._message('photo', item.caption) for item in media)
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        return self._message('document', filename)
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edited.append((message_id, text))
+
+    async def delete_message(self, chat_id, message_id):
+        if message_id in self.deleted:
+            raise BadRequest("Message to delete not found")
+        self.deleted.append(message_id)
+        return True
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('services.job_queue.time.time', lambda: clock[0])
+    queue = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=60)
+    queue.enqueue(1, chat_id=10, user_id=20, message_id=30, payload={'text': "צייר מעגל"})
+    queue.clock = clock
+    return queue
+
+
+def _deliver(queue, bot):
+    """
+    לוקח את העבודה מהתור (אחרי שה-lease של המסירה הקודמת פג), כמו תהליך עבודה חדש
+    """
+    queue.clock[0] += 61
+    [job] = queue.claim('worker')
+    return QueuedMessage(bot, queue, job)
+
+
+def _media(*captions):
+    return [InputMediaPhoto(b'image', caption=caption) for caption in captions]
+
+
+def test_replies_are_not_sent_again_on_redelivery(queue):
+    async def main():
+        bot = FakeBot()
+        message = _deliver(queue, bot)
+        await message.reply_text("מעבד את הבקשה שלך...")
+        await message.reply_photo(photo=b'image', caption="הנה השרטוט")
+
+        # התהליך נפל לפני שהעבודה סומנה כגמורה
+        message = _deliver(queue, bot)
+        processing = await message.reply_text("מעבד את הבקשה שלך...")
+        photo = await message.reply_photo(photo=b'image', caption="הנה השרטוט")
+        assert bot.sent == [('text', "מעבד את הבקשה שלך..."), ('photo', "הנה השרטוט")]
+
+        # ההודעה מהמסירה הקודמת עדיין ניתנת לעריכה ולמחיקה
+        assert isinstance(processing, SentReply) and processing.message_id == 101
+        await processing.edit_text("משרטט...")
+        assert bot.edited == [(101, "משרטט...")]
+        assert not photo.photo
+
+    asyncio.run(main())
+
+
+def test_every_reply_type_is_recorded(queue):
+    async def main():
+        bot = FakeBot()
+        message = _deliver(queue, bot)
+        await message.reply_text("מצטער, נתקלתי בשגיאה")
+        await message.reply_media_group(media=_media("1. a", "2. b"))
+        await message.reply_document(document=b'zip', filename="worksheet.zip")
+        sent = len(bot.sent)
+
+        message = _deliver(queue, bot)
+        await message.reply_text("מצטער, נתקלתי בשגיאה")
+        await message.reply_media_group(media=_media("1. a", "2. b"))
+        await message.reply_document(document=b'zip', filename="worksheet.zip")
+        assert len(bot.sent) == sent == 4
+
+    asyncio.run(main())
+
+
+def test_interrupted_worksheet_sends_only_the_missing_photos(queue):
+    async def main():
+        bot = FakeBot()
+        message = _deliver(queue, bot)
+        await message.reply_media_group(media=_media("1. a", "2. b"))
+        await message.reply_photo(photo=b'image', caption="3. c")
+
+        # במסירה החוזרת השרטוטים מסתיימים בסדר אחר ומתחלקים לקבוצות אחרות
+        message = _deliver(queue, bot)
+        await message.reply_media_group(media=_media("2. b", "4. d"))
+        await message.reply_media_group(media=_media("1. a", "3. c", "5. e", "6. f"))
+        assert await message.reply_media_group(media=_media("1. a", "2. b")) == ()
+        assert [content for _, content in bot.sent] == ["1. a", "2. b", "3. c", "4. d", "5. e", "6. f"]
+
+    asyncio.run(main())
+
+
+def test_deleting_a_reply_that_is_already_gone():
+    async def main():
+        bot = FakeBot()
+        reply = SentReply(bot, 10, 101)
+        assert await reply.delete()
+        assert await reply.delete() is False
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def drawing_bot(tmp_path, monkeypatch):
+    monkeypatch.setenv('TELEGRAM_TOKEN', '123:test')
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setenv('RENDER_CACHE_DIR', str(tmp_path / "renders"))
+    monkeypatch.delenv('JOB_QUEUE_PATH', raising=False)
+    return MathDrawingBot
+
+
+@pytest.mark.parametrize('base_port, ports', [
+    ('9465', ['9465', '9466', '9467']),
+    # 0 מבטל את המדדים בכל תהליכי העבודה
+    ('0', ['0', '0', '0']),
+])
+def test_each_worker_gets_its_own_metrics_port(drawing_bot, monkeypatch, base_port, ports):
+    monkeypatch.setenv('QUEUE_WORKER_METRICS_PORT', base_port)
+    bot = drawing_bot()
+    assert [bot.worker_environment(index)['METRICS_PORT'] for index in range(3)] == ports
+
+
+def test_worker_serves_metrics(drawing_bot, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setenv('METRICS_PORT', str(port))
+    bot = drawing_bot()
+    bot.start_metrics_server()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+    finally:
+        bot.metrics_server.stop()
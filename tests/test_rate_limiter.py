@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+import pytest
+
+from services.rate_limiter import TokenBucket, AdaptiveConcurrencyLimiter, QueueFullError
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    async def main():
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        assert time.monotonic() - start < 0.02
+        await bucket.acquire()
+        assert time.monotonic() - start >= 0.04
+
+    asyncio.run(main())
+
+
+def test_token_bucket_refills_up_to_capacity(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('services.rate_limiter.time.monotonic', lambda: clock[0])
+    bucket = TokenBucket(rate=1, capacity=3)
+    bucket.tokens = 0
+    clock[0] += 2
+    bucket._refill()
+    assert bucket.tokens == 2
+    clock[0] += 10
+    bucket._refill()
+    assert bucket.tokens == 3
+
+
+def test_drain_empties_the_bucket():
+    bucket = TokenBucket(rate=1, capacity=3)
+    bucket.drain()
+    assert bucket.tokens <= 0
+
+
+def test_limit_grows_after_success_and_halves_after_overload():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8)
+        for _ in range(4):
+            await limiter.acquire()
+            limiter.release()
+        assert limiter.limit > 4
+        await limiter.acquire()
+        limiter.release(overloaded=True)
+        assert limiter.limit == pytest.approx(2.5, abs=0.1)
+        for _ in range(5):
+            await limiter.acquire()
+            limiter.release(overloaded=True)
+        assert limiter.limit == limiter.min_limit
+
+    asyncio.run(main())
+
+
+def test_waiters_are_served_in_order():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        await limiter.acquire()
+        order, positions = [], []
+
+        async def on_queued(position):
+            positions.append(position)
+
+        async def wait(name):
+            await limiter.acquire(on_queued)
+            order.append(name)
+
+        waiters = [asyncio.ensure_future(wait(name)) for name in ('a', 'b', 'c')]
+        await asyncio.sleep(0)
+        assert positions == [1, 2, 3]
+        for _ in range(3):
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+        assert order == ['a', 'b', 'c']
+
+    asyncio.run(main())
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_queue=1)
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await limiter.acquire()
+        queued.cancel()
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # first מקבל את המקום ומבוטל לפני שהספיק לרוץ
+        limiter.release()
+        first.cancel()
+        await asyncio.sleep(0)
+        await asyncio.wait_for(second, 1)
+        assert limiter.stats() == {'limit': 1, 'in_flight': 1, 'queued': 0}
+
+    asyncio.run(main())
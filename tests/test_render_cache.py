@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from services.render_cache import RenderCache, code_hash, image_filename, image_format, render_settings
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+JPEG = b'\xff\xd8\xff\xe0' + b'\0' * 100
+WEBP = b'RIFF\0\0\0\0WEBPVP8 ' + b'\0' * 100
+
+
+@pytest.mark.parametrize('data, fmt, filename', [
+    (PNG, 'png', 'drawing.png'),
+    (JPEG, 'jpeg', 'drawing.jpg'),
+    (WEBP, 'webp', 'drawing.webp'),
+])
+def test_image_format(data, fmt, filename):
+    assert image_format(data) == fmt
+    assert image_filename(image_format(data)) == filename
+
+
+@pytest.mark.parametrize('data, fmt, suffix', [(PNG, 'png', '.png'), (JPEG, 'jpeg', '.jpg'), (WEBP, 'webp', '.webp')])
+def test_blob_is_stored_with_its_format(tmp_path, data, fmt, suffix):
+    cache = RenderCache(tmp_path)
+    cache.put("code", data)
+    assert cache.get("code") == (None, data, fmt)
+    assert [path.suffix for path in cache.blob_dir.iterdir()] == [suffix]
+
+
+def test_new_format_replaces_old_blob(tmp_path):
+    cache = RenderCache(tmp_path)
+    cache.put("code", PNG)
+    cache.put("code", JPEG)
+    assert cache.get("code") == (None, JPEG, 'jpeg')
+    assert [path.name for path in cache.blob_dir.iterdir()] == [f"{code_hash('code')}.jpg"]
+
+
+def test_file_id_is_returned_instead_of_bytes(tmp_path):
+    cache = RenderCache(tmp_path)
+    cache.put("code", WEBP)
+    cache.set_file_id("code", "telegram-file-id")
+    assert cache.get("code") == ("telegram-file-id", None, 'webp')
+    cache.forget_file_id("code")
+    assert cache.get("code") == (None, WEBP, 'webp')
+
+
+def test_renders_of_other_settings_are_not_returned(tmp_path):
+    RenderCache(tmp_path, settings="IMAGE_FORMAT=png").put("code", PNG)
+    assert RenderCache(tmp_path, settings="IMAGE_FORMAT=jpeg").get("code") == (None, None, None)
+    assert RenderCache(tmp_path, settings="IMAGE_FORMAT=png").get("code") == (None, PNG, 'png')
+
+
+@pytest.mark.parametrize('name, value', [
+    ('IMAGE_FORMAT', 'webp'),
+    ('IMAGE_MAX_SIDE', '640'),
+    ('RENDER_POLICY', 'false'),
+])
+def test_render_settings_change_with_the_environment(monkeypatch, name, value):
+    monkeypatch.delenv(name, raising=False)
+    before = render_settings()
+    monkeypatch.setenv(name, value)
+    assert render_settings() != before
+
+
+def test_miss(tmp_path):
+    assert RenderCache(tmp_path).get("code") == (None, None, None)
+
+
+def test_eviction_removes_least_recently_used_blob(tmp_path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr('services.render_cache.time.time', lambda: next(clock))
+    cache = RenderCache(tmp_path, max_bytes=len(PNG) + len(WEBP))
+    cache.put("a", PNG)
+    cache.put("b", JPEG)
+    cache.get("a")
+    cache.put("c", WEBP)
+    assert cache.get("b") == (None, None, None)
+    assert cache.get("a")[1] == PNG
+    assert sorted(path.suffix for path in cache.blob_dir.iterdir()) == ['.png', '.webp']
+
+
+def test_cache_from_before_the_format_column(tmp_path):
+    (tmp_path / "blobs").mkdir()
+    key = code_hash("code")
+    (tmp_path / "blobs" / f"{key}.png").write_bytes(JPEG)
+    conn = sqlite3.connect(tmp_path / "renders.sqlite3")
+    with conn:
+        conn.execute(
+            "CREATE TABLE renders (code_hash TEXT PRIMARY KEY, size INTEGER NOT NULL, file_id TEXT, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO renders VALUES (?, ?, NULL, 0, 0)", (key, len(JPEG)))
+    conn.close()
+
+    cache = RenderCache(tmp_path)
+    # the old blob keeps its .png name, and its real format is taken from the bytes
+    assert cache.get("code") == (None, JPEG, 'jpeg')
+    cache.put("code", JPEG)
+    assert [path.name for path in cache.blob_dir.iterdir()] == [f"{key}.jpg"]
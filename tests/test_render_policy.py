@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.patches import Circle
+
+from services.render_policy import RenderPolicy, _m4_indices, RASTERIZE_MIN_VERTICES
+
+DPI = 100
+
+
+@pytest.fixture(autouse=True)
+def _close_figures():
+    yield
+    plt.close('all')
+
+
+def _pixels(fig) -> np.ndarray:
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())[..., :3].astype(int)
+
+
+def _dense_sine(ax, **kwargs):
+    x = np.linspace(0, 10, 200_000)
+    return ax.plot(x, np.sin(7 * x) + 0.3 * np.sin(53 * x), **kwargs)[0]
+
+
+def test_m4_keeps_first_last_min_and_max_of_each_column():
+    px = np.arange(8, dtype=float)
+    py = np.array([0, 5, -3, 1, 2, 9, 4, 3], dtype=float)
+    assert list(_m4_indices(px, py, 4)) == [0, 1, 2, 3, 4, 5, 7]
+
+
+def test_m4_keeps_breaks():
+    px = np.arange(10, dtype=float)
+    py = np.array([0, 1, 2, np.nan, 4, 5, 6, 7, 8, 9], dtype=float)
+    keep = _m4_indices(px, py, 100)
+    assert 3 in keep
+    # עמודה לא חוצה את השבירה: הנקודות שלפניה ושאחריה נשמרות
+    assert {2, 4} <= set(keep)
+
+
+def test_dense_line_is_decimated_without_changing_the_image():
+    reference, ax = plt.subplots(dpi=DPI)
+    _dense_sine(ax)
+    fig, ax = plt.subplots(dpi=DPI)
+    line = _dense_sine(ax)
+
+    report = RenderPolicy().apply(fig, DPI)
+    assert report.decimated == 1
+    assert len(line.get_xydata()) < 10_000
+    assert np.abs(_pixels(fig) - _pixels(reference)).mean() < 0.5
+
+
+@pytest.mark.parametrize('kwargs', [{'linestyle': '--'}, {'marker': '.'}])
+def test_styled_lines_are_not_decimated(kwargs):
+    fig, ax = plt.subplots(dpi=DPI)
+    _dense_sine(ax, **kwargs)
+    assert RenderPolicy().apply(fig, DPI).decimated == 0
+
+
+def test_parametric_curve_is_not_decimated():
+    fig, ax = plt.subplots(dpi=DPI)
+    t = np.linspace(0, 2 * np.pi, 100_000)
+    ax.plot(np.cos(3 * t), np.sin(2 * t))
+    assert RenderPolicy().apply(fig, DPI).decimated == 0
+
+
+def test_best_legend_location_disables_decimation():
+    fig, ax = plt.subplots(dpi=DPI)
+    _dense_sine(ax, label='f')
+    ax.legend()
+    assert RenderPolicy().apply(fig, DPI).decimated == 0
+
+
+def test_many_small_lines_are_merged():
+    fig, ax = plt.subplots(dpi=DPI)
+    for k in range(100):
+        ax.plot([k, k + 0.5], [0, 1], color='C1')
+    ax.plot([0, 100], [2, 2], label='axis', zorder=3)
+    reference = _pixels(fig)
+
+    report = RenderPolicy().apply(fig, DPI)
+    assert report.merged == 100
+    assert report.artists_after == 2
+    assert [type(collection) for collection in ax.collections] == [LineCollection]
+    assert [line.get_label() for line in ax.lines] == ['axis']
+    assert np.abs(_pixels(fig) - reference).mean() < 0.5
+
+
+def test_lines_sharing_a_zorder_with_others_are_not_merged():
+    fig, ax = plt.subplots(dpi=DPI)
+    for k in range(100):
+        ax.plot([k, k + 0.5], [0, 1], color='C1')
+    ax.scatter([1, 2], [3, 4], zorder=2)
+    assert RenderPolicy().apply(fig, DPI).merged == 0
+
+
+def test_many_small_patches_are_merged():
+    fig, ax = plt.subplots(dpi=DPI)
+    for k in range(60):
+        ax.add_patch(Circle((k, 0), 0.3, color='C2'))
+    ax.set_xlim(-1, 61)
+    ax.set_ylim(-1, 1)
+    reference = _pixels(fig)
+
+    report = RenderPolicy().apply(fig, DPI)
+    assert report.merged == 60
+    assert [type(collection) for collection in ax.collections] == [PathCollection]
+    assert np.abs(_pixels(fig) - reference).mean() < 0.5
+
+
+def test_heavy_artist_is_rasterized():
+    fig, ax = plt.subplots(dpi=DPI)
+    t = np.linspace(0, 2 * np.pi, RASTERIZE_MIN_VERTICES + 1)
+    line = ax.plot(np.cos(t), np.sin(t))[0]
+    assert RenderPolicy().apply(fig, DPI).rasterized == 1
+    assert line.get_rasterized()
+
+
+def test_report_counts_vertices_and_artists():
+    fig, ax = plt.subplots(dpi=DPI)
+    ax.plot([0, 1, 2], [0, 1, 0])
+    ax.add_patch(Circle((0, 0), 1))
+    report = RenderPolicy().apply(fig, DPI).as_dict()
+    assert report['artists_before'] == report['artists_after'] == 2
+    assert report['vertices_before'] == report['vertices_after'] > 3
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from bot.telegram_bot import MathDrawingBot
+from services.render_pool import RenderPool
+from utils.code_executor import CodeExecutionError
+
+CODE = "plt.plot([0, 1], [0, 1])\nplt.savefig('line.png')"
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(workers=1, max_jobs_per_worker=2)
+    yield pool
+    pool.close()
+
+
+def _pids(pool: RenderPool) -> set:
+    return {worker.process.pid for worker in pool._all_workers}
+
+
+def test_render_returns_image_bytes(pool):
+    image = pool.render(CODE)
+    assert image.getvalue()[:8] == b'\x89PNG\r\n\x1a\n'
+
+
+def test_render_async(pool):
+    image = asyncio.run(pool.render_async(CODE))
+    assert image.getvalue()[:8] == b'\x89PNG\r\n\x1a\n'
+
+
+async def _ticking(awaitable):
+    """
+    מריץ את awaitable לצד טיימר של 5ms ומחזיר (תוצאה, כמה פעמים הטיימר הספיק לרוץ)
+    """
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    try:
+        return await awaitable, ticks
+    finally:
+        ticker.cancel()
+
+
+def test_render_async_does_not_block_the_event_loop(pool):
+    image, ticks = asyncio.run(_ticking(pool.render_async(CODE)))
+    assert image.getvalue()[:8] == b'\x89PNG\r\n\x1a\n'
+    assert ticks > 0
+
+
+def test_bot_renders_off_the_event_loop(pool, tmp_path, monkeypatch):
+    monkeypatch.setenv('TELEGRAM_TOKEN', '123:test')
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setenv('RENDER_CACHE_DIR', str(tmp_path / "renders"))
+    monkeypatch.delenv('JOB_QUEUE_PATH', raising=False)
+    bot = MathDrawingBot()
+    bot._render_pool = pool
+
+    image_bytes, ticks = asyncio.run(_ticking(bot._render(CODE)))
+    assert image_bytes[:8] == b'\x89PNG\r\n\x1a\n'
+    assert ticks > 0
+    # התמונה נשמרה במטמון
+    assert bot.render_cache.get(CODE)[1] == image_bytes
+
+
+def test_error_in_code_keeps_the_worker(pool):
+    pids = _pids(pool)
+    with pytest.raises(CodeExecutionError) as error:
+        pool.render("plt.plot(undefined_name)")
+    assert error.value.error_type == 'NameError'
+    assert _pids(pool) == pids
+
+
+def test_worker_is_recycled_after_max_jobs(pool):
+    pids = _pids(pool)
+    pool.render(CODE)
+    assert _pids(pool) == pids
+    pool.render(CODE)
+    assert _pids(pool).isdisjoint(pids)
+    assert pool.render(CODE).getvalue()
+
+
+def test_dead_worker_is_replaced(pool):
+    worker = pool._idle.get()
+    worker.process.kill()
+    worker.process.join()
+    pool._idle.put(worker)
+    with pytest.raises(RuntimeError):
+        pool.render(CODE)
+    assert worker.process.pid not in _pids(pool)
+    assert pool.render(CODE).getvalue()
+
+
+def test_closed_pool_refuses_work(pool):
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.render(CODE)
@@ -0,0 +1,50 @@
+import matplotlib.pyplot as plt
+import pytest
+
+from services.renderer_service import RendererService
+from utils.code_executor import CodeExecutionError
+
+
+@pytest.fixture
+def renderer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return RendererService()
+
+
+def test_savefig_is_captured_in_memory(renderer, tmp_path):
+    image = renderer.create_image("plt.plot([0, 1], [0, 1])\nplt.savefig('line.png', dpi=50)")
+    assert image.getvalue()[:8] == b'\x89PNG\r\n\x1a\n'
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_every_saved_figure_is_captured(renderer):
+    images = renderer.create_images(
+        "plt.plot([0, 1])\nplt.savefig('a.png')\n"
+        "plt.figure()\nplt.plot([1, 0])\nplt.savefig('b.png')"
+    )
+    assert len(images) == 2
+    assert images[0].getvalue() != images[1].getvalue()
+
+
+def test_show_is_captured(renderer):
+    assert len(renderer.create_images("plt.plot([0, 1])\nplt.show()")) == 1
+
+
+def test_open_figure_is_captured_without_savefig(renderer):
+    assert renderer.create_image("plt.plot([0, 1])").getvalue()
+
+
+def test_savefig_on_figure_object(renderer, tmp_path):
+    renderer.create_image("fig, ax = plt.subplots()\nax.plot([0, 1])\nfig.savefig('out.png', facecolor='yellow')")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_code_without_figure(renderer):
+    with pytest.raises(CodeExecutionError) as error:
+        renderer.create_image("x = 1")
+    assert error.value.error_type == 'NoFigure'
+
+
+def test_figures_are_closed_after_render(renderer):
+    renderer.create_image("plt.plot([0, 1])\nplt.figure()\nplt.plot([1, 0])")
+    assert plt.get_fignums() == []
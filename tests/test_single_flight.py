@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_identical_requests_share_one_call():
+    async def main():
+        flight = SingleFlight("test")
+        calls, gate = [], asyncio.Event()
+
+        async def work(value):
+            calls.append(value)
+            await gate.wait()
+            return value * 2
+
+        waiters = [asyncio.ensure_future(flight.run('key', work, 21)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*waiters) == [42, 42, 42]
+        assert calls == [21]
+        assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'coalesced': 2}
+
+    asyncio.run(main())
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def work(value):
+            return value
+
+        assert await asyncio.gather(flight.run('a', work, 1), flight.run('b', work, 2)) == [1, 2]
+        assert flight.stats()['leaders'] == 2
+
+    asyncio.run(main())
+
+
+def test_error_is_shared_and_not_cached():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.run('key', fail), flight.run('key', fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(calls) == 1
+        # אחרי שהבקשה הסתיימה, בקשה חדשה מריצה את העבודה מחדש
+        with pytest.raises(ValueError):
+            await flight.run('key', fail)
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def main():
+        flight = SingleFlight("test")
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return 'done'
+
+        first = asyncio.ensure_future(flight.run('key', work))
+        second = asyncio.ensure_future(flight.run('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        gate.set()
+        assert await second == 'done'
+        assert first.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# מודולים שלוקח זמן לטעון - נטענים רק ברקע אחרי שהבוט כבר מקבל עדכונים
+HEAVY_MODULES = ['numpy', 'matplotlib', 'PIL', 'google.generativeai', 'google.api_core']
+
+SCRIPT = f"""
+import sys, json
+from bot.telegram_bot import MathDrawingBot
+bot = MathDrawingBot()
+print(json.dumps({{
+    'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+    'render_pool': bot._render_pool is not None,
+    'model': bot.gemini_service._model is not None,
+}}))
+"""
+
+
+def test_bot_starts_without_heavy_modules(tmp_path):
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN='123:test',
+        GEMINI_API_KEY='test-key',
+        RENDER_CACHE_DIR=str(tmp_path / "renders"),
+        METRICS_PORT='0',
+    )
+    env.pop('JOB_QUEUE_PATH', None)
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert state == {'loaded': [], 'render_pool': False, 'model': False}
@@ -0,0 +1,727 @@
+import os
+import re
+import ast
+import math
+import logging
+import pkgutil
+import importlib.util
+from functools import lru_cache
+from .config import (
+    ALLOWED_MODULES, FORBIDDEN_NAMES, FORBIDDEN_ATTRIBUTES, GLOBAL_IMPORTS, GLOBAL_PATCHES, is_allowed_module
+)
+from .code_vectorizer import vectorize_tree
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# שם הקובץ שמופיע ב-traceback של קוד שנוצר
+CODE_FILENAME = '<generated>'
+
+# קבועים מוכרים שמשמשים בגבולות של מערכים ולולאות
+KNOWN_CONSTANTS = {'pi': math.pi, 'e': math.e, 'tau': math.tau}
+
+# קבועים מספריים של מודולים (np.inf) - ערכים, לא אובייקטים משותפים
+NUMERIC_CONSTANTS = set(KNOWN_CONSTANTS) | {'inf', 'nan'}
+
+# מספר הביטים המקסימלי של מספר שלם שמחושב בהערכה הסטטית. גבולות של מערכים ולולאות קטנים
+# בהרבה, וחישוב של חזקות ענקיות (((10**64)**64)**64) היה תוקע את הניתוח
+MAX_CONSTANT_BITS = 4096
+
+# פונקציות numpy שיוצרות מערך לפי צורה (shape) בארגומנט הראשון
+SHAPE_FUNCTIONS = {'zeros', 'ones', 'empty', 'full', 'identity', 'eye'}
+
+# פונקציות numpy שיוצרות מערך בגודל של מערך אחר
+LIKE_FUNCTIONS = {'zeros_like', 'ones_like', 'empty_like', 'full_like'}
+
+# פונקציות numpy.random שמקבלות את המימדים כארגומנטים נפרדים
+RANDOM_DIMENSION_FUNCTIONS = {'rand', 'randn'}
+
+
+# השם המלא של מה שכל שם גלובלי מצביע עליו: '__import__("matplotlib.pyplot").pyplot' -> matplotlib.pyplot
+GLOBAL_PATHS = {
+    name: re.match(r'__import__\("(\w+)[\w.]*"\)', source).group(1) + source[source.index(')') + 1:]
+    for name, source in GLOBAL_IMPORTS.items()
+}
+
+
+@lru_cache(maxsize=None)
+def _is_module(path: str) -> bool:
+    """
+    האם יש מודול בשם הזה, לפי הקבצים של החבילה ובלי לייבא אותה
+    """
+    parts = path.split('.')
+    try:
+        spec = importlib.util.find_spec(parts[0])
+    except (ImportError, ValueError):
+        return False
+    if spec is None:
+        return False
+    locations = spec.submodule_search_locations
+    for part in parts[1:]:
+        found = next((module for module in pkgutil.iter_modules(locations or []) if module.name == part), None)
+        if found is None:
+            return False
+        locations = [os.path.join(found.module_finder.path, part)] if found.ispkg else None
+    return True
+
+
+class CodeAnalysis:
+    """
+    תוצאת הניתוח של קוד שנוצר: הפרות בטיחות, הערכת עלות, והקוד המקומפל להרצה
+    """
+    def __init__(self, code: str):
+        self.code = code
+        self.code_object = None
+        self.syntax_error = None
+        self.violations = []
+        self.imports = []
+        self.max_array_elements = 0
+        self.loop_iterations = 0
+        # לולאות שמספר האיטרציות שלהן לא ידוע מראש (for על מערך בגודל לא ידוע, while עם תנאי)
+        self.unknown_loops = 0
+        # לולאות בלי שום דרך לצאת מהן (while True בלי break/return/raise)
+        self.unbounded_loops = 0
+        self.recursive_functions = set()
+        # פונקציות שקוראות לעצמן בלי ארגומנט שקטן בכל קריאה
+        self.unbounded_recursion = set()
+        self.vectorized_loops = 0
+
+    @property
+    def is_safe(self) -> bool:
+        return self.code_object is not None and not self.violations
+
+    def cost_violation(self, max_array_elements: int, max_loop_iterations: int):
+        """
+        מחזיר (מגבלה, הודעה) אם ההערכה הסטטית חורגת מהמגבלות, אחרת None
+        """
+        if max_array_elements and self.max_array_elements > max_array_elements:
+            return 'memory', f"הקוד יוצר מערך גדול מדי (כ-{self.max_array_elements:,} איברים)"
+        if max_loop_iterations and self.loop_iterations > max_loop_iterations:
+            return 'time', f"הקוד מריץ יותר מדי איטרציות (כ-{self.loop_iterations:,})"
+        if max_loop_iterations and self.unbounded_loops:
+            return 'time', "הקוד מכיל לולאה אינסופית (while בלי תנאי יציאה)"
+        if max_loop_iterations and self.unbounded_recursion:
+            name = sorted(self.unbounded_recursion)[0]
+            return 'time', f"הפונקציה {name} קוראת לעצמה בלי ארגומנט שקטן בכל קריאה"
+        return None
+
+
+class _Analyzer(ast.NodeVisitor):
+    """
+    מעבר יחיד על העץ: בדיקת ייבוא, גישה לשמות ולתכונות, והערכת גודל מערכים ולולאות
+    """
+    def __init__(self, analysis: CodeAnalysis, allowed_modules):
+        self.analysis = analysis
+        self.allowed_modules = allowed_modules
+        self.constants = {}
+        self.sizes = {}
+        self.multiplier = 1
+        self.function_stack = []
+        # פונקציה -> הקריאות שלה לעצמה, בזמן המעבר על הגוף שלה
+        self.recursive_calls = {}
+        # פונקציה רקורסיבית -> (קריאות לעצמה בכל הפעלה, הפרמטרים שקטנים בכל קריאה)
+        self.recursion = {}
+        # מודולים ומחלקות שמשותפים בין ריצות - אסור לשנות להם תכונות
+        self.shared_names = set(GLOBAL_IMPORTS) | set(GLOBAL_PATCHES)
+        # שמות שהקוד קושר ושעלולים להצביע על אחד מהם (m = np), ראו _find_aliases
+        self.aliases = set()
+        # שם -> השם המלא של המודול (או של מה שבתוכו) שהוא מצביע עליו, ראו _module_path
+        self.module_paths = dict(GLOBAL_PATHS)
+
+    # --- בטיחות ---
+
+    def _violation(self, node, message: str) -> None:
+        self.analysis.violations.append(f"שורה {getattr(node, 'lineno', '?')}: {message}")
+
+    def _is_allowed_module(self, module: str) -> bool:
+        parts = module.split('.')
+        if any(part in FORBIDDEN_ATTRIBUTES or part.startswith('__') for part in parts):
+            # import numpy.lib.npyio עוקף את בדיקת התכונות
+            return False
+        return is_allowed_module(module, self.allowed_modules)
+
+    @staticmethod
+    def _submodule(base: str, name: str):
+        """
+        המודול ש-base.name מצביע עליו, אם זה מודול: תת-מודול (np.testing), מודול של החבילה
+        שמיובא לתוך מודול אחר שלה (plt.cbook -> matplotlib.cbook), או חבילה ראשית (plt.matplotlib)
+        """
+        root = base.split('.')[0]
+        for path in (f"{base}.{name}", f"{root}.{name}"):
+            if _is_module(path):
+                return path
+        return name if name in GLOBAL_PATHS.values() else None
+
+    def _module_path(self, node):
+        """
+        השם המלא של מה שהביטוי מצביע עליו כשהוא מודול או משהו בתוך מודול (plt.cm.viridis), אחרת None
+        """
+        if isinstance(node, ast.Name):
+            return self.module_paths.get(node.id)
+        if isinstance(node, ast.Attribute):
+            base = self._module_path(node.value)
+            if base is not None:
+                return self._submodule(base, node.attr) or f"{base}.{node.attr}"
+        return None
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.analysis.imports.append(alias.name)
+            self.shared_names.add(alias.asname or alias.name.split('.')[0])
+            if not self._is_allowed_module(alias.name):
+                self._violation(node, f"מודול לא מורשה: {alias.name}")
+
+    def visit_ImportFrom(self, node):
+        module = node.module or ''
+        self.analysis.imports.append(module)
+        if node.level or not self._is_allowed_module(module):
+            self._violation(node, f"מודול לא מורשה: {'.' * node.level}{module}")
+        for alias in node.names:
+            self.shared_names.add(alias.asname or alias.name)
+            if alias.name == '*' or alias.name in FORBIDDEN_ATTRIBUTES or alias.name.startswith('_'):
+                self._violation(node, f"ייבוא לא מורשה: {module}.{alias.name}")
+            elif module and not node.level:
+                # from matplotlib import testing
+                submodule = self._submodule(module, alias.name)
+                if submodule and not self._is_allowed_module(submodule):
+                    self._violation(node, f"מודול לא מורשה: {submodule}")
+
+    def visit_Name(self, node):
+        if node.id in FORBIDDEN_NAMES or node.id.startswith('__'):
+            self._violation(node, f"שימוש אסור ב-{node.id}")
+
+    def visit_Attribute(self, node):
+        if node.attr in FORBIDDEN_ATTRIBUTES or node.attr.startswith(('__', 'print_')):
+            # print_figure/print_png של ה-canvas כותבים לקובץ בלי לעבור דרך savefig
+            self._violation(node, f"גישה אסורה לתכונה {node.attr}")
+        else:
+            base = self._module_path(node.value)
+            submodule = self._submodule(base, node.attr) if base is not None else None
+            if submodule and not self._is_allowed_module(submodule):
+                self._violation(node, f"מודול לא מורשה: {submodule}")
+        if isinstance(node.ctx, (ast.Store, ast.Del)) and self._may_be_shared(node.value):
+            self._violation(node, f"אסור לשנות את {ast.unparse(node.value)}")
+        self.generic_visit(node)
+
+    def visit_Module(self, node):
+        self._find_aliases(node)
+        self.generic_visit(node)
+
+    def _find_aliases(self, tree) -> None:
+        """
+        מוצא את כל השמות שעלולים להצביע על אובייקט משותף: השמה (m = np), איבר של מבנה
+        (for m in [np]), מבנה שאובייקט משותף נכנס אליו (d['m'] = np, lst.append(np)),
+        פרמטרים, ופונקציות ומחלקות שהוגדרו בקוד (התוצאה שלהן לא ידועה).
+        נקודת שבת על כל הקשירות, בלי תלות בסדר - לולאות ופונקציות מריצות קוד מאוחר לפני קוד מוקדם
+        """
+        bindings = []  # (target, value); value None - לא ידוע מה נקשר
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                self.shared_names.update(alias.asname or alias.name.split('.')[0] for alias in node.names)
+                for alias in node.names:
+                    if alias.asname:
+                        self.module_paths[alias.asname] = alias.name
+                    else:
+                        self.module_paths[alias.name.split('.')[0]] = alias.name.split('.')[0]
+            elif isinstance(node, ast.ImportFrom):
+                self.shared_names.update(alias.asname or alias.name for alias in node.names)
+                if node.module and not node.level:
+                    for alias in node.names:
+                        self.module_paths[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+            elif isinstance(node, ast.Assign):
+                bindings.extend((target, node.value) for target in node.targets)
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.NamedExpr)):
+                if node.value is not None:
+                    bindings.append((node.target, node.value))
+            elif isinstance(node, (ast.For, ast.AsyncFor, ast.comprehension)):
+                bindings.append((node.target, node.iter))
+            elif isinstance(node, ast.withitem):
+                if node.optional_vars is not None:
+                    bindings.append((node.optional_vars, node.context_expr))
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                # מתודה שמקבלת אובייקט משותף שומרת אותו אצלה
+                arguments = node.args + [keyword.value for keyword in node.keywords]
+                bindings.append((node.func.value, ast.Tuple(elts=arguments, ctx=ast.Load())))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                bindings.append((node.name, None))
+            elif isinstance(node, ast.arg):
+                bindings.append((node.arg, None))
+            elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+                bindings.append((node.name, None))
+            elif isinstance(node, ast.MatchMapping) and node.rest:
+                bindings.append((node.rest, None))
+
+        changed = True
+        while changed:
+            changed = False
+            for target, value in bindings:
+                if isinstance(target, ast.Name) and value is not None and target.id not in self.module_paths:
+                    # m = matplotlib - התכונות של m נבדקות כמו של matplotlib
+                    path = self._module_path(value)
+                    if path is not None:
+                        self.module_paths[target.id] = path
+                        changed = True
+                if value is not None and not self._may_be_shared(value):
+                    continue
+                for name in self._bound_names(target):
+                    if name not in self.aliases:
+                        self.aliases.add(name)
+                        changed = True
+
+    @staticmethod
+    def _bound_names(target) -> list:
+        """
+        השמות שהשמה ל-target קושרת או משנה (d['m'] = ... משנה את d)
+        """
+        if isinstance(target, str):
+            return [target]
+        if isinstance(target, (ast.Tuple, ast.List)):
+            return [name for element in target.elts for name in _Analyzer._bound_names(element)]
+        if isinstance(target, ast.Starred):
+            return _Analyzer._bound_names(target.value)
+        while isinstance(target, (ast.Attribute, ast.Subscript, ast.Call)):
+            target = target.func if isinstance(target, ast.Call) else target.value
+        return [target.id] if isinstance(target, ast.Name) else []
+
+    def _is_shared_function(self, func) -> bool:
+        """
+        פונקציה של מודול או מחלקה משותפים (plt.gca, np.linspace, Circle) - מחזירה אובייקט חדש
+        """
+        while isinstance(func, ast.Attribute):
+            func = func.value
+        return isinstance(func, ast.Name) and func.id in self.shared_names and func.id not in self.aliases
+
+    def _may_be_shared(self, node) -> bool:
+        """
+        האם הביטוי עלול להחזיר אובייקט משותף בין ריצות, או מבנה שמכיל אחד כזה
+        """
+        if isinstance(node, ast.Name):
+            return node.id in self.shared_names or node.id in self.aliases
+        if isinstance(node, ast.Lambda):
+            return True
+        if isinstance(node, ast.Attribute) and node.attr in NUMERIC_CONSTANTS and self._is_shared_function(node.value):
+            # np.pi, math.inf - מספר, לא אובייקט שאפשר לשנות
+            return False
+        if isinstance(node, ast.Call):
+            arguments = node.args + [keyword.value for keyword in node.keywords]
+            if any(self._may_be_shared(argument) for argument in arguments):
+                return True
+            if isinstance(node.func, ast.Name):
+                # builtin או פונקציה מהתבנית; פונקציה שהוגדרה בקוד נמצאת ב-aliases
+                return node.func.id in self.aliases
+            return not self._is_shared_function(node.func) and self._may_be_shared(node.func)
+        return any(
+            self._may_be_shared(child) for child in ast.iter_child_nodes(node) if isinstance(child, ast.expr)
+        )
+
+    # --- הערכת עלות ---
+
+    def _constant(self, node):
+        """
+        ערך מספרי של ביטוי קבוע, או None אם אי אפשר לדעת אותו בלי להריץ
+        """
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self.constants.get(node.id)
+        if isinstance(node, ast.Attribute) and node.attr in KNOWN_CONSTANTS:
+            return KNOWN_CONSTANTS[node.attr]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = self._constant(node.operand)
+            if value is not None:
+                return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.BinOp):
+            left, right = self._constant(node.left), self._constant(node.right)
+            if left is None or right is None or self._too_large(node.op, left, right):
+                return None
+            try:
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                if isinstance(node.op, ast.Div):
+                    return left / right
+                if isinstance(node.op, ast.FloorDiv):
+                    return left // right
+                if isinstance(node.op, ast.Pow):
+                    return left ** right
+            except (ZeroDivisionError, OverflowError):
+                return None
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('int', 'len'):
+            if node.args and node.func.id == 'int':
+                value = self._constant(node.args[0])
+                return int(value) if value is not None else None
+            if node.args and node.func.id == 'len':
+                return self._size(node.args[0])
+        return None
+
+    @staticmethod
+    def _too_large(op, left, right) -> bool:
+        """
+        האם התוצאה של left op right היא מספר שלם גדול מ-MAX_CONSTANT_BITS - לפני שמחשבים אותה
+        """
+        if isinstance(op, ast.Pow):
+            if isinstance(left, int) and isinstance(right, int):
+                return right > 0 and max(left.bit_length() - 1, 1) * right > MAX_CONSTANT_BITS
+            # חזקה של float גולשת מיד (OverflowError), אבל מעריך ענק עדיין איטי לחישוב
+            return abs(right) > MAX_CONSTANT_BITS
+        if isinstance(op, ast.Mult) and isinstance(left, int) and isinstance(right, int):
+            return left.bit_length() + right.bit_length() > MAX_CONSTANT_BITS
+        return False
+
+    def _shape_size(self, node):
+        value = self._constant(node)
+        if value is not None:
+            return max(0, int(value))
+        if isinstance(node, (ast.Tuple, ast.List)):
+            total = 1
+            for element in node.elts:
+                value = self._constant(element)
+                if value is None:
+                    return None
+                total *= max(0, int(value))
+            return total
+        return None
+
+    @staticmethod
+    def _keyword(node: ast.Call, name: str):
+        return next((keyword.value for keyword in node.keywords if keyword.arg == name), None)
+
+    def _call_size(self, node: ast.Call):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+        args = node.args
+
+        if name in ('linspace', 'logspace', 'geomspace'):
+            num = self._keyword(node, 'num') or (args[2] if len(args) > 2 else None)
+            return int(self._constant(num) or 0) if num is not None else 50
+        if name == 'arange':
+            values = [self._constant(arg) for arg in args]
+            if not values or None in values:
+                return None
+            start, stop, step = (0, values[0], 1) if len(values) == 1 else (values + [1])[:3]
+            return max(0, math.ceil((stop - start) / step)) if step else None
+        if name in SHAPE_FUNCTIONS and args:
+            size = self._shape_size(args[0])
+            return size * size if size is not None and name in ('identity', 'eye') else size
+        if name in LIKE_FUNCTIONS and args:
+            return self._size(args[0])
+        if name in RANDOM_DIMENSION_FUNCTIONS:
+            return self._shape_size(ast.Tuple(elts=args)) if args else 1
+        if name == 'meshgrid':
+            total = 1
+            for arg in args:
+                size = self._size(arg)
+                if size is None:
+                    return None
+                total *= size
+            return total
+
+        size_keyword = self._keyword(node, 'size')
+        if size_keyword is not None:
+            return self._shape_size(size_keyword)
+
+        # פונקציה של numpy על מערך (sin, sqrt...) מחזירה מערך בגודל הארגומנט
+        sizes = [self._size(arg) for arg in args]
+        sizes = [size for size in sizes if size is not None]
+        return max(sizes) if sizes else None
+
+    def _size(self, node):
+        """
+        הערכה של מספר האיברים במערך שהביטוי מחזיר, או None אם לא ידוע
+        """
+        if isinstance(node, ast.Name):
+            return self.sizes.get(node.id)
+        if isinstance(node, ast.Call):
+            return self._call_size(node)
+        if isinstance(node, ast.BinOp):
+            sizes = [size for size in (self._size(node.left), self._size(node.right)) if size is not None]
+            return max(sizes) if sizes else None
+        if isinstance(node, ast.UnaryOp):
+            return self._size(node.operand)
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return len(node.elts)
+        return None
+
+    def _record_size(self, size) -> None:
+        if size is not None:
+            self.analysis.max_array_elements = max(self.analysis.max_array_elements, size)
+
+    def _assign(self, target, value_node, size, constant) -> None:
+        if isinstance(target, ast.Name):
+            self.sizes.pop(target.id, None)
+            self.constants.pop(target.id, None)
+            if size is not None:
+                self.sizes[target.id] = size
+            elif constant is not None and not self.function_stack:
+                self.constants[target.id] = constant
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            if isinstance(value_node, (ast.Tuple, ast.List)) and len(value_node.elts) == len(target.elts):
+                for element_target, element_value in zip(target.elts, value_node.elts):
+                    self._assign(
+                        element_target, element_value,
+                        self._size(element_value), self._constant(element_value)
+                    )
+            else:
+                # למשל X, Y = np.meshgrid(x, y) - כל אחד מהפלטים בגודל המלא
+                for element_target in target.elts:
+                    self._assign(element_target, None, size, None)
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        size = self._size(node.value)
+        self._record_size(size)
+        constant = self._constant(node.value) if size is None else None
+        for target in node.targets:
+            self._assign(target, node.value, size, constant)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        self._record_size(self._call_size(node))
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if self.function_stack and name == self.function_stack[-1]:
+            self.recursive_calls[name].append(node)
+        elif name in self.recursion and name not in self.function_stack:
+            branches, shrinking = self.recursion[name]
+            self.analysis.loop_iterations += self.multiplier * self._recursion_calls(node, branches, shrinking)
+
+    @staticmethod
+    def _argument(call: ast.Call, index: int, name: str):
+        keyword = next((keyword.value for keyword in call.keywords if keyword.arg == name), None)
+        if keyword is not None:
+            return keyword
+        positional = call.args[:index + 1]
+        if len(positional) > index and not any(isinstance(arg, ast.Starred) for arg in positional):
+            return call.args[index]
+        return None
+
+    def _shrink(self, node, param: str):
+        """
+        איך הארגומנט קטן ביחס לפרמטר: ('sub', 1) ל-n - 1, ('div', 2) ל-n // 2, ל-n >> 1 או ל-n * 0.5;
+        None אם הוא לא קטן בכל קריאה
+        """
+        if not isinstance(node, ast.BinOp):
+            return None
+        if isinstance(node.left, ast.Name) and node.left.id == param:
+            factor = self._constant(node.right)
+        elif isinstance(node.op, ast.Mult) and isinstance(node.right, ast.Name) and node.right.id == param:
+            factor = self._constant(node.left)
+        else:
+            return None
+        if factor is None:
+            return None
+        if isinstance(node.op, ast.Sub) and factor > 0:
+            return 'sub', factor
+        if isinstance(node.op, (ast.FloorDiv, ast.Div)) and factor > 1:
+            return 'div', factor
+        if isinstance(node.op, ast.RShift) and factor >= 1:
+            return 'div', 2 ** min(factor, 64)
+        if isinstance(node.op, ast.Mult) and 0 < factor < 1:
+            return 'div', 1 / factor
+        return None
+
+    def _shrinking_parameters(self, calls: list, params: list) -> list:
+        """
+        הפרמטרים שקטנים בכל הקריאות הרקורסיביות, כ-(אינדקס, שם, (סוג, צעד)).
+        הצעד הוא הקטן מבין הקריאות (fib(n - 1) + fib(n - 2) - העומק הוא n)
+        """
+        shrinking = []
+        for index, param in enumerate(params):
+            steps = [self._shrink(self._argument(call, index, param), param) for call in calls]
+            if None not in steps:
+                kind = steps[0][0] if len({step[0] for step in steps}) == 1 else 'div'
+                shrinking.append((index, param, (kind, min(step[1] for step in steps))))
+        return shrinking
+
+    def _recursion_calls(self, call: ast.Call, branches: int, shrinking: list) -> int:
+        """
+        הערכה של מספר ההפעלות של פונקציה רקורסיבית מקריאה אליה: branches בחזקת העומק.
+        לא ידוע איזה פרמטר נבדק בתנאי העצירה, ולכן לוקחים את העומק הגדול מבין הפרמטרים
+        שהערך ההתחלתי שלהם ידוע (length * 0.7 עד 1 או depth - 1 עד 0)
+        """
+        depth = None
+        for index, param, (kind, step) in shrinking:
+            value = self._constant(self._argument(call, index, param))
+            if value is None:
+                continue
+            try:
+                levels = value / step if kind == 'sub' else math.log(max(value, 1)) / math.log(step)
+                # מעבר לעומק הזה המספר כבר חורג מכל מגבלה
+                levels = min(max(0, int(levels)), 64)
+            except (OverflowError, ValueError):
+                levels = 64
+            depth = levels if depth is None else max(depth, levels)
+        if depth is None:
+            return 0
+        return depth + 1 if branches == 1 else (branches ** (depth + 1) - 1) // (branches - 1)
+
+    def _iterations(self, iter_node):
+        if isinstance(iter_node, ast.Call) and isinstance(iter_node.func, ast.Name):
+            if iter_node.func.id == 'range':
+                values = [self._constant(arg) for arg in iter_node.args]
+                if not values or None in values:
+                    return None
+                start, stop, step = (0, values[0], 1) if len(values) == 1 else (values + [1])[:3]
+                return max(0, math.ceil((stop - start) / step)) if step else None
+            if iter_node.func.id in ('enumerate', 'reversed', 'sorted') and iter_node.args:
+                return self._iterations(iter_node.args[0])
+            if iter_node.func.id == 'zip' and iter_node.args:
+                counts = [self._iterations(arg) for arg in iter_node.args]
+                counts = [count for count in counts if count is not None]
+                return min(counts) if counts else None
+        if isinstance(iter_node, (ast.List, ast.Tuple, ast.Set)):
+            return len(iter_node.elts)
+        return self._size(iter_node)
+
+    def _visit_loop(self, iterations, body_nodes) -> None:
+        previous = self.multiplier
+        if iterations is None:
+            self.analysis.unknown_loops += 1
+        else:
+            self.multiplier *= max(1, int(iterations))
+            self.analysis.loop_iterations += self.multiplier
+        for child in body_nodes:
+            self.visit(child)
+        self.multiplier = previous
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.visit(node.target)
+        self._assign(node.target, None, None, None)
+        self._visit_loop(self._iterations(node.iter), node.body + node.orelse)
+
+    def visit_While(self, node):
+        self.visit(node.test)
+        always = isinstance(node.test, ast.Constant) and bool(node.test.value)
+        if always and not self._can_exit(node.body):
+            self.analysis.unbounded_loops += 1
+        self._visit_loop(None, node.body + node.orelse)
+
+    def _can_exit(self, nodes, inner: bool = False) -> bool:
+        """
+        האם יש בגוף הלולאה break, return או raise שיוצאים ממנה (break של לולאה פנימית לא נחשב)
+        """
+        for node in nodes:
+            if isinstance(node, (ast.Return, ast.Raise)) or (isinstance(node, ast.Break) and not inner):
+                return True
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if self._can_exit(ast.iter_child_nodes(node), inner or isinstance(node, (ast.For, ast.AsyncFor, ast.While))):
+                return True
+        return False
+
+    def _visit_comprehension(self, node, elements):
+        previous = self.multiplier
+        for generator in node.generators:
+            self.visit(generator.iter)
+            self.visit(generator.target)
+            iterations = self._iterations(generator.iter)
+            if iterations is None:
+                self.analysis.unknown_loops += 1
+            else:
+                self.multiplier *= max(1, int(iterations))
+                self.analysis.loop_iterations += self.multiplier
+            for condition in generator.ifs:
+                self.visit(condition)
+        for element in elements:
+            self.visit(element)
+        self.multiplier = previous
+
+    def visit_ListComp(self, node):
+        self._visit_comprehension(node, [node.elt])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self._visit_comprehension(node, [node.key, node.value])
+
+    def visit_FunctionDef(self, node):
+        if node.name.startswith('__'):
+            self._violation(node, f"שם פונקציה אסור: {node.name}")
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        self.function_stack.append(node.name)
+        self.recursive_calls[node.name] = []
+        for child in node.body:
+            self.visit(child)
+        self.function_stack.pop()
+
+        calls = self.recursive_calls.pop(node.name)
+        self.recursion.pop(node.name, None)
+        if calls:
+            self.analysis.recursive_functions.add(node.name)
+            params = [arg.arg for arg in node.args.posonlyargs + node.args.args]
+            shrinking = self._shrinking_parameters(calls, params)
+            if not shrinking:
+                self.analysis.unbounded_recursion.add(node.name)
+            else:
+                self.recursion[node.name] = (len(calls), shrinking)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def analyze_code(code: str, allowed_modules=ALLOWED_MODULES, vectorize: bool = None) -> CodeAnalysis:
+    """
+    מנתח קוד שנוצר במעבר יחיד: parse פעם אחת, בדיקות בטיחות והערכת עלות על העץ,
+    וקומפילציה של אותו עץ לאובייקט קוד שאפשר להעביר ישירות ל-exec.
+    לפני הקומפילציה לולאות סקלריות מוכרות מומרות לחישוב על מערכים (VECTORIZE_LOOPS)
+    """
+    if vectorize is None:
+        vectorize = os.getenv('VECTORIZE_LOOPS', 'true').lower() == 'true'
+    analysis = CodeAnalysis(code)
+    try:
+        tree = ast.parse(code, filename=CODE_FILENAME)
+    except SyntaxError as e:
+        logger.warning(f"Syntax error in code: {e}")
+        analysis.syntax_error = e
+        analysis.violations.append(f"שגיאת תחביר: {e}")
+        return analysis
+
+    _Analyzer(analysis, allowed_modules).visit(tree)
+    if analysis.violations:
+        logger.warning(f"Code validation failed: {analysis.violations}")
+        return analysis
+
+    analysis.code_object = None
+    if vectorize:
+        try:
+            result = vectorize_tree(tree)
+            analysis.code_object = compile(result.tree, CODE_FILENAME, 'exec')
+            analysis.vectorized_loops = result.rewrites
+        except Exception as e:
+            logger.warning(f"Loop vectorization failed, compiling the code as is: {str(e)}")
+    if analysis.code_object is None:
+        try:
+            analysis.code_object = compile(tree, CODE_FILENAME, 'exec')
+        except SyntaxError as e:
+            # קוד שעובר parse אבל לא קומפילציה, למשל return מחוץ לפונקציה
+            logger.warning(f"Syntax error in code: {e}")
+            analysis.syntax_error = e
+            analysis.violations.append(f"שגיאת תחביר: {e}")
+            return analysis
+    logger.info(
+        f"Code validation passed (arrays up to {analysis.max_array_elements} elements, "
+        f"{analysis.loop_iterations} loop iterations, {analysis.unknown_loops} loops of unknown length, "
+        f"{len(analysis.recursive_functions)} recursive functions, {analysis.vectorized_loops} vectorized)"
+    )
+    return analysis
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    code = """
+import matplotlib.pyplot as plt
+import numpy as np
+
+x = np.linspace(-10, 10, 1000)
+X, Y = np.meshgrid(x, x)
+for i in range(100):
+    plt.plot(x, np.sin(x + i))
+plt.savefig('test.png')
+"""
+    analysis = analyze_code(code)
+    print(f"safe={analysis.is_safe} arrays={analysis.max_array_elements} loops={analysis.loop_iterations}")
@@ -0,0 +1,472 @@
+import re
+import ast
+import logging
+from .code_analyzer import analyze_code
+from .code_repair import HEBREW_PATTERN
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מספר, אולי עם π ("2π", "-pi/2", "3.5")
+VALUE = r'-?\s*(?:\d+(?:\.\d+)?\s*\*?\s*)?(?:π|pi)(?:\s*/\s*\d+)?|-?\d+(?:\.\d+)?'
+
+# שמות צבעים בעברית (כולל נקבה ורבים) -> שם הצבע ב-matplotlib
+HEBREW_COLORS = {
+    'אדום': 'red', 'כחול': 'blue', 'ירוק': 'green', 'צהוב': 'gold', 'שחור': 'black',
+    'סגול': 'purple', 'כתום': 'orange', 'ורוד': 'hotpink', 'אפור': 'gray', 'חום': 'saddlebrown',
+    'תכלת': 'deepskyblue', 'טורקיז': 'turquoise', 'זהב': 'goldenrod',
+}
+ENGLISH_COLORS = {
+    'red', 'blue', 'green', 'yellow', 'black', 'purple', 'orange', 'pink', 'gray', 'grey',
+    'brown', 'cyan', 'magenta', 'gold', 'navy', 'teal',
+}
+COLOR_WORD = '|'.join(
+    [f"{word}(?:ה|ים|ות)?" for word in HEBREW_COLORS if word not in ('תכלת', 'זהב')]
+    + ['תכלת', 'זהב'] + sorted(ENGLISH_COLORS)
+)
+
+# תחילת מילה, עם ו' החיבור אופציונלית ("ובצבע אדום")
+START = r'(?<!\w)ו?'
+END = r'(?!\w)'
+REMOVE = r'(?:בלי|ללא|תוריד|הורד|תורידי|תסיר|הסר|תעלים)\s+(?:את\s+)?'
+ADD = r'(?:(?:עם|תוסיף|הוסף|תוסיפי|תציג|הצג|תראה)\s+)?(?:את\s+)?'
+AXES = r'(?:ה?צירים|ה?מערכת\s+(?:ה)?צירים)'
+
+# תבניות של שינויים פשוטים, לפי סדר ההתאמה: כל התאמה מוסרת מהטקסט לפני התבנית הבאה
+REQUEST_PATTERNS = (
+    ('title', re.compile(START + r'(?:עם\s+)?(?:ה?כותרת|title)\s*[:=\-]?\s*(?:ל-?\s*|to\s+)?'
+                         r'(?:"([^"]+)"|\'([^\']+)\'|“([^”]+)”)', re.IGNORECASE)),
+    ('no_title', re.compile(START + REMOVE + r'ה?כותרת' + END + r'|\b(?:no|without|remove)\s+(?:the\s+)?title\b', re.IGNORECASE)),
+    ('no_grid', re.compile(START + REMOVE + r'ה?רשת' + END + r'|\b(?:no|without|remove|hide)\s+(?:the\s+)?grid\b', re.IGNORECASE)),
+    ('grid', re.compile(START + ADD + r'ה?רשת' + END + r'|\b(?:(?:with|add|show)\s+)?(?:a\s+|the\s+)?grid\b', re.IGNORECASE)),
+    ('no_axes', re.compile(START + REMOVE + AXES + END + r'|\b(?:no|without|remove|hide)\s+(?:the\s+)?axes\b', re.IGNORECASE)),
+    ('axes', re.compile(START + ADD + AXES + END + r'|\b(?:(?:with|add|show)\s+)?(?:the\s+)?axes\b', re.IGNORECASE)),
+    ('radius', re.compile(START + r'(?:עם\s+)?ב?ה?רדיוס\s*(?:של\s*)?=?\s*(' + VALUE + r')'
+                          r'|radius\s*(?:of\s*)?=?\s*(' + VALUE + r')', re.IGNORECASE)),
+    ('range', re.compile(START + r'(?:(?:ב|עם\s+)?ה?תחום\s*(?:של\s*)?|x\s*)?(?:בין\s*|מ-?\s*|from\s+|range\s*)?'
+                         r'[\[(]\s*(' + VALUE + r')\s*,\s*(' + VALUE + r')\s*[\])]'
+                         r'|' + START + r'(?:(?:ב|עם\s+)?ה?תחום\s*(?:של\s*)?(?:בין\s*|מ-?\s*)?|(?:x\s*)?(?:בין\s*|מ-?\s*|from\s+))'
+                         r'(' + VALUE + r')\s*(?:עד|ול-?|ל-?|to|and)\s*(' + VALUE + r')', re.IGNORECASE)),
+    ('color', re.compile(START + r'(?:ב?צבע\s+|ב|in\s+)?(' + COLOR_WORD + r')' + END, re.IGNORECASE)),
+    ('constant', re.compile(r'(?<![\w.])([A-Za-z_]\w{0,15})\s*=\s*(' + VALUE + r')(?![\w.])')),
+    ('title', re.compile(START + r'(?:עם\s+)?(?:ה?כותרת|title)\s*[:=\-]?\s*(?:ל-?\s*|to\s+)?(.+)', re.IGNORECASE)),
+)
+
+# מילים שלא משנות את הבקשה ("עכשיו", "אותו דבר אבל...")
+FILLER_WORDS = {
+    'עכשיו', 'אותו', 'דבר', 'אבל', 'רק', 'גם', 'בבקשה', 'תעשה', 'תעשי', 'עשה', 'את', 'שיהיה',
+    'יהיה', 'שנה', 'תשנה', 'תשני', 'תחליף', 'החלף', 'ו', 'עם', 'ל', 'now', 'please', 'make', 'it',
+    'the', 'same', 'but', 'change', 'set', 'to', 'and', 'also', 'with',
+}
+# מילה ראשונה שמסמנת שההודעה מתייחסת לשרטוט הקודם, גם כשאי אפשר לבצע אותה מקומית
+FOLLOW_UP_MARKERS = {
+    'עכשיו', 'אותו', 'עם', 'בלי', 'ללא', 'תוסיף', 'הוסף', 'תוסיפי', 'תוריד', 'הורד', 'תסיר', 'הסר',
+    'תשנה', 'שנה', 'תחליף', 'החלף', 'תגדיל', 'הגדל', 'תקטין', 'הקטן', 'תזיז', 'הזז', 'תצבע', 'צבע',
+    'רק', 'גם', 'אבל', 'now', 'add', 'remove', 'make', 'change', 'without', 'with', 'also', 'same',
+}
+
+# קריאות שמציירות משהו, שהצבע שלהן משתנה בבקשת צבע (קווי ייחוס כמו axhline לא נצבעים)
+DRAW_CALLS = {
+    'plot', 'scatter', 'fill', 'fill_between', 'fill_betweenx', 'step', 'stem', 'bar', 'barh',
+    'semilogx', 'semilogy', 'loglog', 'polar', 'errorbar', 'arrow',
+    'Circle', 'Polygon', 'Rectangle', 'Ellipse', 'Arc', 'RegularPolygon', 'Wedge',
+}
+COLOR_KEYWORDS = ('color', 'c', 'edgecolor', 'ec', 'facecolor', 'fc')
+# מחרוזת פורמט של plot ('r--', 'bo') - אות הצבע מוסרת ממנה והצבע עובר ל-color=
+FORMAT_STRING = re.compile(r'^[-.:o^vs*+xXDdhHp<>1-4|_,]*[bgrcmykw][-.:o^vs*+xXDdhHp<>1-4|_,]*$')
+# שמות מקובלים למשתנה של רדיוס
+RADIUS_NAMES = {'r', 'R', 'radius', 'rad'}
+TITLE_CALLS = ('title', 'set_title', 'suptitle')
+
+
+class EditRequest:
+    """
+    הודעת המשך שפורקה לשינויים פשוטים. unresolved - המילים שלא הובנו;
+    רק בקשה בלי מילים כאלה אפשר לבצע מקומית
+    """
+    def __init__(self, text: str, edits: list, unresolved: list, marked: bool):
+        self.text = text
+        self.edits = edits
+        self.unresolved = unresolved
+        self.marked = marked
+
+    @property
+    def local(self) -> bool:
+        return bool(self.edits) and not self.unresolved
+
+    @property
+    def is_follow_up(self) -> bool:
+        return self.local or self.marked
+
+
+class CodeEdit:
+    """
+    תוצאת עריכה מקומית: הקוד הערוך, השינויים שבוצעו והניתוח שלו
+    """
+    def __init__(self, code: str, edits: list, analysis):
+        self.code = code
+        self.edits = edits
+        self.analysis = analysis
+
+
+def _value_source(text: str) -> str:
+    """
+    ערך מהבקשה כביטוי פייתון: "2π" -> "2 * np.pi", "-π/2" -> "-np.pi / 2"
+    """
+    text = re.sub(r'\s+', '', text).lower()
+    match = re.fullmatch(r'(-?)(\d+(?:\.\d+)?)?\*?(?:π|pi)(?:/(\d+))?', text)
+    if not match:
+        return text
+    sign, factor, divisor = match.groups()
+    source = f"{sign}{factor} * np.pi" if factor else f"{sign}np.pi"
+    return f"{source} / {divisor}" if divisor else source
+
+
+def parse_edit_request(text: str) -> EditRequest:
+    """
+    מפרק הודעה כמו "עכשיו עם רדיוס 5 ובלי רשת" לרשימת שינויים:
+    ('radius', '5'), ('grid', False) וכדומה
+    """
+    remaining = text.strip().rstrip('.!?')
+    edits = []
+    for kind, pattern in REQUEST_PATTERNS:
+        for match in list(pattern.finditer(remaining)):
+            groups = [group for group in match.groups() if group is not None]
+            if kind == 'title':
+                edits.append(('title', groups[0].strip()))
+            elif kind == 'no_title':
+                edits.append(('title', None))
+            elif kind in ('grid', 'no_grid', 'axes', 'no_axes'):
+                edits.append((kind.replace('no_', ''), not kind.startswith('no_')))
+            elif kind == 'radius':
+                edits.append(('radius', _value_source(groups[0])))
+            elif kind == 'range':
+                edits.append(('range', _value_source(groups[0]), _value_source(groups[1])))
+            elif kind == 'color':
+                word = groups[0].lower()
+                base = next((name for name in HEBREW_COLORS if word.startswith(name)), None)
+                edits.append(('color', HEBREW_COLORS[base] if base else word))
+            elif kind == 'constant':
+                edits.append(('constant', groups[0], _value_source(groups[1])))
+        remaining = pattern.sub(' ', remaining)
+
+    words = [word.strip(',.;:!?-–"\'') for word in remaining.split()]
+    unresolved = [word for word in words if word and word.lower() not in FILLER_WORDS]
+    first = text.split()[0].lower() if text.split() else ''
+    marked = first in FOLLOW_UP_MARKERS or (first.startswith('ו') and first[1:] in FOLLOW_UP_MARKERS)
+    return EditRequest(text, edits, unresolved, marked)
+
+
+def _call_name(call: ast.Call):
+    func = call.func
+    return func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+
+
+def _is_numeric(node: ast.AST) -> bool:
+    """
+    מספר קבוע, אולי עם π וחשבון פשוט (2 * np.pi, -3.5)
+    """
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        return _is_numeric(node.operand)
+    if isinstance(node, ast.BinOp):
+        return _is_numeric(node.left) and _is_numeric(node.right)
+    if isinstance(node, ast.Attribute):
+        return node.attr == 'pi' and isinstance(node.value, ast.Name) and node.value.id in ('np', 'numpy', 'math')
+    return isinstance(node, ast.Name) and node.id == 'pi'
+
+
+def _expression(source: str) -> ast.expr:
+    return ast.parse(source, mode='eval').body
+
+
+def _calls(tree: ast.AST, names) -> list:
+    return [node for node in ast.walk(tree) if isinstance(node, ast.Call) and _call_name(node) in names]
+
+
+def _statement(source: str) -> ast.stmt:
+    return ast.parse(source).body[0]
+
+
+def _insert_before_save(tree: ast.Module, statement: ast.stmt) -> None:
+    """
+    מוסיף פקודה לפני ה-savefig (או show) הראשון, גם כשהוא בתוך פונקציה; אחרת בסוף הקוד
+    """
+    def visit(body: list) -> bool:
+        for index, node in enumerate(body):
+            if (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call)
+                    and _call_name(node.value) in ('savefig', 'show')):
+                body.insert(index, statement)
+                return True
+            for field in ('body', 'orelse', 'finalbody'):
+                inner = getattr(node, field, None)
+                if isinstance(inner, list) and inner and isinstance(inner[0], ast.stmt) and visit(inner):
+                    return True
+        return False
+
+    if not visit(tree.body):
+        tree.body.append(statement)
+
+
+def _remove_calls(tree: ast.Module, names) -> int:
+    """
+    מסיר פקודות שהן רק קריאה לאחת מהפונקציות (plt.title(...)), ומחזיר כמה הוסרו
+    """
+    removed = 0
+
+    class Remover(ast.NodeTransformer):
+        def visit_Expr(self, node):
+            nonlocal removed
+            if isinstance(node.value, ast.Call) and _call_name(node.value) in names:
+                removed += 1
+                return None
+            return node
+
+        def generic_visit(self, node):
+            super().generic_visit(node)
+            # גוף של if/for/def שהתרוקן צריך לפחות pass
+            if not isinstance(node, ast.Module) and getattr(node, 'body', None) == []:
+                node.body.append(ast.Pass())
+            return node
+
+    Remover().visit(tree)
+    return removed
+
+
+def _set_radius(tree: ast.Module, value: str) -> bool:
+    """
+    משנה את הרדיוס: משתנה r/radius, פרמטר radius=, או הפרמטר השני של Circle.
+    כשיש כמה רדיוסים שונים בשרטוט לא ברור איזה לשנות, והבקשה עוברת ל-Gemini
+    """
+    targets = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and node.targets[0].id in RADIUS_NAMES and _is_numeric(node.value)):
+            targets.append((node, 'value'))
+        elif isinstance(node, ast.keyword) and node.arg == 'radius' and _is_numeric(node.value):
+            targets.append((node, 'value'))
+        elif (isinstance(node, ast.Call) and _call_name(node) in ('Circle', 'CirclePolygon')
+                and len(node.args) >= 2 and _is_numeric(node.args[1])):
+            targets.append((node.args, 1))
+    return _replace_all(targets, value)
+
+
+def _replace_all(targets: list, value: str) -> bool:
+    """
+    מחליף את כל הערכים ב-targets (זוגות של אובייקט ושדה/אינדקס), רק אם כולם שווים זה לזה
+    """
+    def get(owner, field):
+        return owner[field] if isinstance(owner, list) else getattr(owner, field)
+
+    if not targets or len({ast.dump(get(owner, field)) for owner, field in targets}) > 1:
+        return False
+    for owner, field in targets:
+        if isinstance(owner, list):
+            owner[field] = _expression(value)
+        else:
+            setattr(owner, field, _expression(value))
+    return True
+
+
+def _set_constant(tree: ast.Module, name: str, value: str) -> bool:
+    targets = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and node.targets[0].id == name and _is_numeric(node.value)):
+            targets.append((node, 'value'))
+        elif isinstance(node, ast.keyword) and node.arg == name and _is_numeric(node.value):
+            targets.append((node, 'value'))
+    return _replace_all(targets, value)
+
+
+def _set_range(tree: ast.Module, low: str, high: str) -> bool:
+    """
+    משנה את תחום ה-x: linspace/arange של משתנה x, ו-xlim.
+    תחום של פרמטר אחר (זווית, t) לא משתנה - שם "תחום" יכול להיות הרבה דברים
+    """
+    x_ranges = [
+        node for node in ast.walk(tree)
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)
+        and _call_name(node.value) in ('linspace', 'arange') and len(node.value.args) >= 2
+        and all(_is_numeric(arg) for arg in node.value.args[:2])
+        and isinstance(node.targets[0], ast.Name) and node.targets[0].id.lower().startswith('x')
+    ]
+    limits = [
+        call for call in _calls(tree, ('xlim', 'set_xlim'))
+        if len(call.args) == 2 and all(_is_numeric(arg) for arg in call.args)
+    ]
+    if not x_ranges and not limits:
+        return False
+    for node in x_ranges:
+        node.value.args[0] = _expression(low)
+        node.value.args[1] = _expression(high)
+    for call in limits:
+        call.args = [_expression(low), _expression(high)]
+    return True
+
+
+def _set_color(tree: ast.Module, color: str) -> bool:
+    """
+    צובע את כל מה שמצויר בצבע אחד. כשהשרטוט כבר צבעוני (כמה צבעים, צבע מחושב,
+    או ציור בלולאה שמקבל צבע אחר בכל סיבוב) לא ברור מה לצבוע, והבקשה עוברת ל-Gemini
+    """
+    calls = _calls(tree, DRAW_CALLS)
+    if not calls:
+        return False
+    in_loops = {
+        id(call) for loop in ast.walk(tree) if isinstance(loop, (ast.For, ast.While))
+        for call in _calls(loop, DRAW_CALLS)
+    }
+    existing = set()
+    for call in calls:
+        if id(call) in in_loops and not any(keyword.arg in COLOR_KEYWORDS for keyword in call.keywords):
+            return False
+        for keyword in call.keywords:
+            if keyword.arg in COLOR_KEYWORDS:
+                if not (isinstance(keyword.value, ast.Constant) and isinstance(keyword.value.value, str)):
+                    return False
+                if keyword.value.value.lower() != 'none':
+                    existing.add(keyword.value.value.lower())
+        for arg in call.args:
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and FORMAT_STRING.match(arg.value):
+                existing.add(re.search('[bgrcmykw]', arg.value).group(0))
+    if len(existing) > 1:
+        return False
+
+    for call in calls:
+        colored = False
+        for keyword in call.keywords:
+            if keyword.arg in COLOR_KEYWORDS and keyword.value.value.lower() != 'none':
+                keyword.value = ast.Constant(color)
+                colored = True
+        args = []
+        for arg in call.args:
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and FORMAT_STRING.match(arg.value):
+                # 'r--' -> '--', ו-'r' לבד פשוט מוסר
+                style = re.sub('[bgrcmykw]', '', arg.value, count=1)
+                if not style:
+                    continue
+                arg = ast.Constant(style)
+            args.append(arg)
+        call.args = args
+        if not colored:
+            call.keywords.append(ast.keyword('color', ast.Constant(color)))
+    return True
+
+
+def _set_grid(tree: ast.Module, on: bool) -> bool:
+    calls = _calls(tree, ('grid',))
+    for call in calls:
+        call.args = [ast.Constant(on)]
+        if on:
+            call.keywords = [keyword for keyword in call.keywords if keyword.arg not in ('visible', 'b')]
+        else:
+            # grid(False, alpha=...) מדליק את הרשת בחזרה
+            call.keywords = [keyword for keyword in call.keywords if keyword.arg in ('axis', 'which')]
+    if not calls:
+        _insert_before_save(tree, _statement(f"plt.grid({on})"))
+    if on:
+        # רשת לא נראית בלי צירים
+        _set_axes(tree, True)
+    return True
+
+
+def _set_axes(tree: ast.Module, on: bool) -> bool:
+    changed = False
+    for call in _calls(tree, ('axis', 'set_axis_off', 'set_axis_on')):
+        name = _call_name(call)
+        if name == 'axis':
+            if call.args and isinstance(call.args[0], ast.Constant) and call.args[0].value in ('on', 'off', True, False):
+                call.args[0] = ast.Constant('on' if on else 'off')
+                changed = True
+        elif name != ('set_axis_on' if on else 'set_axis_off'):
+            call.func.attr = 'set_axis_on' if on else 'set_axis_off'
+            changed = True
+    if not changed and not on:
+        _insert_before_save(tree, _statement("plt.axis('off')"))
+        changed = True
+    return changed
+
+
+def _set_title(tree: ast.Module, text) -> bool:
+    if text is None:
+        _remove_calls(tree, TITLE_CALLS)
+        return True
+    value = ast.Constant(text)
+    if HEBREW_PATTERN.search(text):
+        value = ast.Call(func=ast.Name('get_display', ast.Load()), args=[value], keywords=[])
+    calls = _calls(tree, ('title', 'set_title')) or _calls(tree, ('suptitle',))
+    if len(calls) > 1:
+        return False
+    if not calls:
+        _insert_before_save(tree, ast.Expr(ast.Call(
+            func=_expression('plt.title'), args=[value], keywords=[]
+        )))
+        return True
+    call = calls[0]
+    if call.args:
+        call.args[0] = value
+    else:
+        call.keywords = [keyword for keyword in call.keywords if keyword.arg != 'label']
+        call.args = [value]
+    return True
+
+
+# עריכות לפי סוג השינוי
+EDIT_RULES = {
+    'radius': _set_radius,
+    'constant': _set_constant,
+    'range': _set_range,
+    'color': _set_color,
+    'grid': _set_grid,
+    'axes': _set_axes,
+    'title': _set_title,
+}
+
+
+def edit_code(code: str, request: EditRequest):
+    """
+    מבצע בקשת המשך על הקוד של השרטוט הקודם בשכתובי AST מקומיים (בלי Gemini).
+    מחזיר CodeEdit אם כל השינויים בבקשה בוצעו והקוד הערוך עובר את המנתח, אחרת None
+    """
+    if not request.local:
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    for kind, *args in request.edits:
+        if not EDIT_RULES[kind](tree, *args):
+            logger.info(f"No local edit for {kind} {args}")
+            return None
+
+    edited = ast.unparse(ast.fix_missing_locations(tree))
+    analysis = analyze_code(edited)
+    if not analysis.is_safe:
+        logger.info(f"Local edit fails validation: {analysis.violations}")
+        return None
+    logger.info(f"Edited code locally: {request.edits}")
+    return CodeEdit(edited, request.edits, analysis)
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    code = """import matplotlib.pyplot as plt
+import numpy as np
+r = 3
+theta = np.linspace(0, 2 * np.pi, 200)
+plt.figure(figsize=(10, 10))
+plt.plot(r * np.cos(theta), r * np.sin(theta), 'b-')
+plt.axis('equal')
+plt.axis('off')
+plt.savefig('circle.png')
+plt.close()
+"""
+    for follow_up in ("עכשיו עם רדיוס 5 ובאדום", "תוסיף רשת", "עם כותרת: מעגל", "תוסיף משולש בפנים"):
+        request = parse_edit_request(follow_up)
+        result = edit_code(code, request)
+        print(follow_up, request.edits, request.unresolved, 'local' if result else 'gemini')
+        if result:
+            print(result.code)
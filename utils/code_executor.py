@@ -1,25 +1,32 @@
 import os
 import sys
-import ast
 import json
+import math
+import time
+import queue
+import signal
 import builtins
 import logging
+import threading
 import traceback
+import types
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
 from pathlib import Path
-from dotenv import load_dotenv
-from .config import ALLOWED_MODULES, FORBIDDEN_WORDS, GLOBAL_IMPORTS
+from .config import ALLOWED_MODULES, GLOBAL_IMPORTS, GLOBAL_PATCHES, get_render_limits
+from .code_analyzer import analyze_code, CODE_FILENAME
 
-# הגדרת לוגר
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# תיקיית הלוגים
 log_dir = Path(__file__).parent.parent / "logs"
-log_dir.mkdir(exist_ok=True)
 
 # הגדרת לוגר לקובץ JSON
 class JSONFormatter(logging.Formatter):
-    def __init__(self):
-        super().__init__()
-        self.logs = []
-
     def format(self, record):
         log_entry = {
             'timestamp': datetime.fromtimestamp(record.created).isoformat(),
@@ -49,24 +56,73 @@ class JSONFormatter(logging.Formatter):
         
         return json.dumps(log_entry, ensure_ascii=False)
 
-class JSONHandler(logging.FileHandler):
-    def __init__(self, filename, mode='a', encoding='utf-8'):
-        super().__init__(filename, mode, encoding=encoding)
-        self.logs = []
-        self.formatter = JSONFormatter()
+class JSONLinesHandler(RotatingFileHandler):
+    """
+    כותב רשומת JSON אחת בכל שורה (JSON Lines), עם סבב קבצים לפי גודל ולפי זמן
+    """
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 rotate_seconds=24 * 60 * 60, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding=encoding, delay=True)
+        # ההודעה כבר מפורמטת כ-JSON ע"י ה-QueueHandler
+        self.setFormatter(logging.Formatter('%(message)s'))
+        self.rotate_seconds = rotate_seconds
+        self.rollover_at = time.time() + rotate_seconds
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.rotate_seconds
+
+
+class JSONQueueHandler(QueueHandler):
+    """
+    מפרמט את הרשומה כ-JSON במקום ומעביר אותה לתור; הכתיבה לקובץ נעשית
+    ב-thread נפרד, כך שהלוג אף פעם לא חוסם את מסלול הבקשה.
+    ה-thread מופעל מחדש בכל תהליך (למשל workers שנוצרו מ-fork)
+    """
+    def __init__(self, *handlers):
+        super().__init__(queue.SimpleQueue())
+        self.setFormatter(JSONFormatter())
+        self.handlers = handlers
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # תור חדש - תור שעבר בירושה מתהליך אחר עלול להכיל רשומות שלו
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        super().enqueue(record)
+
+    def stop_listener(self):
+        """
+        ממתין לכתיבת כל הרשומות שבתור ועוצר את ה-thread
+        """
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self._pid = None
+            self.listener = None
+
+    def close(self):
+        self.stop_listener()
+        super().close()
 
-    def emit(self, record):
-        try:
-            msg = self.formatter.format(record)
-            log_entry = json.loads(msg)
-            self.logs.append(log_entry)
-            
-            # כתיבת כל הלוגים כמערך JSON אחד
-            with open(self.baseFilename, 'w', encoding=self.encoding) as f:
-                json.dump(self.logs, f, ensure_ascii=False, indent=2)
-                
-        except Exception:
-            self.handleError(record)
 
 class ConsoleFormatter(logging.Formatter):
     def format(self, record):
@@ -79,154 +135,322 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.propagate = False  # מניעת לוגים כפולים
 
-# הגדרת handler לקובץ JSON
-json_handler = JSONHandler(log_dir / 'code_execution.json')
-json_handler.setLevel(logging.DEBUG)
-logger.addHandler(json_handler)
+queue_handler = None
+_logging_lock = threading.Lock()
+
 
-# הגדרת handler לקונסול - רק אזהרות ושגיאות
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(ConsoleFormatter())
-console_handler.setLevel(logging.WARNING)
-logger.addHandler(console_handler)
+def setup_logging() -> None:
+    """
+    מחבר ללוגר את ה-handlers (קובץ JSON Lines דרך תור, וקונסול לאזהרות).
+    נקרא כשנוצר SafeCodeExecutor - כלומר בתהליכי הרינדור - ולא בייבוא המודול,
+    כדי שתהליך הבוט לא יפתח קובץ לוג שהוא לא כותב אליו
+    """
+    global queue_handler
+    with _logging_lock:
+        if queue_handler is not None:
+            return
+        log_dir.mkdir(exist_ok=True)
+
+        # הגדרת handler לקובץ JSON Lines, דרך תור
+        json_handler = JSONLinesHandler(
+            log_dir / 'code_execution.jsonl',
+            max_bytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+            backup_count=int(os.getenv('LOG_BACKUP_COUNT', 5)),
+            rotate_seconds=int(os.getenv('LOG_ROTATE_HOURS', 24)) * 60 * 60
+        )
+        json_handler.setLevel(logging.DEBUG)
+        queue_handler = JSONQueueHandler(json_handler)
+        logger.addHandler(queue_handler)
+
+        # הגדרת handler לקונסול - רק אזהרות ושגיאות
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(ConsoleFormatter())
+        console_handler.setLevel(logging.WARNING)
+        logger.addHandler(console_handler)
+
+
+def flush_logs() -> None:
+    """
+    כותב לקובץ את כל הלוגים שממתינים בתור.
+    תהליכי worker יוצאים בלי atexit, ולכן צריכים לקרוא לזה לפני סיום
+    """
+    if queue_handler is not None:
+        queue_handler.stop_listener()
+
+class RenderTooExpensiveError(RuntimeError):
+    """
+    נזרקת כשהרצת הקוד חורגת ממגבלות הזמן, המעבד, הזיכרון או גודל התמונה.
+    limit מציין איזו מגבלה נחצתה: 'time', 'cpu', 'memory' או 'pixels'
+    """
+    def __init__(self, message: str, limit: str = None):
+        super().__init__(message)
+        self.limit = limit
+
+
+class CodeExecutionError(RuntimeError):
+    """
+    נזרקת כשהקוד שנוצר נכשל בזמן ריצה. שומרת את סוג החריגה המקורית, את השורה בקוד שנוצר
+    ואת תקציר ה-traceback (רק שורות מהקוד שנוצר), כדי ששלב התיקון יוכל לטפל בה
+    """
+    def __init__(self, message: str, error_type: str = None, error_message: str = None,
+                 line: int = None, details: str = None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.error_message = error_message
+        self.line = line
+        self.details = details
+
+    @classmethod
+    def from_exception(cls, error: Exception, code_lines: list = None) -> 'CodeExecutionError':
+        """
+        בונה את השגיאה מחריגה שנזרקה בתוך exec
+        """
+        frames = [
+            frame for frame in traceback.extract_tb(error.__traceback__)
+            if frame.filename == CODE_FILENAME
+        ]
+        line = frames[-1].lineno if frames else None
+        details = []
+        for frame in frames[-3:]:
+            source = ''
+            if code_lines and 0 < frame.lineno <= len(code_lines):
+                source = code_lines[frame.lineno - 1].strip()
+            details.append(f"line {frame.lineno}: {source}")
+        details.append(f"{type(error).__name__}: {error}")
+        return cls(
+            f"שגיאה בהרצת הקוד: {str(error)}",
+            error_type=type(error).__name__,
+            error_message=str(error),
+            line=line,
+            details='\n'.join(details)
+        )
 
-# טעינת משתני הסביבה
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
 
 class SafeCodeExecutor:
     def __init__(self):
-        self.max_execution_time = int(os.getenv('MAX_EXECUTION_TIME', 30))
+        setup_logging()
+        limits = get_render_limits()
+        self.max_execution_time = limits['MAX_EXECUTION_TIME']
+        self.max_cpu_time = limits['MAX_CPU_TIME']
+        self.max_memory_mb = limits['MAX_MEMORY_MB']
+        self.max_output_pixels = limits['MAX_OUTPUT_PIXELS']
+        self.max_array_elements = limits['MAX_ARRAY_ELEMENTS']
+        self.max_loop_iterations = limits['MAX_LOOP_ITERATIONS']
         self.allowed_modules = ALLOWED_MODULES
         
-        # יצירת סביבת הרצה בטוחה
-        self.safe_builtins = {
-            '__builtins__': {
-                '__import__': __import__,
-                'print': print,
-                'len': len,
-                'range': range,
-                'int': int,
-                'float': float,
-                'str': str,
-                'list': list,
-                'dict': dict,
-                'tuple': tuple,
-                'bool': bool,
-                'True': True,
-                'False': False,
-                'None': None,
-                'min': min,
-                'max': max,
-                'abs': abs,
-                'sum': sum,
-                'round': round,
-                'pow': pow,
-                'enumerate': enumerate,
-                'zip': zip,
-                'map': map,
-                'filter': filter,
-                'sorted': sorted,
-                'reversed': reversed
-            }
-        }
+        # יצירת סביבת הרצה בטוחה: builtins מצומצמים ותבנית גלובלים שנבנית פעם אחת
+        self.safe_builtins = types.MappingProxyType({
+            '__import__': __import__,
+            'print': print,
+            'len': len,
+            'range': range,
+            'int': int,
+            'float': float,
+            'str': str,
+            'list': list,
+            'dict': dict,
+            'tuple': tuple,
+            'bool': bool,
+            'True': True,
+            'False': False,
+            'None': None,
+            'min': min,
+            'max': max,
+            'abs': abs,
+            'sum': sum,
+            'round': round,
+            'pow': pow,
+            'enumerate': enumerate,
+            'zip': zip,
+            'map': map,
+            'filter': filter,
+            'sorted': sorted,
+            'reversed': reversed
+        })
+        self._globals_template = None
+        self._rc_params_snapshot = None
+        # תוצאות הלולאות שהומרו למערכים בהרצה האחרונה
+        self.vectorize_reports = []
 
     def validate_code(self, code: str) -> bool:
         """
         בודק שהקוד בטוח ומתאים להרצה
         """
-        logger.info("Starting code validation")
-        logger.debug(f"Code to validate:\n{code}")
-        
-        code_lower = code.lower()
-        
-        # בדיקת מילים אסורות
-        for word in FORBIDDEN_WORDS:
-            if word in code_lower:
-                logger.warning(f"Validation failed: Found forbidden word: {word}")
-                return False
-            
-        # בדיקת ייבוא ספריות
-        import_lines = [
-            line.strip() 
-            for line in code.split('\n') 
-            if line.strip() and (
-                line.strip().startswith('import ') or  # חייב רווח אחרי import
-                (line.strip().startswith('from ') and ' import ' in line.strip())  # חייב רווח אחרי from ו-import
-            )
-        ]
-        
-        logger.info("Found import lines:")
-        for line in import_lines:
-            logger.info(f"  {line}")
-            if not any(lib in line for lib in self.allowed_modules):
-                logger.warning(f"Validation failed: Unauthorized import: {line}")
-                return False
-        
-        logger.info("Code validation passed")
-        return True
+        return analyze_code(code, self.allowed_modules).is_safe
 
-    def execute_code(self, code: str) -> None:
+    def compile_code(self, code: str) -> types.CodeType:
         """
-        מריץ קוד Python בצורה בטוחה
+        מנתח את הקוד במעבר יחיד ומחזיר אובייקט קוד מקומפל.
+        זורק ValueError על קוד לא בטוח ו-RenderTooExpensiveError על קוד יקר מדי
         """
-        logger.info("Starting code execution")
-        logger.debug(f"Code to execute:\n{code}")
-        
-        # בדיקת תחביר
+        analysis = analyze_code(code, self.allowed_modules)
+        if analysis.syntax_error:
+            raise ValueError(f"שגיאת תחביר בקוד: {analysis.syntax_error}")
+        if not analysis.is_safe:
+            raise ValueError(f"קוד לא מורשה: {analysis.violations[0]}")
+
+        violation = analysis.cost_violation(self.max_array_elements, self.max_loop_iterations)
+        if violation:
+            limit, message = violation
+            logger.warning(f"Render limit exceeded (static estimate): {message}")
+            raise RenderTooExpensiveError(message, limit=limit)
+        return analysis.code_object
+
+    def apply_memory_limit(self) -> None:
+        """
+        מגביל את מרחב הכתובות של התהליך הנוכחי.
+        מיועד לתהליכי רינדור בלבד - לא לקרוא מתוך תהליך הבוט
+        """
+        if resource is None or self.max_memory_mb <= 0:
+            return
+        limit = self.max_memory_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        logger.info(f"Address space limited to {self.max_memory_mb}MB")
+
+    @contextmanager
+    def _execution_limits(self):
+        """
+        אוכף מגבלת זמן אמת (SIGALRM) ומגבלת זמן מעבד (RLIMIT_CPU) סביב הרצת הקוד.
+        סיגנלים זמינים רק ב-thread הראשי וב-Unix; אחרת ההגנה נשארת למאגר הרינדור
+        """
+        if (
+            resource is None
+            or not hasattr(signal, 'SIGALRM')
+            or threading.current_thread() is not threading.main_thread()
+        ):
+            yield
+            return
+
+        def on_timeout(signum, frame):
+            raise RenderTooExpensiveError(
+                f"הרינדור חרג ממגבלת הזמן ({self.max_execution_time} שניות)", limit='time'
+            )
+
+        def on_cpu_limit(signum, frame):
+            raise RenderTooExpensiveError(
+                f"הרינדור חרג ממגבלת זמן המעבד ({self.max_cpu_time} שניות)", limit='cpu'
+            )
+
+        old_alarm = signal.signal(signal.SIGALRM, on_timeout)
+        old_xcpu = signal.signal(signal.SIGXCPU, on_cpu_limit)
+        old_cpu_limit = resource.getrlimit(resource.RLIMIT_CPU)
         try:
-            ast.parse(code)
-        except SyntaxError as e:
-            logger.error(f"Syntax error in code: {e}")
-            raise ValueError(f"שגיאת תחביר בקוד: {e}")
-
-        # בדיקת ייבוא מודולים
-        tree = ast.parse(code)
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.Import, ast.ImportFrom)):
-                if isinstance(node, ast.ImportFrom):
-                    module = node.module.split('.')[0]  # קח את המודול הראשי
+            signal.setitimer(signal.ITIMER_REAL, self.max_execution_time)
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            cpu_soft = math.ceil(usage.ru_utime + usage.ru_stime) + self.max_cpu_time
+            cpu_hard = old_cpu_limit[1]
+            if cpu_hard != resource.RLIM_INFINITY:
+                cpu_soft = min(cpu_soft, cpu_hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_soft, cpu_hard))
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            resource.setrlimit(resource.RLIMIT_CPU, old_cpu_limit)
+            signal.signal(signal.SIGALRM, old_alarm)
+            signal.signal(signal.SIGXCPU, old_xcpu)
+
+    def _build_globals_template(self) -> types.MappingProxyType:
+        """
+        מייבא פעם אחת את כל מה שהקוד שנוצר מקבל מראש (GLOBAL_IMPORTS ו-patches)
+        ומחזיר תבנית לקריאה בלבד
+        """
+        namespace = {}
+        for name, import_str in GLOBAL_IMPORTS.items():
+            try:
+                if name == 'get_display':
+                    # ייבוא מיוחד ל-get_display
+                    from bidi.algorithm import get_display as bidi_get_display
+                    namespace[name] = bidi_get_display
                 else:
-                    module = node.names[0].name.split('.')[0]
-                logger.info(f"Checking module: {module}")
-                if module not in self.allowed_modules:
-                    logger.warning(f"Unauthorized module detected: {module}")
-                    raise ValueError(f"מודול לא מורשה: {module}")
+                    namespace[name] = eval(import_str)
+            except Exception as e:
+                logger.error(f"Error importing {name}: {str(e)}")
+                raise
+
+        import matplotlib.patches
+        for name in GLOBAL_PATCHES:
+            namespace[name] = getattr(matplotlib.patches, name)
+
+        # פונקציות העזר של הלולאות שהומרו למערכים (ראו code_vectorizer)
+        from . import vectorized_runtime
+        namespace.update(vectorized_runtime.HELPERS)
+
+        # מצב rcParams לפני ריצה כלשהי, כדי שהגדרות של ריצה אחת לא יעברו לבאה
+        import matplotlib
+        self._rc_params_snapshot = dict.copy(matplotlib.rcParams)
+        return types.MappingProxyType(namespace)
+
+    def prepare_globals(self) -> None:
+        """
+        בונה את תבנית הגלובלים מראש (נקרא בעליית תהליך רינדור, לפני העבודה הראשונה)
+        """
+        if self._globals_template is None:
+            self._globals_template = self._build_globals_template()
+
+    def _new_globals(self) -> dict:
+        """
+        מחזיר מרחב שמות חדש להרצה אחת: העתק רדוד של התבנית, עם עותק משלו של builtins
+        """
+        self.prepare_globals()
+        globals_dict = dict(self._globals_template)
+        globals_dict['__builtins__'] = dict(self.safe_builtins)
+        return globals_dict
+
+    def _restore_rc_params(self) -> None:
+        """
+        מחזיר את rcParams למצב שנשמר בבניית התבנית (בלי לעבור שוב על ה-validators)
+        """
+        if self._rc_params_snapshot is None:
+            return
+        import matplotlib
+        dict.clear(matplotlib.rcParams)
+        dict.update(matplotlib.rcParams, self._rc_params_snapshot)
+
+    def execute_code(self, code, extra_globals: dict = None) -> None:
+        """
+        מריץ קוד Python בצורה בטוחה, בכפוף למגבלות המשאבים.
+        code הוא מחרוזת, או אובייקט קוד שהתקבל מ-compile_code / analyze_code
+        """
+        logger.info("Starting code execution")
+
+        # קוד שכבר עבר ניתוח מגיע מקומפל; מחרוזת מנותחת ומקומפלת כאן פעם אחת
+        if isinstance(code, types.CodeType):
+            code_object = code
+        else:
+            logger.debug(f"Code to execute:\n{code}")
+            code_object = self.compile_code(code)
 
         # הרצת הקוד בסביבה בטוחה
         try:
-            # ייבוא המודולים בזמן ריצה
-            globals_dict = self.safe_builtins.copy()
-            
-            # קודם נייבא את כל המודולים הבסיסיים
-            for name, import_str in GLOBAL_IMPORTS.items():
-                if not import_str.startswith('patches.'):
-                    try:
-                        if name == 'get_display':
-                            # ייבוא מיוחד ל-get_display
-                            from bidi.algorithm import get_display as bidi_get_display
-                            globals_dict[name] = bidi_get_display
-                        else:
-                            globals_dict[name] = eval(import_str)
-                    except Exception as e:
-                        logger.error(f"Error importing {name}: {str(e)}")
-                        raise
-            
-            # אחר כך נייבא את כל האובייקטים מ-patches
-            from matplotlib.patches import PathPatch, Polygon, Circle, Rectangle, Arc
-            globals_dict.update({
-                'PathPatch': PathPatch,
-                'Polygon': Polygon,
-                'Circle': Circle,
-                'Rectangle': Rectangle,
-                'Arc': Arc
-            })
+            globals_dict = self._new_globals()
             
-            exec(code, globals_dict)
+            if extra_globals:
+                globals_dict.update(extra_globals)
+
+            from . import vectorized_runtime
+            vectorized_runtime.reset_reports()
+            try:
+                with self._execution_limits():
+                    exec(code_object, globals_dict)
+            finally:
+                self._restore_rc_params()
+                self.vectorize_reports = vectorized_runtime.take_reports()
             logger.info("Code executed successfully")
+        except RenderTooExpensiveError as e:
+            logger.warning(f"Render limit exceeded: {str(e)}")
+            raise
+        except MemoryError:
+            logger.warning("Render limit exceeded: out of memory")
+            raise RenderTooExpensiveError(
+                f"הרינדור חרג ממגבלת הזיכרון ({self.max_memory_mb}MB)", limit='memory'
+            )
         except Exception as e:
             logger.error(f"Error during code execution: {str(e)}", exc_info=True)
-            raise RuntimeError(f"שגיאה בהרצת הקוד: {str(e)}")
+            code_lines = code.splitlines() if isinstance(code, str) else None
+            raise CodeExecutionError.from_exception(e, code_lines)
 
 if __name__ == "__main__":
     # דוגמה לשימוש
@@ -0,0 +1,503 @@
+import re
+import ast
+import math
+import logging
+from .config import GLOBAL_IMPORTS, GLOBAL_PATCHES, is_allowed_module
+from .code_analyzer import analyze_code
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מודולים שלא מורשים אבל יש להם תחליף מורשה
+MODULE_REPLACEMENTS = {
+    'pylab': 'matplotlib.pyplot',
+    'matplotlib.pylab': 'matplotlib.pyplot',
+}
+
+# קיצורים נפוצים למודולים של matplotlib שהקוד משתמש בהם בלי לייבא
+MODULE_ALIASES = {
+    'patches': 'matplotlib.patches',
+    'mpatches': 'matplotlib.patches',
+    'mlines': 'matplotlib.lines',
+    'mcolors': 'matplotlib.colors',
+    'cm': 'matplotlib.cm',
+    'ticker': 'matplotlib.ticker',
+    'transforms': 'matplotlib.transforms',
+}
+
+# המודול הנכון של השמות שזמינים בסביבת ההרצה גם בלי ייבוא
+GLOBAL_SOURCES = {'get_display': 'bidi.algorithm', 'Path': 'matplotlib.path'}
+GLOBAL_SOURCES.update({name: 'matplotlib.patches' for name in GLOBAL_PATCHES})
+
+# שמות נפוצים של numpy ו-pyplot שקוד משתמש בהם בלי קידומת (אחרי "from numpy import *" וכדומה).
+# רשימה קבועה ולא dir(), כדי שהתיקון לא יטען את numpy ו-matplotlib בתהליך הבוט
+NUMPY_NAMES = {
+    'pi', 'e', 'inf', 'nan', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2',
+    'sinh', 'cosh', 'tanh', 'sqrt', 'exp', 'log', 'log2', 'log10', 'abs', 'sign', 'floor', 'ceil',
+    'radians', 'degrees', 'deg2rad', 'rad2deg', 'hypot', 'linspace', 'arange', 'array', 'zeros',
+    'ones', 'full', 'meshgrid', 'mgrid', 'ogrid', 'concatenate', 'vstack', 'hstack', 'column_stack',
+    'where', 'clip', 'cumsum', 'diff', 'mean', 'maximum', 'minimum', 'polyval', 'polyfit', 'roots',
+    'dot', 'cross', 'real', 'imag', 'angle', 'conj', 'mod', 'power', 'isclose', 'zeros_like', 'ones_like',
+}
+PYPLOT_NAMES = {
+    'figure', 'subplot', 'subplots', 'plot', 'scatter', 'bar', 'barh', 'hist', 'pie', 'fill',
+    'fill_between', 'fill_betweenx', 'contour', 'contourf', 'imshow', 'quiver', 'streamplot', 'polar',
+    'errorbar', 'step', 'stem', 'loglog', 'semilogx', 'semilogy', 'axhline', 'axvline', 'axhspan',
+    'axvspan', 'arrow', 'annotate', 'text', 'title', 'suptitle', 'xlabel', 'ylabel', 'xlim', 'ylim',
+    'xticks', 'yticks', 'grid', 'legend', 'axis', 'gca', 'gcf', 'colorbar', 'tight_layout',
+    'savefig', 'show', 'close',
+}
+MATH_NAMES = {name for name in dir(math) if not name.startswith('_')}
+
+# שמות שהוסרו מ-numpy, והתחליף שלהם
+NUMPY_REMOVED = {
+    'float': 'float', 'int': 'int', 'bool': 'bool', 'complex': 'complex', 'object': 'object',
+    'str': 'str', 'NaN': 'np.nan', 'NAN': 'np.nan', 'Inf': 'np.inf', 'Infinity': 'np.inf',
+    'PINF': 'np.inf', 'NINF': '-np.inf', 'infty': 'np.inf', 'float_': 'np.float64',
+    'product': 'np.prod', 'cumproduct': 'np.cumprod', 'alltrue': 'np.all', 'sometrue': 'np.any',
+}
+
+# סגנונות seaborn קיבלו את הקידומת seaborn-v0_8 ב-matplotlib 3.6
+STYLE_PREFIX = 'seaborn'
+STYLE_REPLACEMENT = 'seaborn-v0_8'
+# השגיאה של plt.style.use עבור סגנון שלא קיים (OSError), עם שם הסגנון
+STYLE_ERROR = re.compile(r"'([^']+)' is not a valid package style")
+
+# פונקציות שמקבלות טקסט לתצוגה - טקסט בעברית בהן צריך לעבור דרך get_display
+TEXT_FUNCTIONS = {
+    'title', 'suptitle', 'xlabel', 'ylabel', 'text', 'annotate', 'figtext',
+    'set_title', 'set_xlabel', 'set_ylabel', 'set_text',
+}
+HEBREW_PATTERN = re.compile(r'[֐-׿]')
+
+# שורה בהודעת הפרה של המנתח, למשל "שורה 3: מודול לא מורשה: scipy"
+VIOLATION_LINE = re.compile(r'^שורה (\d+):')
+
+
+class CodeFailure:
+    """
+    תיאור אחיד של כישלון: קוד שהמנתח דחה, או חריגה בזמן הרינדור (CodeExecutionError)
+    """
+    def __init__(self, kind: str, error_type: str = None, message: str = '', line: int = None,
+                 violations: list = None):
+        self.kind = kind
+        self.error_type = error_type
+        self.message = message or ''
+        self.line = line
+        self.violations = violations or []
+
+    @classmethod
+    def from_analysis(cls, analysis) -> 'CodeFailure':
+        if analysis.syntax_error is not None:
+            return cls('syntax', 'SyntaxError', str(analysis.syntax_error),
+                       line=analysis.syntax_error.lineno, violations=analysis.violations)
+        return cls('unsafe', 'UnsafeCode', '; '.join(analysis.violations), violations=analysis.violations)
+
+    @classmethod
+    def from_error(cls, error: Exception) -> 'CodeFailure':
+        return cls(
+            'runtime',
+            getattr(error, 'error_type', None) or type(error).__name__,
+            getattr(error, 'error_message', None) or str(error),
+            line=getattr(error, 'line', None)
+        )
+
+    def report(self, code: str) -> str:
+        """
+        תקציר השגיאה עבור בקשת התיקון מ-Gemini: סוג, הודעה והשורה שנכשלה
+        """
+        lines = []
+        if self.kind == 'unsafe':
+            lines.append("The code was rejected by the safety check:")
+            lines.extend(f"- {violation}" for violation in self.violations)
+        else:
+            lines.append(f"{self.error_type}: {self.message}")
+        code_lines = code.splitlines()
+        if self.line and 0 < self.line <= len(code_lines):
+            lines.append(f"Failing line {self.line}: {code_lines[self.line - 1].strip()}")
+        return '\n'.join(lines)
+
+
+class CodeRepair:
+    """
+    תוצאת תיקון מקומי: הקוד המתוקן ושמות התיקונים שהופעלו
+    """
+    def __init__(self, code: str, fixes: list, analysis):
+        self.code = code
+        self.fixes = fixes
+        self.analysis = analysis
+
+
+def _assign(name: str, value: str) -> ast.stmt:
+    return ast.parse(f"{name} = {value}").body[0]
+
+
+def _defined_names(tree: ast.AST) -> set:
+    """
+    שמות שהקוד מגדיר בעצמו - אותם אסור "לתקן" לקידומת של מודול
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+    return names
+
+
+def _qualified(name: str):
+    """
+    השם המלא (עם קידומת מודול) לשם שהקוד השתמש בו בלי קידומת, או None
+    """
+    if name in NUMPY_NAMES:
+        return f"np.{name}"
+    if name in PYPLOT_NAMES:
+        return f"plt.{name}"
+    if name in MATH_NAMES:
+        return f"math.{name}"
+    return None
+
+
+def _fix_imports(tree: ast.Module, failure: CodeFailure) -> list:
+    """
+    ייבוא של מודול לא מורשה (או של שם שלא קיים בו) כשהשם עצמו זמין בסביבת ההרצה:
+    pylab הופך ל-pyplot, שמות כמו get_display או Circle פשוט זמינים, ו-"import *" מוסר
+    """
+    safe_names = set(GLOBAL_IMPORTS) | set(GLOBAL_PATCHES)
+    runtime_import = failure.kind == 'runtime' and failure.error_type in ('ImportError', 'ModuleNotFoundError')
+    if failure.kind != 'unsafe' and not runtime_import:
+        return []
+    violation_lines = {
+        int(match.group(1)) for match in map(VIOLATION_LINE.match, failure.violations) if match
+    }
+
+    fixes = []
+    star_imports = False
+    body = []
+    for node in tree.body:
+        in_scope = (
+            node.lineno in violation_lines if failure.kind == 'unsafe'
+            else failure.line is None or node.lineno == failure.line
+        )
+        if not in_scope or not isinstance(node, (ast.Import, ast.ImportFrom)):
+            body.append(node)
+            continue
+
+        if isinstance(node, ast.Import):
+            aliases = []
+            for alias in node.names:
+                if alias.name in MODULE_REPLACEMENTS:
+                    aliases.append(ast.alias(MODULE_REPLACEMENTS[alias.name], alias.asname or alias.name.split('.')[-1]))
+                    fixes.append(f"import {alias.name} -> {MODULE_REPLACEMENTS[alias.name]}")
+                elif failure.kind == 'unsafe' and not is_allowed_module(alias.name):
+                    fixes.append(f"drop import {alias.name}")
+                else:
+                    aliases.append(alias)
+            if aliases:
+                body.append(ast.Import(names=aliases))
+            continue
+
+        module = node.module or ''
+        if module in MODULE_REPLACEMENTS:
+            module = MODULE_REPLACEMENTS[module]
+        kept = []
+        replacements = []
+        for alias in node.names:
+            local_name = alias.asname or alias.name
+            if alias.name == '*':
+                star_imports = True
+                fixes.append(f"drop from {node.module} import *")
+            elif alias.name in safe_names:
+                # השם כבר קיים בסביבת ההרצה
+                if local_name != alias.name:
+                    replacements.append(_assign(local_name, alias.name))
+                fixes.append(f"use global {alias.name}")
+            elif alias.name in NUMPY_NAMES and (node.level or module.split('.')[0] != 'numpy'):
+                replacements.append(_assign(local_name, f"np.{alias.name}"))
+                fixes.append(f"{alias.name} from numpy")
+            elif alias.name.startswith('_') or node.level:
+                fixes.append(f"drop import {alias.name}")
+            else:
+                kept.append(alias)
+        if kept and module:
+            body.append(ast.ImportFrom(module=module, names=kept, level=0))
+        elif kept:
+            fixes.append("drop relative import")
+        body.extend(replacements)
+
+    tree.body = body
+    if star_imports:
+        fixes.extend(_qualify_names(tree))
+    return fixes
+
+
+def _fix_import_sources(tree: ast.Module, failure: CodeFailure) -> list:
+    """
+    ייבוא של שם מוכר מהמודול הלא נכון (from bidi import get_display) נכשל רק בזמן ריצה,
+    ולכן מתוקן בכל ניסיון תיקון, לא רק כשזו השגיאה שהתקבלה
+    """
+    fixes = []
+    body = []
+    for node in tree.body:
+        if not isinstance(node, ast.ImportFrom):
+            body.append(node)
+            continue
+        kept = []
+        for alias in node.names:
+            source = GLOBAL_SOURCES.get(alias.name)
+            if source and node.module != source:
+                if alias.asname and alias.asname != alias.name:
+                    body.append(_assign(alias.asname, alias.name))
+                fixes.append(f"use global {alias.name}")
+            else:
+                kept.append(alias)
+        if kept:
+            node.names = kept
+            body.append(node)
+    tree.body = body
+    return fixes
+
+
+def _qualify_names(tree: ast.Module) -> list:
+    """
+    מוסיף קידומת מודול לשמות שהקוד משתמש בהם בלי להגדיר (sin -> np.sin, plot -> plt.plot),
+    ומוסיף ייבוא לקיצורים כמו patches או mpatches
+    """
+    defined = _defined_names(tree) | set(GLOBAL_IMPORTS) | set(GLOBAL_PATCHES)
+    fixes = []
+    missing_aliases = set()
+
+    class Qualifier(ast.NodeTransformer):
+        def visit_Name(self, node):
+            if not isinstance(node.ctx, ast.Load) or node.id in defined:
+                return node
+            if node.id in MODULE_ALIASES:
+                missing_aliases.add(node.id)
+                return node
+            qualified = _qualified(node.id)
+            if qualified is None:
+                return node
+            fixes.append(f"{node.id} -> {qualified}")
+            return ast.copy_location(ast.parse(qualified, mode='eval').body, node)
+
+    Qualifier().visit(tree)
+    for alias in sorted(missing_aliases):
+        tree.body.insert(0, ast.parse(f"import {MODULE_ALIASES[alias]} as {alias}").body[0])
+        fixes.append(f"import {MODULE_ALIASES[alias]} as {alias}")
+    return fixes
+
+
+def _fix_undefined_name(tree: ast.Module, failure: CodeFailure) -> list:
+    if failure.error_type != 'NameError':
+        return []
+    match = re.search(r"name '(\w+)' is not defined", failure.message)
+    if not match or (_qualified(match.group(1)) is None and match.group(1) not in MODULE_ALIASES):
+        return []
+    # NameError מדווח רק על השם הראשון - מתקנים את כל השמות המוכרים בבת אחת
+    return _qualify_names(tree)
+
+
+def _fix_removed_numpy_names(tree: ast.Module, failure: CodeFailure) -> list:
+    """
+    np.float, np.NaN וכדומה, שהוסרו מגרסאות חדשות של numpy
+    """
+    if failure.error_type != 'AttributeError' or 'numpy' not in failure.message:
+        return []
+    fixes = []
+
+    class Replacer(ast.NodeTransformer):
+        def visit_Attribute(self, node):
+            self.generic_visit(node)
+            if (isinstance(node.value, ast.Name) and node.value.id in ('np', 'numpy')
+                    and node.attr in NUMPY_REMOVED and isinstance(node.ctx, ast.Load)):
+                fixes.append(f"np.{node.attr} -> {NUMPY_REMOVED[node.attr]}")
+                return ast.copy_location(ast.parse(NUMPY_REMOVED[node.attr], mode='eval').body, node)
+            return node
+
+    Replacer().visit(tree)
+    return fixes
+
+
+def _fix_tick_labels(tree: ast.Module, failure: CodeFailure) -> list:
+    """
+    מספר התוויות שונה ממספר הסימונות בציר (set_xticklabels / xticks):
+    מקצרים את שתי הרשימות לאורך המשותף
+    """
+    if failure.error_type != 'ValueError' or not re.search(r'FixedLocator|number of labels|must match', failure.message):
+        return []
+    fixes = []
+
+    def in_scope(node):
+        return failure.line is None or node.lineno == failure.line
+
+    body = []
+    for node in tree.body:
+        call = node.value if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) else None
+        func = call.func if call is not None else None
+        if call is None or not isinstance(func, ast.Attribute) or not in_scope(node) or not call.args:
+            body.append(node)
+            continue
+
+        keywords = ''.join(f", {ast.unparse(keyword)}" for keyword in call.keywords)
+        if func.attr in ('set_xticklabels', 'set_yticklabels'):
+            axis = func.attr[4]
+            owner = ast.unparse(func.value)
+            labels = ast.unparse(call.args[0])
+            body.extend(ast.parse(
+                f"{owner}.set_{axis}ticks(list({owner}.get_{axis}ticks())[:len({labels})])\n"
+                f"{owner}.{func.attr}(list({labels})[:len({owner}.get_{axis}ticks())]{keywords})"
+            ).body)
+            fixes.append(f"match {func.attr} to ticks")
+        elif func.attr in ('xticks', 'yticks', 'set_xticks', 'set_yticks') and len(call.args) == 2:
+            owner = ast.unparse(func.value)
+            ticks, labels = (ast.unparse(arg) for arg in call.args)
+            body.append(ast.parse(
+                f"{owner}.{func.attr}(list({ticks})[:len(list({labels}))], "
+                f"list({labels})[:len(list({ticks}))]{keywords})"
+            ).body[0])
+            fixes.append(f"match {func.attr} labels to ticks")
+        else:
+            body.append(node)
+    tree.body = body
+    return fixes
+
+
+def _fix_style(tree: ast.Module, failure: CodeFailure) -> list:
+    """
+    plt.style.use עם שם סגנון שלא קיים (השם מופיע בהודעת השגיאה): שמות seaborn הישנים
+    מקבלים את הקידומת החדשה, וסגנון אחר שלא נמצא מוסר. שאר הסגנונות נשארים
+    """
+    match = STYLE_ERROR.search(failure.message) if failure.kind == 'runtime' else None
+    if match is None:
+        return []
+    missing = match.group(1)
+    if missing.startswith(STYLE_PREFIX) and not missing.startswith(STYLE_REPLACEMENT):
+        replacement = STYLE_REPLACEMENT + missing[len(STYLE_PREFIX):]
+    else:
+        replacement = None
+
+    def is_missing(node) -> bool:
+        return isinstance(node, ast.Constant) and node.value == missing
+
+    fixes = []
+    body = []
+    for node in tree.body:
+        call = node.value if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) else None
+        if call is None or not ast.unparse(call.func).endswith('style.use') or not call.args:
+            body.append(node)
+            continue
+        style = call.args[0]
+        # סגנון יחיד, או רשימת סגנונות שאחד מהם חסר
+        styles = style.elts if isinstance(style, (ast.List, ast.Tuple)) else [style]
+        if not any(is_missing(element) for element in styles):
+            body.append(node)
+            continue
+        if replacement is not None:
+            for element in styles:
+                if is_missing(element):
+                    element.value = replacement
+            fixes.append(f"style {replacement}")
+            body.append(node)
+            continue
+        fixes.append(f"drop style {missing}")
+        if isinstance(style, (ast.List, ast.Tuple)):
+            style.elts = [element for element in styles if not is_missing(element)]
+            if style.elts:
+                body.append(node)
+    tree.body = body
+    return fixes
+
+
+def _wrap_hebrew_text(tree: ast.Module) -> list:
+    """
+    טקסט בעברית בכותרות ובתוויות שלא עבר דרך get_display מוצג הפוך - עוטפים אותו
+    """
+    fixes = []
+
+    class Wrapper(ast.NodeTransformer):
+        def visit_Call(self, node):
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            if name == 'get_display':
+                return node
+            self.generic_visit(node)
+            if name not in TEXT_FUNCTIONS and not any(keyword.arg == 'label' for keyword in node.keywords):
+                return node
+
+            def wrap(value):
+                if isinstance(value, ast.Constant) and isinstance(value.value, str) and HEBREW_PATTERN.search(value.value):
+                    fixes.append("wrap Hebrew text in get_display")
+                    return ast.copy_location(
+                        ast.Call(func=ast.Name('get_display', ast.Load()), args=[value], keywords=[]), value
+                    )
+                return value
+
+            if name in TEXT_FUNCTIONS:
+                node.args = [wrap(arg) for arg in node.args]
+            for keyword in node.keywords:
+                if keyword.arg == 'label' or name in TEXT_FUNCTIONS:
+                    keyword.value = wrap(keyword.value)
+            return node
+
+    Wrapper().visit(tree)
+    return fixes
+
+
+# תיקונים לפי סוג הכישלון, לפי הסדר
+RULES = (
+    _fix_imports,
+    _fix_import_sources,
+    _fix_undefined_name,
+    _fix_removed_numpy_names,
+    _fix_tick_labels,
+    _fix_style,
+)
+
+
+def repair_code(code: str, failure: CodeFailure):
+    """
+    מנסה לתקן קוד שנכשל בשכתובי AST מקומיים (אלפיות שנייה, בלי Gemini).
+    מחזיר CodeRepair אם אחד התיקונים התאים והקוד המתוקן עובר את המנתח, אחרת None
+    """
+    if failure.kind == 'syntax':
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    fixes = []
+    for rule in RULES:
+        fixes.extend(rule(tree, failure))
+    if not fixes:
+        logger.info(f"No local repair for {failure.error_type}: {failure.message}")
+        return None
+    # תיקון קוסמטי - מופעל רק יחד עם תיקון אמיתי
+    fixes.extend(_wrap_hebrew_text(tree))
+
+    repaired = ast.unparse(ast.fix_missing_locations(tree))
+    analysis = analyze_code(repaired)
+    if not analysis.is_safe:
+        logger.info(f"Local repair still fails validation: {analysis.violations}")
+        return None
+    logger.info(f"Repaired code locally: {fixes}")
+    return CodeRepair(repaired, fixes, analysis)
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש
+    broken = """from pylab import *
+from bidi import get_display
+x = linspace(0, 2 * pi, 100)
+plot(x, sin(x), label="סינוס")
+title("גרף")
+"""
+    failure = CodeFailure.from_analysis(analyze_code(broken))
+    print(failure.report(broken))
+    result = repair_code(broken, failure)
+    print(result.fixes)
+    print(result.code)
@@ -0,0 +1,680 @@
+import ast
+import copy
+import logging
+import itertools
+from collections import Counter
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# פונקציות העזר שהקוד המשוכתב קורא להן. הן מוזרקות למרחב השמות של ההרצה
+# (ראו vectorized_runtime.HELPERS); קוד שנוצר לא יכול להשתמש בשמות שמתחילים ב-__
+LOOP = '__vectorized_loop'
+COMPREHENSION = '__vectorized_comprehension'
+REGISTER = '__vregister'
+CALL = '__vcall'
+INDEX = '__vindex'
+WHERE = '__vwhere'
+AND = '__vand'
+OR = '__vor'
+NOT = '__vnot'
+SELECT = '__vsel'
+UPDATE = '__vupdate'
+MASK = '__vmask'
+REFINE = '__vrefine'
+EXCLUDE = '__vexclude'
+ANY = '__vany'
+SCALAR = '__vscalar'
+SHAPE = '__vshape'
+FALLBACK = '__vfallback'
+
+# שם הפרמטר שמחזיק את צורת הרשת בפונקציות הווקטוריות
+SHAPE_NAME = '__shape'
+
+# פעולות שיש להן משמעות זהה על מספרים ועל מערכי numpy
+BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+COMPARE_OPERATORS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# פונקציות שלא מחזירות ערך לכל איבר, ולכן לולאה שקוראת להן לא מומרת
+NON_ELEMENTWISE_CALLS = {'range', 'len', 'list', 'tuple', 'dict', 'zip', 'enumerate', 'sorted', 'sum', 'print', 'str'}
+
+
+class NotVectorizable(Exception):
+    """
+    הקוד לא מתאים להמרה למערכים - משאירים אותו כמו שהוא
+    """
+
+
+class VectorizeResult:
+    """
+    העץ אחרי ההמרה, וכמה לולאות, comprehensions ופונקציות הומרו
+    """
+    def __init__(self, tree: ast.Module, loops: int = 0, comprehensions: int = 0, functions: int = 0):
+        self.tree = tree
+        self.loops = loops
+        self.comprehensions = comprehensions
+        self.functions = functions
+
+    @property
+    def rewrites(self) -> int:
+        return self.loops + self.comprehensions
+
+
+def _name(name: str, ctx=None) -> ast.Name:
+    return ast.Name(id=name, ctx=ctx or ast.Load())
+
+
+def _call(func: str, *args) -> ast.Call:
+    return ast.Call(func=_name(func), args=list(args), keywords=[])
+
+
+def _assign(name: str, value) -> ast.Assign:
+    return ast.Assign(targets=[_name(name, ast.Store())], value=value)
+
+
+def _arguments(names: list) -> ast.arguments:
+    return ast.arguments(
+        posonlyargs=[], args=[ast.arg(arg=name) for name in names], vararg=None,
+        kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[]
+    )
+
+
+def _lambda(names: list, body) -> ast.Lambda:
+    return ast.Lambda(args=_arguments(names), body=body)
+
+
+def _function(name: str, args: list, body: list) -> ast.FunctionDef:
+    return ast.FunctionDef(name=name, args=_arguments(args), body=body, decorator_list=[], returns=None)
+
+
+def _root_name(node):
+    """
+    השם שבבסיס שרשרת תכונות (np.random.rand -> np), או None
+    """
+    while isinstance(node, ast.Attribute):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _stored_names(nodes) -> set:
+    names = set()
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                names.add(child.id)
+    return names
+
+
+def _loaded_names(nodes) -> Counter:
+    names = Counter()
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load):
+                names[child.id] += 1
+    return names
+
+
+def _top_level_stores(stmts: list) -> set:
+    """
+    שמות שמוצבים בכל מסלול דרך רשימת הפקודות: הצבות ישירות, ושמות שמוצבים
+    בשני הענפים של תנאי פנימי (elif). הצבות בתוך לולאות לא נספרות
+    """
+    names = set()
+    for stmt in stmts:
+        if isinstance(stmt, (ast.Assign, ast.AugAssign)):
+            names |= _stored_names([stmt])
+        elif isinstance(stmt, ast.If) and stmt.orelse:
+            names |= _top_level_stores(stmt.body) & _top_level_stores(stmt.orelse)
+    return names
+
+
+class _VectorCompiler:
+    """
+    מתרגם גוף של לולאה או פונקציה לקוד שפועל על מערכים שלמים.
+    בתוך תנאים ולולאות פנימיות (למשל לולאת בריחה של פרקטל) כל פקודה רצה תחת מסכה
+    של האיברים שעדיין "נמצאים" בה, כך שכל איבר עובר בדיוק את המסלול שהיה עובר בלולאה הרגילה
+    """
+    def __init__(self, varying: set, defined: set, counter, function: bool = False):
+        self.varying = set(varying)
+        self.defined = set(defined)
+        self.declared = set()
+        self.counter = counter
+        self.function = function
+        # מחסנית של (שם המסכה, סוג): 'alive' לגוף פונקציה, 'loop' ו-'if'
+        self.masks = []
+
+    def fresh(self, prefix: str) -> str:
+        return f"__v{prefix}{next(self.counter)}"
+
+    @property
+    def mask(self):
+        return self.masks[-1][0] if self.masks else None
+
+    def expr(self, node, cond: bool = False):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, (bool, int, float, complex)):
+                return ast.Constant(node.value)
+            raise NotVectorizable(f"constant {node.value!r}")
+        if isinstance(node, ast.Name):
+            if node.id not in self.varying:
+                return _name(node.id)
+            if node.id not in self.defined:
+                raise NotVectorizable(f"'{node.id}' is read before it is set in the loop")
+            if self.mask:
+                return _call(SELECT, _name(node.id), _name(self.mask))
+            return _name(node.id)
+        if isinstance(node, ast.Attribute):
+            root = _root_name(node)
+            if root is not None and root not in self.varying:
+                return copy.deepcopy(node)
+            if node.attr in ('real', 'imag'):
+                return ast.Attribute(value=self.expr(node.value), attr=node.attr, ctx=ast.Load())
+            raise NotVectorizable(f"attribute {node.attr}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, BINARY_OPERATORS):
+            return ast.BinOp(left=self.expr(node.left), op=copy.deepcopy(node.op), right=self.expr(node.right))
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return ast.UnaryOp(op=copy.deepcopy(node.op), operand=self.expr(node.operand))
+            if isinstance(node.op, ast.Not) and cond:
+                return _call(NOT, self.expr(node.operand, cond=True))
+            raise NotVectorizable("unary operator")
+        if isinstance(node, ast.Compare):
+            if not all(isinstance(op, COMPARE_OPERATORS) for op in node.ops):
+                raise NotVectorizable("comparison operator")
+            operands = [self.expr(node.left)] + [self.expr(value) for value in node.comparators]
+            pairs = [
+                ast.Compare(left=operands[k], ops=[copy.deepcopy(op)], comparators=[operands[k + 1]])
+                for k, op in enumerate(node.ops)
+            ]
+            return pairs[0] if len(pairs) == 1 else _call(AND, *pairs)
+        if isinstance(node, ast.BoolOp) and cond:
+            helper = AND if isinstance(node.op, ast.And) else OR
+            return _call(helper, *[self.expr(value, cond=True) for value in node.values])
+        if isinstance(node, ast.IfExp):
+            return _call(WHERE, self.expr(node.test, cond=True), self.expr(node.body), self.expr(node.orelse))
+        if isinstance(node, ast.Call):
+            root = _root_name(node.func)
+            if root is None or root in self.varying or node.keywords:
+                raise NotVectorizable("call")
+            if isinstance(node.func, ast.Name) and node.func.id in NON_ELEMENTWISE_CALLS:
+                raise NotVectorizable(f"call to {node.func.id}")
+            if any(isinstance(arg, ast.Starred) for arg in node.args):
+                raise NotVectorizable("starred call")
+            return _call(CALL, copy.deepcopy(node.func), *[self.expr(arg) for arg in node.args])
+        if isinstance(node, ast.Subscript):
+            index = node.slice
+            if isinstance(index, ast.Tuple):
+                index = ast.Tuple(elts=[self.expr(element) for element in index.elts], ctx=ast.Load())
+            elif isinstance(index, ast.Slice):
+                raise NotVectorizable("slice")
+            else:
+                index = self.expr(index)
+            return _call(INDEX, self.expr(node.value), index)
+        raise NotVectorizable(type(node).__name__)
+
+    def block(self, stmts: list) -> list:
+        compiled = []
+        for stmt in stmts:
+            compiled.extend(self.stmt(stmt))
+        return compiled
+
+    def masked_block(self, mask: str, kind: str, stmts: list) -> list:
+        """
+        מתרגם פקודות תחת מסכה; שמות שהוצבו רק בתוכן לא נחשבים מוגדרים אחרי הבלוק
+        """
+        self.masks.append((mask, kind))
+        saved = set(self.defined)
+        try:
+            return self.block(stmts)
+        finally:
+            self.masks.pop()
+            self.defined = saved
+
+    def stmt(self, node) -> list:
+        if isinstance(node, ast.Pass) or (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)):
+            return []
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if isinstance(target, ast.Name):
+                return self.assign([(target.id, node.value)])
+            if (
+                isinstance(target, ast.Tuple) and isinstance(node.value, ast.Tuple)
+                and len(target.elts) == len(node.value.elts)
+                and all(isinstance(element, ast.Name) for element in target.elts)
+            ):
+                return self.assign([(element.id, value) for element, value in zip(target.elts, node.value.elts)])
+        if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            value = ast.BinOp(left=_name(node.target.id), op=node.op, right=node.value)
+            return self.assign([(node.target.id, value)])
+        if isinstance(node, ast.If):
+            return self.if_statement(node)
+        if isinstance(node, ast.While) and not node.orelse:
+            return self.while_loop(node)
+        if isinstance(node, ast.For) and not node.orelse:
+            return self.range_loop(node)
+        if isinstance(node, ast.Break):
+            return self.leave('loop')
+        if isinstance(node, ast.Return) and self.function and node.value is not None:
+            value = self.expr(node.value)
+            return [_assign('__vresult', _call(UPDATE, _name('__vresult'), _name(self.mask), value))] + self.leave('alive')
+        raise NotVectorizable(type(node).__name__)
+
+    def assign(self, pairs: list) -> list:
+        values = [self.expr(value) for _, value in pairs]
+        compiled = []
+        if len(pairs) > 1:
+            # a, b = b, a + b: כל הערכים מחושבים לפני ההצבה
+            temps = [self.fresh('t') for _ in pairs]
+            compiled += [_assign(temp, value) for temp, value in zip(temps, values)]
+            values = [_name(temp) for temp in temps]
+        for (name, _), value in zip(pairs, values):
+            if self.mask:
+                known = name in self.defined or name in self.declared
+                old = _name(name) if known else ast.Constant(None)
+                compiled.append(_assign(name, _call(UPDATE, old, _name(self.mask), value)))
+            else:
+                compiled.append(_assign(name, value))
+            self.defined.add(name)
+        return compiled
+
+    def _submask(self, condition) -> ast.Call:
+        if self.mask:
+            return _call(REFINE, _name(self.mask), condition)
+        return _call(MASK, _name(SHAPE_NAME), condition)
+
+    def if_statement(self, node: ast.If) -> list:
+        condition = self.fresh('c')
+        then_mask = self.fresh('m')
+        compiled = [
+            _assign(condition, self.expr(node.test, cond=True)),
+            _assign(then_mask, self._submask(_name(condition))),
+        ]
+        # שמות שמוצבים בשני הענפים מוגדרים אחרי התנאי
+        both = (_top_level_stores(node.body) & _top_level_stores(node.orelse)) - self.defined - self.declared
+        for name in both:
+            compiled.append(_assign(name, ast.Constant(None)))
+        self.declared |= both
+
+        compiled += self.masked_block(then_mask, 'if', node.body)
+        if node.orelse:
+            else_mask = self.fresh('m')
+            compiled.append(_assign(else_mask, self._submask(_call(NOT, _name(condition)))))
+            compiled += self.masked_block(else_mask, 'if', node.orelse)
+        self.defined |= both
+        return compiled
+
+    def while_loop(self, node: ast.While) -> list:
+        loop_mask = self.fresh('m')
+        compiled = [_assign(loop_mask, self._submask(self.expr(node.test, cond=True)))]
+        self.masks.append((loop_mask, 'loop'))
+        saved = set(self.defined)
+        try:
+            body = self.block(node.body)
+            body.append(_assign(loop_mask, _call(REFINE, _name(loop_mask), self.expr(node.test, cond=True))))
+        finally:
+            self.masks.pop()
+            self.defined = saved
+        compiled.append(ast.While(test=_call(ANY, _name(loop_mask)), body=body, orelse=[]))
+        return compiled
+
+    def range_loop(self, node: ast.For) -> list:
+        """
+        for k in range(...) עם break או return מותנים - הצורה הנפוצה של לולאת בריחה
+        """
+        if not (
+            isinstance(node.target, ast.Name)
+            and isinstance(node.iter, ast.Call)
+            and isinstance(node.iter.func, ast.Name) and node.iter.func.id == 'range'
+            and 1 <= len(node.iter.args) <= 3 and not node.iter.keywords
+        ):
+            raise NotVectorizable("inner loop that is not over range()")
+        target = node.target.id
+        steps = self.fresh('r')
+        step = self.fresh('k')
+        loop_mask = self.fresh('m')
+        compiled = []
+        if target not in self.defined and target not in self.declared:
+            # האיברים שיצאו מוקדם שומרים את הערך שהיה להם ביציאה
+            compiled.append(_assign(target, ast.Constant(None)))
+        compiled += [
+            _assign(steps, ast.Call(
+                func=_name('range'), args=[_call(SCALAR, self.expr(arg)) for arg in node.iter.args], keywords=[]
+            )),
+            # טווח ריק משאיר את משתנה הלולאה לא מוגדר - את זה משאירים ללולאה המקורית
+            ast.If(test=ast.UnaryOp(op=ast.Not(), operand=_name(steps)), body=[ast.Expr(_call(FALLBACK))], orelse=[]),
+            _assign(loop_mask, self._submask(ast.Constant(True))),
+        ]
+        self.masks.append((loop_mask, 'loop'))
+        saved = set(self.defined)
+        try:
+            body = [
+                ast.If(
+                    test=ast.UnaryOp(op=ast.Not(), operand=_call(ANY, _name(loop_mask))),
+                    body=[ast.Break()], orelse=[]
+                ),
+                _assign(target, _call(UPDATE, _name(target), _name(loop_mask), _name(step))),
+            ]
+            self.defined.add(target)
+            body += self.block(node.body)
+        finally:
+            self.masks.pop()
+            self.defined = saved
+        self.defined.add(target)
+        compiled.append(ast.For(target=_name(step, ast.Store()), iter=_name(steps), body=body, orelse=[]))
+        return compiled
+
+    def leave(self, kind: str) -> list:
+        """
+        break / return: האיברים של המסכה הנוכחית יוצאים מכל המסכות עד הלולאה (או הפונקציה)
+        """
+        levels = [index for index, (_, mask_kind) in enumerate(self.masks) if mask_kind == kind]
+        if not levels:
+            raise NotVectorizable(f"{'break' if kind == 'loop' else 'return'} outside of a loop")
+        leaving = self.fresh('x')
+        compiled = [_assign(leaving, _name(self.mask))]
+        for mask, _ in self.masks[levels[-1]:]:
+            compiled.append(_assign(mask, _call(EXCLUDE, _name(mask), _name(leaving))))
+        return compiled
+
+
+class _Vectorizer:
+    """
+    עובר על העץ ומחליף לולאות מתאימות בקריאה ל-__vectorized_loop, שמריצה גרסה על מערכים
+    ובודקת אותה מול הגרסה הרגילה (ראו vectorized_runtime)
+    """
+    def __init__(self, tree: ast.Module):
+        self.counter = itertools.count()
+        self.loops = 0
+        self.comprehensions = 0
+        self.functions = 0
+        self.all_loads = _loaded_names([tree])
+
+    def rewrite_block(self, stmts: list) -> list:
+        rewritten = []
+        for stmt in stmts:
+            rewritten.extend(self.rewrite_stmt(stmt))
+        return rewritten
+
+    def rewrite_stmt(self, stmt) -> list:
+        if isinstance(stmt, ast.For):
+            try:
+                return self.vectorize_loop(stmt)
+            except NotVectorizable as e:
+                logger.debug(f"Loop at line {stmt.lineno} left as is: {e}")
+            stmt.iter = self.rewrite_expression(stmt.iter)
+            stmt.body = self.rewrite_block(stmt.body)
+            stmt.orelse = self.rewrite_block(stmt.orelse)
+            return [stmt]
+        if isinstance(stmt, (ast.While, ast.If)):
+            stmt.test = self.rewrite_expression(stmt.test)
+            stmt.body = self.rewrite_block(stmt.body)
+            stmt.orelse = self.rewrite_block(stmt.orelse)
+            return [stmt]
+        if isinstance(stmt, ast.With):
+            stmt.body = self.rewrite_block(stmt.body)
+            return [stmt]
+        if isinstance(stmt, ast.FunctionDef):
+            companion = self.vectorize_function(stmt)
+            stmt.body = self.rewrite_block(stmt.body)
+            return [stmt] + companion
+        if isinstance(stmt, (ast.ClassDef, ast.Try, ast.AsyncFunctionDef)):
+            # חריגות ומחלקות - משאירים כמו שהם
+            return [stmt]
+        return [self.rewrite_expression(stmt)]
+
+    def rewrite_expression(self, node):
+        vectorizer = self
+
+        class ComprehensionRewriter(ast.NodeTransformer):
+            def visit_ListComp(self, comp):
+                try:
+                    return ast.copy_location(vectorizer.vectorize_comprehension(comp), comp)
+                except NotVectorizable:
+                    return self.generic_visit(comp)
+
+            def visit_Lambda(self, lambda_node):
+                return lambda_node
+
+        return ComprehensionRewriter().visit(node)
+
+    def _nest(self, loop: ast.For):
+        """
+        מפרק לולאה לרשת של לולאה אחת או שתיים מקוננות: (משתנים, איטרבילים, גוף)
+        """
+        loops = [loop]
+        body = list(loop.body)
+        if body and isinstance(body[-1], ast.For) and not body[-1].orelse and all(
+            isinstance(stmt, (ast.Assign, ast.AugAssign)) for stmt in body[:-1]
+        ):
+            loops.append(body[-1])
+            body = body[:-1] + list(body[-1].body)
+        targets = []
+        for nested in loops:
+            if not isinstance(nested.target, ast.Name) or nested.orelse:
+                raise NotVectorizable("loop target")
+            targets.append(nested.target.id)
+        if len(set(targets)) != len(targets):
+            raise NotVectorizable("repeated loop variable")
+        return targets, [nested.iter for nested in loops], body
+
+    def _output(self, stmt, targets: list):
+        """
+        מזהה פקודת פלט בגוף הלולאה: L.append(E) או Z[i, j] = E / Z[i][j] = E.
+        מחזיר (סוג, שם המיכל, סדר האינדקסים, שרשור, ביטוי) או None
+        """
+        if (
+            isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+            and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == 'append'
+            and isinstance(stmt.value.func.value, ast.Name)
+            and len(stmt.value.args) == 1 and not stmt.value.keywords
+            and not isinstance(stmt.value.args[0], ast.Starred)
+        ):
+            return 'append', stmt.value.func.value.id, None, False, stmt.value.args[0]
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Subscript):
+            target = stmt.targets[0]
+            chained = isinstance(target.value, ast.Subscript)
+            if chained:
+                indexes = [target.value.slice, target.slice]
+                container = target.value.value
+            else:
+                indexes = target.slice.elts if isinstance(target.slice, ast.Tuple) else [target.slice]
+                container = target.value
+            if not isinstance(container, ast.Name) or not all(isinstance(index, ast.Name) for index in indexes):
+                return None
+            order = tuple(targets.index(index.id) if index.id in targets else -1 for index in indexes)
+            if sorted(order) != list(range(len(targets))):
+                return None
+            return 'store', container.id, order, chained, stmt.value
+        return None
+
+    def vectorize_loop(self, loop: ast.For) -> list:
+        targets, iters, body = self._nest(loop)
+        varying = set(targets) | _stored_names(body)
+
+        # פקודות פלט מוחלפות במשתנים זמניים; המיכלים עצמם לא נקראים בשום מקום אחר בלולאה
+        outputs = []
+        vector_body = []
+        scalar_body = []
+        body_loads = _loaded_names(body)
+        for stmt in body:
+            output = self._output(stmt, targets)
+            if output is None:
+                vector_body.append(stmt)
+                scalar_body.append(copy.deepcopy(stmt))
+                continue
+            kind, container, order, chained, value = output
+            if container in varying or any(container == previous[1] for previous in outputs):
+                raise NotVectorizable(f"output container {container}")
+            temp = f"__vout{len(outputs)}"
+            outputs.append((kind, container, order, chained))
+            vector_body.append(ast.Assign(targets=[_name(temp, ast.Store())], value=value))
+            scalar_body.append(ast.Assign(targets=[_name(temp, ast.Store())], value=copy.deepcopy(value)))
+        if not outputs:
+            raise NotVectorizable("no output")
+        for _, container, _, _ in outputs:
+            if body_loads[container] > sum(1 for output in outputs if output[1] == container):
+                raise NotVectorizable(f"{container} is read inside the loop")
+        for inner in iters[1:]:
+            if set(_loaded_names([inner])) & varying:
+                raise NotVectorizable("inner range depends on the outer loop")
+
+        temps = [f"__vout{k}" for k in range(len(outputs))]
+        compiler = _VectorCompiler(varying | set(temps), set(targets), self.counter)
+        compiled = compiler.block(vector_body)
+
+        # משתנים שנשארים אחרי הלולאה עם הערך מהאיטרציה האחרונה
+        last_names = [target for target in targets] + sorted(
+            name for name in compiler.defined - set(targets) if not name.startswith('__')
+        )
+        partial = varying - set(last_names)
+        loop_loads = _loaded_names([loop])
+        for name in partial:
+            if self.all_loads[name] > loop_loads[name]:
+                raise NotVectorizable(f"'{name}' is only set on some iterations and used after the loop")
+
+        index = next(self.counter)
+        vector_name = f"__vloop{index}_vector"
+        scalar_name = f"__vloop{index}_scalar"
+        last_name = f"__vloop{index}_last"
+        vector_function = _function(
+            vector_name, [SHAPE_NAME] + targets,
+            compiled + [ast.Return(ast.Tuple(elts=[_name(temp) for temp in temps], ctx=ast.Load()))]
+        )
+        scalar_function = _function(
+            scalar_name, targets,
+            scalar_body + [ast.Return(ast.Tuple(elts=[
+                ast.Tuple(elts=[_name(temp) for temp in temps], ctx=ast.Load()),
+                ast.Tuple(elts=[_name(name) for name in last_names], ctx=ast.Load()),
+            ], ctx=ast.Load()))]
+        )
+        output_specs = ast.Tuple(elts=[
+            ast.Tuple(elts=[
+                ast.Constant(kind), _name(container),
+                ast.Constant(order), ast.Constant(chained),
+            ], ctx=ast.Load())
+            for kind, container, order, chained in outputs
+        ], ctx=ast.Load())
+        run = _assign(last_name, _call(
+            LOOP,
+            ast.Tuple(elts=[_lambda([], copy.deepcopy(iterable)) for iterable in iters], ctx=ast.Load()),
+            _name(vector_name), _name(scalar_name), output_specs, ast.Constant(loop.lineno)
+        ))
+        restore = ast.If(
+            test=ast.Compare(left=_name(last_name), ops=[ast.IsNot()], comparators=[ast.Constant(None)]),
+            body=[ast.Assign(
+                targets=[ast.Tuple(elts=[_name(name, ast.Store()) for name in last_names], ctx=ast.Store())],
+                value=_name(last_name)
+            )],
+            orelse=[]
+        )
+        generated = [vector_function, scalar_function, run, restore]
+        for node in generated:
+            ast.copy_location(node, loop)
+        self.loops += 1
+        logger.debug(f"Vectorized loop at line {loop.lineno} ({len(targets)} levels, {len(outputs)} outputs)")
+        return generated
+
+    def vectorize_comprehension(self, comp: ast.ListComp) -> ast.Call:
+        if not 1 <= len(comp.generators) <= 2:
+            raise NotVectorizable("comprehension depth")
+        targets = []
+        for generator in comp.generators:
+            if generator.ifs or generator.is_async or not isinstance(generator.target, ast.Name):
+                raise NotVectorizable("comprehension generator")
+            targets.append(generator.target.id)
+        if len(set(targets)) != len(targets):
+            raise NotVectorizable("repeated comprehension variable")
+        for generator in comp.generators[1:]:
+            if set(_loaded_names([generator.iter])) & set(targets):
+                raise NotVectorizable("inner range depends on the outer loop")
+
+        compiler = _VectorCompiler(set(targets), set(targets), self.counter)
+        vector = compiler.expr(comp.elt)
+        self.comprehensions += 1
+        return _call(
+            COMPREHENSION,
+            ast.Tuple(elts=[_lambda([], copy.deepcopy(generator.iter)) for generator in comp.generators], ctx=ast.Load()),
+            _lambda([SHAPE_NAME] + targets, ast.Tuple(elts=[vector], ctx=ast.Load())),
+            _lambda(targets, ast.Tuple(elts=[
+                ast.Tuple(elts=[copy.deepcopy(comp.elt)], ctx=ast.Load()),
+                ast.Tuple(elts=[], ctx=ast.Load()),
+            ], ctx=ast.Load())),
+            ast.Constant(comp.lineno)
+        )
+
+    def vectorize_function(self, function: ast.FunctionDef) -> list:
+        """
+        פונקציה שמחשבת ערך לכל נקודה (כולל לולאת בריחה עם return) מקבלת גרסה על מערכים,
+        כך שלולאה שקוראת לה עדיין ניתנת להמרה
+        """
+        args = function.args
+        if function.decorator_list or args.vararg or args.kwarg or args.kwonlyargs or args.posonlyargs:
+            return []
+        if not function.body or not isinstance(function.body[-1], ast.Return):
+            return []
+        if function.name in _loaded_names(function.body):
+            return []
+        params = [arg.arg for arg in args.args]
+        compiler = _VectorCompiler(set(params) | _stored_names(function.body), set(params), self.counter, function=True)
+        compiler.masks.append(('__valive', 'alive'))
+        try:
+            compiled = compiler.block(copy.deepcopy(function.body))
+        except NotVectorizable as e:
+            logger.debug(f"Function {function.name} has no array version: {e}")
+            return []
+
+        name = f"__vfunc_{function.name}"
+        header = [
+            _assign(SHAPE_NAME, _call(SHAPE, *[_name(param) for param in params])),
+            _assign('__valive', _call(MASK, _name(SHAPE_NAME), ast.Constant(True))),
+            _assign('__vresult', ast.Constant(None)),
+        ]
+        companion = ast.FunctionDef(
+            name=name, args=copy.deepcopy(args), body=header + compiled + [ast.Return(_name('__vresult'))],
+            decorator_list=[], returns=None
+        )
+        register = ast.Expr(_call(REGISTER, _name(function.name), _name(name)))
+        for node in (companion, register):
+            ast.copy_location(node, function)
+        self.functions += 1
+        return [companion, register]
+
+
+def vectorize_tree(tree: ast.Module) -> VectorizeResult:
+    """
+    ממיר לולאות סקלריות מוכרות (צבירת נקודות לרשימה, חישוב על רשת, לולאות בריחה)
+    לחישוב על מערכי numpy. העץ המקורי לא משתנה.
+    הבדיקה שהתוצאה זהה, והחזרה ללולאה המקורית כשהיא לא, קורות בזמן ריצה
+    """
+    tree = copy.deepcopy(tree)
+    vectorizer = _Vectorizer(tree)
+    tree.body = vectorizer.rewrite_block(tree.body)
+    ast.fix_missing_locations(tree)
+    return VectorizeResult(tree, vectorizer.loops, vectorizer.comprehensions, vectorizer.functions)
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: מדפיס את הקוד אחרי ההמרה
+    code = """
+import math
+xs, ys = [], []
+for k in range(5000):
+    t = 2 * math.pi * k / 5000
+    xs.append(math.cos(3 * t))
+    ys.append(math.sin(2 * t))
+
+def escape(c, max_iter):
+    z = 0
+    for n in range(max_iter):
+        if abs(z) > 2:
+            return n
+        z = z * z + c
+    return max_iter
+
+for i in range(200):
+    for j in range(300):
+        image[i, j] = escape(complex(x[j], y[i]), 50)
+"""
+    result = vectorize_tree(ast.parse(code))
+    print(ast.unparse(result.tree))
+    print(f"loops={result.loops} comprehensions={result.comprehensions} functions={result.functions}")
@@ -1,23 +1,155 @@
-# רשימת מודולים מותרים
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# טעינת משתני הסביבה - פעם אחת כאן, וכל המודולים שקוראים את ההגדרות רואים אותם
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+# רשימה סגורה של מודולים שמותר לייבא או להגיע אליהם כתכונה (np.random, plt.cm).
+# כל תת-מודול אחר של הספריות (matplotlib.testing, numpy.testing, matplotlib.cbook) חסום.
+# שם שמסתיים ב-".*" מתיר גם את כל תתי-המודולים שלו
 ALLOWED_MODULES = {
-    'matplotlib',
-    'numpy',
     'math',
     'bidi',
+    'bidi.algorithm',
+    'numpy',
+    'numpy.random.*',
+    'numpy.linalg.*',
+    'numpy.fft.*',
+    'numpy.polynomial.*',
+    'numpy.ma.*',
+    'numpy.lib.stride_tricks',
+    'numpy.lib.scimath',
+    'numpy.exceptions',
+    'numpy.dtypes',
+    'matplotlib',
+    'matplotlib.pyplot',
     'matplotlib.patches',
     'matplotlib.path',
-    'bidi.algorithm'
+    'matplotlib.colors',
+    'matplotlib.cm',
+    'matplotlib.collections',
+    'matplotlib.lines',
+    'matplotlib.markers',
+    'matplotlib.text',
+    'matplotlib.ticker',
+    'matplotlib.transforms',
+    'matplotlib.patheffects',
+    'matplotlib.gridspec',
+    'matplotlib.axes.*',
+    'matplotlib.axis',
+    'matplotlib.figure',
+    'matplotlib.legend',
+    'matplotlib.legend_handler',
+    'matplotlib.colorbar',
+    'matplotlib.contour',
+    'matplotlib.quiver',
+    'matplotlib.streamplot',
+    'matplotlib.stackplot',
+    'matplotlib.table',
+    'matplotlib.spines',
+    'matplotlib.scale',
+    'matplotlib.style.*',
+    'matplotlib.tri.*',
+    'matplotlib.projections.*',
+    'matplotlib.dates',
+    'matplotlib.units',
+    'matplotlib.category',
+    'matplotlib.container',
+    'matplotlib.artist',
+    'matplotlib.offsetbox',
+    'matplotlib.bezier',
+    'matplotlib.textpath',
+    'matplotlib.hatch'
 }
 
-# רשימת מילים אסורות
-FORBIDDEN_WORDS = {
+# שמות שאסור להשתמש בהם בקוד שנוצר (בנוסף לכל שם שמתחיל ב-__)
+FORBIDDEN_NAMES = {
     'exec',
     'eval',
-    'import os',
+    'compile',
+    'open',
+    'input',
+    'globals',
+    'locals',
+    'vars',
+    'getattr',
+    'setattr',
+    'delattr',
+    'breakpoint',
+    'exit',
+    'quit',
+    'help',
+    'memoryview'
+}
+
+# תכונות שאסור לגשת אליהן - מודולי מערכת ומודולים מסוכנים שנחשפים דרך הספריות המותרות,
+# גם כשלא ברור מהקוד שמדובר במודול (m = matplotlib; m.testing), וקריאה/כתיבה של קבצים
+# (בנוסף לכל תכונה שמתחילה ב-__ ולמתודות print_ של ה-canvas)
+FORBIDDEN_ATTRIBUTES = {
+    'os',
+    'sys',
     'subprocess',
-    'system'
+    'builtins',
+    'system',
+    'popen',
+    'ctypes',
+    'ctypeslib',
+    'load',
+    'loadtxt',
+    'genfromtxt',
+    'fromfile',
+    'fromregex',
+    'recfromcsv',
+    'recfromtxt',
+    'DataSource',
+    'open',
+    'npyio',
+    '_npyio_impl',
+    '_datasource',
+    'NpzFile',
+    'pickle',
+    'open_memmap',
+    'f2py',
+    'distutils',
+    'get_sample_data',
+    'rc_file',
+    'rc_params_from_file',
+    'tofile',
+    'save',
+    'savez',
+    'savez_compressed',
+    'savetxt',
+    'memmap',
+    'imread',
+    'imsave',
+    'thumbnail',
+    'dump',
+    'testing',
+    'tests',
+    'cbook',
+    'backends',
+    'backend_bases',
+    'texmanager',
+    'dviread',
+    'animation',
+    'font_manager',
+    'mathtext'
 }
 
+
+
+def is_allowed_module(module: str, allowed_modules=ALLOWED_MODULES) -> bool:
+    """
+    האם מותר לייבא את המודול: הוא ברשימה, בתוך חבילה שמותרת כולה,
+    או חבילה שעוברים דרכה אל מודול מותר (numpy.lib בדרך ל-numpy.lib.stride_tricks)
+    """
+    parts = module.split('.')
+    if module in allowed_modules or any(name.startswith(module + '.') for name in allowed_modules):
+        return True
+    return any('.'.join(parts[:i]) + '.*' in allowed_modules for i in range(1, len(parts) + 1))
+
+
 # מיפוי מודולים לייבוא גלובלי
 GLOBAL_IMPORTS = {
     'matplotlib': '__import__("matplotlib")',
@@ -27,4 +159,28 @@ GLOBAL_IMPORTS = {
     'math': '__import__("math")',
     'get_display': '__import__("bidi.algorithm").get_display',
     'Path': '__import__("matplotlib.path").Path'
-} 
\ No newline at end of file
+}
+
+# מחלקות מ-matplotlib.patches שזמינות לקוד גם בלי ייבוא
+GLOBAL_PATCHES = ('PathPatch', 'Polygon', 'Circle', 'Rectangle', 'Arc')
+
+
+# מגבלות משאבים לרינדור קוד שנוצר (ערכי ברירת מחדל, ניתנים לדריסה במשתני סביבה)
+RENDER_LIMIT_DEFAULTS = {
+    'MAX_EXECUTION_TIME': 30,         # זמן אמת מקסימלי לרינדור, בשניות
+    'MAX_CPU_TIME': 20,               # זמן מעבד מקסימלי לרינדור, בשניות
+    'MAX_MEMORY_MB': 2048,            # מרחב כתובות מקסימלי לתהליך רינדור
+    'MAX_OUTPUT_PIXELS': 16_000_000,  # מספר פיקסלים מקסימלי בתמונה שנשמרת
+    'MAX_ARRAY_ELEMENTS': 50_000_000, # גודל מערך מקסימלי לפי הערכה סטטית של הקוד
+    'MAX_LOOP_ITERATIONS': 10_000_000 # מספר איטרציות מקסימלי לפי הערכה סטטית של הקוד
+}
+
+
+def get_render_limits() -> dict:
+    """
+    מחזיר את מגבלות הרינדור, כשמשתני סביבה גוברים על ערכי ברירת המחדל
+    """
+    return {
+        name: int(os.getenv(name, default))
+        for name, default in RENDER_LIMIT_DEFAULTS.items()
+    }
@@ -0,0 +1,78 @@
+import sys
+import json
+from pathlib import Path
+from typing import Iterator
+
+
+def iter_log_entries(path) -> Iterator[dict]:
+    """
+    קורא קובץ לוג ומחזיר את הרשומות אחת אחת.
+    תומך גם בפורמט החדש (JSON Lines) וגם בפורמט הישן (מערך JSON אחד)
+    """
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        first_char = ''
+        while True:
+            first_char = f.read(1)
+            if not first_char or not first_char.isspace():
+                break
+
+        if not first_char:
+            return
+
+        # פורמט ישן: כל הקובץ הוא מערך JSON
+        if first_char == '[':
+            f.seek(0)
+            yield from json.load(f)
+            return
+
+        f.seek(0)
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # שורה אחרונה חלקית (למשל אחרי קריסה) - מדלגים
+                print(f"Skipping malformed line {line_number} in {path}", file=sys.stderr)
+
+
+def iter_rotated_log_entries(path) -> Iterator[dict]:
+    """
+    קורא את קובץ הלוג יחד עם הקבצים הישנים שלו (path.N ... path.1, ואז path),
+    מהישן לחדש
+    """
+    path = Path(path)
+    backups = sorted(
+        (p for p in path.parent.glob(f"{path.name}.*") if p.suffix[1:].isdigit()),
+        key=lambda p: int(p.suffix[1:]),
+        reverse=True
+    )
+    for backup in backups:
+        yield from iter_log_entries(backup)
+    if path.exists():
+        yield from iter_log_entries(path)
+
+
+def convert_to_json_lines(src, dst) -> int:
+    """
+    ממיר קובץ לוג בפורמט הישן (מערך JSON) לפורמט JSON Lines.
+    מחזיר את מספר הרשומות שנכתבו
+    """
+    count = 0
+    with open(dst, 'a', encoding='utf-8') as out:
+        for entry in iter_log_entries(src):
+            out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # שימוש: python -m utils.log_reader <old.json> <new.jsonl>
+    if len(sys.argv) != 3:
+        print("Usage: python -m utils.log_reader <old.json> <new.jsonl>")
+        sys.exit(1)
+
+    written = convert_to_json_lines(sys.argv[1], sys.argv[2])
+    print(f"Converted {written} log entries")
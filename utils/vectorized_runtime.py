@@ -0,0 +1,443 @@
+import math
+import time
+import cmath
+import itertools
+import logging
+from functools import reduce
+import numpy as np
+from . import code_vectorizer as names
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מתחת לזה התקורה של הבדיקה גדולה מהחיסכון - מריצים את הלולאה המקורית
+MIN_POINTS = 200
+
+# כמה נקודות מחושבות גם בלולאה המקורית כדי לוודא שהתוצאה זהה
+SAMPLE_POINTS = 8
+
+# סבילות להשוואה בין התוצאה על מערכים לתוצאה הרגילה
+RTOL = 1e-7
+ATOL = 1e-9
+
+# חריגות שאחריהן חוזרים ללולאה המקורית. חריגות אחרות (למשל חריגה ממגבלת הזמן
+# של SafeCodeExecutor) ממשיכות הלאה כרגיל
+RECOVERABLE_ERRORS = (
+    ArithmeticError, TypeError, ValueError, IndexError, KeyError, AttributeError,
+    NameError, RecursionError, MemoryError,
+)
+
+# תוצאות של הלולאות שרצו בהרצה הנוכחית (נאסף ע"י SafeCodeExecutor)
+_reports = []
+
+
+class NotVectorized(Exception):
+    """
+    הגרסה על מערכים לא מתאימה לנתונים האלה - חוזרים ללולאה המקורית
+    """
+
+
+def _log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+def _to_int(x, base=None):
+    if base is not None:
+        raise NotVectorized("int() with a base")
+    x = np.asarray(x)
+    if x.dtype.kind == 'c':
+        raise NotVectorized("int() of a complex value")
+    return np.trunc(x).astype(np.int64) if x.dtype.kind == 'f' else x.astype(np.int64)
+
+
+def _to_float(x=0.0):
+    x = np.asarray(x)
+    if x.dtype.kind == 'c':
+        raise NotVectorized("float() of a complex value")
+    return x.astype(np.float64)
+
+
+def _to_complex(real=0, imag=0):
+    return np.asarray(real) + 1j * np.asarray(imag)
+
+
+def _round(x, digits=None):
+    return np.round(x) if digits is None else np.round(x, digits)
+
+
+def _pairwise(func):
+    def apply(*args):
+        if len(args) < 2:
+            raise NotVectorized(f"{func.__name__} of a single iterable")
+        return reduce(func, args)
+    return apply
+
+
+# פונקציות סקלריות וגרסת ה-numpy שלהן
+NUMPY_EQUIVALENTS = {
+    math.sin: np.sin, math.cos: np.cos, math.tan: np.tan,
+    math.asin: np.arcsin, math.acos: np.arccos, math.atan: np.arctan, math.atan2: np.arctan2,
+    math.sinh: np.sinh, math.cosh: np.cosh, math.tanh: np.tanh,
+    math.asinh: np.arcsinh, math.acosh: np.arccosh, math.atanh: np.arctanh,
+    math.exp: np.exp, math.expm1: np.expm1, math.log: _log, math.log10: np.log10,
+    math.log2: np.log2, math.log1p: np.log1p, math.sqrt: np.sqrt, math.pow: np.power,
+    math.fabs: np.fabs, math.floor: np.floor, math.ceil: np.ceil, math.trunc: np.trunc,
+    math.hypot: np.hypot, math.degrees: np.degrees, math.radians: np.radians,
+    math.copysign: np.copysign, math.isnan: np.isnan, math.isinf: np.isinf, math.isfinite: np.isfinite,
+    abs: np.abs, pow: np.power, round: _round, int: _to_int, float: _to_float, complex: _to_complex,
+    min: _pairwise(np.minimum), max: _pairwise(np.maximum),
+}
+
+# פונקציות numpy שאינן ufunc אבל פועלות איבר-איבר
+ELEMENTWISE = {np.where, np.clip, np.angle, np.real, np.imag, np.round, np.around, np.sinc}
+
+
+def vcall(func, *args):
+    try:
+        target = NUMPY_EQUIVALENTS.get(func)
+        if target is None and (isinstance(func, np.ufunc) or func in ELEMENTWISE):
+            target = func
+    except TypeError:
+        target = None
+    if target is None:
+        target = getattr(func, '_vectorized', None)
+    if target is None:
+        raise NotVectorized(f"{getattr(func, '__name__', func)!r} has no array version")
+    return target(*args)
+
+
+def vindex(value, index):
+    return np.asarray(value)[index]
+
+
+def vwhere(condition, a, b):
+    return np.where(condition, a, b)
+
+
+def vand(*values):
+    return reduce(np.logical_and, values)
+
+
+def vor(*values):
+    return reduce(np.logical_or, values)
+
+
+def vnot(value):
+    return np.logical_not(value)
+
+
+def vsel(value, mask):
+    """
+    הערכים של האיברים שבמסכה (סקלר נשאר כמו שהוא)
+    """
+    if isinstance(value, np.ndarray) and value.ndim:
+        return np.broadcast_to(value, mask.shape)[mask]
+    return value
+
+
+def vupdate(old, mask, new):
+    """
+    מציב new באיברים שבמסכה ומשאיר את השאר. תמיד מחזיר מערך חדש, כדי לא לשנות
+    מערך שמשתנה אחר (או הקוד עצמו) מחזיק בו
+    """
+    new = np.asarray(new)
+    if old is None:
+        updated = np.zeros(mask.shape, dtype=new.dtype)
+    else:
+        old = np.asarray(old)
+        updated = np.array(np.broadcast_to(old, mask.shape), dtype=np.result_type(old, new))
+    updated[mask] = new
+    return updated
+
+
+def vmask(shape, condition):
+    return np.array(np.broadcast_to(np.asarray(condition, dtype=bool), shape))
+
+
+def vrefine(mask, condition):
+    refined = mask.copy()
+    refined[mask] = np.asarray(condition, dtype=bool)
+    return refined
+
+
+def vexclude(mask, leaving):
+    return mask & ~leaving
+
+
+def vany(mask) -> bool:
+    return bool(mask.any())
+
+
+def vscalar(value):
+    if isinstance(value, np.ndarray):
+        if value.ndim:
+            raise NotVectorized("loop bound differs between points")
+        return value.item()
+    return value
+
+
+def vshape(*args):
+    return np.broadcast_shapes(*[arg.shape for arg in args if isinstance(arg, np.ndarray)])
+
+
+def vfallback():
+    raise NotVectorized("empty inner range")
+
+
+def vregister(func, vector_func) -> None:
+    func._vectorized = vector_func
+
+
+def _sequence(iterable):
+    """
+    (מערך הערכים, הרצף המקורי) - רק לרצפים שאפשר לעבור עליהם שוב בלי לצרוך אותם
+    """
+    if isinstance(iterable, range):
+        return np.arange(iterable.start, iterable.stop, iterable.step), iterable
+    if isinstance(iterable, np.ndarray):
+        values = iterable
+    elif isinstance(iterable, (list, tuple)):
+        values = np.asarray(iterable)
+    else:
+        raise NotVectorized(f"cannot vectorize a loop over {type(iterable).__name__}")
+    if values.ndim != 1 or values.dtype.kind not in 'biufc':
+        raise NotVectorized("loop values are not plain numbers")
+    return values, iterable
+
+
+def _matches(vector_value, scalar_value) -> bool:
+    if isinstance(scalar_value, np.generic):
+        scalar_value = scalar_value.item()
+    if not isinstance(scalar_value, (bool, int, float, complex)):
+        return False
+    actual = vector_value.item()
+    if actual == scalar_value:
+        return True
+    try:
+        if cmath.isnan(actual) and cmath.isnan(scalar_value):
+            return True
+        return abs(actual - scalar_value) <= ATOL + RTOL * abs(scalar_value)
+    except (TypeError, OverflowError):
+        return False
+
+
+def _sample_positions(arrays, shape):
+    """
+    נקודות לבדיקה: פינות (כולל הערכים הקיצוניים של כל משתנה לולאה) ונקודות בפיזור אחיד
+    """
+    size = math.prod(shape)
+    positions = {np.unravel_index(flat, shape) for flat in np.linspace(0, size - 1, SAMPLE_POINTS).astype(int)}
+    extremes = [(0, len(a) - 1, int(np.argmin(np.abs(a))), int(np.argmax(np.abs(a)))) for a in arrays]
+    corners = [()]
+    for options in extremes:
+        corners = [corner + (option,) for corner in corners for option in set(options)]
+    positions.update(corners)
+    return sorted(tuple(int(k) for k in position) for position in positions)
+
+
+def _run_vectorized(sequences, vector_fn, scalar_fn, outputs):
+    arrays = [values for values, _ in sequences]
+    items = [original for _, original in sequences]
+    shape = tuple(len(values) for values in arrays)
+    grids = [
+        values.reshape([-1 if axis == level else 1 for axis in range(len(arrays))])
+        for level, values in enumerate(arrays)
+    ]
+
+    started = time.perf_counter()
+    with np.errstate(all='ignore'):
+        results = [np.broadcast_to(np.asarray(value), shape) for value in vector_fn(shape, *grids)]
+    vector_seconds = time.perf_counter() - started
+    for value in results:
+        if value.dtype.kind not in 'biufc':
+            raise NotVectorized("result is not numeric")
+
+    # השוואה לחישוב הרגיל על מדגם נקודות
+    positions = _sample_positions(arrays, shape)
+    last = None
+    sample_seconds = 0.0
+    for position in positions:
+        args = [seq[k] for seq, k in zip(items, position)]
+        started = time.perf_counter()
+        scalar_outputs, last_values = scalar_fn(*args)
+        sample_seconds += time.perf_counter() - started
+        for value, expected in zip(results, scalar_outputs):
+            if not _matches(value[position], expected):
+                raise NotVectorized(f"result differs from the loop at {position}")
+        if all(k == n - 1 for k, n in zip(position, shape)):
+            last = last_values
+    sample_seconds /= len(positions)
+
+    # נקודות שיצאו inf/nan מחושבות מחדש בלולאה הרגילה (שם הן עשויות לזרוק חריגה)
+    started = time.perf_counter()
+    bad = np.zeros(shape, dtype=bool)
+    for value in results:
+        if value.dtype.kind in 'fc':
+            bad |= ~np.isfinite(value)
+    if bad.any():
+        results = [np.array(value) for value in results]
+        for position in zip(*np.nonzero(bad)):
+            scalar_outputs, _ = scalar_fn(*[seq[k] for seq, k in zip(items, position)])
+            for value, expected in zip(results, scalar_outputs):
+                value[position] = expected
+
+    # קודם ההצבות (שעלולות להיכשל ולהחזיר ללולאה המקורית), ורק אז ההוספות לרשימות
+    for (kind, target, order, chained), value in zip(outputs, results):
+        if kind == 'store':
+            _store(target, value, order, chained, arrays, grids, items)
+    for (kind, target, order, chained), value in zip(outputs, results):
+        if kind == 'append':
+            _extend(target, value)
+    vector_seconds += time.perf_counter() - started
+    return last, vector_seconds, sample_seconds * math.prod(shape)
+
+
+def _extend(target, value):
+    values = value.ravel().tolist()
+    if type(target) is list:
+        target.extend(values)
+    else:
+        for item in values:
+            target.append(item)
+
+
+def _store(target, value, order, chained, arrays, grids, items):
+    index_arrays = [arrays[level] for level in order]
+    if isinstance(target, np.ndarray) and all(
+        values.dtype.kind in 'iu' and np.unique(values).size == values.size for values in index_arrays
+    ):
+        target[tuple(grids[level] for level in order)] = value
+        return
+    if order == (0, 1) and chained:
+        # רשימה של רשימות, Z[i][j] = ...: שורה אחרי שורה
+        for key, row_values in zip(items[0], value.tolist()):
+            row = target[key]
+            for inner_key, item in zip(items[1], row_values):
+                row[inner_key] = item
+        return
+    positions = itertools.product(*[range(size) for size in value.shape])
+    for position, item in zip(positions, value.ravel().tolist()):
+        _set(target, [items[level][position[level]] for level in order], chained, item)
+
+
+def _set(target, keys, chained, value):
+    if chained:
+        for key in keys[:-1]:
+            target = target[key]
+        target[keys[-1]] = value
+    else:
+        target[tuple(keys) if len(keys) > 1 else keys[0]] = value
+
+
+def _run_scalar(outer, factories, scalar_fn, outputs):
+    """
+    הלולאה המקורית, באותו סדר ועם אותן תופעות לוואי
+    """
+    last = None
+
+    def apply(values, scalar_outputs):
+        for (kind, target, order, chained), value in zip(outputs, scalar_outputs):
+            if kind == 'append':
+                target.append(value)
+            else:
+                _set(target, [values[level] for level in order], chained, value)
+
+    if len(factories) == 1:
+        for a in outer:
+            scalar_outputs, last = scalar_fn(a)
+            apply((a,), scalar_outputs)
+    else:
+        for a in outer:
+            for b in factories[1]():
+                scalar_outputs, last = scalar_fn(a, b)
+                apply((a, b), scalar_outputs)
+    return last
+
+
+def vectorized_loop(factories, vector_fn, scalar_fn, outputs, line):
+    """
+    מריץ לולאה שהומרה: קודם על מערכים, עם בדיקה מול הלולאה המקורית על מדגם;
+    כשמשהו לא מתאים (סוג הנתונים, חריגה, תוצאה שונה) - הלולאה המקורית רצה במקומה.
+    מחזיר את ערכי המשתנים מהאיטרציה האחרונה, או None אם הלולאה לא רצה
+    """
+    outer = factories[0]()
+    try:
+        sequences = [_sequence(outer)] + [_sequence(factory()) for factory in factories[1:]]
+        points = math.prod(len(values) for values, _ in sequences)
+    except NotVectorized:
+        sequences, points = None, 0
+    if sequences is None or points < MIN_POINTS:
+        return _run_scalar(outer, factories, scalar_fn, outputs)
+
+    try:
+        last, vector_seconds, scalar_seconds = _run_vectorized(sequences, vector_fn, scalar_fn, outputs)
+    except (NotVectorized,) + RECOVERABLE_ERRORS as e:
+        reason = str(e) if isinstance(e, NotVectorized) else f"{type(e).__name__}: {e}"
+        logger.info(f"Loop at line {line} ({points} points) falls back to Python: {reason}")
+        _reports.append({'line': line, 'points': points, 'result': 'fallback', 'reason': reason})
+        return _run_scalar(outer, factories, scalar_fn, outputs)
+
+    speedup = scalar_seconds / vector_seconds if vector_seconds > 0 else None
+    logger.info(
+        f"Loop at line {line} vectorized over {points} points in {vector_seconds * 1000:.1f}ms "
+        f"(estimated {scalar_seconds * 1000:.1f}ms as a loop, x{speedup or 0:.1f})"
+    )
+    _reports.append({
+        'line': line, 'points': points, 'result': 'vectorized',
+        'vector_seconds': vector_seconds, 'scalar_seconds': scalar_seconds, 'speedup': speedup,
+    })
+    return last
+
+
+def vectorized_comprehension(factories, vector_fn, scalar_fn, line):
+    result = []
+    vectorized_loop(factories, vector_fn, scalar_fn, (('append', result, None, False),), line)
+    return result
+
+
+def reset_reports() -> None:
+    _reports.clear()
+
+
+def take_reports() -> list:
+    reports = list(_reports)
+    _reports.clear()
+    return reports
+
+
+# מה שמוזרק למרחב השמות של ההרצה
+HELPERS = {
+    names.LOOP: vectorized_loop,
+    names.COMPREHENSION: vectorized_comprehension,
+    names.REGISTER: vregister,
+    names.CALL: vcall,
+    names.INDEX: vindex,
+    names.WHERE: vwhere,
+    names.AND: vand,
+    names.OR: vor,
+    names.NOT: vnot,
+    names.SELECT: vsel,
+    names.UPDATE: vupdate,
+    names.MASK: vmask,
+    names.REFINE: vrefine,
+    names.EXCLUDE: vexclude,
+    names.ANY: vany,
+    names.SCALAR: vscalar,
+    names.SHAPE: vshape,
+    names.FALLBACK: vfallback,
+}
+
+
+if __name__ == "__main__":
+    # דוגמה לשימוש: לולאת נקודות רגילה מול הגרסה על מערכים
+    import ast
+    code = """
+import math
+xs = []
+for k in range(100000):
+    xs.append(math.sin(k / 1000) * math.exp(-k / 50000))
+"""
+    result = names.vectorize_tree(ast.parse(code))
+    namespace = dict(HELPERS)
+    exec(compile(result.tree, '<example>', 'exec'), namespace)
+    print(len(namespace['xs']), take_reports())